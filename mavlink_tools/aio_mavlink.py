@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio ネイティブの MAVLink 接続（TCP / UDP）
+
+FastAPI 等のバックエンドでは、受信を
+    await loop.run_in_executor(None, partial(master.recv_match, blocking=True, timeout=0.1))
+のようにスレッドへ逃がしていることが多い。この方式は
+  - メッセージが無いときは最大 timeout(100ms) 待たされる
+  - 1メッセージごとにスレッド → イベントループへの乗り換えが発生する
+  - クライアントごとに受信すると、スレッドプールとソケットを奪い合う
+という問題がある。
+
+このモジュールは asyncio の Protocol / DatagramProtocol で受け取ったバイト列を
+そのまま pymavlink のパーサ(MAVLink.parse_buffer)に渡し、デコード済みメッセージを
+購読者ごとのキューへ配る。受信はイベントループ上で完結し、ポーリングは無い。
+
+使い方:
+    conn = await open_connection("tcp:127.0.0.1:5762")
+    await conn.wait_heartbeat()
+    conn.mav.request_data_stream_send(conn.target_system, conn.target_component, 0, 4, 1)
+    async for msg in conn.messages(types=["GLOBAL_POSITION_INT", "HEARTBEAT"]):
+        print(msg)
+
+接続文字列は mavutil と同じ書式:
+    tcp:host:port      TCPクライアント（SITL の 5760/5762 等）
+    udpin:host:port    UDP待ち受け（udp: も同じ。最後に受信した相手へ送信する）
+    udpout:host:port   UDP送信先を指定（BlueOS の 14550 等）
+"""
+
+import asyncio
+import time
+
+from pymavlink import mavutil
+
+# 購読者1つあたりに溜めておくメッセージ数。溢れたら古いものから捨てる
+DEFAULT_QUEUE_SIZE = 1000
+
+# 接続が切れたとき、各購読者のキューの最後に入れる印（sub.queue.get() を直接使う場合に見る）
+CLOSED = object()
+
+
+class Subscriber:
+    """messages() の1つの購読。メッセージ種別で絞り込み、キューに溜める。"""
+
+    def __init__(self, types, maxsize):
+        self.types = set(types) if types else None
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0      # キューが溢れて捨てたメッセージ数
+
+    def accepts(self, msg_type):
+        return self.types is None or msg_type in self.types
+
+    def put(self, msg):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(msg)
+
+    async def get(self):
+        """次のメッセージを待つ。接続が切れていれば（溜まっている分を返した後）CLOSED を返す。"""
+        msg = await self.queue.get()
+        if msg is CLOSED:
+            self.queue.put_nowait(CLOSED)      # 次の get() もすぐ CLOSED を返す
+        return msg
+
+
+class _StreamProtocol(asyncio.Protocol):
+    """TCP: 受信したバイト列を接続オブジェクトのパーサへ渡す。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connection_made(self, transport):
+        self.conn._transport = transport
+
+    def data_received(self, data):
+        self.conn._feed(data)
+
+    def connection_lost(self, exc):
+        self.conn._closed(exc)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """UDP: 受信したデータグラムを接続オブジェクトのパーサへ渡す。"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connection_made(self, transport):
+        self.conn._transport = transport
+
+    def datagram_received(self, data, addr):
+        if not self.conn._fixed_peer:
+            self.conn._peer = addr     # udpin: 最後に受信した相手へ送り返す
+        self.conn._feed(data)
+
+    def error_received(self, exc):
+        pass                       # ICMP port unreachable 等。相手が起動すれば回復する
+
+    def connection_lost(self, exc):
+        self.conn._closed(exc)
+
+
+class AsyncMAVLinkConnection:
+    """asyncio 上で動く MAVLink 接続。送信は mav.xxx_send()、受信は messages()。"""
+
+    def __init__(self, source_system=255, source_component=0, queue_size=DEFAULT_QUEUE_SIZE):
+        # file=self: mav.xxx_send() が self.write() を呼ぶ（mavutil の mavfile と同じ使い方）
+        self.mav = mavutil.mavlink.MAVLink(self, srcSystem=source_system,
+                                           srcComponent=source_component)
+        self.mav.robust_parsing = True     # CRC エラー等は例外にせず BAD_DATA として読み飛ばす
+        self.queue_size = queue_size
+        self.target_system = 0
+        self.target_component = 0
+        self.messages_received = 0
+        self.bytes_received = 0
+        self.bad_data = 0
+        self.last_received = None          # 最後にメッセージを受信した時刻(time.monotonic)
+        self._transport = None
+        self._datagram = False
+        self._peer = None                  # udpin の送信先（最後に受信した相手）
+        self._fixed_peer = False           # udpout: 送信先は接続時に固定
+        self._subscribers = []
+        self._closed_event = asyncio.Event()
+
+    # ---- 送信 ----------------------------------------------------------
+
+    def write(self, buf):
+        """pymavlink が組み立てたフレームを送る（mav.xxx_send() から呼ばれる）。"""
+        if self._transport is None or self._transport.is_closing():
+            return
+        if self._fixed_peer:
+            self._transport.sendto(buf)
+        elif self._datagram:
+            if self._peer is not None:
+                self._transport.sendto(buf, self._peer)
+        else:
+            self._transport.write(buf)
+
+    def send(self, msg):
+        self.mav.send(msg)
+
+    # ---- 受信 ----------------------------------------------------------
+
+    def _feed(self, data):
+        """受信したバイト列をパースし、購読者へ配る（イベントループ上で呼ばれる）。"""
+        self.bytes_received += len(data)
+        msgs = self.mav.parse_buffer(data)
+        if not msgs:
+            return
+        for msg in msgs:
+            msg_type = msg.get_type()
+            if msg_type == "BAD_DATA":
+                self.bad_data += 1
+                continue
+            self.messages_received += 1
+            self.last_received = time.monotonic()
+            for sub in self._subscribers:
+                if sub.accepts(msg_type):
+                    sub.put(msg)
+
+    def subscribe(self, types=None, maxsize=None):
+        """購読を登録する。不要になったら unsubscribe() すること。
+
+        接続が切れると、キューの最後に CLOSED が入る（切れた後の購読はすぐ CLOSED になる）。
+        """
+        sub = Subscriber(types, maxsize or self.queue_size)
+        if self.closed:
+            sub.put(CLOSED)
+        else:
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub in self._subscribers:
+            self._subscribers.remove(sub)
+
+    async def messages(self, types=None):
+        """受信メッセージを順に返す非同期イテレータ。types で種別を絞り込める。
+
+            async for msg in conn.messages(types=["HEARTBEAT"]):
+                ...
+        ループを抜けると購読は自動で解除される。接続が切れたら、溜まっている分を返して終わる。
+        """
+        sub = self.subscribe(types)
+        try:
+            while True:
+                msg = await sub.get()
+                if msg is CLOSED:
+                    return
+                yield msg
+        finally:
+            self.unsubscribe(sub)
+
+    async def recv_match(self, type=None, condition=None, timeout=None):
+        """条件に合うメッセージを1つ待つ。タイムアウト・切断なら None（mavutil の recv_match 相当）。"""
+        if isinstance(type, str):
+            type = [type]
+        sub = self.subscribe(type)
+        try:
+            async def wait():
+                while True:
+                    msg = await sub.get()
+                    if msg is CLOSED:
+                        return None
+                    if condition is None or condition(msg):
+                        return msg
+            return await asyncio.wait_for(wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.unsubscribe(sub)
+
+    async def wait_heartbeat(self, timeout=None):
+        """機体の HEARTBEAT を待ち、target_system / target_component を設定する。
+
+        GCS（MAV_TYPE_GCS）や、ジンバル・カメラ等（autopilot が MAV_AUTOPILOT_INVALID）の
+        HEARTBEAT は機体（オートパイロット）ではないので無視する。
+        """
+        msg = await self.recv_match(
+            type="HEARTBEAT", timeout=timeout,
+            condition=lambda m: (m.type != mavutil.mavlink.MAV_TYPE_GCS
+                                 and m.autopilot != mavutil.mavlink.MAV_AUTOPILOT_INVALID))
+        if msg is not None:
+            self.target_system = msg.get_srcSystem()
+            self.target_component = msg.get_srcComponent()
+        return msg
+
+    # ---- 接続の終了 ------------------------------------------------------
+
+    def _closed(self, exc):
+        self._closed_event.set()
+        # 待っている messages() / recv_match() を起こして終わらせる
+        subscribers, self._subscribers = self._subscribers, []
+        for sub in subscribers:
+            sub.put(CLOSED)
+
+    @property
+    def closed(self):
+        return self._closed_event.is_set()
+
+    async def wait_closed(self):
+        await self._closed_event.wait()
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+
+def parse_device(device):
+    """接続文字列を (方式, host, port) に分解する。"""
+    parts = device.split(":")
+    if len(parts) != 3 or parts[0] not in ("tcp", "udp", "udpin", "udpout"):
+        raise ValueError("対応していない接続文字列です: %s（tcp:/udpin:/udpout:host:port）" % device)
+    scheme = "udpin" if parts[0] == "udp" else parts[0]
+    return scheme, parts[1], int(parts[2])
+
+
+async def open_connection(device, source_system=255, source_component=0,
+                          queue_size=DEFAULT_QUEUE_SIZE):
+    """接続文字列から AsyncMAVLinkConnection を作って返す。"""
+    scheme, host, port = parse_device(device)
+    loop = asyncio.get_running_loop()
+    conn = AsyncMAVLinkConnection(source_system, source_component, queue_size)
+    if scheme == "tcp":
+        await loop.create_connection(lambda: _StreamProtocol(conn), host, port)
+    elif scheme == "udpin":
+        conn._datagram = True
+        await loop.create_datagram_endpoint(lambda: _DatagramProtocol(conn), local_addr=(host, port))
+    else:
+        conn._datagram = True
+        conn._fixed_peer = True
+        await loop.create_datagram_endpoint(lambda: _DatagramProtocol(conn), remote_addr=(host, port))
+    return conn
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+到着判定エンジン（複数機体・条件の組み合わせ）
+
+到着判定はスクリプトごとに別々に書かれている。
+  - multi_vehicles_relay.py の wait_for_arrival（到達通知・ミッション完了・STATUSTEXT・
+    付近に留まる・ディスアームの5つ）
+  - smart_delivery.py の ControlTower._is_arrived（1.113195e5 を掛けた平面距離）
+  - flight_experience_ota.py の wait_until_position_reached
+  - multi_vehicle.py の VehicleController.wait_arrival
+  - sequential_control.py の wait_mission_complete
+どれも機体ごとに recv_match のループを回して待つので、20台を待つと20本のループ
+（スレッド）が同じ種類のメッセージを読み続けることになる。
+
+ArrivalEngine は機体のメッセージを1か所（VehiclePool の受信スレッド、または feed()）で受け取り、
+機体ごとに登録した条件（Predicate）に渡す。条件を満たした時点で ArrivalEvent（機体名・理由・
+時刻）を作り、待っている側（Watch.wait() / next_event()）を起こす。待つ側はポーリングしない。
+
+条件:
+  Within(lat, lon, radius, dwell)   半径 radius[m] 以内に dwell 秒留まった（GLOBAL_POSITION_INT）
+  ItemReached(seq)                  seq 以降のアイテムに到達した（MISSION_ITEM_REACHED）
+  MissionComplete()                 MISSION_CURRENT.mission_state が完了（対応 FW・方言のみ）
+  Disarmed()                        ディスアームされた（HEARTBEAT）
+  StatusText(keywords)              STATUSTEXT にキーワードが含まれる
+  a | b                             どちらかを満たした（先に満たした方の理由）
+  a & b                             両方を（それぞれ一度は）満たした
+
+使い方:
+    engine = ArrivalEngine()
+    engine.attach(pool)                       # VehiclePool の受信スレッドで判定する
+    watches = [engine.watch(name, ItemReached(last_seq[name])
+                                  | Within(goal_lat, goal_lon, radius=5, dwell=3, departure=15)
+                                  | Disarmed())
+               for name in names]
+    for event in engine.events(timeout=600):  # 到着した順に受け取る
+        print(event.vehicle, event.reason)
+
+    event = watches[0].wait(timeout=300)      # 1台だけ待つ（タイムアウトなら None）
+"""
+
+import queue
+import threading
+import time
+
+from pymavlink import mavutil
+
+import geodesy
+
+# Within の既定値（multi_vehicles_relay.py の ARRIVE_RADIUS_M / ARRIVE_SETTLE_SEC と同じ）
+DEFAULT_RADIUS = 5.0
+DEFAULT_DWELL = 3.0
+
+# StatusText の既定のキーワード（小文字で比較する）
+MISSION_DONE_TEXTS = ("mission complete", "mission finished", "reached destination")
+
+
+# ---- 条件 ----------------------------------------------------------------
+
+class Predicate:
+    """到着の条件。types のメッセージを update() で受け取り、満たしたら理由（文字列）を返す。
+
+    1つの Predicate は1つの watch で使う（状態を持つので、機体ごとに作る）。
+    """
+
+    types = ()
+
+    def reset(self, now):
+        """watch() の開始時に呼ばれる。"""
+
+    def update(self, msg, now):
+        """msg（types のどれか）を受け取る。満たしたら理由を、まだなら None を返す。"""
+        raise NotImplementedError
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+
+class AnyOf(Predicate):
+    """どれか1つを満たしたら到着。理由は先に満たした条件のもの。"""
+
+    def __init__(self, *predicates):
+        self.predicates = []
+        for predicate in predicates:
+            # a | b | c を1段にする
+            self.predicates.extend(predicate.predicates if type(predicate) is AnyOf else [predicate])
+        self.types = tuple(sorted({t for p in self.predicates for t in p.types}))
+
+    def reset(self, now):
+        for predicate in self.predicates:
+            predicate.reset(now)
+
+    def update(self, msg, now):
+        msg_type = msg.get_type()
+        for predicate in self.predicates:
+            if msg_type in predicate.types:
+                reason = predicate.update(msg, now)
+                if reason is not None:
+                    return reason
+        return None
+
+
+class AllOf(Predicate):
+    """すべてを（それぞれ一度は）満たしたら到着。満たした条件は覚えておく。"""
+
+    def __init__(self, *predicates):
+        self.predicates = []
+        for predicate in predicates:
+            self.predicates.extend(predicate.predicates if type(predicate) is AllOf else [predicate])
+        self.types = tuple(sorted({t for p in self.predicates for t in p.types}))
+        self._reasons = {}
+
+    def reset(self, now):
+        self._reasons = {}
+        for predicate in self.predicates:
+            predicate.reset(now)
+
+    def update(self, msg, now):
+        msg_type = msg.get_type()
+        for index, predicate in enumerate(self.predicates):
+            if index not in self._reasons and msg_type in predicate.types:
+                reason = predicate.update(msg, now)
+                if reason is not None:
+                    self._reasons[index] = reason
+        if len(self._reasons) < len(self.predicates):
+            return None
+        return "、".join(self._reasons[index] for index in range(len(self.predicates)))
+
+
+class Within(Predicate):
+    """(lat, lon) から radius[m] 以内に dwell 秒留まった。
+
+    departure[m] を渡すと、最初の位置からそれだけ離れた後でないと判定しない
+    （出発地点が目的地の近くにあるとき、動き出す前に到着と判定しないため）。
+    """
+
+    types = ("GLOBAL_POSITION_INT",)
+
+    def __init__(self, lat, lon, radius=DEFAULT_RADIUS, dwell=DEFAULT_DWELL, departure=None):
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius
+        self.dwell = dwell
+        self.departure = departure
+        self.distance = None               # 最後に受信した位置からの距離[m]
+        self._start = None
+        self._departed = departure is None
+        self._near_since = None
+
+    def reset(self, now):
+        self.distance = None
+        self._start = None
+        self._departed = self.departure is None
+        self._near_since = None
+
+    def update(self, msg, now):
+        if msg.lat == 0 and msg.lon == 0:                  # GPS の測位前
+            return None
+        lat, lon = msg.lat * 1e-7, msg.lon * 1e-7
+        if not self._departed:
+            if self._start is None:
+                self._start = (lat, lon)
+            elif geodesy.approx_distance(lat, lon, *self._start) >= self.departure:
+                self._departed = True
+        self.distance = geodesy.approx_distance(lat, lon, self.lat, self.lon)
+        if not self._departed or self.distance > self.radius:
+            self._near_since = None
+            return None
+        if self._near_since is None:
+            self._near_since = now
+        if now - self._near_since >= self.dwell:
+            return "目的地から %.1f m 以内に %.0f秒 留まった" % (self.radius, self.dwell)
+        return None
+
+
+class ItemReached(Predicate):
+    """seq 以降のミッションアイテムに到達した（MISSION_ITEM_REACHED）。"""
+
+    types = ("MISSION_ITEM_REACHED",)
+
+    def __init__(self, seq):
+        self.seq = seq
+
+    def update(self, msg, now):
+        if msg.seq >= self.seq:
+            return "ウェイポイント seq=%d に到達" % msg.seq
+        return None
+
+
+class MissionComplete(Predicate):
+    """MISSION_CURRENT.mission_state が MISSION_STATE_COMPLETE になった。
+
+    mission_state の無い方言・ファームウェアでは満たさない（他の条件と | で組み合わせる）。
+    """
+
+    types = ("MISSION_CURRENT",)
+
+    def update(self, msg, now):
+        complete = getattr(mavutil.mavlink, "MISSION_STATE_COMPLETE", None)
+        if complete is not None and getattr(msg, "mission_state", None) == complete:
+            return "ミッション完了(MISSION_CURRENT.mission_state)"
+        return None
+
+
+class Disarmed(Predicate):
+    """機体の HEARTBEAT がディスアームになった。
+
+    armed_first=True なら、一度アームを見た後のディスアームだけを数える
+    （watch() をアームの前に始めるとき）。
+    """
+
+    types = ("HEARTBEAT",)
+
+    def __init__(self, armed_first=False):
+        self.armed_first = armed_first
+        self._armed = False
+
+    def reset(self, now):
+        self._armed = False
+
+    def update(self, msg, now):
+        # GCS・ジンバル・カメラ等（autopilot が INVALID）の HEARTBEAT はアーム状態を表さない
+        if (msg.type == mavutil.mavlink.MAV_TYPE_GCS
+                or msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID):
+            return None
+        if msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED:
+            self._armed = True
+            return None
+        if self.armed_first and not self._armed:
+            return None
+        return "機体がディスアームされた"
+
+
+class StatusText(Predicate):
+    """STATUSTEXT にキーワードのどれかが含まれる（大文字・小文字は区別しない）。"""
+
+    types = ("STATUSTEXT",)
+
+    def __init__(self, keywords=MISSION_DONE_TEXTS):
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+
+    def update(self, msg, now):
+        text = msg.text
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", "replace")
+        text = text.rstrip("\x00").strip()
+        lowered = text.lower()
+        if any(keyword in lowered for keyword in self.keywords):
+            return "機体メッセージ '%s'" % text
+        return None
+
+
+# ---- イベントと待ち --------------------------------------------------------
+
+class ArrivalEvent:
+    """到着。timestamp は time.time()（ログ用）、elapsed は watch() からの秒数。"""
+
+    def __init__(self, vehicle, reason, timestamp, elapsed, msg):
+        self.vehicle = vehicle
+        self.reason = reason
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+        self.msg = msg                     # 条件を満たしたメッセージ
+
+    def __repr__(self):
+        return "<ArrivalEvent %s %s (%.1fs)>" % (self.vehicle, self.reason, self.elapsed)
+
+
+class Watch:
+    """1機体・1条件の待ち。ArrivalEngine.watch() が返す。"""
+
+    def __init__(self, engine, vehicle, predicate, callback, started):
+        self.engine = engine
+        self.vehicle = vehicle
+        self.predicate = predicate
+        self.callback = callback
+        self.started = started
+        self.event = None                  # 到着したら ArrivalEvent
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return "<Watch %s %s>" % (self.vehicle, "arrived" if self.done else "waiting")
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """到着まで待って ArrivalEvent を返す。タイムアウトしたら None。"""
+        self._done.wait(timeout)
+        return self.event
+
+    def cancel(self):
+        """到着を待つのをやめる（到着済みなら何もしない）。"""
+        self.engine._remove(self)
+
+
+class ArrivalEngine:
+    """全機体の到着判定を、メッセージを受け取った側のスレッドで進める。"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._watches = {}                 # 機体名 → [Watch, ...]
+        self._events = queue.Queue()
+        self._pools = []
+        self._registered = set()           # pool に登録済みのメッセージ種別
+
+    def __len__(self):
+        """到着を待っている watch の数。"""
+        with self._lock:
+            return sum(len(watches) for watches in self._watches.values())
+
+    def watch(self, vehicle, predicate, callback=None):
+        """機体 vehicle（名前）が predicate を満たすのを待ち始め、Watch を返す。
+
+        callback(event) を渡すと、到着したときにメッセージを受け取ったスレッドから呼ぶ。
+        """
+        watch = Watch(self, vehicle, predicate, callback, self._clock())
+        predicate.reset(watch.started)
+        with self._lock:
+            self._watches.setdefault(vehicle, []).append(watch)
+            missing = [t for t in predicate.types if t not in self._registered]
+            self._registered.update(missing)
+            pools = list(self._pools)
+        for pool in pools:
+            if missing:
+                pool.on(missing, self._on_message)
+        return watch
+
+    def _remove(self, watch):
+        with self._lock:
+            watches = self._watches.get(watch.vehicle, [])
+            if watch in watches:
+                watches.remove(watch)
+                if not watches:
+                    del self._watches[watch.vehicle]
+
+    def feed(self, vehicle, msg):
+        """機体 vehicle のメッセージを1つ渡す。到着した ArrivalEvent のリストを返す。"""
+        msg_type = msg.get_type()
+        arrived = []
+        with self._lock:
+            watches = self._watches.get(vehicle)
+            if not watches:
+                return arrived
+            now = self._clock()
+            for watch in list(watches):
+                if msg_type not in watch.predicate.types:
+                    continue
+                reason = watch.predicate.update(msg, now)
+                if reason is None:
+                    continue
+                watches.remove(watch)
+                watch.event = ArrivalEvent(vehicle, reason, time.time(), now - watch.started, msg)
+                arrived.append(watch)
+            if not watches:
+                del self._watches[vehicle]
+        for watch in arrived:
+            watch._done.set()
+            self._events.put(watch.event)
+            if watch.callback is not None:
+                watch.callback(watch.event)
+        return [watch.event for watch in arrived]
+
+    def next_event(self, timeout=None):
+        """次の ArrivalEvent（どの機体でも）を待って返す。タイムアウトしたら None。"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def events(self, timeout=None):
+        """待っている watch が無くなるまで、ArrivalEvent を到着した順に返す。
+
+        timeout は全体の秒数。過ぎたら（到着していない機体が残っていても）終わる。
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while len(self) or not self._events.empty():
+            remaining = None if deadline is None else deadline - self._clock()
+            if remaining is not None and remaining <= 0:
+                return
+            event = self.next_event(remaining)
+            if event is None:
+                return
+            yield event
+
+    # ---- VehiclePool との接続 --------------------------------------------------
+
+    def attach(self, pool):
+        """pool（VehiclePool）の全機体のメッセージで判定する（機体名は pool の名前）。
+
+        登録するのは watch() した条件が使うメッセージ種別だけ。判定は pool の受信スレッドで行う。
+        """
+        with self._lock:
+            self._pools.append(pool)
+            types = sorted(self._registered)
+        if types:
+            pool.on(types, self._on_message)
+
+    def _on_message(self, vehicle, msg):
+        # 機体（オートパイロット）のメッセージだけを渡す（GCS・同じ sysid のジンバル等は除く）
+        if (msg.get_srcSystem(), msg.get_srcComponent()) != (vehicle.target_system, vehicle.target_component):
+            return
+        self.feed(vehicle.name, msg)
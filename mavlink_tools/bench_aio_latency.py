@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+受信遅延のベンチマーク: executor + recv_match(timeout=0.1) と aio_mavlink の比較
+
+ループバックの TCP サーバーを SITL の代わりに立て、50〜500 msg/s で TIMESYNC を送る。
+送信時刻(perf_counter_ns)を ts1 に入れておき、イベントループ上で受け取った時刻との差を
+遅延として集計する。
+
+  executor : FastAPI バックエンドと同じ書き方
+             await loop.run_in_executor(None, partial(m.recv_match, blocking=True, timeout=0.1))
+  asyncio  : aio_mavlink.open_connection() + async for msg in conn.messages(...)
+
+使い方:
+    python bench_aio_latency.py
+    python bench_aio_latency.py --rates 50,500 --seconds 5
+"""
+
+import argparse
+import asyncio
+import functools
+import socket
+import statistics
+import threading
+import time
+
+from pymavlink import mavutil
+
+import aio_mavlink
+
+
+class SitlStandIn:
+    """1クライアントだけ受け付け、TIMESYNC を一定レートで送り続ける TCP サーバー。"""
+
+    def __init__(self, rate, count):
+        self.rate = rate
+        self.count = count
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        client, _ = self.server.accept()
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        interval = 1.0 / self.rate
+        started = time.perf_counter()
+        try:
+            for i in range(self.count):
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                msg = mav.timesync_encode(0, time.perf_counter_ns())
+                client.sendall(msg.pack(mav))
+            time.sleep(0.3)
+        except OSError:
+            pass
+        finally:
+            client.close()
+            self.server.close()
+
+
+def summarize(latencies_ns):
+    values = sorted(v / 1e6 for v in latencies_ns)
+    if not values:
+        return 0.0, 0.0, 0.0
+    return (statistics.fmean(values), values[len(values) // 2],
+            values[max(0, int(len(values) * 0.99) - 1)])
+
+
+async def run_executor(rate, count):
+    server = SitlStandIn(rate, count)
+    loop = asyncio.get_running_loop()
+    master = await loop.run_in_executor(None, functools.partial(
+        mavutil.mavlink_connection, "tcp:127.0.0.1:%d" % server.port, retries=0))
+    latencies = []
+    cpu = time.process_time()
+    while len(latencies) < count:
+        msg = await loop.run_in_executor(
+            None, functools.partial(master.recv_match, blocking=True, timeout=0.1))
+        if msg is not None and msg.get_type() == "TIMESYNC":
+            latencies.append(time.perf_counter_ns() - msg.ts1)
+    cpu = time.process_time() - cpu
+    master.close()
+    return latencies, cpu
+
+
+async def run_asyncio(rate, count):
+    server = SitlStandIn(rate, count)
+    conn = await aio_mavlink.open_connection("tcp:127.0.0.1:%d" % server.port)
+    latencies = []
+    cpu = time.process_time()
+    async for msg in conn.messages(types=["TIMESYNC"]):
+        latencies.append(time.perf_counter_ns() - msg.ts1)
+        if len(latencies) >= count:
+            break
+    cpu = time.process_time() - cpu
+    conn.close()
+    return latencies, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="executor + recv_match と aio_mavlink の受信遅延の比較")
+    parser.add_argument("--rates", default="50,100,200,500", help="送信レート[msg/s]（カンマ区切り）")
+    parser.add_argument("--seconds", type=float, default=3.0, help="1計測あたりの送信時間[秒]")
+    args = parser.parse_args()
+
+    print("%8s %-9s %9s %9s %9s %9s" % ("msg/s", "path", "mean ms", "p50 ms", "p99 ms", "CPU s"))
+    for rate in (int(r) for r in args.rates.split(",")):
+        count = int(rate * args.seconds)
+        for name, runner in (("executor", run_executor), ("asyncio", run_asyncio)):
+            latencies, cpu = asyncio.run(runner(rate, count))
+            mean, p50, p99 = summarize(latencies)
+            print("%8d %-9s %9.3f %9.3f %9.3f %9.3f" % (rate, name, mean, p50, p99, cpu))
+
+
+if __name__ == "__main__":
+    main()
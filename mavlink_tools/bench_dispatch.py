@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+受信ループの CPU 時間のベンチマーク: recv_match + if/elif と mav_dispatch の比較
+
+SITL の既定の送信内容に近い合成ストリーム（ATTITUDE / RAW_IMU / VFR_HUD 等が大半）を
+メモリ上の接続から読み、到着判定ループ（multi_vehicles_relay.py の wait_for_arrival）と
+同じ5種類のメッセージだけを処理する。10k メッセージあたりの CPU 時間を比べる。
+
+  recv_match   : master.recv_match(type=[...]) + get_type() の if/elif（今の書き方）
+  parse_buffer : mav.parse_buffer() + get_type() の if/elif（mavlink_reader 等の書き方）
+  dispatcher   : MessageDispatcher.pump()（登録の無いメッセージはデコードしない）
+
+ソケットの代わりにメモリ上のバイト列から読むので、システムコールの分は含まない
+（recv_match は実際には1メッセージあたり数回 recv するので、差はもっと開く）。
+
+使い方:
+    python bench_dispatch.py
+    python bench_dispatch.py --messages 200000
+"""
+
+import argparse
+import time
+
+from pymavlink import mavutil
+
+from mav_dispatch import MessageDispatcher
+
+# wait_for_arrival が見ているメッセージ
+SUBSCRIBED = ["MISSION_ITEM_REACHED", "MISSION_CURRENT", "GLOBAL_POSITION_INT",
+              "STATUSTEXT", "HEARTBEAT"]
+
+
+class MemoryLink(mavutil.mavfile):
+    """バイト列から読む mavutil の接続（recv_match / pump をそのまま使うため）。"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        super().__init__(None, "memory")
+
+    def recv(self, n=None):
+        if n is None:
+            n = self.mav.bytes_needed()
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+    def select(self, timeout):
+        return self.pos < len(self.data)
+
+    def close(self):
+        pass
+
+    @property
+    def done(self):
+        return self.pos >= len(self.data) and not self.mav.buf_len()
+
+
+def synthetic_stream(count):
+    """10Hz / 1Hz / 0.2Hz のメッセージを混ぜたストリーム。(バイト列, メッセージ数) を返す。"""
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    fast = [
+        lambda t: mav.attitude_encode(t, 0.01, 0.02, 1.5, 0, 0, 0),
+        lambda t: mav.raw_imu_encode(t * 1000, 1, 2, -1000, 0, 0, 0, 200, 10, 400),
+        lambda t: mav.scaled_pressure_encode(t, 1013.2, 0.1, 2500),
+        lambda t: mav.vfr_hud_encode(5.0, 5.1, 90, 40, 10.0, 0.2),
+        lambda t: mav.servo_output_raw_encode(t * 1000, 0, 1500, 1500, 1600, 1500, 0, 0, 0, 0),
+        lambda t: mav.rc_channels_encode(t, 16, *([1500] * 18), 255),
+        lambda t: mav.nav_controller_output_encode(0.1, 0.2, 90, 90, 25, 0.1, 0.5, 0.2),
+        lambda t: mav.gps_raw_int_encode(t * 1000, 3, 358792449, 1403394654, 10000, 80, 120, 500, 9000, 12),
+        lambda t: mav.ahrs_encode(0, 0, 0, 0, 0, 0, 0),
+        lambda t: mav.vibration_encode(t * 1000, 0.1, 0.1, 0.1, 0, 0, 0),
+        lambda t: mav.global_position_int_encode(t, 358792449, 1403394654, 10000, 5000, 0, 0, 0, 9000),
+    ]
+    slow = [
+        lambda t: mav.heartbeat_encode(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                       mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                       mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED, 3, 4),
+        lambda t: mav.sys_status_encode(0, 0, 0, 500, 12600, 1000, 90, 0, 0, 0, 0, 0, 0),
+        lambda t: mav.system_time_encode(t * 1000, t),
+        lambda t: mav.power_status_encode(5000, 0, 0),
+        lambda t: mav.meminfo_encode(4096, 65535),
+        lambda t: mav.battery_status_encode(0, 0, 0, 2500, [4200] * 10, 1000, 100, 10, 90),
+        lambda t: mav.mission_current_encode(3),
+        lambda t: mav.ekf_status_report_encode(0x1FF, 0.1, 0.1, 0.1, 0.1, 0.1),
+    ]
+    rare = [
+        lambda t: mav.statustext_encode(6, b"Reached command #3"),
+        lambda t: mav.mission_item_reached_encode(3),
+    ]
+    frames = []
+    tick = 0
+    while len(frames) < count:
+        t = tick * 100
+        frames.extend(make(t).pack(mav) for make in fast)
+        if tick % 10 == 0:
+            frames.extend(make(t).pack(mav) for make in slow)
+        if tick % 50 == 0:
+            frames.extend(make(t).pack(mav) for make in rare)
+        tick += 1
+    frames = frames[:count]
+    return b"".join(frames), len(frames)
+
+
+class ArrivalState:
+    """各方式で同じ処理をさせるための、到着判定ループ相当の状態。"""
+
+    def __init__(self):
+        self.reached = None
+        self.current_seq = None
+        self.position = None
+        self.text = None
+        self.armed = None
+        self.handled = 0
+
+    def on_reached(self, msg):
+        self.handled += 1
+        self.reached = msg.seq
+
+    def on_current(self, msg):
+        self.handled += 1
+        self.current_seq = msg.seq
+
+    def on_position(self, msg):
+        self.handled += 1
+        self.position = (msg.lat / 1e7, msg.lon / 1e7)
+
+    def on_statustext(self, msg):
+        self.handled += 1
+        self.text = msg.text.strip().lower()
+
+    def on_heartbeat(self, msg):
+        self.handled += 1
+        self.armed = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+
+    def handle(self, msg):
+        msg_type = msg.get_type()
+        if msg_type == "MISSION_ITEM_REACHED":
+            self.on_reached(msg)
+        elif msg_type == "MISSION_CURRENT":
+            self.on_current(msg)
+        elif msg_type == "STATUSTEXT":
+            self.on_statustext(msg)
+        elif msg_type == "GLOBAL_POSITION_INT":
+            self.on_position(msg)
+        elif msg_type == "HEARTBEAT":
+            self.on_heartbeat(msg)
+
+
+def run_recv_match(data):
+    state = ArrivalState()
+    master = MemoryLink(data)
+    while not master.done:
+        msg = master.recv_match(type=SUBSCRIBED, blocking=False)
+        if msg is not None:
+            state.handle(msg)
+    return state
+
+
+def run_parse_buffer(data):
+    state = ArrivalState()
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=255, srcComponent=0)
+    for start in range(0, len(data), 4096):
+        for msg in mav.parse_buffer(data[start:start + 4096]) or []:
+            state.handle(msg)
+    return state
+
+
+def run_dispatcher(data):
+    state = ArrivalState()
+    master = MemoryLink(data)
+    dispatcher = MessageDispatcher(master.mav)
+    dispatcher.on("MISSION_ITEM_REACHED", state.on_reached)
+    dispatcher.on("MISSION_CURRENT", state.on_current)
+    dispatcher.on("STATUSTEXT", state.on_statustext)
+    dispatcher.on("GLOBAL_POSITION_INT", state.on_position)
+    dispatcher.on("HEARTBEAT", state.on_heartbeat)
+    while not master.done:
+        dispatcher.pump(master, timeout=0)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recv_match + if/elif と MessageDispatcher の CPU 時間の比較")
+    parser.add_argument("--messages", type=int, default=100000, help="合成ストリームのメッセージ数")
+    args = parser.parse_args()
+
+    data, count = synthetic_stream(args.messages)
+    print("%d メッセージ / %d バイト（購読: %s）" % (count, len(data), ", ".join(SUBSCRIBED)))
+    print("%-13s %12s %14s %10s" % ("方式", "処理した数", "CPU ms/10k", "倍率"))
+    baseline = None
+    for name, runner in (("recv_match", run_recv_match),
+                         ("parse_buffer", run_parse_buffer),
+                         ("dispatcher", run_dispatcher)):
+        cpu = time.process_time()
+        state = runner(data)
+        cpu = time.process_time() - cpu
+        per_10k = cpu * 1000 * 10000 / count
+        baseline = baseline or per_10k
+        print("%-13s %12d %14.1f %9.1fx" % (name, state.handled, per_10k, baseline / per_10k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+FleetIndex のベンチマーク（最寄りの空き機体の検索）
+
+N 台の機体を作業エリアに散らばらせ、毎ステップ全機体の位置を少しずつ動かしながら
+（GLOBAL_POSITION_INT の受信に相当）、ランダムな目標地点に近い k 台を検索する。
+
+  全機体ループ : 毎回全機体の距離を geodesy.distance で計算して並べる
+  NumPy        : 位置の配列から一括で距離を計算して argpartition
+  FleetIndex   : グリッドを外側へ広げて探す
+
+使い方:
+    python bench_fleet_index.py
+    python bench_fleet_index.py --vehicles 10000 --k 5
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import fleet_index
+import geodesy
+
+LAT0, LON0 = 35.80, 139.00
+AREA = 0.2          # 作業エリアの広さ[度]（約 20km 四方）
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FleetIndex の検索時間")
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--cell", type=float, default=fleet_index.DEFAULT_CELL_SIZE)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = ["v%d" % index for index in range(args.vehicles)]
+    lats = [LAT0 + rng.uniform(0, AREA) for _ in names]
+    lons = [LON0 + rng.uniform(0, AREA) for _ in names]
+    fleet = fleet_index.FleetIndex(cell_size=args.cell, max_age=None)     # 計測が長いので古さは見ない
+
+    started = time.perf_counter()
+    for step in range(10):
+        for index, name in enumerate(names):
+            lats[index] += rng.uniform(-1e-4, 1e-4)
+            lons[index] += rng.uniform(-1e-4, 1e-4)
+            fleet.update(name, lats[index], lons[index])
+    update = (time.perf_counter() - started) / (10 * args.vehicles)
+
+    targets = [(LAT0 + rng.uniform(0, AREA), LON0 + rng.uniform(0, AREA)) for _ in range(args.queries)]
+
+    def loop(lat, lon):
+        found = sorted((geodesy.distance(lat, lon, lats[i], lons[i]), names[i]) for i in range(len(names)))
+        return [name for _, name in found[:args.k]]
+
+    lat_array, lon_array = np.array(lats), np.array(lons)
+
+    def vector(lat, lon):
+        distance = geodesy.distance(lat, lon, lat_array, lon_array)
+        index = np.argpartition(distance, args.k)[:args.k]
+        return [names[i] for i in index[np.argsort(distance[index])]]
+
+    def index(lat, lon):
+        return [name for name, _ in fleet.nearest(lat, lon, k=args.k)]
+
+    print("%d 台、k=%d、検索 %d 回（位置の更新 %.1f us/回）"
+          % (args.vehicles, args.k, args.queries, update * 1e6))
+    results = {}
+    for label, func, count in (("全機体ループ", loop, min(args.queries, 200)),
+                               ("NumPy", vector, args.queries),
+                               ("FleetIndex", index, args.queries)):
+        started = time.perf_counter()
+        results[label] = [func(lat, lon) for lat, lon in targets[:count]]
+        elapsed = (time.perf_counter() - started) / count
+        print("  %-12s : %8.1f us/検索" % (label, elapsed * 1e6))
+    # 投影面の距離と haversine の差で、ごくまれに同じくらいの距離の機体の順番が入れ替わる
+    same = sum(a == b for a, b in zip(results["NumPy"], results["FleetIndex"]))
+    print("  NumPy と同じ結果: %d / %d" % (same, args.queries))
+
+
+if __name__ == "__main__":
+    main()
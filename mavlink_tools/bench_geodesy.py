@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+geodesy のベンチマーク（1点ずつの math と NumPy のブロードキャスト）
+
+  ルート長 : N 点の折れ線の長さ（for ループで distance() と path_length()）
+  近接判定 : M 台の全組み合わせ（M x M）の距離で、閾値より近い組を数える
+
+使い方:
+    python bench_geodesy.py
+    python bench_geodesy.py --points 1000000 --vehicles 500
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import geodesy
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="geodesy のループとベクトル化の比較")
+    parser.add_argument("--points", type=int, default=100000, help="ルートの点数")
+    parser.add_argument("--vehicles", type=int, default=200, help="近接判定の機体数")
+    parser.add_argument("--radius", type=float, default=30.0, help="近接とみなす距離[m]")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    lats = 35.87 + np.cumsum(rng.normal(0, 1e-5, args.points))
+    lons = 140.33 + np.cumsum(rng.normal(0, 1e-5, args.points))
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+
+    def route_loop():
+        return sum(geodesy.distance(lat_list[i], lon_list[i], lat_list[i + 1], lon_list[i + 1])
+                   for i in range(len(lat_list) - 1))
+
+    print("ルート長（%d 点）" % args.points)
+    loop, expected = timed(route_loop, args.repeat)
+    print("  ループ          : %8.1f ms" % (loop * 1e3))
+    for name, method in (("haversine", geodesy.distance),
+                         ("平面近似", geodesy.approx_distance),
+                         ("Vincenty", geodesy.geodesic_distance)):
+        elapsed, length = timed(lambda: geodesy.path_length(lats, lons, method), args.repeat)
+        print("  %-15s : %8.1f ms  (x%.0f)  差 %.3f m"
+              % (name, elapsed * 1e3, loop / elapsed, length - expected))
+
+    count = args.vehicles
+    lat = 35.87 + rng.uniform(0, 0.01, count)
+    lon = 140.33 + rng.uniform(0, 0.01, count)
+    lat_list, lon_list = lat.tolist(), lon.tolist()
+
+    def proximity_loop():
+        return sum(1 for i in range(count) for j in range(i + 1, count)
+                   if geodesy.distance(lat_list[i], lon_list[i], lat_list[j], lon_list[j]) < args.radius)
+
+    def proximity_vector():
+        pairwise = geodesy.distance(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        return int(np.count_nonzero(np.triu(pairwise < args.radius, k=1)))
+
+    print("近接判定（%d 台、%d 組）" % (count, count * (count - 1) // 2))
+    loop, expected = timed(proximity_loop, args.repeat)
+    vector, found = timed(proximity_vector, args.repeat)
+    print("  ループ          : %8.1f ms  %d 組" % (loop * 1e3, expected))
+    print("  ブロードキャスト : %8.1f ms  %d 組  (x%.0f)" % (vector * 1e3, found, loop / vector))
+
+
+if __name__ == "__main__":
+    main()
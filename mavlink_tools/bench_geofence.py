@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Geofence のベンチマーク（多数の飛行禁止区域に対する位置の判定）
+
+作業エリア（約 20km 四方の inclusion）に --zones 個の星形の exclusion（頂点 24 個）を置き、
+ランダムな位置を判定する。
+
+  素朴な判定  : 1点ずつ、全区域の全辺でレイキャスティング（Python）
+  breach()    : 1点ずつ、bbox とグリッドで絞ってから判定（テレメトリ受信ごとの判定に相当）
+  check()     : NumPy 配列でまとめて判定（ミッション全体・全機体の位置の一括判定に相当）
+
+使い方:
+    python bench_geofence.py
+    python bench_geofence.py --zones 200 --points 1000000
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import geofence
+
+LAT0, LON0 = 35.75, 139.00
+AREA = 0.2
+
+
+def star(lat, lon, radius, points=12):
+    vertices = []
+    for i in range(points * 2):
+        r = radius if i % 2 == 0 else radius * 0.4
+        angle = math.pi * i / points
+        vertices.append((lat + r * math.cos(angle), lon + r * math.sin(angle)))
+    return vertices
+
+
+def naive_breach(fence, lat, lon):
+    for index, zone in enumerate(fence.zones):
+        inside = False
+        for lat1, lon1, lat2, lon2 in zone._edge_list:
+            if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                inside = not inside
+        if inside != (index < len(fence.inclusions)):
+            return index
+    return -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geofence の判定時間")
+    parser.add_argument("--zones", type=int, default=50, help="飛行禁止区域の数")
+    parser.add_argument("--points", type=int, default=100000, help="まとめて判定する点の数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    area = [(LAT0, LON0), (LAT0 + AREA, LON0), (LAT0 + AREA, LON0 + AREA), (LAT0, LON0 + AREA)]
+    started = time.perf_counter()
+    fence = geofence.Geofence(
+        [geofence.Polygon(area, "area")],
+        [geofence.Polygon(star(LAT0 + rng.uniform(0.01, AREA - 0.01), LON0 + rng.uniform(0.01, AREA - 0.01),
+                               rng.uniform(0.002, 0.01)), "zone%d" % i)
+         for i in range(args.zones)])
+    print("区域 %d 個（頂点 %d 個）の準備: %.1f ms" % (
+        len(fence.zones), sum(len(zone.vertices) for zone in fence.zones), (time.perf_counter() - started) * 1e3))
+
+    lats = LAT0 - 0.01 + rng.uniform(0, AREA + 0.02, args.points)
+    lons = LON0 - 0.01 + rng.uniform(0, AREA + 0.02, args.points)
+    count = min(args.points, 20000)
+    lat_list, lon_list = lats[:count].tolist(), lons[:count].tolist()
+
+    started = time.perf_counter()
+    expected = [naive_breach(fence, lat, lon) for lat, lon in zip(lat_list, lon_list)]
+    naive = (time.perf_counter() - started) / count
+    started = time.perf_counter()
+    names = [fence.breach(lat, lon) for lat, lon in zip(lat_list, lon_list)]
+    scalar = (time.perf_counter() - started) / count
+    started = time.perf_counter()
+    result = fence.check(lats, lons)
+    batch = (time.perf_counter() - started) / args.points
+
+    zone_names = [zone.name for zone in fence.zones]
+    assert [zone_names.index(name) if name else -1 for name in names] == expected
+    assert result[:count].tolist() == expected
+    print("素朴な判定 : %7.2f us/点" % (naive * 1e6))
+    print("breach()   : %7.2f us/点  (x%.0f)" % (scalar * 1e6, naive / scalar))
+    print("check()    : %7.3f us/点  (x%.0f)  %d 点のうち違反 %d 点" % (
+        batch * 1e6, naive / batch, args.points, np.count_nonzero(result >= 0)))
+    print("100 台 x 10Hz のテレメトリの判定に使う CPU: breach() %.2f%%、素朴な判定 %.1f%%" % (
+        scalar * 1000 * 100, naive * 1000 * 100))
+
+
+if __name__ == "__main__":
+    main()
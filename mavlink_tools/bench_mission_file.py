@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+mission_file のベンチマーク（1万件の測量グリッドの読み込み・変換・書き出し）
+
+Mission Planner と同じ書式（\\r\\n、%.8f）の .waypoints を作り、
+  読み込み : 1行ずつ dict を作る読み込み（sequential_control.load_mission_from_file と同じ）と
+             read_waypoints()（検証つき）
+  変換     : dict から1件ずつ MISSION_ITEM_INT を作る場合と to_items()
+  書き出し : 1件ずつ書式を組み立てる場合（routes.export_waypoints と同じ）と write_waypoints()
+  .plan    : write_plan() / read_plan()
+を比較する（それぞれ5回実行して一番速い時間）。
+
+使い方:
+    python bench_mission_file.py
+    python bench_mission_file.py --items 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from pymavlink import mavutil
+
+import mission_file
+
+
+def survey(count, seed):
+    """往復の測量グリッド（seq 0 はホーム）。"""
+    rng = np.random.default_rng(seed)
+    mission = mission_file.empty(count)
+    mission["seq"] = np.arange(count)
+    mission["frame"] = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT
+    mission["command"] = mavutil.mavlink.MAV_CMD_NAV_WAYPOINT
+    mission["autocontinue"] = 1
+    rows = np.arange(count) // 50
+    cols = np.where(rows % 2 == 0, np.arange(count) % 50, 49 - np.arange(count) % 50)
+    mission["x"] = np.round(35.87 + rows * 2e-5 + rng.normal(0, 1e-8, count), 8)
+    mission["y"] = np.round(140.33 + cols * 2e-5, 8)
+    mission["z"] = 30.0
+    mission[0] = (0, 1, 0, 16, 0, 0, 0, 0, 35.87, 140.33, 0, 1)
+    return mission
+
+
+def adhoc_read(path):
+    with open(path, "r") as f:
+        lines = f.readlines()
+    items = []
+    for line in lines[1:]:
+        parts = line.strip().split("\t")
+        if len(parts) < 12:
+            continue
+        items.append({
+            "seq": int(parts[0]), "current": int(parts[1]), "frame": int(parts[2]),
+            "command": int(parts[3]), "param1": float(parts[4]), "param2": float(parts[5]),
+            "param3": float(parts[6]), "param4": float(parts[7]),
+            "x": int(float(parts[8]) * 1e7), "y": int(float(parts[9]) * 1e7), "z": float(parts[10]),
+            "autocontinue": int(parts[11]),
+        })
+    return items
+
+
+def adhoc_items(items):
+    return [mavutil.mavlink.MAVLink_mission_item_int_message(
+        1, 1, item["seq"], item["frame"], item["command"], item["current"], item["autocontinue"],
+        item["param1"], item["param2"], item["param3"], item["param4"], item["x"], item["y"], item["z"])
+        for item in items]
+
+
+def adhoc_write(path, items):
+    lines = ["QGC WPL 110"]
+    for item in items:
+        lines.append("\t".join([
+            str(item.seq), "1" if item.seq == 0 else "0", str(item.frame), str(item.command),
+            "%.8f" % item.param1, "%.8f" % item.param2, "%.8f" % item.param3, "%.8f" % item.param4,
+            "%.8f" % (item.x / 1e7), "%.8f" % (item.y / 1e7), "%.6f" % item.z, str(item.autocontinue),
+        ]))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def timed(func, *args, repeat=5):
+    """repeat 回実行して一番速かった時間[ms]と結果。"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = (time.perf_counter() - started) * 1e3
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ミッションファイルの読み書きの時間")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mission = survey(args.items, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "survey.waypoints")
+        with open(source, "w", newline="\r\n") as f:        # Mission Planner の書式
+            f.write("QGC WPL 110\n")
+            for row in mission.tolist():
+                f.write("%d\t%d\t%d\t%d\t%.8f\t%.8f\t%.8f\t%.8f\t%.8f\t%.8f\t%.6f\t%d\n" % row)
+        print("%d 件（%.0f KB）" % (args.items, os.path.getsize(source) / 1024))
+
+        adhoc, items = timed(adhoc_read, source)
+        fast, loaded = timed(mission_file.read_waypoints, source)
+        assert len(items) == len(loaded) == args.items
+        print("  読み込み  dict        : %7.1f ms" % adhoc)
+        print("            read_waypoints: %5.1f ms  （検証つき、配列 %d KB）" % (fast, loaded.nbytes // 1024))
+
+        adhoc, messages = timed(adhoc_items, items)
+        fast, converted = timed(mission_file.to_items, loaded, 1, 1)
+        assert all(abs(a.x - b.x) <= 1 for a, b in zip(messages, converted))     # int() の切り捨てと四捨五入の差
+        print("  変換      dict → item : %7.1f ms" % adhoc)
+        print("            to_items()  : %7.1f ms" % fast)
+
+        adhoc, _ = timed(adhoc_write, os.path.join(directory, "adhoc.waypoints"), messages)
+        fast, _ = timed(mission_file.write_waypoints, os.path.join(directory, "out.waypoints"), loaded)
+        print("  書き出し  1件ずつ     : %7.1f ms" % adhoc)
+        print("            write_waypoints: %4.1f ms" % fast)
+
+        plan = os.path.join(directory, "out.plan")
+        write, _ = timed(mission_file.write_plan, plan, loaded)
+        read, again = timed(mission_file.read_plan, plan)
+        assert again[1:].tobytes() == loaded[1:].tobytes()
+        print("  .plan     書き出し %.1f ms / 読み込み %.1f ms（往復で値は同じ）" % (write, read))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+ミッション転送のベンチマーク（テレメトリ無線を模擬した仮想時間のシミュレーション）
+
+mission_transfer の状態機械は送受信と切り離されているので、ソケットを使わずに
+「遅延・帯域・パケット損失のあるリンク」と「ArduPilot 相当の機体」を仮想時間で動かして、
+225件のミッション（internet_mission.py 程度）の転送時間を比べる。
+
+  stop-and-wait : 1件ずつ要求し、5秒応答が無ければ再要求（routes.download_mission 相当）
+  engine        : window 件まで同時に要求し、RTT から決めたタイムアウトで再送
+
+リンクの既定値は 57600bps の無線（片道 60ms）。損失率ごとに結果を表示する。
+アップロードは機体が1件ずつ要求する方式なので、窓を広げる余地は無い。
+差が出るのは、要求・アイテムを取りこぼしたときの立ち直りの速さだけ。
+
+使い方:
+    python bench_mission_transfer.py
+    python bench_mission_transfer.py --items 500 --loss 0,0.05,0.1 --latency 0.2
+"""
+
+import argparse
+import heapq
+import random
+
+from pymavlink import mavutil
+
+import mission_transfer
+
+VEHICLE_REREQUEST = 1.0      # 機体が受信中に要求を出し直す間隔[秒]（ArduPilot 相当の想定値）
+GCS = "gcs"
+VEHICLE = "vehicle"
+
+
+class FixedTimeout:
+    """RTT を計測せず、常に同じタイムアウトを使う（従来の書き方の再現）。"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.samples = 0
+
+    def add(self, rtt):
+        pass
+
+
+class Link:
+    """片道遅延・帯域・損失のある双方向リンク。送信は方向ごとに直列化される。"""
+
+    def __init__(self, latency, bitrate, loss, seed):
+        self.latency = latency
+        self.bitrate = bitrate
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.busy_until = {GCS: 0.0, VEHICLE: 0.0}
+        self.events = []
+        self.counter = 0
+        self.packets = 0
+
+    def send(self, now, source, dest, msg):
+        size = len(msg.pack(mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)))
+        start = max(now, self.busy_until[source])
+        self.busy_until[source] = start + size * 10 / self.bitrate    # 8N1: 1バイト10ビット
+        self.packets += 1
+        if self.rng.random() < self.loss:
+            return
+        self.counter += 1
+        heapq.heappush(self.events, (self.busy_until[source] + self.latency, self.counter, dest, msg))
+
+
+class SimVehicle:
+    """ミッションプロトコルだけを実装した ArduPilot 相当の機体。"""
+
+    def __init__(self, mission):
+        self.mission = mission
+        self.mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        self.receiving = None     # [次に要求する seq, 件数, 受信したアイテム, 最後に要求した時刻]
+
+    def _stamp(self, msg):
+        msg.pack(self.mav)        # 送信元(sysid=1)をヘッダに入れる
+        return msg
+
+    def handle(self, msg, now):
+        msg_type = msg.get_type()
+        mavlink = mavutil.mavlink
+        if msg_type == "MISSION_REQUEST_LIST":
+            return [self._stamp(mavlink.MAVLink_mission_count_message(255, 0, len(self.mission)))]
+        if msg_type == "MISSION_REQUEST_INT" and msg.seq < len(self.mission):
+            return [self._stamp(self.mission[msg.seq])]
+        if msg_type == "MISSION_COUNT":
+            self.receiving = [0, msg.count, [], now]
+            return [self._stamp(mavlink.MAVLink_mission_request_int_message(255, 0, 0))]
+        if msg_type == "MISSION_ITEM_INT":
+            if self.receiving is None:
+                return [self._stamp(mavlink.MAVLink_mission_ack_message(255, 0, mavlink.MAV_MISSION_ERROR))]
+            if msg.seq != self.receiving[0]:
+                return [self._stamp(mavlink.MAVLink_mission_ack_message(
+                    255, 0, mavlink.MAV_MISSION_INVALID_SEQUENCE))]
+            self.receiving[2].append(msg)
+            self.receiving[0] += 1
+            self.receiving[3] = now
+            if self.receiving[0] == self.receiving[1]:
+                self.mission = self.receiving[2]
+                self.receiving = None
+                return [self._stamp(mavlink.MAVLink_mission_ack_message(255, 0, mavlink.MAV_MISSION_ACCEPTED))]
+            return [self._stamp(mavlink.MAVLink_mission_request_int_message(255, 0, self.receiving[0]))]
+        return []
+
+    def poll(self, now):
+        if self.receiving is not None and now - self.receiving[3] >= VEHICLE_REREQUEST:
+            self.receiving[3] = now
+            return [self._stamp(mavutil.mavlink.MAVLink_mission_request_int_message(
+                255, 0, self.receiving[0]))]
+        return []
+
+
+def simulate(transfer, vehicle, link, limit=3600.0):
+    """仮想時間で転送を最後まで進め、(所要時間[秒], 送信パケット数) を返す。"""
+    now = 0.0
+    for msg in transfer.start(now):
+        link.send(now, GCS, VEHICLE, msg)
+    while not transfer.done and now < limit:
+        candidates = [limit]
+        if link.events:
+            candidates.append(link.events[0][0])
+        if transfer.next_deadline is not None:
+            candidates.append(transfer.next_deadline)
+        if vehicle.receiving is not None:
+            candidates.append(vehicle.receiving[3] + VEHICLE_REREQUEST)
+        now = max(now, min(candidates) + 1e-9)    # 期限ちょうどで止まらないように少し進める
+        while link.events and link.events[0][0] <= now:
+            _, _, dest, msg = heapq.heappop(link.events)
+            if dest == VEHICLE:
+                for reply in vehicle.handle(msg, now):
+                    link.send(now, VEHICLE, GCS, reply)
+            else:
+                for reply in transfer.handle(msg, now):
+                    link.send(now, GCS, VEHICLE, reply)
+        for msg in transfer.poll(now):
+            link.send(now, GCS, VEHICLE, msg)
+        for msg in vehicle.poll(now):
+            link.send(now, VEHICLE, GCS, msg)
+    if not transfer.done or transfer.error:
+        return None, link.packets
+    return transfer.elapsed, link.packets
+
+
+def survey_mission(count):
+    return [mavutil.mavlink.MAVLink_mission_item_int_message(
+        255, 0, seq, mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+        mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0,
+        358792449 + (seq // 15) * 900, 1403394654 + (seq % 15) * 900, 30.0) for seq in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ミッション転送時間の比較（模擬無線リンク）")
+    parser.add_argument("--items", type=int, default=225, help="ミッションの件数")
+    parser.add_argument("--latency", type=float, default=0.06, help="片道遅延[秒]")
+    parser.add_argument("--bitrate", type=int, default=57600, help="無線の通信速度[bps]")
+    parser.add_argument("--loss", default="0,0.02,0.05,0.1", help="パケット損失率（カンマ区切り）")
+    parser.add_argument("--window", type=int, default=mission_transfer.DEFAULT_WINDOW)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mission = survey_mission(args.items)
+    print("%d 件 / 片道 %.0f ms / %d bps" % (args.items, args.latency * 1000, args.bitrate))
+    print("%-9s %6s %-14s %10s %9s" % ("方向", "損失", "方式", "所要[秒]", "パケット"))
+    for loss in (float(v) for v in args.loss.split(",")):
+        for direction in ("download", "upload"):
+            for name in ("stop-and-wait", "engine"):
+                if name == "engine":
+                    rtt, window = mission_transfer.RttEstimator(), args.window
+                else:
+                    rtt, window = FixedTimeout(5.0), 1
+                if direction == "download":
+                    vehicle = SimVehicle(survey_mission(args.items))
+                    transfer = mission_transfer.MissionDownload(1, 1, window=window, rtt=rtt,
+                                                                max_retries=20)
+                else:
+                    vehicle = SimVehicle([])
+                    transfer = mission_transfer.MissionUpload(1, 1, mission, rtt=rtt, max_retries=20)
+                link = Link(args.latency, args.bitrate, loss, args.seed)
+                elapsed, packets = simulate(transfer, vehicle, link)
+                print("%-9s %5.0f%% %-14s %10s %9d" % (
+                    direction, loss * 100, name,
+                    "失敗" if elapsed is None else "%.1f" % elapsed, packets))
+
+
+if __name__ == "__main__":
+    main()
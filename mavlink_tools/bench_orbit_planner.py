@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+OrbitPlanner のベンチマーク（多数の構造物の点検ミッションの計画）
+
+--structures 個の構造物について、出発地点を変えながら計画し直す。
+
+  poi.py      : plan_structure_orbits（1点ずつ）+ 全アイテムの作成
+  初回        : plan_many()（NumPy でまとめて）+ mission()
+  再計画      : キャッシュから取り出して、新しい出発地点へ並べ替えるだけ（円周だけ / ミッションまで）
+
+使い方:
+    python bench_orbit_planner.py
+    python bench_orbit_planner.py --structures 1000 --points 72
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from pymavlink import mavutil
+
+import orbit_planner
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workshop", "20th", "takao_hokii"))
+import poi  # noqa: E402
+
+
+def poi_mission(spec, cur_lat, cur_lon, points):
+    """poi.py の関数で同じミッションを作る（機体から現在地を読む部分と print を除く）。"""
+    class Master:
+        target_system = target_component = 1
+
+    master = Master()
+    radius = poi.estimate_orbit_radius(spec, 10.0, 5.0)
+    circle = poi.rotate_points_to_closest(
+        poi.make_circle_points(spec.center_lat, spec.center_lon, radius, points), cur_lat, cur_lon)
+    rings = [[(lat, lon, alt) for lat, lon in circle] for alt in poi.plan_vertical_levels(spec)]
+    frame = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+    mission = [poi.make_mission_item_int(master, 0, frame, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF, 1, 1,
+                                         0, 0, 0, 0, int(spec.center_lat * 1e7), int(spec.center_lon * 1e7),
+                                         rings[0][0][2])]
+    for ring in rings:
+        for lat, lon, alt in ring:
+            mission.append(poi.make_mission_item_int(master, len(mission), frame,
+                                                     mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1,
+                                                     0, 2.0, 0, float("nan"), int(lat * 1e7), int(lon * 1e7), alt))
+    return mission
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OrbitPlanner の計画時間")
+    parser.add_argument("--structures", type=int, default=500)
+    parser.add_argument("--points", type=int, default=36, help="1周あたりの点数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    specs = [orbit_planner.StructureSpec(35.8 + rng.uniform(0, 0.1), 139.0 + rng.uniform(0, 0.1),
+                                         rng.uniform(1, 20), rng.uniform(1, 20), 0.0, rng.uniform(5, 30))
+             for _ in range(args.structures)]
+    starts = [(spec.center_lat + rng.uniform(-1e-3, 1e-3), spec.center_lon + rng.uniform(-1e-3, 1e-3))
+              for spec in specs]
+    params = {"n_points_per_ring": args.points, "min_radius_m": 5.0}
+    print("構造物 %d 個、1周 %d 点" % (args.structures, args.points))
+
+    started = time.perf_counter()
+    items = sum(len(poi_mission(spec, lat, lon, args.points)) for spec, (lat, lon) in zip(specs, starts))
+    print("  poi.py              : %8.1f ms  （%d アイテム）" % ((time.perf_counter() - started) * 1e3, items))
+
+    planner = orbit_planner.OrbitPlanner()
+    started = time.perf_counter()
+    plans = planner.plan_many(specs, **params)
+    planned = time.perf_counter() - started
+    for plan, (lat, lon) in zip(plans, starts):
+        plan.mission(lat, lon, 1, 1)
+    print("  初回（計画のみ）    : %8.1f ms" % (planned * 1e3))
+    print("  初回 + ミッション   : %8.1f ms" % ((time.perf_counter() - started) * 1e3))
+
+    starts = [(lat + 5e-4, lon - 5e-4) for lat, lon in starts]
+    started = time.perf_counter()
+    for spec, (lat, lon) in zip(specs, starts):
+        plan = planner.plan(spec, **params)
+        plan.rings(plan.closest_index(lat, lon))
+    print("  再計画（円周）      : %8.1f ms" % ((time.perf_counter() - started) * 1e3))
+    started = time.perf_counter()
+    for plan, (lat, lon) in zip(planner.plan_many(specs, **params), starts):
+        plan.mission(lat, lon, 1, 1)
+    print("  再計画 + ミッション : %8.1f ms  （キャッシュ %d 件ヒット）"
+          % ((time.perf_counter() - started) * 1e3, planner.hits))
+
+
+if __name__ == "__main__":
+    main()
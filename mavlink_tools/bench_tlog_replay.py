@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+tlog リプレイの最大速度ベンチマーク
+
+GLOBAL_POSITION_INT だけの合成 tlog を作り、ReplayServer（--speed 0）から TCP で受信して
+1秒あたりのフレーム数を計測する。目標は 100k msg/s 以上。
+受信側はフレーム長が一定であることを利用してバイト数から数える（デコードの速度は測らない）。
+
+使い方:
+    python bench_tlog_replay.py
+    python bench_tlog_replay.py --messages 1000000
+"""
+
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from pymavlink import mavutil
+
+import tlog_replay
+
+
+def write_synthetic_tlog(path, count):
+    """10Hz の GLOBAL_POSITION_INT を count 件記録した tlog を作る。フレーム長を返す。"""
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    frame_len = 0
+    start = time.time()
+    with tlog_replay.TlogWriter(path) as writer:
+        for i in range(count):
+            msg = mav.global_position_int_encode(
+                i * 100, 358792449 + i % 1000, 1403394654, 10000, 5000, 0, 0, 0, 9000)
+            frame = msg.pack(mav)
+            frame_len = len(frame)
+            writer.write(frame, timestamp=start + i * 0.1)
+    return frame_len
+
+
+def receive_all(port, expected_bytes):
+    sock = socket.create_connection(("127.0.0.1", port))
+    received = 0
+    started = time.perf_counter()
+    while received < expected_bytes:
+        chunk = sock.recv(1 << 20)
+        if not chunk:
+            break
+        received += len(chunk)
+    elapsed = time.perf_counter() - started
+    sock.close()
+    return received, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tlog リプレイ（最大速度）のスループット計測")
+    parser.add_argument("--messages", type=int, default=500000, help="合成 tlog のフレーム数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.tlog")
+        frame_len = write_synthetic_tlog(path, args.messages)
+
+        started = time.perf_counter()
+        tlog = tlog_replay.load(path)
+        load_sec = time.perf_counter() - started
+        print("読み込み: %d フレーム %.2f 秒（%.0f frames/s）"
+              % (len(tlog), load_sec, len(tlog) / load_sec))
+
+        server = tlog_replay.ReplayServer(tlog, speed=0)
+        port = server.serve_tcp("127.0.0.1", 0)
+        received, elapsed = receive_all(port, frame_len * len(tlog))
+        server.stop()
+        frames = received // frame_len
+        rate = frames / elapsed
+        print("TCP 最大速度: %d フレーム %.2f 秒 → %.0f msg/s（%.1f MB/s）%s"
+              % (frames, elapsed, rate, received / elapsed / 1e6,
+                 "OK" if rate >= 100000 else "目標(100k msg/s)未達"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+VehiclePool のベンチマーク（N 台の模擬 SITL）
+
+別プロセスで N 台分の TCP サーバーを動かす。各機体は接続されてから
+0.05〜0.5 秒後（SITL の起動待ち相当）に HEARTBEAT を送り始め、その後は
+ATTITUDE / GLOBAL_POSITION_INT / VFR_HUD 等を合計 --rate msg/s で流し続ける。
+
+  起動時間  : 1台ずつ mavlink_connection + wait_heartbeat する場合と VehiclePool.open() の比較
+  定常状態  : 機体ごとに受信スレッドで recv_match する場合と、VehiclePool（受信スレッド1本）の
+              受信側プロセスの CPU 使用率
+
+使い方:
+    python bench_vehicle_pool.py
+    python bench_vehicle_pool.py --vehicles 100 --rate 50 --seconds 10
+"""
+
+import argparse
+import multiprocessing
+import random
+import selectors
+import socket
+import threading
+import time
+
+from pymavlink import mavutil
+
+import vehicle_pool
+
+BASE_PORT = 27000
+WARMUP = 1.0       # 計測前に、接続中に溜まった分を読み終えるまで待つ[秒]
+
+
+def serve(count, rate, ready, seed):
+    """N 台分の模擬機体（1プロセス・selectors）。"""
+    rng = random.Random(seed)
+    selector = selectors.DefaultSelector()
+    for index in range(count):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", BASE_PORT + index))
+        server.listen(4)
+        server.setblocking(False)
+        selector.register(server, selectors.EVENT_READ, index)
+    ready.set()
+
+    clients = []     # [socket, MAVLink, 送り始める時刻]
+    mav_types = ("ATTITUDE", "GLOBAL_POSITION_INT", "VFR_HUD", "SYS_STATUS")
+    interval = len(mav_types) / rate
+    next_send = time.monotonic()
+    next_beat = time.monotonic()
+    while True:
+        for key, _ in selector.select(0.005):
+            if isinstance(key.data, int):
+                client, _ = key.fileobj.accept()
+                client.setblocking(False)
+                mav = mavutil.mavlink.MAVLink(None, srcSystem=key.data + 1, srcComponent=1)
+                clients.append([client, mav, time.monotonic() + rng.uniform(0.05, 0.5)])
+                selector.register(client, selectors.EVENT_READ, client)
+            else:
+                try:
+                    if not key.fileobj.recv(65536):
+                        raise OSError
+                except OSError:
+                    selector.unregister(key.fileobj)
+                    clients = [c for c in clients if c[0] is not key.fileobj]
+        now = time.monotonic()
+        beat = now >= next_beat
+        send = now >= next_send
+        if not (beat or send):
+            continue
+        if beat:
+            next_beat = now + 1.0
+        if send:
+            next_send = max(next_send + interval, now)     # 遅れても溜めて送らない
+        for client in clients:
+            sock, mav, start = client
+            if now < start:
+                continue
+            frames = []
+            if beat or start >= 0:
+                frames.append(mav.heartbeat_encode(2, 3, 217, 4, 3).pack(mav))
+                client[2] = -1.0                # 最初の HEARTBEAT は送った
+            if send:
+                frames.append(mav.attitude_encode(0, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav))
+                frames.append(mav.global_position_int_encode(
+                    0, 358792449, 1403394654, 100000, 50000, 0, 0, 0, 9000).pack(mav))
+                frames.append(mav.vfr_hud_encode(0, 0, 90, 0, 50, 0).pack(mav))
+                frames.append(mav.sys_status_encode(0, 0, 0, 500, 12600, -1, -1, 0, 0, 0, 0, 0, 0).pack(mav))
+            try:
+                sock.send(b"".join(frames))
+            except OSError:
+                pass
+
+
+def start_server(count, rate, seed):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(count, rate, ready, seed), daemon=True)
+    process.start()
+    ready.wait(10)
+    return process
+
+
+def devices(count):
+    return ["tcp:127.0.0.1:%d" % (BASE_PORT + index) for index in range(count)]
+
+
+def sequential_startup(count):
+    started = time.monotonic()
+    masters = []
+    for device in devices(count):
+        master = mavutil.mavlink_connection(device, retries=0)
+        master.wait_heartbeat(timeout=10)
+        masters.append(master)
+    return time.monotonic() - started, masters
+
+
+def threaded_cpu(masters, seconds):
+    """機体ごとの受信スレッドで recv_match する（dronekit と同じ構成）。"""
+    stop = threading.Event()
+    counts = [0] * len(masters)
+
+    def reader(index, master):
+        while not stop.is_set():
+            if master.recv_match(blocking=True, timeout=0.5) is not None:
+                counts[index] += 1
+
+    threads = [threading.Thread(target=reader, args=(i, m), daemon=True) for i, m in enumerate(masters)]
+    for thread in threads:
+        thread.start()
+    time.sleep(WARMUP)
+    received = sum(counts)
+    cpu = time.process_time()
+    time.sleep(seconds)
+    cpu = time.process_time() - cpu
+    received = sum(counts) - received
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return cpu, received
+
+
+def pool_cpu(pool, seconds):
+    counts = [0]
+
+    def count(vehicle, msg):
+        counts[0] += 1
+
+    pool.on(["ATTITUDE", "GLOBAL_POSITION_INT", "VFR_HUD", "SYS_STATUS"], count)
+    time.sleep(WARMUP)
+    received = counts[0]
+    cpu = time.process_time()
+    time.sleep(seconds)
+    return time.process_time() - cpu, counts[0] - received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VehiclePool の起動時間と CPU 使用率")
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=40.0, help="1台あたりのテレメトリ[msg/s]")
+    parser.add_argument("--seconds", type=float, default=5.0, help="定常状態の計測時間[秒]")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("%d 台 / 1台あたり %.0f msg/s" % (args.vehicles, args.rate))
+
+    server = start_server(args.vehicles, args.rate, args.seed)
+    elapsed, masters = sequential_startup(args.vehicles)
+    print("起動  1台ずつ     : %6.2f 秒" % elapsed)
+    cpu, received = threaded_cpu(masters, args.seconds)
+    print("定常  スレッド%3d本: CPU %5.1f%%  %7.0f msg/s  %5.1f us/msg" % (
+        len(masters), cpu / args.seconds * 100, received / args.seconds, cpu / max(1, received) * 1e6))
+    for master in masters:
+        master.close()
+    server.terminate()
+    server.join()
+
+    server = start_server(args.vehicles, args.rate, args.seed)
+    pool = vehicle_pool.VehiclePool(devices(args.vehicles), gcs_heartbeat=0)
+    started = time.monotonic()
+    report = pool.open(timeout=30)
+    elapsed = time.monotonic() - started
+    failed = [name for name, reason in report.items() if reason]
+    print("起動  VehiclePool : %6.2f 秒%s" % (elapsed, "（失敗 %d 台）" % len(failed) if failed else ""))
+    cpu, received = pool_cpu(pool, args.seconds)
+    print("定常  スレッド  1本: CPU %5.1f%%  %7.0f msg/s  %5.1f us/msg" % (
+        cpu / args.seconds * 100, received / args.seconds, cpu / max(1, received) * 1e6))
+    pool.close()
+    server.terminate()
+    server.join()
+
+
+if __name__ == "__main__":
+    main()
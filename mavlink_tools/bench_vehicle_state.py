@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+vehicle_state のベンチマーク（書く側 1 スレッド・200Hz、読む側 16 スレッド）
+
+書く側は 5ms ごとに位置・姿勢・速度を更新し、読む側は状態を読み続ける。
+  ロック + dict コピー : Lite_mapper の TelemetryData（update() も get() もロックを取り、get() は dict をコピー）
+  StateMirror          : 読む側は mirror.state を読むだけ（ロック・コピー無し）
+を比較し、読み出しの回数・1回の時間と、書く側の更新時間・周期の遅れ（5ms からのずれ）を表示する。
+読む側はスナップショットの値がそろっているか（書き込み途中の値が混ざっていないか）も確かめる。
+
+読む側は既定で 1 スレッドあたり 1000 回/秒（Web の API やブロードキャストの想定）。
+StateMirror で速くなるのは読み出しだけで、書く側の更新時間・周期の遅れはロック方式より大きい。
+--reader-rate 0 にすると休まず読み続けるが、そのときの書く側の遅れは GIL の取り合いで決まる
+（ロックで待つ読む側は GIL を手放すが、StateMirror の読む側は手放さないので、書く側の遅れは
+数百 ms になる。読む側を休ませずに回す使い方には向かない）。
+
+使い方:
+    python bench_vehicle_state.py
+    python bench_vehicle_state.py --readers 32 --seconds 5
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from vehicle_state import StateMirror
+
+# 読み出し時間を測る間隔（READ_SAMPLE 回に1回）
+READ_SAMPLE = 16
+
+
+class LockedTelemetry:
+    """TelemetryData と同じ方式（ロック + dict、get() はコピー）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {"lat": None, "lon": None, "alt": None, "heading": None,
+                      "roll": None, "pitch": None, "yaw": None, "groundspeed": None}
+
+    def update(self, **fields):
+        with self._lock:
+            changed = [key for key, value in fields.items() if self._data.get(key) != value]
+            self._data.update(fields)
+        return changed
+
+    def get(self):
+        with self._lock:
+            return dict(self._data)
+
+
+def run(name, write, read, readers, seconds, rate, reader_rate):
+    stop = threading.Event()
+    counts = [0] * readers
+    read_times = [[] for _ in range(readers)]
+    torn = [0]
+    update_times = []
+    lateness = []
+
+    def writer():
+        period = 1.0 / rate
+        next_time = time.perf_counter()
+        value = 0
+        while not stop.is_set():
+            value += 1
+            started = time.perf_counter()
+            lateness.append(started - next_time)
+            write(value)
+            update_times.append(time.perf_counter() - started)
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def reader(index):
+        count = 0
+        period = 1.0 / reader_rate if reader_rate else 0.0
+        samples = read_times[index]
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            if count % READ_SAMPLE == 0:
+                started = time.perf_counter()
+                lat, lon = read()
+                samples.append(time.perf_counter() - started)
+            else:
+                lat, lon = read()
+            if lat is not None and lon != -lat:
+                torn[0] += 1
+            count += 1
+            if period:
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        counts[index] = count
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    reads = sum(counts)
+    read_us = np.concatenate([np.array(t) for t in read_times]) * 1e6
+    updates = np.array(update_times) * 1e6
+    late = np.array(lateness) * 1e3
+    print("%s" % name)
+    print("  読み出し %10d 回（%.0f 回/秒）  1回の時間 中央値 %.2f µs / 99%% %.2f µs / 最大 %.0f µs"
+          % (reads, reads / seconds, np.median(read_us), np.percentile(read_us, 99), read_us.max()))
+    print("  書き込み %10d 回（%.0f Hz）  更新時間 中央値 %.1f µs / 99%% %.1f µs"
+          % (len(updates), len(updates) / seconds, np.median(updates), np.percentile(updates, 99)))
+    print("  周期の遅れ 中央値 %.2f ms / 99%% %.2f ms / 最大 %.2f ms  不整合 %d 回"
+          % (np.median(late), np.percentile(late, 99), late.max(), torn[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="機体状態の読み書きの競合")
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--rate", type=float, default=200.0, help="書く側の更新レート[Hz]")
+    parser.add_argument("--reader-rate", type=float, default=1000.0,
+                        help="読む側1スレッドの読み出しレート[Hz]（0 なら休まず読み続ける）")
+    args = parser.parse_args()
+    print("書く側 1 スレッド（%.0f Hz）、読む側 %d スレッド（%s）、%.0f 秒" % (
+        args.rate, args.readers, "%.0f Hz" % args.reader_rate if args.reader_rate else "休み無し",
+        args.seconds))
+
+    telemetry = LockedTelemetry()
+
+    def locked_write(value):
+        telemetry.update(lat=float(value), lon=float(-value), alt=30.0, heading=float(value % 360),
+                         roll=0.1, pitch=0.2, yaw=float(value % 360), groundspeed=5.0)
+
+    def locked_read():
+        data = telemetry.get()
+        return data["lat"], data["lon"]
+
+    run("ロック + dict コピー", locked_write, locked_read, args.readers, args.seconds, args.rate, args.reader_rate)
+
+    mirror = StateMirror()
+
+    def mirror_write(value):
+        mirror.update(lat=float(value), lon=float(-value), alt=30.0, heading=float(value % 360),
+                      roll=0.1, pitch=0.2, yaw=float(value % 360), groundspeed=5.0)
+
+    def mirror_read():
+        state = mirror.state
+        return state.lat, state.lon
+
+    run("StateMirror", mirror_write, mirror_read, args.readers, args.seconds, args.rate, args.reader_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+コマンドの送信と COMMAND_ACK の突き合わせ（複数のコマンドを同時に待つ）
+
+コマンドの ACK 待ちは
+  - Lite_mapper/drone_control.py の _wait_command_ack
+  - autopilot_demo.py の wait_command_ack
+  - multi_vehicles_relay.py の start_mission
+のように recv_match(type="COMMAND_ACK") のループで書かれていて、待っている間に届いた
+他のメッセージ（位置・HEARTBEAT 等）はすべて捨てられる。ACK を取りこぼすと再送もしない。
+kazushi-yoshida の DroneManager._acks はコマンドID → 結果の dict で ACK を取っておくが、
+同じコマンドの古い ACK と区別できず、IN_PROGRESS も扱わない。
+
+CommandSender は
+  - COMMAND_LONG / COMMAND_INT を送ると、すぐに CommandFuture（concurrent.futures.Future）を返す
+  - 受信側（VehiclePool の受信スレッドや mavutil の message_hooks）から渡された COMMAND_ACK を
+    コマンドID と送信元（target_system / target_component）で、応答待ちのコマンドと突き合わせる。
+    他のメッセージには触らないので、テレメトリの受信は止まらない
+  - MAV_RESULT_IN_PROGRESS は途中経過として future.progress を更新し、最終結果の ACK を待つ
+    （その間は再送しない。progress_timeout 秒で打ち切る）
+  - ACK が来なければ、confirmation を1つ増やして再送する（COMMAND_LONG のみ。COMMAND_INT には
+    confirmation が無いのでそのまま送り直す）。タイムアウトは mission_transfer.RttEstimator で
+    実測した往復時間から決める
+  - 対象とコマンドIDが違うコマンドは同時に応答待ちにできる。同じ対象・同じコマンドIDのものは
+    ACK で区別できないので、前のものの結果が出てから送る
+ACK（拒否も含む）が来たら future の結果は CommandAck、再送しても来なければ CommandError。
+
+使い方:
+    commands = CommandSender.for_vehicle(pool, "copter")     # VehiclePool の受信スレッドで ACK を受け取る
+    # または mavutil の接続: CommandSender.for_master(master)（recv_match 等で受信している間に ACK を拾う）
+
+    arm = commands.command_long(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM, [1])
+    rate = commands.command_long(mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, [33, 100000])
+    calib = commands.command_long(mavutil.mavlink.MAV_CMD_PREFLIGHT_CALIBRATION, [0, 0, 0, 0, 1])
+    calib.add_progress_callback(lambda future, progress: print("calibration", progress))
+    print(arm.result(timeout=5).name)                        # MAV_RESULT_ACCEPTED 等
+    commands.close()
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from pymavlink import mavutil
+
+from mission_transfer import RttEstimator
+
+DEFAULT_RETRIES = 5            # 1つのコマンドを送る回数の上限（初回を含む）
+
+# IN_PROGRESS の後、次の ACK（途中経過・最終結果）を待つ時間[秒]
+DEFAULT_PROGRESS_TIMEOUT = 30.0
+
+
+class CommandError(RuntimeError):
+    """コマンドの ACK が来なかった（再送しても応答が無い・CommandSender を閉じた）。"""
+
+
+def result_name(result):
+    entry = mavutil.mavlink.enums["MAV_RESULT"].get(result)
+    return entry.name if entry else str(result)
+
+
+class CommandAck:
+    """コマンドの最終結果。"""
+
+    def __init__(self, command, result, progress, result_param2, attempts, elapsed):
+        self.command = command
+        self.result = result
+        self.progress = progress               # 最後の IN_PROGRESS の進捗（無ければ None）
+        self.result_param2 = result_param2     # MAVLink2 の COMMAND_ACK のみ
+        self.attempts = attempts               # 送った回数
+        self.elapsed = elapsed                 # 最初の送信から結果までの時間[秒]
+
+    def __repr__(self):
+        return "<CommandAck %d %s try=%d %.3fs>" % (self.command, self.name, self.attempts, self.elapsed)
+
+    @property
+    def name(self):
+        return result_name(self.result)
+
+    @property
+    def ok(self):
+        return self.result == mavutil.mavlink.MAV_RESULT_ACCEPTED
+
+
+class CommandFuture(Future):
+    """1つのコマンドの結果（CommandAck）。IN_PROGRESS の途中経過も受け取れる。"""
+
+    def __init__(self, command):
+        super().__init__()
+        self.command = command
+        self.progress = None
+        self.attempts = 0
+        self._progress_callbacks = []
+
+    def add_progress_callback(self, callback):
+        """IN_PROGRESS の ACK が届くたびに callback(future, progress) を呼ぶ（受信スレッドから）。"""
+        self._progress_callbacks.append(callback)
+
+    def _set_progress(self, progress):
+        self.progress = progress
+        for callback in self._progress_callbacks:
+            callback(self, progress)
+
+
+class _Pending:
+    def __init__(self, future, msg, key):
+        self.future = future
+        self.msg = msg
+        self.key = key                 # (target_system, target_component, command)
+        self.first_sent = None
+        self.deadline = None
+        self.in_progress = False
+
+
+class CommandSender:
+    """コマンドを送って CommandFuture を返し、handle() に渡された COMMAND_ACK で結果を決める。
+
+    send は msg を送る関数（VehiclePool の vehicle.send、mavutil の master.mav.send 等）。
+    target_system / target_component は command_long() / command_int() で省略したときの宛先。
+    """
+
+    def __init__(self, send, target_system=1, target_component=1, rtt=None, retries=DEFAULT_RETRIES,
+                 progress_timeout=DEFAULT_PROGRESS_TIMEOUT):
+        self._send = send
+        self.target_system = target_system
+        self.target_component = target_component
+        self.rtt = rtt or RttEstimator()
+        self.retries = retries
+        self.progress_timeout = progress_timeout
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._in_flight = {}           # (target_system, target_component, command) → _Pending
+        self._queued = {}              # 同じキーで前のコマンドの結果を待っているもの → [_Pending, ...]
+        self._deadlines = []           # (期限, 番号, _Pending) のヒープ
+        self._order = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="CommandSender", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_master(cls, master, **options):
+        """mavutil の接続 master から作る。ACK は message_hooks で受け取る。
+
+        master で recv_match 等の受信を続けていれば、その途中で ACK を拾う
+        （どのメッセージを待っていても、COMMAND_ACK は捨てられずにこちらへ来る）。
+        """
+        lock = threading.Lock()
+
+        def send(msg):
+            with lock:
+                master.mav.send(msg)
+
+        sender = cls(send, master.target_system, master.target_component, **options)
+        master.message_hooks.append(lambda master, msg: sender.handle(msg))
+        return sender
+
+    @classmethod
+    def for_vehicle(cls, pool, name, **options):
+        """VehiclePool の機体 name に送る。ACK は pool の受信スレッドで受け取る。"""
+        vehicle = pool[name]
+        sender = cls(vehicle.send, vehicle.target_system, vehicle.target_component, **options)
+
+        def on_ack(source, msg):
+            if source is vehicle:
+                sender.handle(msg)
+
+        pool.on("COMMAND_ACK", on_ack)
+        return sender
+
+    def __len__(self):
+        """結果が出ていないコマンドの数（順番待ちを含む）。"""
+        with self._lock:
+            return len(self._in_flight) + sum(len(queued) for queued in self._queued.values())
+
+    # ---- 送信 ------------------------------------------------------------
+
+    def command_long(self, command, params=(), target_system=None, target_component=None):
+        """COMMAND_LONG を送って CommandFuture を返す。params は param1〜7（足りない分は 0）。"""
+        params = _params(params, 7)
+        target_system, target_component = self._target(target_system, target_component)
+        msg = mavutil.mavlink.MAVLink_command_long_message(
+            target_system, target_component, command, 0, *params)
+        return self._submit(msg, (target_system, target_component, command))
+
+    def command_int(self, command, params=(), x=0, y=0, z=0.0, frame=None,
+                    target_system=None, target_component=None):
+        """COMMAND_INT を送って CommandFuture を返す。params は param1〜4、x / y は緯度経度×1e7。"""
+        params = _params(params, 4)
+        target_system, target_component = self._target(target_system, target_component)
+        if frame is None:
+            frame = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+        msg = mavutil.mavlink.MAVLink_command_int_message(
+            target_system, target_component, frame, command, 0, 0, *params, int(x), int(y), z)
+        return self._submit(msg, (target_system, target_component, command))
+
+    def _target(self, target_system, target_component):
+        return (self.target_system if target_system is None else target_system,
+                self.target_component if target_component is None else target_component)
+
+    def _submit(self, msg, key):
+        future = CommandFuture(msg.command)
+        future.set_running_or_notify_cancel()      # 送った後は取り消せない
+        pending = _Pending(future, msg, key)
+        with self._lock:
+            if self._closed:
+                raise CommandError("CommandSender は閉じています")
+            if key in self._in_flight:
+                self._queued.setdefault(key, []).append(pending)
+                return future
+            self._in_flight[key] = pending
+            self._transmit(pending, time.monotonic())
+        return future
+
+    def _transmit(self, pending, now):
+        """pending を送り、再送の期限を決める（ロックの中で呼ぶ）。"""
+        msg = pending.msg
+        if pending.future.attempts and "confirmation" in msg.fieldnames:
+            msg.confirmation = min(pending.future.attempts, 255)
+        pending.future.attempts += 1
+        pending.first_sent = pending.first_sent or now
+        self._schedule(pending, now + self.rtt.timeout)
+        self._send(msg)
+
+    def _schedule(self, pending, deadline):
+        pending.deadline = deadline
+        heapq.heappush(self._deadlines, (deadline, next(self._order), pending))
+        self._wakeup.notify()
+
+    # ---- 受信 ------------------------------------------------------------
+
+    def handle(self, msg):
+        """受信したメッセージを渡す（COMMAND_ACK 以外は何もしない）。"""
+        if msg.get_type() != "COMMAND_ACK":
+            return
+        now = time.monotonic()
+        src_system, src_component = msg.get_srcSystem(), msg.get_srcComponent()
+        progress = None
+        with self._lock:
+            pending = self._match(msg.command, src_system, src_component)
+            if pending is None:
+                return                              # 結果が出た後の重複した ACK 等
+            if pending.future.attempts == 1 and not pending.in_progress:
+                self.rtt.add(now - pending.first_sent)   # 再送したものは RTT に使わない
+            if msg.result == mavutil.mavlink.MAV_RESULT_IN_PROGRESS:
+                pending.in_progress = True
+                progress = getattr(msg, "progress", None)
+                self._schedule(pending, now + self.progress_timeout)
+            else:
+                ack = CommandAck(msg.command, msg.result, pending.future.progress,
+                                 getattr(msg, "result_param2", None), pending.future.attempts,
+                                 now - pending.first_sent)
+                self._finish(pending, now)
+        if pending.in_progress and msg.result == mavutil.mavlink.MAV_RESULT_IN_PROGRESS:
+            pending.future._set_progress(progress)
+        else:
+            pending.future.set_result(ack)
+
+    def _match(self, command, src_system, src_component):
+        for key, pending in self._in_flight.items():
+            target_system, target_component, pending_command = key
+            if pending_command != command:
+                continue
+            if target_system not in (0, src_system):
+                continue
+            if target_component not in (0, src_component):
+                continue
+            return pending
+        return None
+
+    def _finish(self, pending, now):
+        """pending を応答待ちから外し、同じキーの次のコマンドを送る（ロックの中で呼ぶ）。"""
+        pending.deadline = None
+        del self._in_flight[pending.key]
+        queued = self._queued.get(pending.key)
+        if queued:
+            following = queued.pop(0)
+            if not queued:
+                del self._queued[pending.key]
+            self._in_flight[pending.key] = following
+            self._transmit(following, now)
+
+    # ---- 再送 ------------------------------------------------------------
+
+    def _run(self):
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                while self._deadlines and (self._deadlines[0][0] <= now
+                                           or self._deadlines[0][2].deadline != self._deadlines[0][0]):
+                    deadline, _, pending = heapq.heappop(self._deadlines)
+                    if pending.deadline != deadline:
+                        continue                    # 結果が出た・期限が延びた
+                    self._expire(pending, now)
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                self._wakeup.wait(timeout)
+
+    def _expire(self, pending, now):
+        if not pending.in_progress and pending.future.attempts < self.retries:
+            self._transmit(pending, now)
+            return
+        if pending.in_progress:
+            error = CommandError("コマンド %d が IN_PROGRESS のまま %.0f 秒応答がありません"
+                                 % (pending.msg.command, self.progress_timeout))
+        else:
+            error = CommandError("コマンド %d の ACK がありません（%d 回送信）"
+                                 % (pending.msg.command, pending.future.attempts))
+        self._finish(pending, now)
+        # ロックを持ったまま future のコールバックを呼ばないよう、別スレッドで結果を入れる
+        threading.Thread(target=pending.future.set_exception, args=(error,), daemon=True).start()
+
+    def close(self):
+        """再送のスレッドを止め、結果の出ていないコマンドを CommandError にする。"""
+        with self._lock:
+            self._closed = True
+            pending = list(self._in_flight.values())
+            pending += [p for queued in self._queued.values() for p in queued]
+            self._in_flight.clear()
+            self._queued.clear()
+            self._deadlines.clear()
+            self._wakeup.notify()
+        self._thread.join(2)
+        for item in pending:
+            item.future.set_exception(CommandError("CommandSender を閉じました"))
+
+
+def _params(params, count):
+    params = [float(p) for p in params]
+    if len(params) > count:
+        raise ValueError("パラメータは %d 個までです" % count)
+    return params + [0.0] * (count - len(params))
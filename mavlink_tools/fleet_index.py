@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+機体位置の空間インデックス（最寄りの空き機体の検索）
+
+course2_example_d2.py のように、ゴールに一番近い機体を選ぶたびに全機体へ
+connect(wait_ready=True) して位置を読み、距離を全部計算して np.argmin する方法は、
+機体数に比例して遅くなる（接続だけで 1台数秒）。
+
+FleetIndex は機体の最新位置を一様グリッド（セル一辺 cell_size[m]）に入れておき、
+GLOBAL_POSITION_INT を受信するたびにその機体だけを更新する（セルを移るときだけ付け替え）。
+検索は目標地点のセルから外側へ1周ずつ広げ、見つかった k 台より近い機体が
+もう無いと分かった時点で止める。セルより広がった範囲に機体が少ないときは全機体を直接調べる。
+
+  - 位置は最初に登録した機体の緯度を基準にした正距円筒図法で平面に投影する。
+    距離は投影面上の直線距離[m]で、基準緯度から南北 10km で誤差 0.1% 程度
+    （作業エリア内の配車用。経度 ±180 度をまたぐ範囲は扱わない）
+  - 検索の対象は「空き」（reserve していない、available=False にしていない）で、
+    位置が max_age 秒以内に更新された機体
+  - すべての操作は1つのロックで守る（VehiclePool の受信スレッドから更新し、
+    別のスレッドから検索できる）
+
+使い方:
+    pool = VehiclePool({...})
+    pool.open()
+    fleet = FleetIndex()
+    fleet.attach(pool)                       # GLOBAL_POSITION_INT で位置を更新する
+
+    fleet.nearest(35.806627, 139.085252, k=3)    # [("copter3", 812.4), ...]
+    name = fleet.dispatch(35.806627, 139.085252) # 最寄りの空き機体を確保して返す
+    ...
+    fleet.release(name)                      # 任務が終わったら空きに戻す
+"""
+
+import math
+import threading
+import time
+
+from geodesy import EARTH_RADIUS
+
+# グリッドのセルの一辺[m]
+DEFAULT_CELL_SIZE = 500.0
+
+# この秒数より古い位置の機体は検索しない（リンク断・受信停止）
+DEFAULT_MAX_AGE = 5.0
+
+
+class _Entry:
+    __slots__ = ("name", "lat", "lon", "alt", "x", "y", "cell", "updated", "available", "reserved")
+
+    def __init__(self, name):
+        self.name = name
+        self.lat = self.lon = self.alt = None
+        self.x = self.y = 0.0
+        self.cell = None
+        self.updated = None
+        self.available = True
+        self.reserved = False
+
+
+class FleetIndex:
+    """機体名 → 最新位置の空間インデックス。"""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, max_age=DEFAULT_MAX_AGE, clock=time.monotonic):
+        self.cell_size = float(cell_size)
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}             # 機体名 → _Entry
+        self._cells = {}               # (ix, iy) → {機体名: _Entry}
+        self._scale_x = None           # 経度[度] → x[m]（基準緯度で決まる）
+        self._scale_y = math.radians(1.0) * EARTH_RADIUS
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    # ---- 投影 ------------------------------------------------------------
+
+    def _project(self, lat, lon):
+        if self._scale_x is None:
+            self._scale_x = self._scale_y * math.cos(math.radians(lat))
+        return lon * self._scale_x, lat * self._scale_y
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    # ---- 更新 ------------------------------------------------------------
+
+    def update(self, name, lat, lon, alt=None, timestamp=None):
+        """機体 name の位置を更新する（初めての機体なら登録する）。"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._entries[name] = _Entry(name)
+            x, y = self._project(lat, lon)
+            cell = self._cell(x, y)
+            if cell != entry.cell:
+                if entry.cell is not None:
+                    self._unlink(entry)
+                self._cells.setdefault(cell, {})[name] = entry
+                entry.cell = cell
+            entry.lat, entry.lon, entry.alt = lat, lon, alt
+            entry.x, entry.y = x, y
+            entry.updated = self._clock() if timestamp is None else timestamp
+
+    def remove(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._unlink(entry)
+
+    def _unlink(self, entry):
+        members = self._cells[entry.cell]
+        del members[entry.name]
+        if not members:
+            del self._cells[entry.cell]
+
+    def set_available(self, name, available):
+        """機体を検索の対象にする / しない（整備中・バッテリー交換中等）。"""
+        with self._lock:
+            self._entries[name].available = bool(available)
+
+    def position(self, name):
+        """(lat, lon, alt, 更新からの経過秒) を返す。"""
+        with self._lock:
+            entry = self._entries[name]
+            return entry.lat, entry.lon, entry.alt, self._clock() - entry.updated
+
+    # ---- 検索 ------------------------------------------------------------
+
+    def nearest(self, lat, lon, k=1, max_distance=None, available_only=True, accept=None):
+        """(lat, lon) に近い順に最大 k 台の [(機体名, 距離[m]), ...] を返す。
+
+        available_only が True なら空き機体だけ、accept(name) を渡せばさらにそれで絞る。
+        max_distance[m] より遠い機体は返さない。
+        """
+        with self._lock:
+            return self._nearest(lat, lon, k, max_distance, available_only, accept)
+
+    def dispatch(self, lat, lon, max_distance=None, accept=None):
+        """(lat, lon) に最も近い空き機体を確保して（reserve）名前を返す。無ければ None。
+
+        検索と確保を1つのロックの中で行うので、同時に呼んでも同じ機体を2回返さない。
+        """
+        with self._lock:
+            found = self._nearest(lat, lon, 1, max_distance, True, accept)
+            if not found:
+                return None
+            name = found[0][0]
+            self._entries[name].reserved = True
+            return name
+
+    def reserve(self, name):
+        with self._lock:
+            self._entries[name].reserved = True
+
+    def release(self, name):
+        """dispatch() / reserve() で確保した機体を空きに戻す。"""
+        with self._lock:
+            self._entries[name].reserved = False
+
+    def _nearest(self, lat, lon, k, max_distance, available_only, accept):
+        if not self._entries or k <= 0:
+            return []
+        now = self._clock()
+        x, y = self._project(lat, lon)
+        cx, cy = self._cell(x, y)
+        limit = math.inf if max_distance is None else max_distance
+        found = []                         # (距離, 機体名)
+
+        def scan(entries):
+            for entry in entries:
+                if available_only and (entry.reserved or not entry.available):
+                    continue
+                if self.max_age is not None and now - entry.updated > self.max_age:
+                    continue
+                if accept is not None and not accept(entry.name):
+                    continue
+                d = math.hypot(entry.x - x, entry.y - y)
+                if d <= limit:
+                    found.append((d, entry.name))
+
+        ring = 0
+        while True:
+            # 1周分のセル数が埋まっているセル数より多くなったら、全機体を直接調べる方が速い
+            if 8 * ring > len(self._cells):
+                found = []
+                scan(self._entries.values())
+                break
+            if ring == 0:
+                cells = [(cx, cy)]
+            else:
+                cells = [(cx + dx, cy + dy)
+                         for dx in range(-ring, ring + 1)
+                         for dy in (-ring, ring)]
+                cells += [(cx + dx, cy + dy)
+                          for dx in (-ring, ring)
+                          for dy in range(-ring + 1, ring)]
+            for cell in cells:
+                members = self._cells.get(cell)
+                if members:
+                    scan(members.values())
+            # 次の周のセルにある機体は ring * cell_size より遠い
+            reach = ring * self.cell_size
+            if reach >= limit:
+                break
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= reach:
+                    break
+            ring += 1
+        found.sort()
+        return [(name, d) for d, name in found[:k]]
+
+    # ---- VehiclePool との接続 --------------------------------------------------
+
+    def attach(self, pool, msg_type="GLOBAL_POSITION_INT"):
+        """pool（VehiclePool）の全機体の GLOBAL_POSITION_INT で位置を更新する。
+
+        機体名は pool の名前を使う。GPS が測位する前（緯度経度とも 0）の位置は無視する。
+        """
+        def on_position(vehicle, msg):
+            if msg.lat == 0 and msg.lon == 0:
+                return
+            self.update(vehicle.name, msg.lat * 1e-7, msg.lon * 1e-7, msg.relative_alt * 1e-3)
+
+        return pool.on(msg_type, on_position)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+測地計算（距離・方位・移動先・ENU ⇔ 緯度経度）
+
+距離や方位の計算は、スクリプトごとに少しずつ違う形で書かれている
+（get_distance_metres / initial_bearing / haversine / approx_dist_m / haversine_m 等）。
+しかも1点ずつ math で計算するので、機体全体の近接チェックやルート長の計算が
+Python のループになる。
+
+このモジュールの関数は、引数にスカラーを渡せばスカラーを、NumPy 配列（やリスト）を渡せば
+ブロードキャストして配列を返す。スカラーだけのときは NumPy を通さずに math で計算する
+（1点だけの計算では NumPy の呼び出しの方が重いため）。
+
+  distance(lat1, lon1, lat2, lon2)            球面（haversine）の距離[m]
+  approx_distance(lat1, lon1, lat2, lon2)     平面近似（正距円筒）の距離[m]。数 km までの到着判定用
+  geodesic_distance(lat1, lon1, lat2, lon2)   WGS84 楕円体上の距離[m]（Vincenty 法、誤差 1mm 未満）
+  bearing(lat1, lon1, lat2, lon2)             初期方位[度]（北=0、時計回り、0〜360）
+  destination(lat, lon, bearing, distance)    方位・距離だけ進んだ地点 (lat, lon)
+  path_length(lats, lons)                     折れ線（ルート）の長さ[m]
+  lla_to_enu / enu_to_lla                     基準点まわりの ENU（東・北・上[m]）⇔ 緯度経度高度（WGS84）
+  lla_to_ecef / ecef_to_lla                   緯度経度高度（WGS84）⇔ ECEF[m]
+
+角度はすべて度、距離・高度はメートル（高度は楕円体高）。
+"""
+
+import math
+
+import numpy as np
+
+# WGS84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# 球面近似に使う地球の平均半径[m]（IUGG）
+EARTH_RADIUS = 6371008.8
+
+# Vincenty 法の反復の上限と収束判定
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+
+def _is_scalar(*values):
+    return all(isinstance(value, (int, float)) for value in values)
+
+
+def _result(value):
+    """0次元の配列・NumPy のスカラーは Python の float にする。"""
+    if isinstance(value, np.generic) or (isinstance(value, np.ndarray) and value.ndim == 0):
+        return value.item()
+    return value
+
+
+# ---- 球面・平面近似 ------------------------------------------------------
+
+def distance(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS):
+    """2点間の大円距離[m]（haversine）。楕円体との差は最大 0.5% 程度。"""
+    if _is_scalar(lat1, lon1, lat2, lon2):
+        phi1 = math.radians(lat1)
+        phi2 = math.radians(lat2)
+        a = (math.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+        return 2 * radius * math.asin(math.sqrt(min(1.0, a)))
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.subtract(lon2, lon1)) / 2) ** 2)
+    return _result(2 * radius * np.arcsin(np.sqrt(np.minimum(1.0, a))))
+
+
+def approx_distance(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS):
+    """平面近似（正距円筒図法）の距離[m]。数 km 以内なら haversine との差は 1mm 程度。"""
+    if _is_scalar(lat1, lon1, lat2, lon2):
+        x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+        y = math.radians(lat2 - lat1)
+        return radius * math.hypot(x, y)
+    x = np.radians(np.subtract(lon2, lon1)) * np.cos(np.radians(np.add(lat1, lat2) / 2))
+    y = np.radians(np.subtract(lat2, lat1))
+    return _result(radius * np.hypot(x, y))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """地点1から地点2への初期方位[度]（北=0、東=90、0以上360未満）。"""
+    if _is_scalar(lat1, lon1, lat2, lon2):
+        phi1 = math.radians(lat1)
+        phi2 = math.radians(lat2)
+        dlon = math.radians(lon2 - lon1)
+        y = math.sin(dlon) * math.cos(phi2)
+        x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlon)
+        return math.degrees(math.atan2(y, x)) % 360.0
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dlon = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(dlon) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlon)
+    return _result(np.degrees(np.arctan2(y, x)) % 360.0)
+
+
+def destination(lat, lon, bearing_deg, distance_m, radius=EARTH_RADIUS):
+    """(lat, lon) から方位 bearing_deg[度] へ distance_m[m] 進んだ地点 (lat, lon)（球面）。"""
+    if _is_scalar(lat, lon, bearing_deg, distance_m):
+        phi1 = math.radians(lat)
+        theta = math.radians(bearing_deg)
+        delta = distance_m / radius
+        sin_phi2 = (math.sin(phi1) * math.cos(delta)
+                    + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+        phi2 = math.asin(max(-1.0, min(1.0, sin_phi2)))
+        lam = math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                         math.cos(delta) - math.sin(phi1) * sin_phi2)
+        return math.degrees(phi2), (lon + math.degrees(lam) + 540.0) % 360.0 - 180.0
+    phi1 = np.radians(lat)
+    theta = np.radians(bearing_deg)
+    delta = np.divide(distance_m, radius)
+    sin_phi2 = np.sin(phi1) * np.cos(delta) + np.cos(phi1) * np.sin(delta) * np.cos(theta)
+    phi2 = np.arcsin(np.clip(sin_phi2, -1.0, 1.0))
+    lam = np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(phi1),
+                     np.cos(delta) - np.sin(phi1) * sin_phi2)
+    return (_result(np.degrees(phi2)),
+            _result((np.add(lon, np.degrees(lam)) + 540.0) % 360.0 - 180.0))
+
+
+def path_length(lats, lons, method=distance):
+    """緯度・経度の列を順に結んだ折れ線の長さ[m]。"""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if lats.size < 2:
+        return 0.0
+    return float(np.sum(method(lats[:-1], lons[:-1], lats[1:], lons[1:])))
+
+
+# ---- WGS84 楕円体 -------------------------------------------------------
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """WGS84 楕円体上の2点間の距離[m]（Vincenty の逆問題）。
+
+    対蹠点に近い（ほぼ地球の反対側の）組み合わせは収束しないので NaN を返す。
+    """
+    scalar = _is_scalar(lat1, lon1, lat2, lon2)
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=float)
+                                                   for v in (lat1, lon1, lat2, lon2)))
+    f = WGS84_F
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    big_l = np.radians(lon2 - lon1)
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    for _ in range(VINCENTY_ITERATIONS):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # 赤道上の線（cos2_alpha = 0）では cos_2sigma_m = 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0,
+                                    cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = big_l + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lam - lam_prev) < VINCENTY_TOLERANCE
+        if converged.all():
+            break
+
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    s = WGS84_B * big_a * (sigma - delta_sigma)
+    s = np.where(converged, s, np.nan)
+    return float(s) if scalar else s
+
+
+def lla_to_ecef(lat, lon, alt=0.0):
+    """緯度経度・楕円体高 → ECEF (x, y, z)[m]。"""
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    sin_phi = np.sin(phi)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_phi ** 2)
+    x = (n + alt) * np.cos(phi) * np.cos(lam)
+    y = (n + alt) * np.cos(phi) * np.sin(lam)
+    z = (n * (1 - WGS84_E2) + alt) * sin_phi
+    return _result(x), _result(y), _result(z)
+
+
+def ecef_to_lla(x, y, z):
+    """ECEF (x, y, z)[m] → 緯度経度・楕円体高（Bowring の式 + 1回の補正、誤差 1mm 未満）。"""
+    x, y, z = (np.asarray(v, dtype=float) for v in (x, y, z))
+    ep2 = (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    p = np.hypot(x, y)
+    lam = np.arctan2(y, x)
+    beta = np.arctan2(WGS84_A * z, WGS84_B * p)
+    for _ in range(2):
+        phi = np.arctan2(z + ep2 * WGS84_B * np.sin(beta) ** 3,
+                         p - WGS84_E2 * WGS84_A * np.cos(beta) ** 3)
+        beta = np.arctan((1 - WGS84_F) * np.tan(phi))
+    sin_phi = np.sin(phi)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_phi ** 2)
+    # 極付近は p / cos(phi) が不安定なので z から求める
+    alt = np.where(np.abs(np.cos(phi)) > 1e-3,
+                   p / np.cos(phi) - n,
+                   z / sin_phi - n * (1 - WGS84_E2))
+    return _result(np.degrees(phi)), _result(np.degrees(lam)), _result(alt)
+
+
+def _enu_rotation(lat0, lon0):
+    phi = math.radians(lat0)
+    lam = math.radians(lon0)
+    sin_phi, cos_phi = math.sin(phi), math.cos(phi)
+    sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+    return np.array([[-sin_lam, cos_lam, 0.0],
+                     [-sin_phi * cos_lam, -sin_phi * sin_lam, cos_phi],
+                     [cos_phi * cos_lam, cos_phi * sin_lam, sin_phi]])
+
+
+def lla_to_enu(lat, lon, alt, lat0, lon0, alt0=0.0):
+    """緯度経度高度 → 基準点 (lat0, lon0, alt0) の ENU (east, north, up)[m]（基準点はスカラー）。"""
+    x, y, z = lla_to_ecef(lat, lon, alt)
+    x0, y0, z0 = lla_to_ecef(lat0, lon0, alt0)
+    rotation = _enu_rotation(lat0, lon0)
+    d = np.stack(np.broadcast_arrays(np.subtract(x, x0), np.subtract(y, y0), np.subtract(z, z0)))
+    east, north, up = np.tensordot(rotation, d, axes=1)
+    return _result(east), _result(north), _result(up)
+
+
+def enu_to_lla(east, north, up, lat0, lon0, alt0=0.0):
+    """基準点 (lat0, lon0, alt0) の ENU (east, north, up)[m] → 緯度経度高度（基準点はスカラー）。"""
+    x0, y0, z0 = lla_to_ecef(lat0, lon0, alt0)
+    rotation = _enu_rotation(lat0, lon0)
+    d = np.tensordot(rotation.T, np.stack(np.broadcast_arrays(
+        np.asarray(east, dtype=float), np.asarray(north, dtype=float),
+        np.asarray(up, dtype=float))), axes=1)
+    return ecef_to_lla(d[0] + x0, d[1] + y0, d[2] + z0)
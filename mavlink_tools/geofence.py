@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+ジオフェンス（Mission Planner の .poly の読み込み・判定・機体へのアップロード）
+
+workshop/11th の day4-fence.poly（飛行範囲）と day4-exclude1〜3.poly（飛行禁止区域）は
+Mission Planner で作ったものだが、読み込んで使うコードは無く、機体側も FENCE_ENABLE を
+設定するだけになっている。
+
+このモジュールでは
+  - .poly を読んで Polygon（多角形の区域）にし、Geofence に
+    inclusion（この中にいること）/ exclusion（この中に入らないこと）としてまとめる
+  - 点が区域の中かを、まとめて（NumPy 配列で）または1点ずつ判定する
+      * 外接矩形（bbox）の外の点はそれだけで判定する
+      * bbox を GRID_SIZE x GRID_SIZE のセルに分け、辺が通らないセルは
+        「全部内側 / 全部外側」を作るときに決めておく。辺が通るセルの点だけ
+        偶奇判定（レイキャスティング）をする
+  - ミッション全体（各ウェイポイントと、その間の経路を LEG_SPACING[m] ごとに）を調べる
+  - MISSION_TYPE_FENCE のミッションプロトコルで機体へアップロード / ダウンロードする
+    （mission_transfer を使う。MAVLink2 の dialect が必要）
+
+ArduPilot と同じく、どれか1つの inclusion の外、またはどれか1つの exclusion の中にいれば
+違反（breach）とする。多角形は緯度・経度をそのまま平面の座標として扱う。
+
+使い方:
+    fence = Geofence.load(inclusion=["day4-fence.poly"],
+                          exclusion=["day4-exclude1.poly", "day4-exclude2.poly"])
+    fence.breach(35.805, 139.086)           # "day4-exclude1"（違反した区域の名前）か None
+    fence.check(lats, lons)                 # 点ごとに違反した区域の番号（-1 は違反なし）
+    fence.check_mission(items)              # [(seq, 次の seq か None, 区域の名前), ...]
+    fence.upload(master)                    # MISSION_TYPE_FENCE で書き込む
+
+    fence.attach(pool, on_breach)           # VehiclePool の全機体を GLOBAL_POSITION_INT で監視
+"""
+
+import os
+
+import numpy as np
+from pymavlink import mavutil
+
+import geodesy
+import mission_transfer
+
+# bbox を分けるセルの数（1辺あたり）
+GRID_SIZE = 32
+
+# ミッションの経路を調べる間隔[m]
+LEG_SPACING = 10.0
+
+# 偶奇判定で一度に扱う「点の数 x 辺の数」の上限（メモリ使用量を抑える）
+CHUNK_ELEMENTS = 1 << 21
+
+# セルの状態
+OUTSIDE = 0
+INSIDE = 1
+BOUNDARY = 2
+
+# 位置を持つミッションアイテムの座標系
+GLOBAL_FRAMES = (
+    mavutil.mavlink.MAV_FRAME_GLOBAL,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT_INT,
+)
+
+
+# ---- .poly ---------------------------------------------------------------
+
+def read_poly(path):
+    """Mission Planner の .poly（1行に "緯度 経度"、# はコメント）を [(lat, lon), ...] で返す。
+
+    最後の頂点が最初と同じ（閉じている）ときは取り除く。
+    """
+    vertices = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            lat, lon = line.split()[:2]
+            vertices.append((float(lat), float(lon)))
+    if len(vertices) > 1 and vertices[0] == vertices[-1]:
+        vertices.pop()
+    return vertices
+
+
+def write_poly(path, vertices):
+    """[(lat, lon), ...] を .poly（最初の頂点で閉じる）として書き出す。"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#saved by mavlink_tools geofence\n")
+        for lat, lon in list(vertices) + list(vertices[:1]):
+            f.write("%r %r\n" % (lat, lon))
+
+
+# ---- 区域 ----------------------------------------------------------------
+
+def _crossings(lats, lons, edges):
+    """偶奇判定。edges は (lat1, lon1, lat2, lon2) の配列。点ごとの内側/外側を返す。"""
+    inside = np.zeros(lats.shape, dtype=bool)
+    step = max(1, CHUNK_ELEMENTS // max(1, len(edges)))
+    y1, x1, y2, x2 = edges.T
+    for start in range(0, len(lats), step):
+        py = lats[start:start + step, None]
+        px = lons[start:start + step, None]
+        spans = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        inside[start:start + step] = np.count_nonzero(spans & (px < x), axis=1) % 2 == 1
+    return inside
+
+
+class Polygon:
+    """多角形の区域。vertices は [(lat, lon), ...]（閉じなくてよい）。"""
+
+    def __init__(self, vertices, name=None, grid_size=GRID_SIZE):
+        if len(vertices) < 3:
+            raise ValueError("多角形には3つ以上の頂点が必要です: %s" % name)
+        self.name = name
+        self.vertices = [(float(lat), float(lon)) for lat, lon in vertices]
+        points = np.array(self.vertices)
+        self.edges = np.hstack([points, np.roll(points, -1, axis=0)])
+        self._edge_list = self.edges.tolist()
+        self.lat_min, self.lon_min = points.min(axis=0)
+        self.lat_max, self.lon_max = points.max(axis=0)
+        self.grid_size = grid_size
+        self._cell_lat = (self.lat_max - self.lat_min) / grid_size or 1.0
+        self._cell_lon = (self.lon_max - self.lon_min) / grid_size or 1.0
+        self.grid = self._build_grid()
+        self._grid_list = self.grid.tolist()
+
+    def __repr__(self):
+        return "<Polygon %s %d vertices>" % (self.name, len(self.vertices))
+
+    @classmethod
+    def load(cls, path, name=None):
+        """.poly を読む。name を省略したらファイル名（拡張子なし）にする。"""
+        if name is None:
+            name = os.path.splitext(os.path.basename(path))[0]
+        return cls(read_poly(path), name)
+
+    def _build_grid(self):
+        n = self.grid_size
+        grid = np.full((n, n), OUTSIDE, dtype=np.int8)
+        # 辺が通るセル: 辺を列（経度方向のセル）ごとに切り、その列の中での緯度の範囲を塗る
+        for lat1, lon1, lat2, lon2 in self._edge_list:
+            c1, c2 = sorted((self._col(lon1), self._col(lon2)))
+            for col in range(c1, c2 + 1):
+                if lon1 == lon2:
+                    lo, hi = sorted((lat1, lat2))
+                else:
+                    left = max(min(lon1, lon2), self.lon_min + col * self._cell_lon)
+                    right = min(max(lon1, lon2), self.lon_min + (col + 1) * self._cell_lon)
+                    t = [(lon - lon1) / (lon2 - lon1) for lon in (left, right)]
+                    lo, hi = sorted(lat1 + (lat2 - lat1) * v for v in t)
+                grid[self._row(lo):self._row(hi) + 1, col] = BOUNDARY
+        # 辺が通らないセルは、中心が内側ならセル全体が内側
+        rows, cols = np.nonzero(grid != BOUNDARY)
+        centers_lat = self.lat_min + (rows + 0.5) * self._cell_lat
+        centers_lon = self.lon_min + (cols + 0.5) * self._cell_lon
+        grid[rows, cols] = np.where(_crossings(centers_lat, centers_lon, self.edges), INSIDE, OUTSIDE)
+        return grid
+
+    def _row(self, lat):
+        return min(self.grid_size - 1, max(0, int((lat - self.lat_min) / self._cell_lat)))
+
+    def _col(self, lon):
+        return min(self.grid_size - 1, max(0, int((lon - self.lon_min) / self._cell_lon)))
+
+    def contains_point(self, lat, lon):
+        """1点の判定（NumPy を使わない）。"""
+        if not (self.lat_min <= lat <= self.lat_max and self.lon_min <= lon <= self.lon_max):
+            return False
+        state = self._grid_list[self._row(lat)][self._col(lon)]
+        if state != BOUNDARY:
+            return state == INSIDE
+        inside = False
+        for lat1, lon1, lat2, lon2 in self._edge_list:
+            if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                inside = not inside
+        return inside
+
+    def contains(self, lats, lons):
+        """点ごとに区域の中かを返す（bool の配列）。"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        result = np.zeros(np.broadcast(lats, lons).shape, dtype=bool)
+        lats, lons = np.broadcast_to(lats, result.shape), np.broadcast_to(lons, result.shape)
+        in_box = ((lats >= self.lat_min) & (lats <= self.lat_max)
+                  & (lons >= self.lon_min) & (lons <= self.lon_max))
+        if not in_box.any():
+            return result
+        box_lats, box_lons = lats[in_box], lons[in_box]
+        rows = np.clip(((box_lats - self.lat_min) / self._cell_lat).astype(int), 0, self.grid_size - 1)
+        cols = np.clip(((box_lons - self.lon_min) / self._cell_lon).astype(int), 0, self.grid_size - 1)
+        state = self.grid[rows, cols]
+        inside = state == INSIDE
+        boundary = state == BOUNDARY
+        if boundary.any():
+            inside[boundary] = _crossings(box_lats[boundary], box_lons[boundary], self.edges)
+        result[in_box] = inside
+        return result
+
+
+class Circle:
+    """円の区域（中心 lat, lon、半径 radius[m]）。"""
+
+    def __init__(self, lat, lon, radius, name=None):
+        self.name = name
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radius = float(radius)
+
+    def __repr__(self):
+        return "<Circle %s %.0fm>" % (self.name, self.radius)
+
+    def contains_point(self, lat, lon):
+        return geodesy.approx_distance(self.lat, self.lon, lat, lon) <= self.radius
+
+    def contains(self, lats, lons):
+        return np.asarray(geodesy.approx_distance(self.lat, self.lon, lats, lons)) <= self.radius
+
+
+# ---- フェンス -------------------------------------------------------------
+
+class Geofence:
+    """inclusion（中にいること）と exclusion（入らないこと）の区域のまとまり。
+
+    zones は inclusions + exclusions の順のリストで、check() が返す番号はこの添字。
+    """
+
+    def __init__(self, inclusions=(), exclusions=(), return_point=None):
+        self.inclusions = list(inclusions)
+        self.exclusions = list(exclusions)
+        self.return_point = return_point        # (lat, lon) か None
+        self._states = {}                       # attach(): 機体名 → 違反中の区域の名前
+
+    @property
+    def zones(self):
+        return self.inclusions + self.exclusions
+
+    @classmethod
+    def load(cls, inclusion=(), exclusion=(), return_point=None):
+        """.poly のパスのリストから作る。"""
+        return cls([Polygon.load(path) for path in inclusion],
+                   [Polygon.load(path) for path in exclusion], return_point)
+
+    # ---- 判定 ------------------------------------------------------------
+
+    def breach(self, lat, lon):
+        """1点を判定し、違反した最初の区域の名前を返す（違反がなければ None）。"""
+        for zone in self.inclusions:
+            if not zone.contains_point(lat, lon):
+                return zone.name
+        for zone in self.exclusions:
+            if zone.contains_point(lat, lon):
+                return zone.name
+        return None
+
+    def check(self, lats, lons):
+        """点ごとに、違反した最初の区域の zones の添字を返す（-1 は違反なし）。"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        result = np.full(np.broadcast(lats, lons).shape, -1, dtype=np.int32)
+        for index, zone in enumerate(self.zones):
+            pending = result == -1
+            if not pending.any():
+                break
+            inside = zone.contains(lats[pending] if lats.shape else lats,
+                                   lons[pending] if lons.shape else lons)
+            breached = ~inside if index < len(self.inclusions) else inside
+            result[pending] = np.where(breached, index, -1)
+        return result
+
+    def check_mission(self, items, spacing=LEG_SPACING):
+        """ミッションのウェイポイントと、その間の経路（spacing[m] ごと）を調べる。
+
+        [(seq, 次のウェイポイントの seq, 区域の名前), ...] を返す。ウェイポイントそのものの違反は
+        次の seq が None。items は MISSION_ITEM_INT（または MISSION_ITEM）のリスト。
+        """
+        points = [(item.seq,) + _item_position(item) for item in items
+                  if item.frame in GLOBAL_FRAMES and (item.x or item.y)]
+        if not points:
+            return []
+        seqs = [seq for seq, _, _ in points]
+        lats = [lat for _, lat, _ in points]
+        lons = [lon for _, _, lon in points]
+        sample_lats, sample_lons, owners = list(lats), list(lons), [(seq, None) for seq in seqs]
+        for i in range(len(points) - 1):
+            length = geodesy.distance(lats[i], lons[i], lats[i + 1], lons[i + 1])
+            count = int(length // spacing)
+            if count:
+                t = np.arange(1, count + 1) / (count + 1)
+                sample_lats.extend(lats[i] + (lats[i + 1] - lats[i]) * t)
+                sample_lons.extend(lons[i] + (lons[i + 1] - lons[i]) * t)
+                owners.extend([(seqs[i], seqs[i + 1])] * count)
+        zones = self.zones
+        found = []
+        for owner, index in zip(owners, self.check(sample_lats, sample_lons).tolist()):
+            if index >= 0:
+                violation = owner + (zones[index].name,)
+                if violation not in found:
+                    found.append(violation)
+        return found
+
+    # ---- 機体との受け渡し ---------------------------------------------------
+
+    def to_items(self):
+        """MISSION_TYPE_FENCE 用の MISSION_ITEM_INT のリスト（seq は 0 から）。"""
+        mavlink = mavutil.mavlink
+        items = []
+
+        def add(command, lat, lon, param1=0.0):
+            items.append(mavlink.MAVLink_mission_item_int_message(
+                0, 0, len(items), mavlink.MAV_FRAME_GLOBAL, command, 0, 1,
+                param1, 0, 0, 0, int(round(lat * 1e7)), int(round(lon * 1e7)), 0))
+
+        if self.return_point is not None:
+            add(mavlink.MAV_CMD_NAV_FENCE_RETURN_POINT, *self.return_point)
+        for zones, vertex_cmd, circle_cmd in (
+                (self.inclusions, mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION,
+                 mavlink.MAV_CMD_NAV_FENCE_CIRCLE_INCLUSION),
+                (self.exclusions, mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION,
+                 mavlink.MAV_CMD_NAV_FENCE_CIRCLE_EXCLUSION)):
+            for zone in zones:
+                if isinstance(zone, Circle):
+                    add(circle_cmd, zone.lat, zone.lon, zone.radius)
+                else:
+                    for lat, lon in zone.vertices:
+                        add(vertex_cmd, lat, lon, len(zone.vertices))
+        return items
+
+    @classmethod
+    def from_items(cls, items):
+        """to_items() / 機体からダウンロードしたフェンスのアイテムから作る。"""
+        mavlink = mavutil.mavlink
+        fence = cls()
+        vertices = []
+        for item in items:
+            lat, lon = _item_position(item)
+            if item.command == mavlink.MAV_CMD_NAV_FENCE_RETURN_POINT:
+                fence.return_point = (lat, lon)
+            elif item.command in (mavlink.MAV_CMD_NAV_FENCE_CIRCLE_INCLUSION,
+                                  mavlink.MAV_CMD_NAV_FENCE_CIRCLE_EXCLUSION):
+                zones = (fence.inclusions if item.command == mavlink.MAV_CMD_NAV_FENCE_CIRCLE_INCLUSION
+                         else fence.exclusions)
+                zones.append(Circle(lat, lon, item.param1, "circle%d" % item.seq))
+            elif item.command in (mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION,
+                                  mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION):
+                vertices.append((lat, lon))
+                if len(vertices) == int(item.param1):
+                    zones = (fence.inclusions
+                             if item.command == mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION
+                             else fence.exclusions)
+                    zones.append(Polygon(vertices, "polygon%d" % (item.seq - len(vertices) + 1)))
+                    vertices = []
+        return fence
+
+    def upload(self, master, **kwargs):
+        """MISSION_TYPE_FENCE で機体へ書き込む。件数を返す（kwargs は upload_mission へ）。"""
+        return mission_transfer.upload_mission(
+            master, self.to_items(), mission_type=mavutil.mavlink.MAV_MISSION_TYPE_FENCE, **kwargs)
+
+    @classmethod
+    def download(cls, master, **kwargs):
+        """機体のフェンスを読み出して Geofence にする。"""
+        return cls.from_items(mission_transfer.download_mission(
+            master, mission_type=mavutil.mavlink.MAV_MISSION_TYPE_FENCE, **kwargs))
+
+    # ---- VehiclePool との接続 --------------------------------------------------
+
+    def attach(self, pool, on_breach, msg_type="GLOBAL_POSITION_INT"):
+        """pool（VehiclePool）の全機体の位置を監視し、違反の状態が変わったら
+        on_breach(vehicle, 区域の名前 / 違反が解消したら None) を呼ぶ（最初は違反なしとみなす）。
+
+        受信スレッドから呼ばれるので、on_breach はすぐ戻ること。
+        """
+        def on_position(vehicle, msg):
+            if msg.lat == 0 and msg.lon == 0:
+                return
+            zone = self.breach(msg.lat * 1e-7, msg.lon * 1e-7)
+            if self._states.get(vehicle.name) != zone:
+                self._states[vehicle.name] = zone
+                on_breach(vehicle, zone)
+
+        return pool.on(msg_type, on_position)
+
+
+def _item_position(item):
+    if item.get_type() == "MISSION_ITEM_INT":
+        return item.x * 1e-7, item.y * 1e-7
+    return float(item.x), float(item.y)
+
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+依存関係グラフ（DAG）でレグを実行するスケジューラ
+
+複数機体の配送は「前の機体が到着したら次の機体が出発する」の連鎖で書かれることが多い
+（smart_delivery.py の routes の 'wait'、multi_vehicles_relay.py の build_legs / run_leg）。
+直列に書くと、前の機体を待つ必要のない機体まで順番待ちになる。
+
+LegScheduler では、レグごとに「どのイベントの後に出発できるか」を宣言する。
+  - レグが終わると、レグ名のイベントが起きる（"rover"）
+  - レグの途中で emit("arrived") すると "rover.arrived" が起きる（到着・荷物の載せ替え等）
+  - 依存するイベントがすべて起きたレグから、それぞれ別スレッドで実行する
+  - レグが失敗したら、そのレグのイベントを待つレグは実行せずに skipped にする
+    （関係のないレグはそのまま続ける）
+
+実行後は、各レグの開始・終了・待ち時間と、全体の時間を決めたレグの連鎖（クリティカルパス）
+を返す。duration（所要時間の見積もり）を渡しておけば、実行前に plan() で同じものを見積もれる。
+
+使い方:
+    def rover_leg(ctx):
+        run_leg(rover, ...)          # 到着まで
+        ctx.emit("arrived")
+        wait_cargo_transfer(60, ...)  # 載せ替え
+
+    legs = [
+        Leg("rover", rover_leg, emits={"arrived": 300}, duration=360),
+        Leg("boat", boat_leg, after=["rover"], duration=240),          # 載せ替えの後
+        Leg("copter", copter_leg, after=["boat"], duration=180),
+        Leg("rover2", rover2_leg, after=["rover.arrived"], duration=400),  # 到着したらすぐ
+    ]
+    report = LegScheduler(legs).run()
+    print(report.table())
+    print(report.critical_path)      # ["rover", "boat", "copter"] 等
+"""
+
+import threading
+import time
+
+# レグの状態
+WAITING = "waiting"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Leg:
+    """1つのレグ。run(ctx) がレグの処理で、別スレッドで呼ばれる。
+
+    after   : 出発の前に起きている必要があるイベント名のリスト
+    emits   : 途中で emit() するイベント名 → レグ開始からの時間の見積もり[秒]（None は終了時と同じ）
+    duration: レグの所要時間の見積もり[秒]（plan() で使う）
+    """
+
+    def __init__(self, name, run, after=(), emits=None, duration=None):
+        if "." in name:
+            raise ValueError("レグ名に '.' は使えません: %s" % name)
+        self.name = name
+        self.run = run
+        self.after = list(after)
+        self.emits = dict(emits or {})
+        self.duration = duration
+        self.status = WAITING
+        self.error = None
+        self.result = None
+        self.ready_at = None       # 依存するイベントがすべて起きた時刻（スケジューラ開始からの秒）
+        self.started_at = None
+        self.finished_at = None
+        self.gated_by = None       # 最後に起きた依存イベント（出発を決めたイベント）
+
+    @property
+    def events(self):
+        """このレグが起こすイベント名の一覧。"""
+        return [self.name] + ["%s.%s" % (self.name, suffix) for suffix in self.emits]
+
+    @property
+    def elapsed(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class LegContext:
+    """run(ctx) に渡される。途中のイベントを起こすのに使う。"""
+
+    def __init__(self, scheduler, leg):
+        self.scheduler = scheduler
+        self.leg = leg
+
+    def emit(self, suffix):
+        """"<レグ名>.<suffix>" のイベントを起こす（emits で宣言したものだけ）。"""
+        if suffix not in self.leg.emits:
+            raise ValueError("%s は emits に %s を宣言していません" % (self.leg.name, suffix))
+        self.scheduler._event("%s.%s" % (self.leg.name, suffix))
+
+    @property
+    def elapsed(self):
+        """レグを開始してからの時間[秒]。"""
+        return self.scheduler._now() - self.leg.started_at
+
+
+class ScheduleReport:
+    """LegScheduler.run() の結果。"""
+
+    def __init__(self, legs, events, elapsed):
+        self.legs = legs               # レグ名 → Leg
+        self.events = events           # イベント名 → 起きた時刻[秒]
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return all(leg.status == DONE for leg in self.legs.values())
+
+    @property
+    def critical_path(self):
+        """全体の時間を決めたレグの連鎖（最後に終わったレグから、出発を決めたイベントを遡る）。"""
+        finished = [leg for leg in self.legs.values() if leg.finished_at is not None]
+        if not finished:
+            return []
+        leg = max(finished, key=lambda leg: leg.finished_at)
+        path = [leg.name]
+        while leg.gated_by is not None:
+            leg = self.legs[leg.gated_by.split(".")[0]]
+            path.append(leg.name)
+        return path[::-1]
+
+    def table(self):
+        """結果の表（文字列）。時刻はスケジューラ開始からの秒（ready は依存先を待ち終えた時刻）。"""
+        critical = set(self.critical_path)
+        lines = ["%-12s %-8s %8s %8s %8s  %s"
+                 % ("leg", "status", "ready", "start", "end", "gated by")]
+        for leg in self.legs.values():
+            lines.append("%-12s %-8s %8s %8s %8s  %s%s" % (
+                leg.name, leg.status, _seconds(leg.ready_at), _seconds(leg.started_at),
+                _seconds(leg.finished_at), leg.gated_by or "-",
+                "  *" if leg.name in critical else ""))
+        lines.append("合計 %.1f 秒、クリティカルパス: %s"
+                     % (self.elapsed, " -> ".join(self.critical_path) or "-"))
+        return "\n".join(lines)
+
+
+def _seconds(value):
+    return "-" if value is None else "%.1f" % value
+
+
+class LegScheduler:
+    """Leg のリストを依存関係どおりに、できるだけ並行して実行する。"""
+
+    def __init__(self, legs, clock=time.monotonic):
+        self.legs = {}
+        for leg in legs:
+            if leg.name in self.legs:
+                raise ValueError("レグ名が重複しています: %s" % leg.name)
+            self.legs[leg.name] = leg
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._events = {}              # イベント名 → 時刻
+        self._started = None
+        self._check()
+
+    # ---- グラフの検査・見積もり ------------------------------------------------
+
+    def _producer(self, event):
+        return self.legs.get(event.split(".")[0])
+
+    def _check(self):
+        """存在しないイベントへの依存と、循環を検出する。"""
+        for leg in self.legs.values():
+            for event in leg.after:
+                producer = self._producer(event)
+                if producer is None or event not in producer.events:
+                    raise ValueError("%s の依存先 %s を起こすレグがありません" % (leg.name, event))
+        self._order()
+
+    def _order(self):
+        """依存関係の順（トポロジカル順）のレグ名のリスト。循環があれば ValueError。"""
+        order = []
+        state = {}
+
+        def visit(name, stack):
+            if state.get(name) == DONE:
+                return
+            if state.get(name) == RUNNING:
+                raise ValueError("レグの依存関係が循環しています: %s"
+                                 % " -> ".join(stack[stack.index(name):] + [name]))
+            state[name] = RUNNING
+            for event in self.legs[name].after:
+                visit(self._producer(event).name, stack + [name])
+            state[name] = DONE
+            order.append(name)
+
+        for name in self.legs:
+            visit(name, [])
+        return order
+
+    def plan(self):
+        """duration / emits の見積もりから各レグの開始・終了時刻とクリティカルパスを求める。
+
+        (全体の時間, クリティカルパス, {レグ名: (開始, 終了)}) を返す。
+        """
+        times = {}
+        events = {}
+        gate = {}
+        for name in self._order():
+            leg = self.legs[name]
+            if leg.duration is None:
+                raise ValueError("%s に duration（所要時間の見積もり）がありません" % name)
+            start, gate[name] = 0.0, None
+            for event in leg.after:
+                if events[event] > start:
+                    start, gate[name] = events[event], event
+            end = start + leg.duration
+            times[name] = (start, end)
+            events[name] = end
+            for suffix, offset in leg.emits.items():
+                events["%s.%s" % (name, suffix)] = end if offset is None else start + offset
+        if not times:
+            return 0.0, [], times
+        name = max(times, key=lambda name: times[name][1])
+        total = times[name][1]
+        path = [name]
+        while gate[name] is not None:
+            name = gate[name].split(".")[0]
+            path.append(name)
+        return total, path[::-1], times
+
+    # ---- 実行 ------------------------------------------------------------
+
+    def _now(self):
+        return self._clock() - self._started
+
+    def _event(self, event):
+        with self._cond:
+            if event not in self._events:
+                self._events[event] = self._now()
+                self._cond.notify_all()
+
+    def _run_leg(self, leg):
+        try:
+            leg.result = leg.run(LegContext(self, leg))
+            status = DONE
+        except Exception as error:
+            leg.error = "%s: %s" % (type(error).__name__, error)
+            status = FAILED
+        with self._cond:
+            leg.finished_at = self._now()
+            leg.status = status
+            if status == DONE:
+                # 宣言したのに emit しなかったイベントは、終了時に起きたものとする
+                for event in leg.events:
+                    self._events.setdefault(event, leg.finished_at)
+            self._cond.notify_all()
+
+    def _impossible(self, event):
+        """もう起きないイベントか（起こすレグが失敗・スキップした）。"""
+        producer = self._producer(event)
+        return event not in self._events and producer.status in (FAILED, SKIPPED)
+
+    def run(self, timeout=None):
+        """すべてのレグが終わる（または実行できなくなる）まで実行し、ScheduleReport を返す。
+
+        timeout を過ぎたら、まだ出発していないレグを skipped にして戻る
+        （実行中のレグのスレッドは止められないので、そのまま残る）。
+        """
+        self._started = self._clock()
+        with self._cond:
+            while True:
+                for leg in self.legs.values():
+                    if leg.status != WAITING:
+                        continue
+                    if any(self._impossible(event) for event in leg.after):
+                        leg.status = SKIPPED
+                        leg.error = "依存先が失敗しました: %s" % ", ".join(
+                            event for event in leg.after if self._impossible(event))
+                        self._cond.notify_all()
+                        continue
+                    if all(event in self._events for event in leg.after):
+                        leg.ready_at = max([self._events[e] for e in leg.after], default=0.0)
+                        leg.gated_by = max(leg.after, key=lambda e: self._events[e], default=None)
+                        leg.started_at = self._now()
+                        leg.status = RUNNING
+                        thread = threading.Thread(target=self._run_leg, args=(leg,),
+                                                  name="leg-%s" % leg.name, daemon=True)
+                        thread.start()
+                statuses = [leg.status for leg in self.legs.values()]
+                if all(status in (DONE, FAILED, SKIPPED) for status in statuses):
+                    break
+                remaining = None if timeout is None else timeout - self._now()
+                if remaining is not None and remaining <= 0:
+                    for leg in self.legs.values():
+                        if leg.status == WAITING:
+                            leg.status = SKIPPED
+                            leg.error = "タイムアウト"
+                    break
+                self._cond.wait(remaining)
+        return ScheduleReport(self.legs, dict(self._events), self._now())
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+MAVLink 接続のリンク品質・スループットの計測
+
+リンクの状態を測っているところは無く、multi_vehicles_relay.py の mavlink_is_flowing /
+find_talking_port も HEARTBEAT が届くかどうかしか見ていない。無線が混んで遅い・
+パケットが落ちている、のか、コードが遅いのかを切り分けられない。
+
+LinkStats は接続ごとに
+  - 受信・送信のバイト数、メッセージ種別ごとの数
+  - 送信元（sysid, compid）ごとのシーケンス番号の飛び（= 落ちたパケット数）
+  - CRC エラーで捨てたフレーム数
+  - 往復時間（RTT）: TIMESYNC の往復、COMMAND_LONG / COMMAND_INT → COMMAND_ACK
+  - デコードにかかった時間
+を数える。結果は Prometheus のテキスト形式（Web バックエンドの /metrics）と、
+CLI 向けの1行の要約（前回からの差分のレート）で取り出せる。
+
+計測の取り付け:
+  instrument(master)   mavutil の接続（recv_match 等で受信するもの）。message_hooks・
+                       送信コールバック・mav.decode に取り付ける
+  instrument_pool(pool) VehiclePool の全機体。MessageDispatcher の frame_hook で
+                       デコードせずに読み飛ばすフレームも数える
+どちらも接続して最初の HEARTBEAT を受け取った後に呼ぶこと（mavutil は最初の受信で
+MAVLink1/2 を判定して mav を作り直すことがある）。
+
+使い方:
+    stats = instrument(master, "copter")
+    ...
+    ping(master)                             # TIMESYNC を送る（RTT を測るなら周期的に）
+    print(stats.summary())                   # copter: 受信 12.3 kB/s 85 msg/s 損失 0.4% ...
+
+    # Flask
+    @app.route("/metrics")
+    def metrics():
+        return Response(prometheus_text(links), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+    # コマンドラインから（5秒ごとに要約を表示）
+    python link_stats.py tcp:127.0.0.1:5762 --interval 5
+"""
+
+import argparse
+import collections
+import threading
+import time
+
+from pymavlink import mavutil
+
+# RTT の統計に使う最近のサンプル数
+RTT_SAMPLES = 100
+
+# ping() を CLI で送る間隔[秒]
+TIMESYNC_INTERVAL = 1.0
+
+# CLI で要約を表示する間隔[秒]
+SUMMARY_INTERVAL = 10.0
+
+# 応答が返らなかった TIMESYNC / コマンドを忘れるまでの時間[秒]
+PENDING_TIMEOUT = 30.0
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# SiK 無線の RADIO_STATUS（シーケンス番号は機体と関係ないので損失に数えない）
+RADIO_SOURCE = (ord("3"), ord("D"))
+
+COMMAND_TYPES = ("COMMAND_LONG", "COMMAND_INT")
+
+
+class LinkStats:
+    """1つの接続の計測値。受信側の数は受信スレッドから、送信側は任意のスレッドから更新する。"""
+
+    def __init__(self, name, clock=time.monotonic):
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.rx_messages = {}             # メッセージID → 受信数
+        self.tx_messages = {}             # メッセージID → 送信数
+        self.rx_lost = 0                  # シーケンス番号の飛びから数えた、落ちたパケット数
+        self.sources = {}                 # (sysid, compid) → [最後の seq, 受信数, 損失数]
+        self.crc_errors = 0
+        self.decoded_messages = 0
+        self.decode_time = 0.0            # デコードにかかった時間の合計[秒]
+        self.rtt = {"timesync": collections.deque(maxlen=RTT_SAMPLES),
+                    "command": collections.deque(maxlen=RTT_SAMPLES)}
+        self.rtt_total = {"timesync": [0, 0.0], "command": [0, 0.0]}    # [数, 合計[秒]]
+        self._timesync = {}               # 送った ts1[ns] → 送信時刻
+        self._commands = {}               # コマンドID → [送信時刻, ...]
+        self._last_summary = None
+
+    def __repr__(self):
+        return "<LinkStats %s rx=%d tx=%d lost=%d>" % (self.name, self.rx_bytes, self.tx_bytes, self.rx_lost)
+
+    @property
+    def rx_frames(self):
+        return sum(self.rx_messages.values())
+
+    @property
+    def tx_frames(self):
+        return sum(self.tx_messages.values())
+
+    @property
+    def loss(self):
+        """損失率（落ちたパケット数 / 送られたはずのパケット数）。"""
+        received = self.rx_frames
+        return self.rx_lost / (received + self.rx_lost) if received + self.rx_lost else 0.0
+
+    def rtt_stats(self, method):
+        """(最新, 平均, 最大)[秒]。サンプルが無ければ None。"""
+        samples = self.rtt[method]
+        if not samples:
+            return None
+        return samples[-1], sum(samples) / len(samples), max(samples)
+
+    # ---- 受信 ------------------------------------------------------------
+
+    def frame(self, src_system, src_component, seq, msg_id, length):
+        """受信したフレーム1つを数える（デコードしたかどうかに関係なく）。"""
+        self.rx_bytes += length
+        self.rx_messages[msg_id] = self.rx_messages.get(msg_id, 0) + 1
+        source = (src_system, src_component)
+        if source == RADIO_SOURCE:
+            return
+        state = self.sources.get(source)
+        if state is None:
+            self.sources[source] = [seq, 1, 0]
+            return
+        lost = (seq - state[0] - 1) % 256
+        state[0] = seq
+        state[1] += 1
+        if lost:
+            state[2] += lost
+            self.rx_lost += lost
+
+    def message(self, msg):
+        """デコードしたメッセージから RTT を測る（TIMESYNC の応答・COMMAND_ACK）。"""
+        msg_type = msg.get_type()
+        now = self._clock()
+        if msg_type == "TIMESYNC":
+            if msg.tc1 == 0:
+                return                    # 相手からの要求
+            with self._lock:
+                sent = self._timesync.pop(msg.ts1, None)
+            if sent is not None:
+                self._add_rtt("timesync", now - sent)
+        elif msg_type == "COMMAND_ACK":
+            with self._lock:
+                pending = self._commands.get(msg.command)
+                sent = pending.pop(0) if pending else None
+            if sent is not None:
+                self._add_rtt("command", now - sent)
+
+    def crc_error(self):
+        """デコードせずに読み飛ばしたフレームの CRC エラー（MessageDispatcher.crc_error_hook）。"""
+        self.crc_errors += 1
+
+    def decoded(self, seconds, ok):
+        """デコード1回の時間。ok が False なら CRC エラー等で捨てたフレーム。"""
+        self.decode_time += seconds
+        if ok:
+            self.decoded_messages += 1
+        else:
+            self.crc_errors += 1
+
+    def _add_rtt(self, method, seconds):
+        self.rtt[method].append(seconds)
+        total = self.rtt_total[method]
+        total[0] += 1
+        total[1] += seconds
+
+    # ---- 送信 ------------------------------------------------------------
+
+    def sent(self, msg):
+        """送信したメッセージ1つを数える（pymavlink の送信コールバック）。"""
+        msg_id = msg.get_msgId()
+        now = self._clock()
+        with self._lock:
+            self.tx_bytes += len(msg.get_msgbuf())
+            self.tx_messages[msg_id] = self.tx_messages.get(msg_id, 0) + 1
+            if msg.get_type() in COMMAND_TYPES:
+                self._commands.setdefault(msg.command, []).append(now)
+            elif msg.get_type() == "TIMESYNC" and msg.tc1 == 0:
+                self._timesync[msg.ts1] = now
+            self._expire(now)
+
+    def _expire(self, now):
+        limit = now - PENDING_TIMEOUT
+        for ts1, sent in list(self._timesync.items()):
+            if sent < limit:
+                del self._timesync[ts1]
+        for command, times in list(self._commands.items()):
+            times[:] = [sent for sent in times if sent >= limit]
+            if not times:
+                del self._commands[command]
+
+    # ---- 出力 ------------------------------------------------------------
+
+    def summary(self):
+        """前回の summary() からのレートを1行で返す（初回は計測開始から）。"""
+        now = self._clock()
+        current = (now, self.rx_bytes, self.rx_frames, self.tx_bytes, self.rx_lost, self.crc_errors,
+                   self.decoded_messages, self.decode_time)
+        last = self._last_summary or (self.started, 0, 0, 0, 0, 0, 0, 0.0)
+        self._last_summary = current
+        elapsed = max(now - last[0], 1e-9)
+        frames = current[2] - last[2]
+        lost = current[4] - last[4]
+        decoded = current[6] - last[6]
+        parts = ["%s: 受信 %.1f kB/s %.0f msg/s 損失 %.1f%% CRC %d" % (
+            self.name, (current[1] - last[1]) / elapsed / 1000, frames / elapsed,
+            100.0 * lost / (frames + lost) if frames + lost else 0.0, current[5] - last[5]),
+            "送信 %.1f kB/s" % ((current[3] - last[3]) / elapsed / 1000)]
+        rtts = []
+        for method in ("timesync", "command"):
+            stats = self.rtt_stats(method)
+            if stats is not None:
+                rtts.append("%s %.1f ms" % (method, stats[1] * 1000))
+        if rtts:
+            parts.append("RTT " + " ".join(rtts))
+        if decoded:
+            parts.append("デコード %.1f µs/msg" % ((current[7] - last[7]) / decoded * 1e6))
+        return " | ".join(parts)
+
+    def samples(self):
+        """Prometheus の (メトリクス名, ラベル, 値) のリスト（summary は _count / _sum）。"""
+        link = {"link": self.name}
+        samples = [
+            ("mavlink_rx_bytes_total", link, self.rx_bytes),
+            ("mavlink_tx_bytes_total", link, self.tx_bytes),
+            ("mavlink_rx_lost_total", link, self.rx_lost),
+            ("mavlink_crc_errors_total", link, self.crc_errors),
+            ("mavlink_decoded_messages_total", link, self.decoded_messages),
+            ("mavlink_decode_seconds_total", link, self.decode_time),
+        ]
+        for metric, counts in (("mavlink_rx_messages_total", self.rx_messages),
+                               ("mavlink_tx_messages_total", self.tx_messages)):
+            for msg_id, count in sorted(dict(counts).items()):
+                samples.append((metric, dict(link, type=_message_name(msg_id)), count))
+        for method, (count, total) in self.rtt_total.items():
+            labels = dict(link, method=method)
+            samples.append(("mavlink_rtt_seconds_count", labels, count))
+            samples.append(("mavlink_rtt_seconds_sum", labels, total))
+            stats = self.rtt_stats(method)
+            if stats is not None:
+                samples.append(("mavlink_rtt_last_seconds", labels, stats[0]))
+        return samples
+
+
+# Prometheus のメトリクス → (TYPE, HELP)
+METRICS = {
+    "mavlink_rx_bytes_total": ("counter", "Bytes of MAVLink frames received"),
+    "mavlink_tx_bytes_total": ("counter", "Bytes of MAVLink frames sent"),
+    "mavlink_rx_messages_total": ("counter", "MAVLink messages received by type"),
+    "mavlink_tx_messages_total": ("counter", "MAVLink messages sent by type"),
+    "mavlink_rx_lost_total": ("counter", "Packets lost, counted from sequence number gaps"),
+    "mavlink_crc_errors_total": ("counter", "Frames dropped because of CRC errors"),
+    "mavlink_decoded_messages_total": ("counter", "MAVLink messages decoded"),
+    "mavlink_decode_seconds_total": ("counter", "Time spent decoding MAVLink messages"),
+    "mavlink_rtt_seconds": ("summary", "Round trip time (TIMESYNC or COMMAND -> COMMAND_ACK)"),
+    "mavlink_rtt_last_seconds": ("gauge", "Latest round trip time"),
+}
+
+
+def prometheus_text(links):
+    """links（LinkStats のリスト）を Prometheus のテキスト形式にする。"""
+    grouped = collections.OrderedDict((name, []) for name in METRICS)
+    for stats in links:
+        for metric, labels, value in stats.samples():
+            family = metric if metric in METRICS else metric.rsplit("_", 1)[0]     # xxx_count / xxx_sum
+            grouped[family].append((metric, labels, value))
+    lines = []
+    for family, samples in grouped.items():
+        if not samples:
+            continue
+        kind, text = METRICS[family]
+        lines.append("# HELP %s %s" % (family, text))
+        lines.append("# TYPE %s %s" % (family, kind))
+        for metric, labels, value in samples:
+            label_text = ",".join('%s="%s"' % (key, _escape(str(val))) for key, val in labels.items())
+            lines.append("%s{%s} %s" % (metric, label_text, repr(float(value)) if isinstance(value, float)
+                                        else value))
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _message_name(msg_id):
+    msg_class = mavutil.mavlink.mavlink_map.get(msg_id)
+    return msg_class.msgname if msg_class is not None else str(msg_id)
+
+
+# ---- 取り付け -----------------------------------------------------------------
+
+def _hook_mav(mav, stats):
+    """送信コールバックと mav.decode（時間・CRC エラー）に取り付ける。"""
+    mav.set_send_callback(stats.sent)
+    decode = mav.decode
+
+    def timed_decode(msgbuf):
+        started = time.perf_counter()
+        try:
+            msg = decode(msgbuf)
+        except mavutil.mavlink.MAVError:
+            stats.decoded(time.perf_counter() - started, False)
+            raise
+        stats.decoded(time.perf_counter() - started, True)
+        return msg
+
+    mav.decode = timed_decode
+
+
+def instrument(master, name=None):
+    """mavutil の接続 master に計測を取り付けて LinkStats を返す。"""
+    stats = LinkStats(name or getattr(master, "address", "link"))
+    _hook_mav(master.mav, stats)
+
+    def on_message(master, msg):
+        if msg.get_msgId() < 0:          # BAD_DATA（CRC エラーは decode で数えている）
+            return
+        stats.frame(msg.get_srcSystem(), msg.get_srcComponent(), msg.get_seq(), msg.get_msgId(),
+                    len(msg.get_msgbuf()))
+        stats.message(msg)
+
+    master.message_hooks.append(on_message)
+    return stats
+
+
+def instrument_pool(pool):
+    """VehiclePool の全機体（接続できたもの）に計測を取り付けて {機体名: LinkStats} を返す。"""
+    links = {}
+    for vehicle in pool:
+        if vehicle.dispatcher is None:
+            continue
+        stats = links[vehicle.name] = LinkStats(vehicle.name)
+        _hook_mav(vehicle.master.mav, stats)
+        vehicle.dispatcher.frame_hook = stats.frame
+        vehicle.dispatcher.crc_error_hook = stats.crc_error
+    pool.on(["TIMESYNC", "COMMAND_ACK"],
+            lambda vehicle, msg: links[vehicle.name].message(msg) if vehicle.name in links else None)
+    return links
+
+
+def ping(master):
+    """TIMESYNC を送る。応答が返ると、取り付けた LinkStats の RTT（timesync）に入る。"""
+    master.mav.send(master.mav.timesync_encode(0, time.monotonic_ns()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MAVLink 接続のリンク品質の計測")
+    parser.add_argument("device", help="接続文字列（例: tcp:127.0.0.1:5762）")
+    parser.add_argument("--interval", type=float, default=SUMMARY_INTERVAL, help="要約の表示間隔[秒]")
+    parser.add_argument("--prometheus", action="store_true", help="要約の代わりに Prometheus の形式で表示")
+    args = parser.parse_args()
+
+    master = mavutil.mavlink_connection(args.device, source_system=255)
+    master.wait_heartbeat()
+    stats = instrument(master, args.device)
+    next_ping = next_summary = time.monotonic()
+    next_summary += args.interval
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_ping:
+                ping(master)
+                next_ping = now + TIMESYNC_INTERVAL
+            if now >= next_summary:
+                print(prometheus_text([stats]) if args.prometheus else stats.summary())
+                next_summary = now + args.interval
+            master.recv_match(blocking=True, timeout=0.1)
+    except KeyboardInterrupt:
+        pass
+    master.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+メッセージID で引くディスパッチャ
+
+受信ループの多くは
+    msg = master.recv_match(type=[...], blocking=True, timeout=1)
+    msg_type = msg.get_type()
+    if msg_type == "MISSION_ITEM_REACHED": ...
+    elif msg_type == "MISSION_CURRENT": ...
+のように書かれている。recv_match は type に関係なく「受信した全メッセージ」を
+デコード（CRC 計算 + ペイロードの展開）してから絞り込むので、SITL が流してくる
+ATTITUDE や RAW_IMU 等、使わないメッセージにも毎回コストを払っている。
+
+MessageDispatcher はハンドラをメッセージID ごとに先に登録しておき、
+受信したバイト列をヘッダだけ見て切り出す。登録の無いメッセージID はデコードせずに
+読み飛ばし、登録のあるものだけ pymavlink でデコードしてハンドラを呼ぶ。
+
+使い方:
+    dispatcher = MessageDispatcher()
+    dispatcher.on("MISSION_ITEM_REACHED", on_reached)
+    dispatcher.on("GLOBAL_POSITION_INT", on_position)
+    while True:
+        for result in dispatcher.pump(master, timeout=1.0):
+            ...   # ハンドラが None 以外を返したら、ここで受け取れる
+
+ハンドラは msg を1つ受け取る関数。None 以外を返すと pump() / feed() の戻り値に入るので、
+「到着した理由」等を返してループを抜ける、という書き方ができる。
+"""
+
+from pymavlink import mavutil
+
+MAVLINK1_STX = 0xFE
+MAVLINK2_STX = 0xFD
+MAVLINK2_SIGNED = 0x01          # incompat_flags: 署名付き（末尾に13バイト追加）
+SIGNATURE_LEN = 13
+MAVLINK1_MIN_LEN = 6 + 2        # ヘッダ + CRC（ペイロード0バイト）
+MAVLINK2_MIN_LEN = 10 + 2
+
+# pump() で1回に読むバイト数の上限
+RECV_BYTES = 65536
+
+
+def message_id(msg_type):
+    """メッセージ名（"HEARTBEAT" 等）またはメッセージID を、メッセージID(int) にする。"""
+    if isinstance(msg_type, int):
+        return msg_type
+    msg_id = getattr(mavutil.mavlink, "MAVLINK_MSG_ID_%s" % msg_type.upper(), None)
+    if msg_id is None:
+        raise ValueError("不明なメッセージ名です: %s" % msg_type)
+    return msg_id
+
+
+class MessageDispatcher:
+    """メッセージID → ハンドラの表で受信メッセージを振り分ける。"""
+
+    def __init__(self, mav=None):
+        # デコード用の MAVLink インスタンス（送信には使わない）
+        self.mav = mav or mavutil.mavlink.MAVLink(None, srcSystem=255, srcComponent=0)
+        self.handlers = {}             # メッセージID → [ハンドラ, ...]
+        self.bytes_received = 0
+        self.decoded = 0               # デコードしてハンドラへ渡したメッセージ数
+        self.skipped = 0               # 登録が無いので読み飛ばしたメッセージ数
+        self.bad_data = 0              # CRC エラー等で捨てたフレーム数
+        self.frame_hook = None         # frame_hook(sysid, compid, seq, msg_id, length)（全フレーム）
+        self.crc_error_hook = None     # crc_error_hook()（frame_hook があるとき、読み飛ばす型の CRC エラー）
+        self._buf = bytearray()
+
+    # ---- 登録 ----------------------------------------------------------
+
+    def on(self, msg_types, handler=None):
+        """msg_types（名前・ID・それらのリスト）にハンドラを登録する。
+
+        handler を省略するとデコレータとして使える:
+            @dispatcher.on("HEARTBEAT")
+            def on_heartbeat(msg): ...
+        """
+        if isinstance(msg_types, (str, int)):
+            msg_types = [msg_types]
+        ids = [message_id(t) for t in msg_types]
+
+        def register(func):
+            for msg_id in ids:
+                self.handlers.setdefault(msg_id, []).append(func)
+            return func
+
+        if handler is None:
+            return register
+        return register(handler)
+
+    def off(self, msg_types, handler):
+        """on() で登録したハンドラを外す。"""
+        if isinstance(msg_types, (str, int)):
+            msg_types = [msg_types]
+        for msg_id in (message_id(t) for t in msg_types):
+            handlers = self.handlers.get(msg_id, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if not handlers:
+                self.handlers.pop(msg_id, None)
+
+    @property
+    def message_types(self):
+        """登録されているメッセージ名の一覧（recv_match の type= にも使える）。"""
+        names = []
+        for msg_id in self.handlers:
+            msg_class = mavutil.mavlink.mavlink_map.get(msg_id)
+            names.append(msg_class.msgname if msg_class else str(msg_id))
+        return names
+
+    # ---- 振り分け --------------------------------------------------------
+
+    def dispatch(self, msg):
+        """デコード済みの msg をハンドラへ渡す。None 以外の戻り値を最初の1つだけ返す。"""
+        result = None
+        for handler in self.handlers.get(msg.get_msgId(), ()):
+            value = handler(msg)
+            if result is None:
+                result = value
+        return result
+
+    def feed(self, data, on_message=None):
+        """受信したバイト列を処理する。ハンドラが返した None 以外の値のリストを返す。
+
+        on_message を渡すと、デコードした各メッセージを dispatch の前に渡す
+        （mavutil の接続の状態更新 post_message 等に使う）。
+        """
+        self.bytes_received += len(data)
+        buf = self._buf
+        buf += data
+        handlers = self.handlers
+        results = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            stx = buf[pos]
+            if stx == MAVLINK2_STX:
+                if pos + MAVLINK2_MIN_LEN > end:
+                    break
+                length = MAVLINK2_MIN_LEN + buf[pos + 1]
+                if buf[pos + 2] & MAVLINK2_SIGNED:
+                    length += SIGNATURE_LEN
+                msg_id = buf[pos + 7] | (buf[pos + 8] << 8) | (buf[pos + 9] << 16)
+            elif stx == MAVLINK1_STX:
+                if pos + MAVLINK1_MIN_LEN > end:
+                    break
+                length = MAVLINK1_MIN_LEN + buf[pos + 1]
+                msg_id = buf[pos + 5]
+            else:
+                # フレームの先頭ではない: 次の STX まで読み飛ばす
+                pos = self._next_stx(buf, pos + 1, end)
+                self.bad_data += 1
+                continue
+            if pos + length > end:
+                break                   # フレームの途中までしか届いていない
+
+            frame_end = pos + length
+            if msg_id not in handlers:
+                # 直後が次のフレームの先頭なら、長さは正しいとみなしてデコードせず飛ばす。
+                # そうでなければ（ノイズで STX に見えただけかもしれない）CRC で確かめる。
+                # frame_hook があるときは、壊れたフレームを数えないよう CRC だけ確かめる。
+                if frame_end == end or buf[frame_end] in (MAVLINK1_STX, MAVLINK2_STX):
+                    if self.frame_hook is not None:
+                        if not self._crc_ok(buf, pos, stx, msg_id, frame_end):
+                            self.bad_data += 1
+                            if self.crc_error_hook is not None:
+                                self.crc_error_hook()
+                            pos += 1
+                            continue
+                        self._frame(buf, pos, stx, msg_id, length)
+                    self.skipped += 1
+                    pos = frame_end
+                    continue
+            try:
+                msg = self.mav.decode(buf[pos:frame_end])
+            except mavutil.mavlink.MAVError:
+                self.bad_data += 1
+                pos += 1
+                continue
+            if self.frame_hook is not None:
+                self._frame(buf, pos, stx, msg_id, length)
+            pos = frame_end
+            if msg_id not in handlers:
+                self.skipped += 1
+                continue
+            self.decoded += 1
+            if on_message is not None:
+                on_message(msg)
+            value = self.dispatch(msg)
+            if value is not None:
+                results.append(value)
+        del buf[:pos]
+        return results
+
+    def _frame(self, buf, pos, stx, msg_id, length):
+        if stx == MAVLINK2_STX:
+            self.frame_hook(buf[pos + 5], buf[pos + 6], buf[pos + 4], msg_id, length)
+        else:
+            self.frame_hook(buf[pos + 3], buf[pos + 4], buf[pos + 2], msg_id, length)
+
+    @staticmethod
+    def _crc_ok(buf, pos, stx, msg_id, frame_end):
+        """デコードせずにフレームの CRC だけを確かめる（署名は確かめない）。"""
+        msg_class = mavutil.mavlink.mavlink_map.get(msg_id)
+        if msg_class is None:
+            return False
+        header = 10 if stx == MAVLINK2_STX else 6
+        crc_end = pos + header + buf[pos + 1]
+        if crc_end + 2 > frame_end:
+            return False
+        crc = mavutil.mavlink.x25crc(buf[pos + 1:crc_end])
+        crc.accumulate(bytes((msg_class.crc_extra,)))
+        return crc.crc == buf[crc_end] | (buf[crc_end + 1] << 8)
+
+    @staticmethod
+    def _next_stx(buf, start, end):
+        found = [p for p in (buf.find(bytes([MAVLINK2_STX]), start),
+                             buf.find(bytes([MAVLINK1_STX]), start)) if p != -1]
+        return min(found) if found else end
+
+    # ---- mavutil の接続から読む ----------------------------------------------
+
+    def pump(self, master, timeout=1.0):
+        """mavutil の接続から届いている分を読んで処理する。ハンドラの戻り値のリストを返す。
+
+        データが無ければ最大 timeout 秒待つ。デコードしたメッセージは master.post_message()
+        にも渡すので、HEARTBEAT を登録していれば master.motors_armed() 等も今まで通り使える。
+        同じ接続で recv_match() を使っていた場合、パーサに残っていたバイト列も引き取る。
+        """
+        leftover = _take_buffered(master.mav)
+        if leftover:
+            results = self.feed(leftover, master.post_message)
+            if results:
+                return results
+        if not master.select(timeout):
+            return []
+        data = master.recv(RECV_BYTES)
+        if not data:
+            return []
+        if master.first_byte:
+            master.auto_mavlink_version(data)
+        return self.feed(data, master.post_message)
+
+
+def _take_buffered(mav):
+    """pymavlink のパーサに溜まっている未処理のバイト列を取り出して空にする。"""
+    buf = getattr(mav, "buf", None)
+    if not buf or mav.buf_index >= len(buf):
+        return b""
+    data = bytes(buf[mav.buf_index:])
+    mav.buf = bytearray()
+    mav.buf_index = 0
+    mav.expected_length = mavutil.mavlink.HEADER_LEN_V1 + 2
+    return data
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+メッセージの送信レートの管理（利用者ごとの要求をまとめて SET_MESSAGE_INTERVAL）
+
+送信レートの要求はスクリプトごとにばらばらに出されている。
+  - blueos の backend: request_data_stream_send(..., MAV_DATA_STREAM_ALL, 4, 1)
+  - pm01_message_dump.py / multi_vehicles_relay.py の request_message_interval:
+    MAV_CMD_SET_MESSAGE_INTERVAL
+  - 18th/yuji-sakamoto の square.py: intervalReq
+後から出した要求が前の要求を黙って上書きするので、地図は 10Hz の位置が欲しいのに
+到着判定が 2Hz に下げてしまう、逆に誰も使わなくなったメッセージが高いレートのまま
+無線の帯域と機体・地上局の CPU を使い続ける、ということが起きる。
+
+RateManager は利用者（consumer）ごとの要求 {メッセージ: Hz} を覚えておき、
+  - メッセージごとに全利用者の最大のレートを求め、機体に設定済みの値と違うもの（差分）だけを
+    SET_MESSAGE_INTERVAL で送る
+  - 送った後に GET_MESSAGE_INTERVAL で読み戻し、MESSAGE_INTERVAL の値で確かめる
+    （COMMAND_ACK にはメッセージID が無いので、確認は MESSAGE_INTERVAL の message_id で突き合わせる）
+  - 初めて変えるメッセージは、変える前の間隔を読んでおく。利用者が抜けたら残りの利用者の最大の
+    レートへ下げ、誰も使わなくなったら元の間隔へ戻す（読めなかったら既定のレート = 0）
+送信は param_write と同じく、応答待ちを最大 window 個までにしてまとめて送り、
+応答が無い・値が違うものだけを送り直す。
+
+使い方:
+    rates = RateManager(master)
+    rates.require("map", {"GLOBAL_POSITION_INT": 10, "ATTITUDE": 10})
+    rates.require("arrival", {"GLOBAL_POSITION_INT": 2, "MISSION_CURRENT": 1})
+    print(rates.apply().table())             # GLOBAL_POSITION_INT 10Hz, ATTITUDE 10Hz, MISSION_CURRENT 1Hz
+
+    rates.release("map")
+    rates.apply()                            # GLOBAL_POSITION_INT 2Hz, ATTITUDE は元の間隔へ
+
+    with rates.consumer("logger", {"VFR_HUD": 5}):
+        ...                                  # 抜けるときに元へ戻す
+
+    # コマンドラインから（Enter で元へ戻す）
+    python message_rates.py tcp:127.0.0.1:5762 GLOBAL_POSITION_INT=10 ATTITUDE=20
+"""
+
+import argparse
+import contextlib
+import time
+
+from pymavlink import mavutil
+
+from mav_dispatch import message_id
+
+DEFAULT_WINDOW = 8         # 応答待ちにしておけるメッセージの数
+DEFAULT_TIMEOUT = 1.0      # 1回の送信で応答を待つ時間[秒]
+DEFAULT_RETRIES = 3        # 1つのメッセージを送る回数の上限（初回を含む）
+
+# 読み戻した間隔のずれの許容[µs]（ArduPilot は ms 単位で持つので、最大 1ms 丸められる）
+INTERVAL_TOLERANCE = 1000
+
+# 既定のレートへ戻すときの間隔（SET_MESSAGE_INTERVAL の param2）
+DEFAULT_INTERVAL = 0
+
+# 結果の状態
+OK = "ok"                  # 読み戻した間隔が一致した
+MISMATCH = "mismatch"      # 読み戻した間隔が違う（機体がレートを制限した等）
+TIMEOUT = "timeout"        # MESSAGE_INTERVAL が返らなかった（未対応の FW 等）
+PENDING = "pending"
+
+
+def interval_us(hz):
+    """レート[Hz] → SET_MESSAGE_INTERVAL の間隔[µs]。"""
+    return int(round(1e6 / hz))
+
+
+def message_name(msg_id):
+    msg_class = mavutil.mavlink.mavlink_map.get(msg_id)
+    return msg_class.msgname if msg_class is not None else str(msg_id)
+
+
+class RateChange:
+    """1つのメッセージの設定（または読み出し）の結果。"""
+
+    def __init__(self, msg_id, interval):
+        self.msg_id = msg_id
+        self.name = message_name(msg_id)
+        self.interval = interval   # 設定する間隔[µs]（None は読み出しだけ、0 は既定のレート）
+        self.status = PENDING
+        self.reported = None       # MESSAGE_INTERVAL で読み戻した間隔[µs]
+        self.attempts = 0
+        self.first_sent = None
+        self.last_sent = None
+        self.latency = None        # 最初の送信から確定までの時間[秒]
+
+    def matches(self, reported):
+        if self.interval is None or self.interval == DEFAULT_INTERVAL:
+            return True            # 読み出しだけ・既定のレートは値を問わない
+        return abs(reported - self.interval) <= INTERVAL_TOLERANCE
+
+
+class RateResult:
+    """apply() の結果。rows はメッセージID → RateChange（設定したものだけ）。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.elapsed = 0.0         # 全体の時間[秒]（変える前の間隔の読み出しを含む）
+        self.sent = 0              # 送った COMMAND_LONG の総数
+        self.queried = 0           # 変える前の間隔を読んだメッセージの数
+
+    @property
+    def ok(self):
+        return all(row.status == OK for row in self.rows.values())
+
+    @property
+    def failed(self):
+        return [row.name for row in self.rows.values() if row.status != OK]
+
+    def table(self):
+        """結果の表（文字列）。"""
+        lines = ["%-24s %10s %10s %-9s %4s %9s"
+                 % ("message", "requested", "reported", "status", "try", "ms")]
+        for row in self.rows.values():
+            lines.append("%-24s %10s %10s %-9s %4d %9s" % (
+                row.name, _rate_text(row.interval), _rate_text(row.reported),
+                row.status, row.attempts,
+                "-" if row.latency is None else "%.1f" % (row.latency * 1000)))
+        lines.append("合計 %.3f 秒、COMMAND_LONG %d 回（変える前の読み出し %d 個）、失敗 %d 個"
+                     % (self.elapsed, self.sent, self.queried, len(self.failed)))
+        return "\n".join(lines)
+
+
+def _rate_text(interval):
+    if interval is None:
+        return "-"
+    if interval == DEFAULT_INTERVAL:
+        return "default"
+    if interval < 0:
+        return "off"
+    return "%.4gHz" % (1e6 / interval)
+
+
+class RateManager:
+    """1機体（master）のメッセージのレートを、利用者ごとの要求から決めて設定する。"""
+
+    def __init__(self, master, window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES):
+        self.master = master
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.consumers = {}        # 利用者の名前 → {メッセージID: Hz}
+        self.applied = {}          # メッセージID → 設定した間隔[µs]（RateManager が変えたものだけ）
+        self.original = {}         # メッセージID → 最初に変える前の間隔[µs]
+
+    # ---- 要求 ------------------------------------------------------------
+
+    def require(self, consumer, rates):
+        """利用者 consumer の要求を {メッセージ名 または ID: Hz} で登録する（前の要求は置き換える）。"""
+        required = {}
+        for msg_type, hz in rates.items():
+            if hz <= 0:
+                raise ValueError("レートは正の値にしてください: %s=%r" % (msg_type, hz))
+            required[message_id(msg_type)] = float(hz)
+        self.consumers[consumer] = required
+
+    def release(self, consumer):
+        """利用者 consumer の要求を取り消す（次の apply() で下げる・元へ戻す）。"""
+        self.consumers.pop(consumer, None)
+
+    def targets(self):
+        """メッセージID → 全利用者の最大のレート[Hz]。"""
+        targets = {}
+        for required in self.consumers.values():
+            for msg_id, hz in required.items():
+                targets[msg_id] = max(hz, targets.get(msg_id, 0.0))
+        return targets
+
+    def pending(self):
+        """機体に送る必要のある差分（メッセージID → 間隔[µs]）。"""
+        changes = {}
+        targets = self.targets()
+        for msg_id, hz in targets.items():
+            interval = interval_us(hz)
+            if self.applied.get(msg_id) != interval:
+                changes[msg_id] = interval
+        for msg_id in self.applied:
+            if msg_id not in targets:
+                changes[msg_id] = self.original.get(msg_id, DEFAULT_INTERVAL)
+        return changes
+
+    @contextlib.contextmanager
+    def consumer(self, consumer, rates):
+        """with の間だけ consumer の要求を有効にする（入るとき・抜けるときに apply()）。"""
+        self.require(consumer, rates)
+        result = self.apply()
+        try:
+            yield result
+        finally:
+            self.release(consumer)
+            self.apply()
+
+    # ---- 設定 ------------------------------------------------------------
+
+    def apply(self):
+        """差分だけを機体に設定して確かめ、RateResult を返す。差分が無ければ何も送らない。"""
+        started = time.time()
+        changes = self.pending()
+        sent = 0
+        unknown = [msg_id for msg_id in changes
+                   if msg_id not in self.applied and msg_id not in self.original]
+        if unknown:
+            rows, sent = self._exchange({msg_id: None for msg_id in unknown})
+            for msg_id, row in rows.items():
+                self.original[msg_id] = row.reported if row.status == OK else DEFAULT_INTERVAL
+
+        rows, count = self._exchange(changes)
+        targets = self.targets()
+        for msg_id, row in rows.items():
+            if row.status != OK:
+                continue                           # 次の apply() でもう一度送る
+            if msg_id in targets:
+                self.applied[msg_id] = row.interval
+            else:                                  # 元へ戻した
+                self.applied.pop(msg_id, None)
+                self.original.pop(msg_id, None)
+        result = RateResult(rows)
+        result.sent = sent + count
+        result.queried = len(unknown)
+        result.elapsed = time.time() - started
+        return result
+
+    def _command(self, command, msg_id, interval=0):
+        self.master.mav.command_long_send(self.master.target_system, self.master.target_component,
+                                          command, 0, msg_id, interval, 0, 0, 0, 0, 0)
+
+    def _exchange(self, intervals):
+        """intervals（ID → 間隔、None は読み出しだけ）を SET + GET で送り、(rows, 送信数) を返す。"""
+        rows = {msg_id: RateChange(msg_id, interval) for msg_id, interval in intervals.items()}
+        queue = list(rows.values())    # 送信待ち（初回・再送）
+        in_flight = {}                 # メッセージID → RateChange（応答待ち）
+        sent = 0
+
+        def settle(row, status, now):
+            row.status = status
+            row.latency = now - row.first_sent
+            in_flight.pop(row.msg_id, None)
+
+        def retry_or_fail(row, status, now):
+            in_flight.pop(row.msg_id, None)
+            if row.attempts < self.retries:
+                queue.append(row)
+            else:
+                settle(row, status, now)
+
+        while queue or in_flight:
+            now = time.time()
+            while queue and len(in_flight) < self.window:
+                row = queue.pop(0)
+                if row.interval is not None:
+                    self._command(mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, row.msg_id, row.interval)
+                    sent += 1
+                self._command(mavutil.mavlink.MAV_CMD_GET_MESSAGE_INTERVAL, row.msg_id)
+                sent += 1
+                row.attempts += 1
+                row.first_sent = row.first_sent or now
+                row.last_sent = now
+                in_flight[row.msg_id] = row
+
+            msg = self.master.recv_match(type="MESSAGE_INTERVAL", blocking=True,
+                                         timeout=min(0.1, self.timeout))
+            now = time.time()
+            if msg is not None and msg.get_srcSystem() == self.master.target_system:
+                row = in_flight.get(msg.message_id)
+                if row is not None:
+                    row.reported = msg.interval_us
+                    if row.matches(msg.interval_us):
+                        settle(row, OK, now)
+                    else:
+                        retry_or_fail(row, MISMATCH, now)
+
+            for row in list(in_flight.values()):
+                if now - row.last_sent >= self.timeout:
+                    retry_or_fail(row, TIMEOUT, now)
+        return rows, sent
+
+
+def parse_assignment(text):
+    name, value = text.split("=", 1)
+    return name.strip().upper(), float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メッセージの送信レートの設定")
+    parser.add_argument("device", help="接続文字列（例: tcp:127.0.0.1:5762）")
+    parser.add_argument("assignments", nargs="+", metavar="MESSAGE=HZ")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="応答待ち時間[秒]")
+    args = parser.parse_args()
+
+    master = mavutil.mavlink_connection(args.device, source_system=1, source_component=90)
+    master.wait_heartbeat()
+    rates = RateManager(master, timeout=args.timeout)
+    with rates.consumer("cli", dict(parse_assignment(a) for a in args.assignments)) as result:
+        print(result.table())
+        input("Enter で元のレートに戻します...")
+    master.close()
+
+
+if __name__ == "__main__":
+    main()
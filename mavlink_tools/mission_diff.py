@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+ミッションの差分と、変わった部分だけの書き込み（MISSION_WRITE_PARTIAL_LIST）
+
+1つのウェイポイントを変えるだけでも、ミッション全体をアップロードし直すと
+長いミッションでは数秒〜数十秒リンクがふさがる（飛行中の再指示では致命的）。
+
+MissionMirror は「機体に入っているはずのミッション」の写しを持ち、
+新しいミッションとの差分から、変わった連続区間だけを MISSION_WRITE_PARTIAL_LIST で書き込む。
+  - 件数が変わる場合（追加・削除）は部分書き込みができないので、全体をアップロードする
+    （プロトコルの仕様で、部分書き込みは既存の seq の置き換えしかできない）
+  - 機体が部分書き込みを拒否した場合も、全体のアップロードに切り替える
+  - 写しが古くないか、書き込む前に MISSION_COUNT で件数だけ確かめる（1往復）
+
+写しはミッションのキャッシュとしても使える（mission()）。書き込みのたびに
+ダウンロードし直して確かめる代わりに、写しを返す。写しを捨てるのは
+  - handle() に渡したメッセージで、機体のミッションが変わったと分かったとき
+    （MISSION_CHANGED、他の GCS の書き込みへの MISSION_ACK、MISSION_CURRENT の
+    mission_id が写しの ID と違うとき）
+  - 確認（verify=True）で件数が違うか、機体の返す ID（opaque_id）が写しと違うとき
+機体が ID を返す（MAVLink2 の opaque_id / mission_id）場合、MISSION_CURRENT の mission_id が
+写しの ID と同じなら確認の往復もしない。MISSION_CHANGED と ID はそれらを含む dialect
+（MAVLINK20=1 の common 等）でだけ使われ、無い dialect では件数の確認と MISSION_ACK で判定する。
+
+他の GCS の書き込みは、ACCEPTED の MISSION_ACK の宛先（target_system / target_component）が
+自分（master の source_system / source_component）と違うことで判定する。他の GCS が
+同じ sysid・compid を使っていると区別できない（その場合は verify=True の件数の確認に頼る）。
+
+使い方:
+    mirror = MissionMirror(master)
+    mirror.sync()                          # 機体からダウンロードして写しを作る
+    items = mirror.copy()
+    items[120].x = int(35.88 * 1e7)        # 1件だけ変更
+    report = mirror.apply(items)
+    print(report.mode, report.ranges)      # "partial" [(120, 120)]
+
+    items = mirror.mission()               # 変わっていなければ写しを返す（ダウンロードしない）
+    pool.on(MISSION_WATCH, lambda vehicle, msg: mirror.handle(msg))   # 変更を監視する
+"""
+
+import copy
+import struct
+import time
+
+from pymavlink import mavutil
+
+import mission_transfer
+
+# この件数以下の「変わっていない区間」で隔てられた変更区間は1回の書き込みにまとめる
+# （部分書き込み1回ごとに往復が増えるため、少しなら同じ値を書き直すほうが速い）
+DEFAULT_MERGE_GAP = 2
+
+# 比較に使うフィールド（seq / 宛先 / current は比較しない）
+ITEM_FIELDS = ("frame", "command", "autocontinue", "param1", "param2", "param3", "param4",
+               "x", "y", "z")
+FLOAT_FIELDS = ("param1", "param2", "param3", "param4", "z")
+
+# 写しを古くするかを判定するメッセージ（MissionMirror.handle() に渡す）
+# MISSION_CHANGED は dialect に無いことがある（ardupilotmega の v1.0 等）ので、あるものだけにする
+# （無い名前を MessageDispatcher.on() / pool.on() に渡すと ValueError になる）
+MISSION_WATCH = tuple(name for name in ("MISSION_CHANGED", "MISSION_ACK", "MISSION_CURRENT")
+                      if name in {cls.msgname for cls in mavutil.mavlink.mavlink_map.values()})
+
+
+def _float32(value):
+    return struct.unpack("<f", struct.pack("<f", float(value)))[0]
+
+
+def item_key(item):
+    """アイテムの内容を比較用のタプルにする。実数は機体と同じ float32 に丸める。"""
+    return tuple(_float32(getattr(item, name)) if name in FLOAT_FIELDS else getattr(item, name)
+                 for name in ITEM_FIELDS)
+
+
+def diff_ranges(old, new, merge_gap=DEFAULT_MERGE_GAP):
+    """内容が変わった seq の連続区間 [(開始, 終了), ...]（終了を含む）を返す。
+
+    件数が違う場合は部分書き込みで表せないので None を返す。
+    """
+    if len(old) != len(new):
+        return None
+    ranges = []
+    for seq, (a, b) in enumerate(zip(old, new)):
+        if item_key(a) == item_key(b):
+            continue
+        if ranges and seq - ranges[-1][1] - 1 <= merge_gap:
+            ranges[-1] = (ranges[-1][0], seq)
+        else:
+            ranges.append((seq, seq))
+    return ranges
+
+
+class ApplyReport:
+    """MissionMirror.apply() の結果。"""
+
+    def __init__(self, mode, ranges, items_sent, elapsed, reason=None):
+        self.mode = mode                # "none" / "partial" / "full"
+        self.ranges = ranges            # 部分書き込みした区間
+        self.items_sent = items_sent    # 書き込んだアイテム数
+        self.elapsed = elapsed          # かかった時間[秒]
+        self.reason = reason            # 全体のアップロードにした理由
+
+
+class MissionMirror:
+    """機体のミッションの写し。差分だけを書き込むために使う。"""
+
+    def __init__(self, master, mission_type=0, merge_gap=DEFAULT_MERGE_GAP, rtt=None):
+        self.master = master
+        self.mission_type = mission_type
+        self.merge_gap = merge_gap
+        self.rtt = rtt or mission_transfer.RttEstimator()
+        self.items = None               # 機体に入っているはずのアイテム（None は未取得）
+        self.opaque_id = None           # 写しのミッションの ID（機体が返す場合）
+        self.current_id = None          # MISSION_CURRENT で最後に見た mission_id
+        self.stale = False              # handle() で機体のミッションが変わったと分かった
+        self.downloads = 0              # sync() でダウンロードした回数
+
+    def sync(self):
+        """機体からダウンロードして写しを作り直す。"""
+        transfer = mission_transfer.MissionDownload(
+            self.master.target_system, self.master.target_component,
+            mission_type=self.mission_type, rtt=self.rtt)
+        self.items = mission_transfer.run_transfer(self.master, transfer)
+        self._synced(transfer.opaque_id)
+        self.downloads += 1
+        return self.items
+
+    def _synced(self, opaque_id):
+        self.opaque_id = opaque_id
+        self.stale = False
+
+    def mission(self, verify=True):
+        """機体のミッション。写しが使えればダウンロードせずに写しを返す（書き換えないこと）。
+
+        verify=True なら、機体の件数（と ID）を1往復で確かめる（MISSION_CURRENT の
+        mission_id が写しの ID と同じなら確かめない）。verify=False なら handle() で
+        変更が分かるまで写しを信じる。
+        """
+        if self.items is None or self.stale:
+            return self.sync()
+        if verify and not self._unchanged():
+            return self.sync()
+        return self.items
+
+    def handle(self, msg):
+        """受信したメッセージ（MISSION_WATCH）を渡す。ミッションが変わったと分かれば写しを古くする。"""
+        if msg.get_srcSystem() != self.master.target_system:
+            return
+        if getattr(msg, "mission_type", 0) != self.mission_type:
+            return
+        msg_type = msg.get_type()
+        if msg_type == "MISSION_CHANGED":
+            self.stale = True
+        elif msg_type == "MISSION_ACK":
+            # 自分宛て以外の ACCEPTED = 他の GCS が書き込んだ（同じ sysid の GCS は compid で区別する）
+            mav = self.master.mav
+            if (msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED
+                    and (msg.target_system, msg.target_component) != (mav.srcSystem, mav.srcComponent)):
+                self.stale = True
+        elif msg_type == "MISSION_CURRENT":
+            mission_id = getattr(msg, "mission_id", 0) or None
+            if mission_id is not None:
+                self.current_id = mission_id
+                if self.opaque_id is not None and mission_id != self.opaque_id:
+                    self.stale = True
+
+    def _unchanged(self):
+        """写しが機体のミッションと同じか（ID が分かれば往復なし、分からなければ件数で確かめる）。"""
+        if self.stale:
+            return False
+        if self.opaque_id is not None and self.current_id == self.opaque_id:
+            return True
+        count, opaque_id = self._vehicle_count()
+        if count != len(self.items):
+            return False
+        return self.opaque_id is None or opaque_id is None or opaque_id == self.opaque_id
+
+    def copy(self):
+        """写しのコピー（書き換えて apply() に渡す用）。"""
+        return [copy.copy(item) for item in self.items or []]
+
+    def vehicle_count(self):
+        """機体のミッション件数を問い合わせる。"""
+        return self._vehicle_count()[0]
+
+    def _vehicle_count(self):
+        transfer = mission_transfer.MissionDownload(
+            self.master.target_system, self.master.target_component, start=0, end=0,
+            mission_type=self.mission_type, rtt=self.rtt)
+        mission_transfer.run_transfer(self.master, transfer)
+        return transfer.count, transfer.opaque_id
+
+    def _upload(self, items, start_index=None):
+        transfer = mission_transfer.MissionUpload(
+            self.master.target_system, self.master.target_component, items,
+            self.mission_type, self.rtt, start_index=start_index)
+        mission_transfer.run_transfer(self.master, transfer)
+        self._synced(transfer.opaque_id)
+
+    def apply(self, new_items, verify=True):
+        """new_items を機体へ書き込む。変わった区間だけを送り、できなければ全体を送る。"""
+        started = time.monotonic()
+        new_items = [copy.copy(item) for item in new_items]
+        for seq, item in enumerate(new_items):
+            item.seq = seq              # 写しの seq は機体と同じにしておく（MissionUpload は写しを変えない）
+        reason = None
+        ranges = None
+        if self.items is None:
+            reason = "機体のミッションの写しがありません"
+        elif verify and not self._unchanged():
+            reason = "機体のミッションが写しと違います（他から書き換えられた）"
+        else:
+            ranges = diff_ranges(self.items, new_items, self.merge_gap)
+            if ranges is None:
+                reason = "件数が変わるため部分書き込みできません"
+
+        if ranges is not None and not ranges:
+            return ApplyReport("none", [], 0, time.monotonic() - started)
+
+        if ranges is not None:
+            sent = 0
+            try:
+                for first, last in ranges:
+                    self._upload(new_items[first:last + 1], start_index=first)
+                    sent += last - first + 1
+                    # 書き込めた区間は写しにも反映する（途中で失敗しても写しは正しいまま）
+                    self.items[first:last + 1] = [copy.copy(item) for item in new_items[first:last + 1]]
+                return ApplyReport("partial", ranges, sent, time.monotonic() - started)
+            except mission_transfer.MissionTransferError as error:
+                reason = "部分書き込みに失敗しました（%s）" % error
+
+        self._upload(new_items)
+        self.items = [copy.copy(item) for item in new_items]
+        return ApplyReport("full", [], len(new_items), time.monotonic() - started, reason)
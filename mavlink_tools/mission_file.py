@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+ミッションファイルの読み書き（.waypoints / QGC の .plan / 旧形式の .mission）
+
+QGC WPL 110（.waypoints）の読み込みは、スクリプトごとに別々に書かれている
+（internet_mission.mission_parser、measure_battery_auto.read_mission_from_waypoints、
+sequential_control.load_mission_from_file 等）。改行コード（\\r\\n / \\n）の扱いも、
+読み飛ばす行の条件もそれぞれ違い、dronekit の Command や dict を1件ずつ作るので
+数千件の測量グリッドでは読み込みと変換に時間がかかる。
+
+このモジュールは3つの形式を、1件 1行の NumPy の構造化配列（MISSION_DTYPE）に読み込む。
+  - .waypoints は BLOCK_LINES 行ずつ読み（ストリーム）、ブロックごとに NumPy で数値化・検証する。
+    合わないブロックだけ1行ずつ読み直し、行番号つきのエラーにする。
+    改行コードは何でもよい（ユニバーサル改行）。先頭の BOM も読み飛ばす
+  - 数値は float64 のまま持ち、書き出しは repr（最短で元の値に戻る表記）なので、
+    読み込み → 書き出し → 読み込みで値は変わらない
+  - 検証: 列の数・数値・seq が 0 からの連番か・current / autocontinue が 0 か 1 か・
+    frame と command が既知の値か（strict=False で省略）・緯度経度の範囲。
+    問題があれば MissionFileError（ファイル名と行番号つき）
+  - .plan（QGC）の survey 等の ComplexItem は、QGC が保存時に展開したアイテム
+    （TransectStyleComplexItem.Items）を読み込む。書き出しは SimpleItem だけになる
+
+seq 0 はホーム（.plan / .mission では plannedHomePosition）として扱う（Mission Planner と同じ）。
+.plan / .mission に書き出すとき、seq 0 は緯度・経度・高度だけが残る。
+
+使い方:
+    mission = load("survey.waypoints")        # 拡張子で形式を選ぶ
+    mission["z"] += 10                         # 配列としてまとめて編集できる
+    save("survey.plan", mission)
+    items = to_items(mission, master.target_system, master.target_component)
+    upload_mission(master, items)              # mission_transfer
+"""
+
+import itertools
+import json
+import math
+import os
+import warnings
+
+import numpy as np
+from pymavlink import mavutil
+
+WAYPOINTS_HEADER = "QGC WPL 110"
+
+MISSION_DTYPE = np.dtype([
+    ("seq", "<u4"),
+    ("current", "u1"),
+    ("frame", "u1"),
+    ("command", "<u2"),
+    ("param1", "<f8"),
+    ("param2", "<f8"),
+    ("param3", "<f8"),
+    ("param4", "<f8"),
+    ("x", "<f8"),            # 緯度[度]（ローカル座標系では x[m]）
+    ("y", "<f8"),            # 経度[度]
+    ("z", "<f8"),            # 高度[m]
+    ("autocontinue", "u1"),
+])
+
+FIELDS = MISSION_DTYPE.names
+
+# 緯度経度で位置を表す座標系（MISSION_ITEM_INT では x, y が 1e7 倍の整数になる）
+GLOBAL_FRAMES = frozenset((
+    mavutil.mavlink.MAV_FRAME_GLOBAL,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT_INT,
+))
+
+KNOWN_FRAMES = frozenset(mavutil.mavlink.enums["MAV_FRAME"])
+KNOWN_COMMANDS = frozenset(mavutil.mavlink.enums["MAV_CMD"])
+
+# .waypoints をまとめて数値化する行数
+BLOCK_LINES = 4096
+
+# frame / command の列（MISSION_DTYPE）に入る最大値
+FRAME_MAX = np.iinfo(MISSION_DTYPE["frame"]).max
+COMMAND_MAX = np.iinfo(MISSION_DTYPE["command"]).max
+
+_INTEGER_COLUMNS = [0, 1, 2, 3, 11]
+_FRAME_ARRAY = np.array(sorted(KNOWN_FRAMES))
+_COMMAND_ARRAY = np.array(sorted(KNOWN_COMMANDS))
+_GLOBAL_ARRAY = np.array(sorted(GLOBAL_FRAMES))
+
+
+class MissionFileError(ValueError):
+    """ミッションファイルの形式・内容の誤り。"""
+
+    def __init__(self, source, line, message):
+        super().__init__("%s:%s: %s" % (source, line, message) if line else "%s: %s" % (source, message))
+        self.source = source
+        self.line = line
+
+
+def empty(count=0):
+    return np.zeros(count, dtype=MISSION_DTYPE)
+
+
+# ---- 検証 ----------------------------------------------------------------
+
+def _check(row, expected_seq, strict, source, line):
+    seq, current, frame, command = row[:4]
+    if seq != expected_seq:
+        raise MissionFileError(source, line, "seq が連番ではありません（%d の次が %d）"
+                               % (expected_seq - 1, seq))
+    if current not in (0, 1) or row[11] not in (0, 1):
+        raise MissionFileError(source, line, "current / autocontinue は 0 か 1 です")
+    # strict=False でも、配列の列（frame は u1、command は u2）に入らない値は別の値に化けるので通さない
+    if not 0 <= frame <= FRAME_MAX:
+        raise MissionFileError(source, line, "frame が範囲外です（%d）" % frame)
+    if not 0 <= command <= COMMAND_MAX:
+        raise MissionFileError(source, line, "command が範囲外です（%d）" % command)
+    if strict and frame not in KNOWN_FRAMES:
+        raise MissionFileError(source, line, "不明な frame %d" % frame)
+    if strict and command not in KNOWN_COMMANDS:
+        raise MissionFileError(source, line, "不明な command %d" % command)
+    if frame in GLOBAL_FRAMES and (row[8] or row[9]):
+        if not (-90.0 <= row[8] <= 90.0 and -180.0 <= row[9] <= 180.0):
+            raise MissionFileError(source, line, "緯度経度が範囲外です（%r, %r）" % (row[8], row[9]))
+
+
+def validate(mission, strict=True, source="<mission>"):
+    """配列の内容を検証する（読み込みと同じ規則）。問題がなければ mission を返す。"""
+    for index, row in enumerate(mission.tolist()):
+        _check(row, index, strict, source, "seq %d" % index)
+    return mission
+
+
+# ---- .waypoints（QGC WPL 110） -------------------------------------------------
+
+def _waypoint_rows(lines, expected, strict, source, first_number):
+    """ヘッダの後の行を1行ずつ検証してタプルで返す。"""
+    for number, line in enumerate(lines, first_number):
+        line = line.strip()
+        if not line:
+            continue
+        columns = line.split("\t")
+        if len(columns) != 12:
+            columns = line.split()           # タブが空白になっているファイルも読む
+            if len(columns) != 12:
+                raise MissionFileError(source, number, "列の数が 12 ではありません（%d）" % len(columns))
+        try:
+            row = (int(columns[0]), int(columns[1]), int(columns[2]), int(columns[3]),
+                   float(columns[4]), float(columns[5]), float(columns[6]), float(columns[7]),
+                   float(columns[8]), float(columns[9]), float(columns[10]), int(columns[11]))
+        except ValueError as error:
+            raise MissionFileError(source, number, "数値ではありません（%s）" % error)
+        _check(row, expected, strict, source, number)
+        expected += 1
+        yield row
+
+
+def _read_header(lines, source):
+    """ヘッダの行まで読み進め、読んだ行数を返す。"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            continue
+        if not line.startswith(WAYPOINTS_HEADER):
+            raise MissionFileError(source, number, "1行目が '%s' ではありません" % WAYPOINTS_HEADER)
+        return number
+    raise MissionFileError(source, None, "空のファイルです")
+
+
+def iter_waypoints(lines, strict=True, source="<waypoints>"):
+    """QGC WPL 110 の行（文字列のイテラブル）を1件ずつ検証してタプルで返す。"""
+    lines = iter(lines)
+    number = _read_header(lines, source)
+    yield from _waypoint_rows(lines, 0, strict, source, number + 1)
+
+
+def _parse_block(lines, expected, strict):
+    """数千行をまとめて NumPy で数値にして検証する。
+
+    少しでも合わなければ None を返す（その区間は _waypoint_rows で読み直し、
+    正確な行番号つきのエラーにする）。
+    """
+    lines = [line for line in lines if not line.isspace()]
+    if not lines:
+        return empty()
+    # 合計の個数だけでは、13列の行と11列の行が続くと並びがずれたまま通ってしまうので、行ごとに数える
+    if any(len(line.split()) != 12 for line in lines):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)     # 古い NumPy は途中で止まって警告
+            values = np.fromstring(" ".join(lines), sep=" ")
+    except ValueError:                                              # 数値でない文字がある
+        return None
+    if values.size != 12 * len(lines):
+        return None
+    values = values.reshape(-1, 12)
+    integers = values[:, _INTEGER_COLUMNS]
+    if not np.array_equal(integers, np.floor(integers)):
+        return None
+    seq, current, frame, command, autocontinue = integers.T
+    if not np.array_equal(seq, np.arange(expected, expected + len(values))):
+        return None
+    if ((current > 1) | (current < 0) | (autocontinue > 1) | (autocontinue < 0)).any():
+        return None
+    if ((frame < 0) | (frame > FRAME_MAX) | (command < 0) | (command > COMMAND_MAX)).any():
+        return None
+    if strict and not (np.isin(frame, _FRAME_ARRAY).all() and np.isin(command, _COMMAND_ARRAY).all()):
+        return None
+    lat, lon = values[:, 8], values[:, 9]
+    placed = np.isin(frame, _GLOBAL_ARRAY) & ((lat != 0) | (lon != 0))
+    if (placed & ~((np.abs(lat) <= 90) & (np.abs(lon) <= 180))).any():
+        return None
+    mission = empty(len(values))
+    for column, name in enumerate(FIELDS):
+        mission[name] = values[:, column]
+    return mission
+
+
+def read_waypoints(path, strict=True):
+    """.waypoints を読み込んで MISSION_DTYPE の配列を返す。path はファイルオブジェクトでもよい。
+
+    BLOCK_LINES 行ずつ読み、ブロックごとに NumPy で数値化と検証をする（ファイル全体は
+    メモリに読み込まない）。
+    """
+    if not hasattr(path, "read"):
+        with open(path, encoding="utf-8-sig", newline=None) as f:
+            return _read_waypoints(f, strict, path)
+    return _read_waypoints(path, strict, getattr(path, "name", "<file>"))
+
+
+def _read_waypoints(f, strict, source):
+    number = _read_header(f, source)
+    blocks = []
+    expected = 0
+    while True:
+        lines = list(itertools.islice(f, BLOCK_LINES))
+        if not lines:
+            break
+        block = _parse_block(lines, expected, strict)
+        if block is None:
+            block = np.fromiter(_waypoint_rows(lines, expected, strict, source, number + 1),
+                                dtype=MISSION_DTYPE)
+        blocks.append(block)
+        expected += len(block)
+        number += len(lines)
+    return np.concatenate(blocks) if blocks else empty()
+
+
+def format_waypoints(mission):
+    """QGC WPL 110 の行を1行ずつ返す（改行なし）。"""
+    yield WAYPOINTS_HEADER
+    for row in mission.tolist():
+        yield "%d\t%d\t%d\t%d\t%r\t%r\t%r\t%r\t%r\t%r\t%r\t%d" % row
+
+
+def write_waypoints(path, mission):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for line in format_waypoints(mission):
+            f.write(line + "\n")
+    return path
+
+
+# ---- .plan（QGC） -----------------------------------------------------------
+
+def _json_number(value):
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+
+
+def _param(value):
+    return float("nan") if value is None else float(value)
+
+
+def read_plan(path, strict=True):
+    """QGC の .plan（JSON）を読み込む。plannedHomePosition を seq 0 にする。"""
+    with open(path, encoding="utf-8-sig") as f:
+        try:
+            plan = json.load(f)
+        except ValueError as error:
+            raise MissionFileError(path, None, "JSON ではありません（%s）" % error)
+    if plan.get("fileType") != "Plan" or "mission" not in plan:
+        raise MissionFileError(path, None, "QGC の Plan ファイルではありません")
+    mission = plan["mission"]
+    home = mission.get("plannedHomePosition") or [0.0, 0.0, 0.0]
+    rows = [(0, 1, mavutil.mavlink.MAV_FRAME_GLOBAL, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+             0.0, 0.0, 0.0, 0.0, _param(home[0]), _param(home[1]), _param(home[2]), 1)]
+
+    def add(item, where):
+        if item.get("type") == "SimpleItem":
+            params = item.get("params", [])
+            if len(params) != 7:
+                raise MissionFileError(path, where, "params が 7 個ではありません")
+            rows.append((len(rows), 0, int(item["frame"]), int(item["command"]),
+                         *(_param(value) for value in params), int(bool(item.get("autoContinue", True)))))
+        elif item.get("type") == "ComplexItem":
+            simple = (item.get("TransectStyleComplexItem") or {}).get("Items")
+            if simple is None:
+                raise MissionFileError(path, where, "展開済みのアイテムが無い ComplexItem（%s）"
+                                       % item.get("complexItemType"))
+            for index, child in enumerate(simple):
+                add(child, "%s.%d" % (where, index))
+        else:
+            raise MissionFileError(path, where, "不明なアイテムの種類 %r" % item.get("type"))
+
+    for index, item in enumerate(mission.get("items", [])):
+        add(item, "items[%d]" % index)
+    for row in rows:
+        _check(row, row[0], strict, path, "seq %d" % row[0])
+    return np.array(rows, dtype=MISSION_DTYPE)
+
+
+def write_plan(path, mission, firmware_type=mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+               vehicle_type=mavutil.mavlink.MAV_TYPE_QUADROTOR):
+    """QGC の .plan（JSON）を書き出す。seq 0 を plannedHomePosition にする。"""
+    rows = mission.tolist()
+    home = rows[0] if rows else None
+    items = []
+    for row in rows[1:]:
+        items.append({
+            "type": "SimpleItem",
+            "autoContinue": bool(row[11]),
+            "command": row[3],
+            "doJumpId": row[0],
+            "frame": row[2],
+            "params": [_json_number(value) for value in row[4:11]],
+        })
+    plan = {
+        "fileType": "Plan",
+        "groundStation": "QGroundControl",
+        "version": 1,
+        "geoFence": {"circles": [], "polygons": [], "version": 2},
+        "rallyPoints": {"points": [], "version": 2},
+        "mission": {
+            "version": 2,
+            "firmwareType": firmware_type,
+            "vehicleType": vehicle_type,
+            "plannedHomePosition": [home[8], home[9], home[10]] if home else [0.0, 0.0, 0.0],
+            "items": items,
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=4, allow_nan=False)
+    return path
+
+
+# ---- .mission（QGC の旧形式） ---------------------------------------------------
+
+def read_qgc_mission(path, strict=True):
+    """QGC の旧形式 .mission（JSON、version "1.0"）を読み込む。"""
+    with open(path, encoding="utf-8-sig") as f:
+        try:
+            data = json.load(f)
+        except ValueError as error:
+            raise MissionFileError(path, None, "JSON ではありません（%s）" % error)
+    if "items" not in data:
+        raise MissionFileError(path, None, "QGC の .mission ファイルではありません")
+    home = data.get("plannedHomePosition") or {}
+    coordinate = home.get("coordinate") or [0.0, 0.0, 0.0]
+    rows = [(0, 1, int(home.get("frame", mavutil.mavlink.MAV_FRAME_GLOBAL)),
+             int(home.get("command", mavutil.mavlink.MAV_CMD_NAV_WAYPOINT)), 0.0, 0.0, 0.0, 0.0,
+             _param(coordinate[0]), _param(coordinate[1]), _param(coordinate[2]), 1)]
+    for index, item in enumerate(data["items"]):
+        if item.get("type", "missionItem") != "missionItem":
+            raise MissionFileError(path, "items[%d]" % index, "不明なアイテムの種類 %r" % item.get("type"))
+        coordinate = item.get("coordinate", [0.0, 0.0, 0.0])
+        rows.append((len(rows), 0, int(item["frame"]), int(item["command"]),
+                     _param(item.get("param1", 0)), _param(item.get("param2", 0)),
+                     _param(item.get("param3", 0)), _param(item.get("param4", 0)),
+                     _param(coordinate[0]), _param(coordinate[1]), _param(coordinate[2]),
+                     int(bool(item.get("autoContinue", True)))))
+    for row in rows:
+        _check(row, row[0], strict, path, "seq %d" % row[0])
+    return np.array(rows, dtype=MISSION_DTYPE)
+
+
+def write_qgc_mission(path, mission):
+    rows = mission.tolist()
+
+    def item(row):
+        return {
+            "autoContinue": bool(row[11]),
+            "command": row[3],
+            "coordinate": [_json_number(value) for value in row[8:11]],
+            "frame": row[2],
+            "id": row[0],
+            "param1": _json_number(row[4]),
+            "param2": _json_number(row[5]),
+            "param3": _json_number(row[6]),
+            "param4": _json_number(row[7]),
+            "type": "missionItem",
+        }
+
+    data = {
+        "MAV_AUTOPILOT": mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+        "complexItems": [],
+        "groundStation": "QGroundControl",
+        "items": [item(row) for row in rows[1:]],
+        "plannedHomePosition": item(rows[0]) if rows else None,
+        "version": "1.0",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, allow_nan=False)
+    return path
+
+
+# ---- 形式の選択 -------------------------------------------------------------
+
+READERS = {".waypoints": read_waypoints, ".txt": read_waypoints,
+           ".plan": read_plan, ".mission": read_qgc_mission}
+WRITERS = {".waypoints": write_waypoints, ".txt": write_waypoints,
+           ".plan": write_plan, ".mission": write_qgc_mission}
+
+
+def load(path, strict=True):
+    """拡張子（.waypoints / .txt / .plan / .mission）で形式を選んで読み込む。"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise MissionFileError(path, None, "対応していない拡張子です")
+    return READERS[extension](path, strict=strict)
+
+
+def save(path, mission):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise MissionFileError(path, None, "対応していない拡張子です")
+    return WRITERS[extension](path, mission)
+
+
+# ---- MISSION_ITEM_INT との変換 ------------------------------------------------
+
+def to_items(mission, target_system=0, target_component=0):
+    """MISSION_ITEM_INT のリストにする（緯度経度は 1e7 倍、ローカル座標系は 1e4 倍の整数）。"""
+    is_global = np.isin(mission["frame"], list(GLOBAL_FRAMES))
+    scale = np.where(is_global, 1e7, 1e4)
+    xs = np.round(mission["x"] * scale).astype(np.int64).tolist()
+    ys = np.round(mission["y"] * scale).astype(np.int64).tolist()
+    make = mavutil.mavlink.MAVLink_mission_item_int_message
+    return [make(target_system, target_component, row[0], row[2], row[3], row[1], row[11],
+                 row[4], row[5], row[6], row[7], x, y, row[10])
+            for row, x, y in zip(mission.tolist(), xs, ys)]
+
+
+def from_items(items):
+    """MISSION_ITEM_INT（または MISSION_ITEM）のリストを配列にする。"""
+    mission = empty(len(items))
+    for index, item in enumerate(items):
+        x, y = item.x, item.y
+        if item.get_type() == "MISSION_ITEM_INT":
+            scale = 1e7 if item.frame in GLOBAL_FRAMES else 1e4
+            x, y = x / scale, y / scale
+        mission[index] = (item.seq, item.current, item.frame, item.command, item.param1, item.param2,
+                          item.param3, item.param4, x, y, item.z, item.autocontinue)
+    return mission
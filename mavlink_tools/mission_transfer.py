@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+ミッションのアップロード / ダウンロード（再送・RTT に合わせたタイムアウト・範囲指定つき）
+
+よくある書き方の問題:
+  - pm50_mission_basics.upload_mission は MISSION_COUNT の直後に全アイテムを送りつける。
+    機体は MISSION_REQUEST_INT で1件ずつ要求してくるので、要求前のアイテムは捨てられる。
+  - routes.upload_mission / download_mission は正しいが、1件ずつ往復し、取りこぼすと
+    5秒待ってから再要求する。テレメトリ無線で 200件を超えるミッションだと数分かかる。
+
+このモジュールはミッションプロトコルを状態機械（MissionUpload / MissionDownload）として実装し、
+送受信の方法（同期の mavutil か asyncio か）とは切り離している。
+  - ダウンロード: MISSION_REQUEST_INT を window 件まで同時に出しておき、届いた順に受け取る。
+    必要な範囲（start〜end）だけ取ることもできる。
+  - アップロード: 要求のペースは機体が決めるので、要求が来たらすぐ返す。要求が途切れたら
+    最後に送ったもの（MISSION_COUNT か直前のアイテム）を再送する。最後の ACK を取りこぼした
+    場合は MISSION_COUNT を問い合わせて、書き込めたかを確かめる。
+  - タイムアウトは固定値ではなく、実測した往復時間(RTT)から決める（TCP と同じ計算）。
+    再送した要求の応答は RTT の計測に使わない。RttEstimator を接続ごとに使い回せば、
+    2回目以降の転送は最初から適切なタイムアウトになる。
+
+使い方（同期: mavutil）:
+    items = download_mission(master)                    # 全件
+    items = download_mission(master, start=100, end=120)
+    upload_mission(master, items)
+
+使い方（asyncio: aio_mavlink）:
+    conn = await aio_mavlink.open_connection("tcp:127.0.0.1:5762")
+    await conn.wait_heartbeat()
+    items = await download_mission_async(conn)
+    await upload_mission_async(conn, items)
+
+mission_type（フェンス・ラリーポイント）を指定する場合は MAVLink2 の dialect が必要
+（環境変数 MAVLINK20=1 で pymavlink を読み込む）。
+"""
+
+import asyncio
+import copy
+import time
+
+from pymavlink import mavutil
+
+import aio_mavlink
+
+DEFAULT_WINDOW = 8           # ダウンロード時に同時に出しておく要求の数
+MAX_RETRIES = 5              # 同じ要求を再送する回数の上限
+INITIAL_TIMEOUT = 1.0        # RTT の実測値が無いときのタイムアウト[秒]
+MIN_TIMEOUT = 0.05
+MAX_TIMEOUT = 5.0
+RTT_MARGIN = 0.02            # タイムアウトの RTT への上乗せの下限[秒]（RTT が安定しているときの早すぎる再送を防ぐ）
+
+MISSION_MESSAGES = ["MISSION_COUNT", "MISSION_ITEM_INT", "MISSION_REQUEST_INT",
+                    "MISSION_REQUEST", "MISSION_ACK"]
+
+
+class MissionTransferError(RuntimeError):
+    """ミッションの転送に失敗した（機体が拒否した・応答が無かった）。"""
+
+
+class RttEstimator:
+    """要求→応答の往復時間から再送タイムアウトを決める（RFC 6298 と同じ計算）。"""
+
+    def __init__(self, initial=INITIAL_TIMEOUT, minimum=MIN_TIMEOUT, maximum=MAX_TIMEOUT):
+        self.srtt = None
+        self.rttvar = None
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.samples = 0
+
+    def add(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+
+    @property
+    def timeout(self):
+        if self.srtt is None:
+            return self.initial
+        return min(self.maximum, max(self.minimum, self.srtt + max(4 * self.rttvar, RTT_MARGIN)))
+
+
+def _message(cls, mission_type, *args):
+    """mission_type つきでメッセージを作る（MAVLink1 の dialect では 0 のみ）。"""
+    msg = cls(*args)
+    if mission_type:
+        if "mission_type" not in msg.fieldnames:
+            raise ValueError("mission_type=%d には MAVLink2 の dialect が必要です（MAVLINK20=1）"
+                             % mission_type)
+        msg.mission_type = mission_type
+    return msg
+
+
+def _result_name(result):
+    entry = mavutil.mavlink.enums["MAV_MISSION_RESULT"].get(result)
+    return entry.name if entry else str(result)
+
+
+class _Transfer:
+    """アップロード / ダウンロード共通の部分。"""
+
+    def __init__(self, target_system, target_component, mission_type, rtt, max_retries):
+        self.target_system = target_system
+        self.target_component = target_component
+        self.mission_type = mission_type
+        self.rtt = rtt or RttEstimator()
+        self.max_retries = max_retries
+        self.done = False
+        self.error = None
+        self.retransmits = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.opaque_id = None        # 機体が返したミッションの ID（MAVLink2 の opaque_id。無ければ None）
+
+    def accepts(self, msg):
+        """この転送の相手・mission_type のメッセージか。"""
+        return (msg.get_srcSystem() == self.target_system
+                and getattr(msg, "mission_type", 0) == self.mission_type)
+
+    def _finish(self, now, error=None):
+        self.done = True
+        self.error = error
+        self.elapsed = now - self.started
+
+    def _make(self, cls, *args):
+        return _message(cls, self.mission_type, self.target_system, self.target_component, *args)
+
+
+class MissionDownload(_Transfer):
+    """ミッションのダウンロード（start 以上 end 未満の seq。end=None は末尾まで）。
+
+    start(now) / handle(msg, now) / poll(now) は送るべきメッセージのリストを返す。
+    """
+
+    def __init__(self, target_system, target_component, start=0, end=None, mission_type=0,
+                 window=DEFAULT_WINDOW, rtt=None, max_retries=MAX_RETRIES):
+        super().__init__(target_system, target_component, mission_type, rtt, max_retries)
+        self.range_start = start
+        self.range_end = end
+        self.window = window
+        self.count = None           # 機体のミッション件数
+        self.items = {}             # seq → MISSION_ITEM_INT
+        self._wanted = []           # まだ要求していない seq
+        self._pending = {}          # seq → [送信時刻, 送信回数]
+        self._list_sent = None      # [送信時刻, 送信回数]（MISSION_REQUEST_LIST）
+
+    def start(self, now):
+        self.started = now
+        self._list_sent = [now, 1]
+        return [self._make(mavutil.mavlink.MAVLink_mission_request_list_message)]
+
+    @property
+    def result(self):
+        """受け取ったアイテム（seq 順）。"""
+        return [self.items[seq] for seq in sorted(self.items)]
+
+    def handle(self, msg, now):
+        if self.done or not self.accepts(msg):
+            return []
+        msg_type = msg.get_type()
+        if msg_type == "MISSION_COUNT" and self.count is None:
+            if self._list_sent[1] == 1:
+                self.rtt.add(now - self._list_sent[0])
+            self.count = msg.count
+            self.opaque_id = getattr(msg, "opaque_id", None) or None
+            end = msg.count if self.range_end is None else min(self.range_end, msg.count)
+            self._wanted = list(range(max(0, self.range_start), end))
+            return self._fill(now)
+        if msg_type == "MISSION_ITEM_INT" and msg.seq in self._pending:
+            sent_at, attempts = self._pending.pop(msg.seq)
+            if attempts == 1:
+                self.rtt.add(now - sent_at)
+            self.items[msg.seq] = msg
+            return self._fill(now)
+        if msg_type == "MISSION_ACK" and msg.type != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+            self._finish(now, "機体がダウンロードを拒否しました（%s）" % _result_name(msg.type))
+        return []
+
+    def _fill(self, now):
+        """要求中が window 件になるまで次の seq を要求する。全部そろえば ACK を返す。"""
+        out = []
+        while self._wanted and len(self._pending) < self.window:
+            seq = self._wanted.pop(0)
+            self._pending[seq] = [now, 1]
+            out.append(self._make(mavutil.mavlink.MAVLink_mission_request_int_message, seq))
+        if not self._wanted and not self._pending:
+            self._finish(now)
+            out.append(self._make(mavutil.mavlink.MAVLink_mission_ack_message,
+                                  mavutil.mavlink.MAV_MISSION_ACCEPTED))
+        return out
+
+    def poll(self, now):
+        """タイムアウトした要求を再送する。"""
+        if self.done:
+            return []
+        timeout = self.rtt.timeout
+        if self.count is None:
+            if now - self._list_sent[0] < timeout * self._list_sent[1]:
+                return []
+            if self._list_sent[1] > self.max_retries:
+                self._finish(now, "MISSION_COUNT を受信できませんでした")
+                return []
+            self._list_sent = [now, self._list_sent[1] + 1]
+            self.retransmits += 1
+            return [self._make(mavutil.mavlink.MAVLink_mission_request_list_message)]
+        out = []
+        for seq, entry in self._pending.items():
+            # 再送のたびに待ち時間を延ばす（混雑したリンクに再送を重ねないため）
+            if now - entry[0] < timeout * entry[1]:
+                continue
+            if entry[1] > self.max_retries:
+                self._finish(now, "ミッションアイテム seq=%d を取得できませんでした" % seq)
+                return []
+            entry[0] = now
+            entry[1] += 1
+            self.retransmits += 1
+            out.append(self._make(mavutil.mavlink.MAVLink_mission_request_int_message, seq))
+        return out
+
+    @property
+    def next_deadline(self):
+        timeout = self.rtt.timeout
+        if self.count is None:
+            return self._list_sent[0] + timeout * self._list_sent[1]
+        if not self._pending:
+            return None
+        return min(sent + timeout * attempts for sent, attempts in self._pending.values())
+
+
+class MissionUpload(_Transfer):
+    """ミッションのアップロード。items は MISSION_ITEM_INT のリスト。
+
+    送るのは items のコピー（seq・宛先・mission_type はコピーに設定し、渡したものは変えない）。
+
+    start_index を指定すると MISSION_WRITE_PARTIAL_LIST で部分書き込みをする
+    （機体上の seq=start_index から len(items) 件を置き換える。件数は変えられない）。
+    """
+
+    def __init__(self, target_system, target_component, items, mission_type=0, rtt=None,
+                 max_retries=MAX_RETRIES, start_index=None):
+        super().__init__(target_system, target_component, mission_type, rtt, max_retries)
+        self.start_index = start_index
+        offset = start_index or 0
+        self.items = []
+        for index, item in enumerate(items):
+            item = copy.copy(item)
+            item.target_system = target_system
+            item.target_component = target_component
+            item.seq = offset + index
+            if mission_type:
+                if "mission_type" not in item.fieldnames:
+                    raise ValueError("mission_type=%d には MAVLink2 の dialect が必要です（MAVLINK20=1）"
+                                     % mission_type)
+                item.mission_type = mission_type
+            self.items.append(item)
+        self.requested = set()       # 機体から要求された seq
+        self._last = None            # 最後に送ったメッセージ
+        self._last_sent = None       # [送信時刻, 送信回数]
+        self._verifying = False      # 最後の ACK を取りこぼした疑いがあり、件数で確認中
+
+    def start(self, now):
+        self.started = now
+        if self.start_index is not None:
+            return self._send(self._make(mavutil.mavlink.MAVLink_mission_write_partial_list_message,
+                                         self.start_index, self.start_index + len(self.items) - 1),
+                              now)
+        return self._send(self._make(mavutil.mavlink.MAVLink_mission_count_message,
+                                     len(self.items)), now)
+
+    @property
+    def result(self):
+        return len(self.items)
+
+    def _send(self, msg, now, retransmit=False):
+        if retransmit:
+            self._last_sent = [now, self._last_sent[1] + 1]
+            self.retransmits += 1
+        else:
+            self._last = msg
+            self._last_sent = [now, 1]
+        return [msg]
+
+    def handle(self, msg, now):
+        if self.done or not self.accepts(msg):
+            return []
+        msg_type = msg.get_type()
+        if msg_type in ("MISSION_REQUEST_INT", "MISSION_REQUEST"):
+            index = msg.seq - (self.start_index or 0)
+            if not 0 <= index < len(self.items):
+                return []
+            if self._last_sent[1] == 1 and msg.seq not in self.requested:
+                self.rtt.add(now - self._last_sent[0])
+            self.requested.add(msg.seq)
+            return self._send(self.items[index], now)
+        if msg_type == "MISSION_ACK":
+            if msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED:
+                if self._verifying or len(self.requested) == len(self.items):
+                    self.opaque_id = getattr(msg, "opaque_id", None) or None
+                    self._finish(now)
+                return []
+            if msg.type == mavutil.mavlink.MAV_MISSION_INVALID_SEQUENCE:
+                return []        # 再送したアイテムが重複した（機体は次を要求済み）
+            if (msg.type == mavutil.mavlink.MAV_MISSION_ERROR and self._last_sent[1] > 1
+                    and len(self.requested) == len(self.items) and self.start_index is None):
+                # 最後のアイテムの再送に対する応答: 機体はもう受信を終えている。
+                # 書き込めたかは件数を問い合わせて確かめる
+                self._verifying = True
+                return self._send(self._make(mavutil.mavlink.MAVLink_mission_request_list_message), now)
+            self._finish(now, "機体がアップロードを拒否しました（%s）" % _result_name(msg.type))
+            return []
+        if msg_type == "MISSION_COUNT" and self._verifying:
+            if msg.count == len(self.items):
+                self._finish(now)
+            else:
+                self._finish(now, "アップロード後の件数が一致しません（%d / %d）"
+                             % (msg.count, len(self.items)))
+            # 確認のために始めたダウンロードを終わらせる（機体が MISSION_REQUEST_INT を待ち続けないよう）
+            return [self._make(mavutil.mavlink.MAVLink_mission_ack_message,
+                               mavutil.mavlink.MAV_MISSION_ACCEPTED)]
+        return []
+
+    def poll(self, now):
+        """要求が途切れたら、最後に送ったものを再送する。"""
+        if self.done or now - self._last_sent[0] < self.rtt.timeout * self._last_sent[1]:
+            return []
+        if self._last_sent[1] > self.max_retries:
+            self._finish(now, "機体からの要求が途切れました（要求された %d / %d 件）"
+                         % (len(self.requested), len(self.items)))
+            return []
+        return self._send(self._last, now, retransmit=True)
+
+    @property
+    def next_deadline(self):
+        return self._last_sent[0] + self.rtt.timeout * self._last_sent[1]
+
+
+# ---------------------------------------------------------------------------
+# 送受信（同期: mavutil / 非同期: aio_mavlink）
+# ---------------------------------------------------------------------------
+
+def run_transfer(master, transfer, timeout=60.0):
+    """mavutil の接続で転送を最後まで進め、結果を返す。失敗したら MissionTransferError。"""
+    now = time.monotonic()
+    deadline = now + timeout
+    for msg in transfer.start(now):
+        master.mav.send(msg)
+    while not transfer.done:
+        now = time.monotonic()
+        if now >= deadline:
+            raise MissionTransferError("ミッションの転送が %.0f 秒以内に終わりませんでした" % timeout)
+        next_deadline = transfer.next_deadline
+        wait = 0.5 if next_deadline is None else min(0.5, max(0.0, next_deadline - now))
+        msg = master.recv_match(type=MISSION_MESSAGES, blocking=True, timeout=wait)
+        now = time.monotonic()
+        out = transfer.handle(msg, now) if msg is not None else []
+        out += transfer.poll(now)
+        for reply in out:
+            master.mav.send(reply)
+    if transfer.error:
+        raise MissionTransferError(transfer.error)
+    return transfer.result
+
+
+async def run_transfer_async(conn, transfer, timeout=60.0):
+    """aio_mavlink の接続で転送を最後まで進め、結果を返す。"""
+    loop = asyncio.get_running_loop()
+    sub = conn.subscribe(MISSION_MESSAGES)
+    try:
+        deadline = loop.time() + timeout
+        for msg in transfer.start(time.monotonic()):
+            conn.send(msg)
+        while not transfer.done:
+            if loop.time() >= deadline:
+                raise MissionTransferError("ミッションの転送が %.0f 秒以内に終わりませんでした" % timeout)
+            next_deadline = transfer.next_deadline
+            now = time.monotonic()
+            wait = 0.5 if next_deadline is None else min(0.5, max(0.0, next_deadline - now))
+            try:
+                msg = await asyncio.wait_for(sub.get(), wait)
+            except asyncio.TimeoutError:
+                msg = None
+            if msg is aio_mavlink.CLOSED:
+                raise MissionTransferError("ミッションの転送中に接続が切れました")
+            now = time.monotonic()
+            out = transfer.handle(msg, now) if msg is not None else []
+            out += transfer.poll(now)
+            for reply in out:
+                conn.send(reply)
+    finally:
+        conn.unsubscribe(sub)
+    if transfer.error:
+        raise MissionTransferError(transfer.error)
+    return transfer.result
+
+
+def download_mission(master, start=0, end=None, mission_type=0, window=DEFAULT_WINDOW,
+                     rtt=None, timeout=60.0):
+    """機体のミッション（start〜end の範囲）をダウンロードして MISSION_ITEM_INT のリストで返す。"""
+    transfer = MissionDownload(master.target_system, master.target_component, start, end,
+                               mission_type, window, rtt)
+    return run_transfer(master, transfer, timeout)
+
+
+def upload_mission(master, items, mission_type=0, rtt=None, timeout=60.0, start_index=None):
+    """items（MISSION_ITEM_INT のリスト）を機体へアップロードする。件数を返す。
+
+    start_index を指定すると、その seq からの部分書き込みになる（MISSION_WRITE_PARTIAL_LIST）。
+    """
+    transfer = MissionUpload(master.target_system, master.target_component, items,
+                             mission_type, rtt, start_index=start_index)
+    return run_transfer(master, transfer, timeout)
+
+
+async def download_mission_async(conn, start=0, end=None, mission_type=0, window=DEFAULT_WINDOW,
+                                 rtt=None, timeout=60.0):
+    transfer = MissionDownload(conn.target_system, conn.target_component, start, end,
+                               mission_type, window, rtt)
+    return await run_transfer_async(conn, transfer, timeout)
+
+
+async def upload_mission_async(conn, items, mission_type=0, rtt=None, timeout=60.0,
+                               start_index=None):
+    transfer = MissionUpload(conn.target_system, conn.target_component, items, mission_type, rtt,
+                             start_index=start_index)
+    return await run_transfer_async(conn, transfer, timeout)
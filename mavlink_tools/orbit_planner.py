@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+構造物点検の周回（オービット）ミッションの計画とキャッシュ
+
+poi.py（workshop/20th/takao_hokii）は、実行のたびに
+plan_vertical_levels → make_circle_points → rotate_points_to_closest で円周の点を1点ずつ作り、
+build_orbit_mission で MISSION_ITEM_INT を全部作り直す。点検する構造物が数百あると、
+出発地点が変わるだけの再計画でも全部を計算し直すことになる。
+
+OrbitPlanner は
+  - 多数の構造物の円周を NumPy で一度に計算する（plan_many()）
+  - 計画（OrbitPlan: 半径・各リングの高度・円周の緯度経度）を
+    StructureSpec と計画のパラメータをキーにして LRU でキャッシュする
+  - 出発地点に一番近い点から始まるように並べ替えるとき（re-rotation）は、
+    円周を作り直さずに開始位置の添字だけを変える
+
+円周の点・ミッションの内容は poi.py と同じ（同じ平面近似・同じアイテムの並び）。
+
+使い方:
+    planner = OrbitPlanner()
+    plans = planner.plan_many(specs, n_points_per_ring=36, safety_margin_m=10.0)
+    items = plans[0].mission(cur_lat, cur_lon)          # TAKEOFF, DO_SET_ROI, 各リング, RTL
+    upload_mission(master, items)                       # mission_transfer
+
+    # 同じ構造物・同じパラメータなら、2回目以降はキャッシュから（並べ替えだけ）
+    items = planner.plan(specs[0], n_points_per_ring=36, safety_margin_m=10.0).mission(lat, lon)
+"""
+
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from pymavlink import mavutil
+
+import geodesy
+
+# キャッシュする計画の数
+DEFAULT_CACHE_SIZE = 1024
+
+# 計画のパラメータの既定値（poi.py の plan_vertical_levels / build_orbit_mission と同じ）
+DEFAULT_PARAMS = {
+    "n_points_per_ring": 36,
+    "safety_margin_m": 10.0,
+    "min_radius_m": 5.0,
+    "start_alt_m": 1.0,
+    "end_alt_margin_m": 0.0,
+    "alt_step_m": 1.0,
+    "max_rings": 30,
+    "acceptance_radius_m": 2.0,
+}
+
+SPEC_FIELDS = ("center_lat", "center_lon", "width_m", "depth_m", "base_alt_m", "height_m")
+
+
+@dataclass(frozen=True)
+class StructureSpec:
+    """点検する構造物（poi.py の StructureSpec と同じ項目）。"""
+    center_lat: float      # 構造物中心（緯度）
+    center_lon: float      # 構造物中心（経度）
+    width_m: float         # 構造物幅（東西方向）
+    depth_m: float         # 構造物奥行き（南北方向）
+    base_alt_m: float      # 基準高度
+    height_m: float        # 構造物高さ
+
+
+def spec_key(spec):
+    """キャッシュのキーにする構造物の値（同じ項目を持つものなら poi.StructureSpec でもよい）。"""
+    return tuple(float(getattr(spec, name)) for name in SPEC_FIELDS)
+
+
+def _params(params):
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise TypeError("不明なパラメータ: %s" % ", ".join(sorted(unknown)))
+    merged = dict(DEFAULT_PARAMS, **params)
+    return merged, tuple(sorted(merged.items()))
+
+
+def vertical_levels(spec, start_alt_m, end_alt_margin_m, alt_step_m, max_rings):
+    """リングの高度の配列（poi.plan_vertical_levels と同じ）。"""
+    bottom = spec.base_alt_m + start_alt_m
+    top = spec.base_alt_m + spec.height_m + end_alt_margin_m
+    if top <= bottom:
+        return np.array([bottom])
+    count = max(1, min(int(math.floor((top - bottom) / alt_step_m)) + 1, max_rings))
+    if count == 1:
+        return np.array([bottom])
+    step = (top - bottom) / (count - 1)
+    return bottom + np.arange(count) * step
+
+
+class OrbitPlan:
+    """1つの構造物の計画。円周は東（角度 0）から反時計回りに並ぶ。"""
+
+    def __init__(self, spec, params, radius, altitudes, lats, lons):
+        self.spec = spec
+        self.params = params
+        self.radius = radius
+        self.altitudes = altitudes          # リングの高度（下から）
+        self.lats = lats                    # 円周の点（全リング共通）
+        self.lons = lons
+        self._x = (lats * 1e7).astype(np.int64)     # MISSION_ITEM_INT の x, y（poi.py と同じ切り捨て）
+        self._y = (lons * 1e7).astype(np.int64)
+
+    def __repr__(self):
+        return "<OrbitPlan r=%.1fm rings=%d points=%d>" % (self.radius, len(self.altitudes), len(self.lats))
+
+    def closest_index(self, lat, lon):
+        """(lat, lon) に一番近い円周の点の添字。"""
+        return int(np.argmin(geodesy.approx_distance(lat, lon, self.lats, self.lons,
+                                                     radius=geodesy.WGS84_A)))
+
+    def rings(self, start=0):
+        """円周を start から並べ替えた (リング数, 点数, 3) の配列（緯度, 経度, 高度）。"""
+        order = np.roll(np.arange(len(self.lats)), -start)
+        shape = (len(self.altitudes), len(order))
+        return np.stack([np.broadcast_to(self.lats[order], shape),
+                         np.broadcast_to(self.lons[order], shape),
+                         np.broadcast_to(self.altitudes[:, None], shape)], axis=-1)
+
+    def mission(self, cur_lat=None, cur_lon=None, target_system=0, target_component=0, start=None):
+        """MISSION_ITEM_INT のリスト（TAKEOFF, DO_SET_ROI, 各リングの円周, RTL）。
+
+        円周は (cur_lat, cur_lon) に一番近い点から始める（start で直接指定もできる）。
+        """
+        if start is None:
+            start = 0 if cur_lat is None else self.closest_index(cur_lat, cur_lon)
+        mavlink = mavutil.mavlink
+        frame = mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+        center_x = int(self.spec.center_lat * 1e7)
+        center_y = int(self.spec.center_lon * 1e7)
+        make = mavlink.MAVLink_mission_item_int_message
+        items = [
+            make(target_system, target_component, 0, frame, mavlink.MAV_CMD_NAV_TAKEOFF, 1, 1,
+                 0, 0, 0, 0, center_x, center_y, float(self.altitudes[0])),
+            make(target_system, target_component, 1, frame, mavlink.MAV_CMD_DO_SET_ROI, 0, 1,
+                 mavlink.MAV_ROI_LOCATION, 0, 0, 0, center_x, center_y,
+                 self.spec.base_alt_m + self.spec.height_m / 2.0),
+        ]
+        xs = np.roll(self._x, -start).tolist()
+        ys = np.roll(self._y, -start).tolist()
+        accept = self.params["acceptance_radius_m"]
+        nan = float("nan")
+        for alt in self.altitudes.tolist():
+            for x, y in zip(xs, ys):
+                items.append(make(target_system, target_component, len(items), frame,
+                                  mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, accept, 0, nan, x, y, alt))
+        items.append(make(target_system, target_component, len(items), frame,
+                          mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH, 0, 1, 0, 0, 0, 0, 0, 0, 0))
+        return items
+
+
+class OrbitPlanner:
+    """OrbitPlan を作り、(構造物, パラメータ) ごとにキャッシュする。"""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()          # (spec_key, パラメータ) → OrbitPlan
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def plan(self, spec, **params):
+        """1つの構造物の計画（キャッシュにあればそれを返す）。"""
+        return self.plan_many([spec], **params)[0]
+
+    def plan_many(self, specs, **params):
+        """複数の構造物の計画をまとめて作る。キャッシュに無いものだけを NumPy で一度に計算する。"""
+        merged, param_key = _params(params)
+        keys = [(spec_key(spec), param_key) for spec in specs]
+        plans = [None] * len(keys)
+        missing = []
+        for index, key in enumerate(keys):
+            plan = self._cache.get(key)
+            if plan is None:
+                missing.append(index)
+            else:
+                self._cache.move_to_end(key)
+                plans[index] = plan
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            for index, plan in zip(missing, self._compute([specs[i] for i in missing], merged)):
+                plans[index] = plan
+                self._store(keys[index], plan)
+        return plans
+
+    def _store(self, key, plan):
+        self._cache[key] = plan
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _compute(specs, params):
+        values = np.array([spec_key(spec) for spec in specs])
+        lat0, lon0, width, depth = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+        # 構造物を包む円 + 安全マージン（poi.estimate_orbit_radius）
+        radius = np.maximum(np.hypot(width / 2, depth / 2) + params["safety_margin_m"],
+                            params["min_radius_m"])
+        # 全構造物の円周を (構造物数, 点数) でまとめて計算する（poi.make_circle_points）
+        theta = 2 * np.pi * np.arange(params["n_points_per_ring"]) / params["n_points_per_ring"]
+        dx = radius[:, None] * np.cos(theta)             # 東
+        dy = radius[:, None] * np.sin(theta)             # 北
+        lats = lat0[:, None] + np.degrees(dy / geodesy.WGS84_A)
+        lons = lon0[:, None] + np.degrees(dx / (geodesy.WGS84_A * np.cos(np.radians(lat0)))[:, None])
+        plans = []
+        for index, spec in enumerate(specs):
+            altitudes = vertical_levels(spec, params["start_alt_m"], params["end_alt_margin_m"],
+                                        params["alt_step_m"], params["max_rings"])
+            plans.append(OrbitPlan(spec, params, float(radius[index]), altitudes,
+                                   lats[index], lons[index]))
+        return plans
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+パラメータの一括取得（抜けの再要求つき）とディスクキャッシュ
+
+pm20_read_params.py のように param_request_list を1回送って PARAM_VALUE を受け取るだけだと、
+途中で落ちたメッセージはそれっきりになる。また接続し直すたびに約1000個を取り直すので、
+損失の多いリンクでは数十秒かかる。
+
+ParamSync は
+  - PARAM_VALUE の param_index / param_count で「どの番号がまだ来ていないか」を管理し、
+    一覧の送信が止まったら、抜けている番号だけを param_request_read（番号指定）で要求する。
+    要求は window 個ずつまとめて送り、応答を待たずに次を送る（1個ずつ往復しない）。
+  - 取得した表を「機体の sysid + ファームウェアの識別子（AUTOPILOT_VERSION）」ごとに
+    JSON で保存する。次回接続時は param_count と数個の値を読んで一致すれば、
+    一覧の取得を省略してキャッシュを使う。
+
+使い方:
+    sync = ParamSync(master)
+    params = sync.fetch()               # キャッシュが有効なら数百ms で返る
+    print(params.values["RTL_ALT"])
+
+    # コマンドラインから（pm20_read_params.py の代わり）
+    python param_sync.py tcp:127.0.0.1:5762
+    python param_sync.py tcp:127.0.0.1:5762 --no-cache
+
+キャッシュの確認は param_count と数個の値だけなので、他のGCSから値を変えられた場合は
+古い値を返すことがある。確実に最新が必要なら fetch(use_cache=False) を使うこと。
+"""
+
+import argparse
+import json
+import os
+import time
+
+from pymavlink import mavutil
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mavlink_tools", "params")
+
+QUIET_TIMEOUT = 1.0        # この時間 PARAM_VALUE が来なければ一覧の送信が終わったとみなす[秒]
+REQUEST_WINDOW = 20        # 抜けの再要求を一度に送る数
+MAX_ROUNDS = 10            # 抜けの再要求を繰り返す回数の上限
+VALIDATE_SAMPLES = 4       # キャッシュの確認で読む値の数
+PARAM_INDEX_NONE = 65535   # 一覧以外（設定の応答等）で送られてくる PARAM_VALUE の param_index
+
+
+def param_name(msg):
+    """PARAM_VALUE の param_id を文字列にする（末尾の NUL を除く）。"""
+    name = msg.param_id
+    if isinstance(name, bytes):
+        name = name.decode("ascii", "replace")
+    return name.strip("\x00")
+
+
+def request_firmware_id(master, timeout=2.0):
+    """AUTOPILOT_VERSION を要求し、ファームウェアの識別子（文字列）を返す。取れなければ None。"""
+    master.mav.command_long_send(
+        master.target_system, master.target_component,
+        mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE, 0,
+        mavutil.mavlink.MAVLINK_MSG_ID_AUTOPILOT_VERSION, 0, 0, 0, 0, 0, 0)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        msg = master.recv_match(type="AUTOPILOT_VERSION", blocking=True,
+                                timeout=deadline - time.time())
+        if msg is None:
+            break
+        if msg.get_srcSystem() != master.target_system:
+            continue
+        return "%08x-%s-%08x" % (msg.flight_sw_version,
+                                 bytes(msg.flight_custom_version).hex(), msg.board_version)
+    return None
+
+
+class ParamSet:
+    """取得したパラメータ表。names[i] が param_index=i のパラメータ名。"""
+
+    def __init__(self, names, values, types, from_cache=False):
+        self.names = names
+        self.values = values       # 名前 → 値(float)
+        self.types = types         # 名前 → MAV_PARAM_TYPE
+        self.from_cache = from_cache
+        self.elapsed = 0.0         # 取得にかかった時間[秒]
+        self.rounds = 0            # 抜けの再要求を行った回数
+        self.refetched = 0         # 抜けとして再要求したパラメータ数
+
+    @property
+    def count(self):
+        return len(self.names)
+
+    def to_dict(self):
+        return {"names": self.names,
+                "values": [self.values[n] for n in self.names],
+                "types": [self.types[n] for n in self.names]}
+
+    @classmethod
+    def from_dict(cls, data):
+        names = data["names"]
+        return cls(names, dict(zip(names, data["values"])), dict(zip(names, data["types"])),
+                   from_cache=True)
+
+
+class ParamSync:
+    """1機体のパラメータを取得・キャッシュする。"""
+
+    def __init__(self, master, cache_dir=DEFAULT_CACHE_DIR, quiet_timeout=QUIET_TIMEOUT,
+                 window=REQUEST_WINDOW, max_rounds=MAX_ROUNDS):
+        self.master = master
+        self.cache_dir = cache_dir
+        self.quiet_timeout = quiet_timeout
+        self.window = window
+        self.max_rounds = max_rounds
+        self.firmware_id = None
+
+    # ---- 取得 ----------------------------------------------------------
+
+    def fetch(self, use_cache=True, timeout=60.0):
+        """パラメータ表を返す。全件そろわなければ TimeoutError。"""
+        started = time.time()
+        if self.firmware_id is None:
+            self.firmware_id = request_firmware_id(self.master) or "unknown"
+        if use_cache:
+            params = self.load_cache()
+            if params is not None and self.validate(params):
+                params.elapsed = time.time() - started
+                return params
+        params = self._download(started + timeout)
+        params.elapsed = time.time() - started
+        if self.cache_dir:
+            self.save_cache(params)
+        return params
+
+    def _download(self, deadline):
+        master = self.master
+        names = {}       # param_index → 名前
+        values = {}
+        types = {}
+        count = None
+        master.mav.param_request_list_send(master.target_system, master.target_component)
+
+        def receive(wait, pending=None):
+            """wait 秒 PARAM_VALUE が来なくなるか、pending の番号がすべて届くまで受け取る。"""
+            nonlocal count
+            while time.time() < deadline:
+                msg = master.recv_match(type="PARAM_VALUE", blocking=True, timeout=wait)
+                if msg is None:
+                    return
+                if msg.get_srcSystem() != master.target_system:
+                    continue
+                name = param_name(msg)
+                values[name] = msg.param_value
+                types[name] = msg.param_type
+                if msg.param_index != PARAM_INDEX_NONE and msg.param_index < msg.param_count:
+                    count = msg.param_count
+                    names[msg.param_index] = name
+                    if pending is not None:
+                        pending.discard(msg.param_index)
+                        if not pending:
+                            return
+                if count is not None and len(names) >= count:
+                    return
+
+        receive(self.quiet_timeout)
+        rounds = 0
+        refetched = 0
+        while count is None or len(names) < count:
+            if time.time() >= deadline or rounds >= self.max_rounds:
+                raise TimeoutError(
+                    "パラメータを取得しきれませんでした（%d / %s 個）"
+                    % (len(names), "?" if count is None else count))
+            rounds += 1
+            if count is None:
+                # 1つも届かなかった: 一覧をもう一度要求する
+                master.mav.param_request_list_send(master.target_system, master.target_component)
+                receive(self.quiet_timeout)
+                continue
+            missing = [i for i in range(count) if i not in names]
+            refetched += len(missing)
+            for start in range(0, len(missing), self.window):
+                batch = missing[start:start + self.window]
+                for index in batch:
+                    master.mav.param_request_read_send(
+                        master.target_system, master.target_component, b"", index)
+                receive(self.quiet_timeout, set(batch))
+
+        ordered = [names[i] for i in range(count)]
+        params = ParamSet(ordered, {n: values[n] for n in ordered}, {n: types[n] for n in ordered})
+        params.rounds = rounds
+        params.refetched = refetched
+        return params
+
+    def read_by_index(self, indices, timeout=2.0):
+        """指定した番号のパラメータをまとめて読む。{番号: (名前, 値, param_count)} を返す。"""
+        master = self.master
+        for index in indices:
+            master.mav.param_request_read_send(
+                master.target_system, master.target_component, b"", index)
+        wanted = set(indices)
+        result = {}
+        deadline = time.time() + timeout
+        while wanted and time.time() < deadline:
+            msg = master.recv_match(type="PARAM_VALUE", blocking=True,
+                                    timeout=deadline - time.time())
+            if msg is None:
+                break
+            if msg.get_srcSystem() == master.target_system and msg.param_index in wanted:
+                wanted.discard(msg.param_index)
+                result[msg.param_index] = (param_name(msg), msg.param_value, msg.param_count)
+        return result
+
+    # ---- キャッシュ --------------------------------------------------------
+
+    def cache_path(self):
+        firmware = self.firmware_id or "unknown"
+        return os.path.join(self.cache_dir, "sys%d_%s.json" % (self.master.target_system, firmware))
+
+    def load_cache(self):
+        """キャッシュを読む。無い・壊れている場合は None。"""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.cache_path(), "r", encoding="utf-8") as f:
+                return ParamSet.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_cache(self, params):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path()
+        tmp = path + ".tmp"
+        data = params.to_dict()
+        data["sysid"] = self.master.target_system
+        data["firmware"] = self.firmware_id
+        data["saved_at"] = time.time()
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)      # 書きかけのファイルを読まないよう、置き換えで保存する
+
+    def update_cache(self, name, value):
+        """書き込んだ値をキャッシュにも反映する（パラメータ設定後に呼ぶ）。"""
+        params = self.load_cache()
+        if params is None or name not in params.values:
+            return
+        params.values[name] = value
+        self.save_cache(params)
+
+    def validate(self, params):
+        """キャッシュが機体と一致するかを、param_count と数個の値で確かめる。"""
+        if params.count == 0:
+            return False
+        step = max(1, params.count // VALIDATE_SAMPLES)
+        indices = sorted(set(list(range(0, params.count, step))[:VALIDATE_SAMPLES]
+                             + [params.count - 1]))
+        samples = self.read_by_index(indices)
+        if len(samples) != len(indices):
+            return False
+        for index, (name, value, count) in samples.items():
+            if count != params.count or params.names[index] != name:
+                return False
+            if params.values[name] != value:
+                return False
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パラメータの一括取得（キャッシュつき）")
+    parser.add_argument("device", nargs="?", default="tcp:127.0.0.1:5762", help="接続文字列")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わずに取り直す")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="キャッシュの保存先")
+    args = parser.parse_args()
+
+    master = mavutil.mavlink_connection(args.device, source_system=1, source_component=90)
+    master.wait_heartbeat()
+    sync = ParamSync(master, cache_dir=args.cache_dir)
+    params = sync.fetch(use_cache=not args.no_cache)
+    for name in params.names:
+        print("name: %s\tvalue: %s" % (name, params.values[name]))
+    print("%d 個 / %.2f 秒（%s、再要求 %d 個 / %d 回）"
+          % (params.count, params.elapsed, "キャッシュ" if params.from_cache else "機体から取得",
+             params.refetched, params.rounds))
+    master.close()
+
+
+if __name__ == "__main__":
+    main()
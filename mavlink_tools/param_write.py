@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+パラメータの一括書き込み（パイプライン + 読み戻し確認）
+
+set_param(master, name, value) のように「PARAM_SET を1つ送って PARAM_VALUE の応答を待つ」
+を繰り返すと、1個あたり1往復（リンクによっては数百ms）かかり、飛行前の設定だけで
+1機あたり数秒かかる。
+
+set_params() は name → value の dict を受け取り、
+  - 応答を待たずに最大 window 個まで PARAM_SET を送っておく（送信中の数に上限をつける）
+  - 届いた PARAM_VALUE をパラメータ名で突き合わせ、値が一致すれば成功とする
+  - 応答が来なかった・値が違ったものだけを送り直す（最大 retries 回）
+結果はパラメータごとの表（状態・読み戻した値・試行回数・応答時間）と、
+時間の内訳（全体・初回の送信が一巡するまで・再送にかかった時間）で返す。
+
+使い方:
+    result = set_params(master, {"WPNAV_SPEED": 1000, "RTL_ALT": 3000})
+    print(result.table())
+    if not result.ok:
+        print("失敗:", result.failed)
+
+    # コマンドラインから
+    python param_write.py tcp:127.0.0.1:5762 WPNAV_SPEED=1000 RTL_ALT=3000
+"""
+
+import argparse
+import math
+import struct
+import time
+
+from pymavlink import mavutil
+
+from param_sync import param_name
+
+DEFAULT_WINDOW = 8         # 応答待ちにしておける PARAM_SET の数
+DEFAULT_TIMEOUT = 1.0      # 1回の送信で応答を待つ時間[秒]
+DEFAULT_RETRIES = 3        # 1つのパラメータを送る回数の上限（初回を含む）
+
+# 結果の状態
+OK = "ok"                  # 読み戻した値が一致した
+MISMATCH = "mismatch"      # 応答はあったが値が違う（範囲外・整数型への丸め等）
+TIMEOUT = "timeout"        # 応答が無かった（存在しないパラメータ名の場合もこれになる）
+ERROR = "error"            # PARAM_ERROR が返った（対応FWのみ）
+PENDING = "pending"
+
+
+def as_float32(value):
+    """PARAM_SET で送られる float32 に丸めた値。"""
+    return struct.unpack("<f", struct.pack("<f", float(value)))[0]
+
+
+def values_match(requested, echoed):
+    return math.isclose(as_float32(requested), echoed, rel_tol=1e-6, abs_tol=1e-6)
+
+
+class ParamWrite:
+    """1つのパラメータの書き込み結果。"""
+
+    def __init__(self, name, value, param_type):
+        self.name = name
+        self.value = float(value)
+        self.param_type = param_type
+        self.status = PENDING
+        self.echoed = None         # 機体が返した値
+        self.attempts = 0
+        self.first_sent = None
+        self.last_sent = None
+        self.latency = None        # 最初の送信から確定までの時間[秒]
+
+
+class ParamWriteResult:
+    """set_params() の結果。rows はパラメータ名 → ParamWrite（指定した順）。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.elapsed = 0.0         # 全体の時間[秒]
+        self.first_pass = 0.0      # 全パラメータの初回送信の結果が出るまで[秒]
+        self.retry_time = 0.0      # それ以降（再送）にかかった時間[秒]
+        self.sent = 0              # 送った PARAM_SET の総数
+
+    @property
+    def ok(self):
+        return all(row.status == OK for row in self.rows.values())
+
+    @property
+    def failed(self):
+        return [name for name, row in self.rows.items() if row.status != OK]
+
+    def table(self):
+        """結果の表（文字列）。"""
+        lines = ["%-16s %12s %12s %-9s %4s %9s"
+                 % ("name", "requested", "echoed", "status", "try", "ms")]
+        for row in self.rows.values():
+            lines.append("%-16s %12g %12s %-9s %4d %9s" % (
+                row.name, row.value, "-" if row.echoed is None else "%g" % row.echoed,
+                row.status, row.attempts,
+                "-" if row.latency is None else "%.1f" % (row.latency * 1000)))
+        lines.append("合計 %.3f 秒（初回 %.3f 秒 + 再送 %.3f 秒）、PARAM_SET %d 回、失敗 %d 個"
+                     % (self.elapsed, self.first_pass, self.retry_time, self.sent, len(self.failed)))
+        return "\n".join(lines)
+
+
+def set_params(master, values, types=None, window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT,
+               retries=DEFAULT_RETRIES):
+    """values（name → value）を書き込み、ParamWriteResult を返す。
+
+    types に name → MAV_PARAM_TYPE を渡せる（省略時は REAL32。ArduPilot は機体側の型に変換する）。
+    """
+    types = types or {}
+    rows = {name: ParamWrite(name, value, types.get(name, mavutil.mavlink.MAV_PARAM_TYPE_REAL32))
+            for name, value in values.items()}
+    result = ParamWriteResult(rows)
+    queue = list(rows.values())    # 送信待ち（初回・再送）
+    in_flight = {}                 # 名前 → ParamWrite（応答待ち）
+    first_round = set(rows)        # 初回の結果がまだ出ていないパラメータ
+    started = time.time()
+
+    def settle(row, status, now):
+        row.status = status
+        row.latency = now - row.first_sent
+        in_flight.pop(row.name, None)
+        first_round.discard(row.name)
+
+    def retry_or_fail(row, status, now):
+        in_flight.pop(row.name, None)
+        first_round.discard(row.name)
+        if row.attempts < retries:
+            queue.append(row)
+        else:
+            settle(row, status, now)
+
+    while queue or in_flight:
+        now = time.time()
+        while queue and len(in_flight) < window:
+            row = queue.pop(0)
+            master.mav.param_set_send(master.target_system, master.target_component,
+                                      row.name.encode(), row.value, row.param_type)
+            row.attempts += 1
+            row.first_sent = row.first_sent or now
+            row.last_sent = now
+            in_flight[row.name] = row
+            result.sent += 1
+
+        msg = master.recv_match(type=["PARAM_VALUE", "PARAM_ERROR"], blocking=True,
+                                timeout=min(0.1, timeout))
+        now = time.time()
+        if msg is not None and msg.get_srcSystem() == master.target_system:
+            row = in_flight.get(param_name(msg))
+            if row is not None:
+                if msg.get_type() == "PARAM_ERROR":
+                    settle(row, ERROR, now)
+                else:
+                    row.echoed = msg.param_value
+                    if values_match(row.value, msg.param_value):
+                        settle(row, OK, now)
+                    else:
+                        retry_or_fail(row, MISMATCH, now)
+
+        for row in list(in_flight.values()):
+            if now - row.last_sent >= timeout:
+                retry_or_fail(row, TIMEOUT, now)
+
+        if not first_round and not result.first_pass:
+            result.first_pass = now - started
+
+    result.elapsed = time.time() - started
+    if not result.first_pass:
+        result.first_pass = result.elapsed
+    result.retry_time = result.elapsed - result.first_pass
+    return result
+
+
+def parse_assignment(text):
+    name, value = text.split("=", 1)
+    return name.strip().upper(), float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パラメータの一括書き込み")
+    parser.add_argument("device", help="接続文字列（例: tcp:127.0.0.1:5762）")
+    parser.add_argument("assignments", nargs="+", metavar="NAME=VALUE")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="応答待ちにしておける数")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="応答待ち時間[秒]")
+    args = parser.parse_args()
+
+    values = dict(parse_assignment(a) for a in args.assignments)
+    master = mavutil.mavlink_connection(args.device, source_system=1, source_component=90)
+    master.wait_heartbeat()
+    result = set_params(master, values, window=args.window, timeout=args.timeout)
+    print(result.table())
+    master.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Minimal TCP stand-in for an autopilot, used by the tests.
+
+Answers HEARTBEAT, parameter reads/writes, the mission protocol (ArduPilot
+semantics: INVALID_SEQUENCE for unexpected items, re-requests while receiving)
+REQUEST_MESSAGE(AUTOPILOT_VERSION), SET/GET_MESSAGE_INTERVAL, TIMESYNC and the
+COMMAND_LONG/COMMAND_INT listed in command_results (optionally IN_PROGRESS first). Messages can be dropped or delayed on
+purpose to exercise retry paths.
+"""
+import random
+import socket
+import threading
+import time
+
+from pymavlink import mavutil
+
+
+class FakeVehicle:
+    def __init__(self, params=(), sysid=1, drop_list_indices=(), firmware=0x04050600,
+                 drop_set_echo=(), readonly=(), reply_delay=0.0, mission=(), mission_loss=0.0,
+                 seed=1, partial_supported=True, default_interval=250000, command_results=(),
+                 command_drops=(), command_progress=()):
+        self.params = dict(params)                 # name -> value, in index order
+        self.names = list(params)
+        self.sysid = sysid
+        self.drop_list_indices = set(drop_list_indices)
+        self.drop_set_echo = set(drop_set_echo)    # Names whose first PARAM_SET echo is lost
+        self.readonly = set(readonly)              # Names that keep their value on PARAM_SET
+        self.reply_delay = reply_delay             # Simulated one-way link delay for PARAM_SET
+        self.firmware = firmware
+        self.mission = list(mission)               # MISSION_ITEM_INT messages on the vehicle
+        self.mission_loss = mission_loss           # Probability of losing a mission reply
+        self.partial_supported = partial_supported # Refuse MISSION_WRITE_PARTIAL_LIST if False
+        self.uploads = []                          # (start, end) of each completed write
+        self._rng = random.Random(seed)
+        self._receiving = None                     # {"start", "end", "next", "items", "asked"}
+        self.requests = []                         # Received request message types
+        self.intervals = {}                        # msg id -> interval_us set by SET_MESSAGE_INTERVAL
+        self.default_interval = default_interval   # Reported for ids left at their default rate
+        self.commands = []                         # (command, param1, param2) of each COMMAND_LONG
+        self.command_results = dict(command_results)   # command -> MAV_RESULT to acknowledge with
+        self.command_drops = dict(command_drops)       # command -> receptions to ignore first
+        self.command_progress = dict(command_progress) # command -> seconds of IN_PROGRESS before the result
+        self.confirmations = []                    # (command, confirmation) of each acknowledged command
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.device = "tcp:127.0.0.1:%d" % self.port
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        self.server.settimeout(5)
+        try:
+            client, _ = self.server.accept()
+        except OSError:
+            return
+        client.settimeout(0.05)
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=self.sysid, srcComponent=1)
+        self.client = client
+        self.mav = mav
+        last_beat = 0.0
+        try:
+            while not self._stop.is_set():
+                if time.time() - last_beat >= 0.5:
+                    self.send(mav.heartbeat_encode(
+                        mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                        mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 4, 3))
+                    last_beat = time.time()
+                upload = self._receiving
+                if upload is not None and time.time() - upload["asked"] >= 0.2:
+                    self._request_item()           # Re-request like ArduPilot does
+                try:
+                    data = client.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                for msg in mav.parse_buffer(data) or []:
+                    self.requests.append(msg.get_type())
+                    self.handle(msg)
+        except OSError:
+            pass
+        finally:
+            client.close()
+
+    def send(self, msg, mav=None):
+        """Send msg; pass another MAVLink instance to send as a different component."""
+        mav = mav or self.mav
+        with self._lock:
+            self.client.sendall(msg.pack(mav))
+            mav.seq = (mav.seq + 1) % 256              # pack() alone does not advance it
+
+    def reply(self, msg):
+        """Send a mission reply, possibly losing it."""
+        if self.mission_loss and self._rng.random() < self.mission_loss:
+            return
+        self.send(msg)
+
+    def _request_item(self):
+        upload = self._receiving
+        upload["asked"] = time.time()
+        self.reply(self.mav.mission_request_int_encode(255, 0, upload["next"]))
+
+    def param_value(self, name, index=None):
+        if index is None:
+            index = self.names.index(name)
+        return self.mav.param_value_encode(
+            name.encode(), float(self.params[name]), mavutil.mavlink.MAV_PARAM_TYPE_REAL32,
+            len(self.names), index)
+
+    def handle(self, msg):
+        msg_type = msg.get_type()
+        if msg_type == "PARAM_REQUEST_LIST":
+            for index, name in enumerate(self.names):
+                if index in self.drop_list_indices:
+                    continue
+                self.send(self.param_value(name, index))
+            self.drop_list_indices = set()
+        elif msg_type == "PARAM_REQUEST_READ":
+            if msg.param_index >= 0:
+                if msg.param_index < len(self.names):
+                    self.send(self.param_value(self.names[msg.param_index], msg.param_index))
+            else:
+                name = msg.param_id.strip("\x00")
+                if name in self.params:
+                    self.send(self.param_value(name))
+        elif msg_type == "PARAM_SET":
+            name = msg.param_id.strip("\x00")
+            if name not in self.params:
+                return
+            if name not in self.readonly:
+                self.params[name] = msg.param_value
+            if name in self.drop_set_echo:
+                self.drop_set_echo.discard(name)
+                return
+            reply = self.param_value(name)
+            if self.reply_delay:
+                threading.Timer(self.reply_delay, self.send, args=(reply,)).start()
+            else:
+                self.send(reply)
+        elif msg_type == "MISSION_REQUEST_LIST":
+            self.reply(self.mav.mission_count_encode(255, 0, len(self.mission)))
+        elif msg_type in ("MISSION_REQUEST_INT", "MISSION_REQUEST"):
+            if msg.seq < len(self.mission) and self._receiving is None:
+                self.reply(self.mission[msg.seq])
+        elif msg_type == "MISSION_COUNT":
+            self._start_receiving(0, msg.count, [])
+        elif msg_type == "MISSION_WRITE_PARTIAL_LIST":
+            if not self.partial_supported:
+                self.reply(self.mav.mission_ack_encode(
+                    255, 0, mavutil.mavlink.MAV_MISSION_UNSUPPORTED))
+                return
+            if not 0 <= msg.start_index <= msg.end_index < len(self.mission):
+                self.reply(self.mav.mission_ack_encode(255, 0, mavutil.mavlink.MAV_MISSION_ERROR))
+                return
+            self._start_receiving(msg.start_index, msg.end_index + 1, list(self.mission))
+        elif msg_type == "MISSION_ITEM_INT":
+            upload = self._receiving
+            if upload is None:
+                self.reply(self.mav.mission_ack_encode(255, 0, mavutil.mavlink.MAV_MISSION_ERROR))
+            elif msg.seq != upload["next"]:
+                self.reply(self.mav.mission_ack_encode(
+                    255, 0, mavutil.mavlink.MAV_MISSION_INVALID_SEQUENCE))
+            else:
+                upload["items"].append(msg)
+                upload["next"] += 1
+                if upload["next"] < upload["end"]:
+                    self._request_item()
+                else:
+                    self._finish_receiving()
+        elif msg_type == "TIMESYNC" and msg.tc1 == 0:
+            self.send(self.mav.timesync_encode(time.monotonic_ns(), msg.ts1))
+        elif msg_type == "COMMAND_LONG":
+            self.commands.append((msg.command, msg.param1, msg.param2))
+            if msg.command == mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+                if msg.param2 == 0:
+                    self.intervals.pop(int(msg.param1), None)
+                else:                                  # ArduPilot keeps whole milliseconds
+                    interval = int(msg.param2)
+                    self.intervals[int(msg.param1)] = interval if interval < 0 else interval // 1000 * 1000
+                self.send(self.mav.command_ack_encode(msg.command, mavutil.mavlink.MAV_RESULT_ACCEPTED))
+            elif msg.command == mavutil.mavlink.MAV_CMD_GET_MESSAGE_INTERVAL:
+                msg_id = int(msg.param1)
+                self.send(self.mav.message_interval_encode(
+                    msg_id, self.intervals.get(msg_id, self.default_interval)))
+                self.send(self.mav.command_ack_encode(msg.command, mavutil.mavlink.MAV_RESULT_ACCEPTED))
+            elif (msg.command == mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE
+                    and int(msg.param1) == mavutil.mavlink.MAVLINK_MSG_ID_AUTOPILOT_VERSION):
+                self.send(self.mav.autopilot_version_encode(
+                    0, self.firmware, 0, 0, 0, [1, 2, 3, 4, 5, 6, 7, 8], [0] * 8, [0] * 8, 0, 0, 0))
+            elif msg.command in self.command_results:
+                self._acknowledge(msg, msg.confirmation)
+        elif msg_type == "COMMAND_INT" and msg.command in self.command_results:
+            self._acknowledge(msg, None)
+
+    def _acknowledge(self, msg, confirmation):
+        if self.command_drops.get(msg.command):
+            self.command_drops[msg.command] -= 1
+            return
+        self.confirmations.append((msg.command, confirmation))
+        result = self.command_results[msg.command]
+        delay = self.command_progress.get(msg.command)
+        if delay is None:
+            self.send(self.mav.command_ack_encode(msg.command, result))
+            return
+        in_progress = mavutil.mavlink.MAV_RESULT_IN_PROGRESS
+        self.send(self.mav.command_ack_encode(msg.command, in_progress))
+        threading.Timer(delay / 2, self.send, args=(self.mav.command_ack_encode(msg.command, in_progress),)).start()
+        threading.Timer(delay, self.send, args=(self.mav.command_ack_encode(msg.command, result),)).start()
+
+    def _start_receiving(self, start, end, base):
+        self._receiving = {"start": start, "end": end, "next": start, "items": [],
+                           "base": base, "asked": 0.0}
+        if start == end:
+            self._finish_receiving()
+        else:
+            self._request_item()
+
+    def _finish_receiving(self):
+        upload = self._receiving
+        self._receiving = None
+        if upload["base"]:
+            mission = upload["base"]
+            mission[upload["start"]:upload["end"]] = upload["items"]
+        else:
+            mission = upload["items"]
+        self.mission = mission
+        self.uploads.append((upload["start"], upload["end"]))
+        self.reply(self.mav.mission_ack_encode(255, 0, mavutil.mavlink.MAV_MISSION_ACCEPTED))
+
+    def close(self):
+        self._stop.set()
+        self.server.close()
+        self.thread.join(2)
+
+
+def connect(vehicle):
+    master = mavutil.mavlink_connection(vehicle.device, source_system=255, retries=0)
+    master.wait_heartbeat(timeout=5)
+    return master
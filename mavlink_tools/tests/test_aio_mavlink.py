@@ -0,0 +1,153 @@
+import asyncio
+
+from pymavlink import mavutil
+
+import aio_mavlink
+
+
+def encoder(src_system=1):
+    return mavutil.mavlink.MAVLink(None, srcSystem=src_system, srcComponent=1)
+
+
+def heartbeat(mav):
+    return mav.heartbeat_encode(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 4, 0).pack(mav)
+
+
+def test_feed_delivers_only_subscribed_types():
+    async def scenario():
+        conn = aio_mavlink.AsyncMAVLinkConnection()
+        sub = conn.subscribe(types=["HEARTBEAT"])
+        mav = encoder()
+        data = heartbeat(mav) + mav.timesync_encode(0, 1).pack(mav) + heartbeat(mav)
+        # Split mid-frame to check that the parser keeps partial frames
+        conn._feed(data[:5])
+        conn._feed(data[5:])
+        assert conn.messages_received == 3
+        assert sub.queue.qsize() == 2
+        assert (await sub.queue.get()).get_type() == "HEARTBEAT"
+
+    asyncio.run(scenario())
+
+
+def test_bad_crc_is_counted_not_raised():
+    conn = aio_mavlink.AsyncMAVLinkConnection()
+    frame = bytearray(heartbeat(encoder()))
+    frame[-1] ^= 0xFF
+    conn._feed(bytes(frame))
+    assert conn.messages_received == 0
+    assert conn.bad_data >= 1
+
+
+def test_tcp_roundtrip():
+    async def scenario():
+        received = []
+
+        async def handle(reader, writer):
+            mav = encoder(src_system=7)
+            writer.write(heartbeat(mav) + mav.timesync_encode(0, 42).pack(mav))
+            await writer.drain()
+            received.append(await reader.read(1024))
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        conn = await aio_mavlink.open_connection("tcp:127.0.0.1:%d" % port)
+        timesync = conn.subscribe(types=["TIMESYNC"])
+        await conn.wait_heartbeat(timeout=2)
+        assert conn.target_system == 7
+        assert (await asyncio.wait_for(timesync.queue.get(), 2)).ts1 == 42
+
+        conn.mav.ping_send(0, 1, 0, 0)
+        await asyncio.sleep(0.05)
+        assert received and received[0][0] in (0xFE, 0xFD)
+        conn.close()
+        server.close()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+
+def test_wait_heartbeat_skips_peripherals():
+    async def scenario():
+        async def handle(reader, writer):
+            gimbal = mavutil.mavlink.MAVLink(None, srcSystem=7, srcComponent=154)
+            writer.write(gimbal.heartbeat_encode(
+                mavutil.mavlink.MAV_TYPE_GIMBAL, mavutil.mavlink.MAV_AUTOPILOT_INVALID,
+                0, 0, 0).pack(gimbal))
+            writer.write(heartbeat(encoder(src_system=7)))
+            await writer.drain()
+            await reader.read(1024)
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        conn = await aio_mavlink.open_connection("tcp:127.0.0.1:%d" % port)
+        msg = await conn.wait_heartbeat(timeout=2)
+        assert msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA
+        assert (conn.target_system, conn.target_component) == (7, 1)   # ジンバル（154）ではない
+        conn.close()
+        server.close()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+def test_messages_iterator_unsubscribes_on_exit():
+    async def scenario():
+        conn = aio_mavlink.AsyncMAVLinkConnection()
+        mav = encoder()
+
+        async def first():
+            async for msg in conn.messages(types=["HEARTBEAT"]):
+                return msg
+
+        task = asyncio.create_task(first())
+        await asyncio.sleep(0)
+        conn._feed(heartbeat(mav))
+        assert (await task).get_type() == "HEARTBEAT"
+        await asyncio.sleep(0)
+        assert conn._subscribers == []
+
+    asyncio.run(scenario())
+
+
+def test_parse_device():
+    assert aio_mavlink.parse_device("udp:0.0.0.0:14550") == ("udpin", "0.0.0.0", 14550)
+    assert aio_mavlink.parse_device("udpout:host.docker.internal:14550")[0] == "udpout"
+
+
+def test_iterators_end_when_peer_disconnects():
+    async def scenario():
+        close_peer = asyncio.Event()
+
+        async def handle(reader, writer):
+            mav = encoder(src_system=7)
+            writer.write(heartbeat(mav))
+            await writer.drain()
+            await close_peer.wait()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        conn = await aio_mavlink.open_connection("tcp:127.0.0.1:%d" % port)
+        received = []
+
+        async def consume():
+            async for msg in conn.messages(types=["HEARTBEAT"]):
+                received.append(msg)
+
+        consumer = asyncio.create_task(consume())
+        waiter = asyncio.create_task(conn.recv_match(type="TIMESYNC"))
+        sub = conn.subscribe()
+        await asyncio.sleep(0.1)
+        close_peer.set()
+        server.close()
+        await asyncio.wait_for(consumer, 2)                    # 切断で async for が終わる
+        assert [m.get_srcSystem() for m in received] == [7]
+        assert await asyncio.wait_for(waiter, 2) is None
+        assert conn.closed
+        assert (await sub.get()).get_type() == "HEARTBEAT"     # 溜まっていた分の後に CLOSED
+        assert await sub.get() is aio_mavlink.CLOSED
+        assert await sub.get() is aio_mavlink.CLOSED
+        assert await conn.subscribe().get() is aio_mavlink.CLOSED
+        assert [msg async for msg in conn.messages()] == []
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
@@ -0,0 +1,122 @@
+import threading
+
+from pymavlink import mavutil
+
+import arrival
+import fake_vehicle
+import vehicle_pool
+
+mavlink = mavutil.mavlink
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def position(lat, lon):
+    return mavlink.MAVLink_global_position_int_message(0, int(lat * 1e7), int(lon * 1e7), 0, 0, 0, 0, 0, 0)
+
+
+def heartbeat(armed):
+    return mavlink.MAVLink_heartbeat_message(
+        mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+        mavlink.MAV_MODE_FLAG_SAFETY_ARMED if armed else 0, 4, 4, 3)
+
+
+def test_predicates_and_events():
+    clock = Clock()
+    engine = arrival.ArrivalEngine(clock=clock)
+    goal = (35.8790, 140.3390)
+    rover = engine.watch("rover", arrival.ItemReached(9)
+                         | arrival.Within(*goal, radius=5, dwell=3, departure=15)
+                         | arrival.Disarmed(armed_first=True))
+    boat = engine.watch("boat", arrival.StatusText() & arrival.ItemReached(4))
+    assert len(engine) == 2
+
+    # 出発地点が目的地の近く: 離れる前は留まっても到着にしない
+    for second in range(5):
+        clock.now = second
+        assert engine.feed("rover", position(goal[0] + 1e-5, goal[1])) == []
+    assert engine.feed("rover", heartbeat(False)) == []                  # アーム前のディスアーム
+    engine.feed("rover", mavlink.MAVLink_mission_item_reached_message(3))
+    clock.now = 10
+    engine.feed("rover", position(goal[0] + 5e-4, goal[1]))            # 55m 離れた
+    clock.now = 20
+    engine.feed("rover", position(goal[0] + 2e-5, goal[1]))
+    clock.now = 22
+    engine.feed("rover", position(goal[0] + 5e-5, goal[1]))            # 5.6m: 外に出たのでやり直し
+    clock.now = 23
+    engine.feed("rover", position(goal[0] + 1e-5, goal[1]))
+    assert not rover.done
+    clock.now = 26
+    events = engine.feed("rover", position(goal[0], goal[1]))
+    assert [e.reason for e in events] == ["目的地から 5.0 m 以内に 3秒 留まった"]
+    assert rover.wait(0) is events[0] and rover.event.elapsed == 26
+    assert engine.feed("rover", mavlink.MAVLink_mission_item_reached_message(9)) == []   # 到着済み
+
+    # 両方を満たすまで待つ（先に満たした方は覚えておく）
+    engine.feed("boat", mavlink.MAVLink_statustext_message(6, b"Mission Complete"))
+    engine.feed("boat", mavlink.MAVLink_statustext_message(6, b"hello"))
+    assert not boat.done
+    engine.feed("boat", mavlink.MAVLink_mission_item_reached_message(4))
+    assert boat.event.reason == "機体メッセージ 'Mission Complete'、ウェイポイント seq=4 に到達"
+    assert [engine.next_event(0).vehicle for _ in range(2)] == ["rover", "boat"]
+    assert engine.next_event(0) is None and len(engine) == 0
+
+    copter = engine.watch("copter", arrival.Disarmed())
+    copter.cancel()
+    assert engine.feed("copter", heartbeat(False)) == [] and copter.wait(0) is None
+
+
+def test_pool_vehicles_share_one_thread():
+    vehicles = [fake_vehicle.FakeVehicle(sysid=sysid) for sysid in (1, 2, 3)]
+    pool = vehicle_pool.VehiclePool({"v%d" % v.sysid: v.device for v in vehicles})
+    engine = arrival.ArrivalEngine()
+    engine.attach(pool)
+    before = set(threading.enumerate())
+    try:
+        assert pool.open(timeout=2.0) == {"v1": None, "v2": None, "v3": None}
+        watches = {
+            "v1": engine.watch("v1", arrival.ItemReached(5)),
+            "v2": engine.watch("v2", arrival.StatusText(["reached destination"])),
+            "v3": engine.watch("v3", arrival.Disarmed()),     # 模擬機体はディスアームのまま
+        }
+        vehicles[0].send(vehicles[0].mav.mission_item_reached_encode(5))
+        vehicles[1].send(vehicles[1].mav.statustext_encode(6, b"Reached destination"))
+        arrived = {event.vehicle: event.reason for event in engine.events(timeout=3)}
+        assert arrived == {"v1": "ウェイポイント seq=5 に到達",
+                           "v2": "機体メッセージ 'Reached destination'",
+                           "v3": "機体がディスアームされた"}
+        assert all(watch.done for watch in watches.values())
+        assert [t.name for t in set(threading.enumerate()) - before] == ["VehiclePool"]
+    finally:
+        pool.close()
+        for vehicle in vehicles:
+            vehicle.close()
+
+
+def test_other_components_are_ignored():
+    engine = arrival.ArrivalEngine()
+    gimbal = mavlink.MAVLink_heartbeat_message(
+        mavlink.MAV_TYPE_GIMBAL, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0, 3)
+    watch = engine.watch("copter", arrival.Disarmed())
+    assert engine.feed("copter", gimbal) == [] and not watch.done
+    watch.cancel()
+
+    vehicle = fake_vehicle.FakeVehicle()
+    pool = vehicle_pool.VehiclePool({"copter": vehicle.device})
+    engine.attach(pool)
+    try:
+        assert pool.open(timeout=2.0) == {"copter": None}
+        watch = engine.watch("copter", arrival.StatusText())
+        companion = mavlink.MAVLink(None, srcSystem=vehicle.sysid, srcComponent=191)
+        vehicle.send(companion.statustext_encode(6, b"Mission complete (companion)"), companion)
+        vehicle.send(vehicle.mav.statustext_encode(6, b"Mission complete"))
+        assert watch.wait(3).reason == "機体メッセージ 'Mission complete'"
+    finally:
+        pool.close()
+        vehicle.close()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+from pymavlink import mavutil
+
+import command_sender
+import fake_vehicle
+import vehicle_pool
+from mission_transfer import RttEstimator
+
+mavlink = mavutil.mavlink
+ARM = mavlink.MAV_CMD_COMPONENT_ARM_DISARM
+CALIBRATE = mavlink.MAV_CMD_PREFLIGHT_CALIBRATION
+SET_MODE = mavlink.MAV_CMD_DO_SET_MODE
+REPOSITION = mavlink.MAV_CMD_DO_REPOSITION
+
+
+def test_concurrent_commands_progress_and_retransmit():
+    vehicle = fake_vehicle.FakeVehicle(
+        command_results={ARM: mavlink.MAV_RESULT_ACCEPTED, CALIBRATE: mavlink.MAV_RESULT_ACCEPTED,
+                         SET_MODE: mavlink.MAV_RESULT_DENIED},
+        command_drops={ARM: 1}, command_progress={CALIBRATE: 0.6})
+    pool = vehicle_pool.VehiclePool({"copter": vehicle.device}, gcs_heartbeat=0)
+    try:
+        assert pool.open(timeout=2.0) == {"copter": None}
+        commands = command_sender.CommandSender.for_vehicle(
+            pool, "copter", rtt=RttEstimator(initial=0.2))
+        progress = []
+        calibrate = commands.command_long(CALIBRATE, [0, 0, 0, 0, 1])
+        calibrate.add_progress_callback(lambda future, value: progress.append(value))
+        arm = commands.command_long(ARM, [1])
+        mode = commands.command_long(SET_MODE, [1, 4])
+        assert len(commands) == 3
+
+        ack = mode.result(timeout=2)                                 # 拒否も ACK として返る
+        assert (ack.name, ack.ok, ack.attempts) == ("MAV_RESULT_DENIED", False, 1)
+        ack = arm.result(timeout=2)                                  # 1回目は落ちて再送
+        assert ack.ok and ack.attempts == 2
+        assert (ARM, 1) in vehicle.confirmations                     # 再送は confirmation=1
+        assert not calibrate.done()                                  # IN_PROGRESS の間は待ち続ける
+        heartbeat = pool["copter"].wait_message("HEARTBEAT", timeout=2)
+        assert heartbeat is not None                                 # 待っている間もテレメトリは届く
+        ack = calibrate.result(timeout=3)
+        assert ack.ok and ack.attempts == 1 and ack.elapsed >= 0.5
+        assert len(progress) == 2 and vehicle.confirmations.count((CALIBRATE, 0)) == 1
+        assert len(commands) == 0 and commands.rtt.samples >= 2
+        commands.close()
+    finally:
+        pool.close()
+        vehicle.close()
+
+
+def test_master_queue_command_int_and_timeout():
+    vehicle = fake_vehicle.FakeVehicle(
+        command_results={ARM: mavlink.MAV_RESULT_ACCEPTED, REPOSITION: mavlink.MAV_RESULT_ACCEPTED})
+    master = fake_vehicle.connect(vehicle)
+    stop = threading.Event()
+
+    def receive():
+        while not stop.is_set():
+            master.recv_match(blocking=True, timeout=0.05)
+
+    receiver = threading.Thread(target=receive)
+    receiver.start()
+    try:
+        commands = command_sender.CommandSender.for_master(
+            master, rtt=RttEstimator(initial=0.2), retries=2)
+        first = commands.command_long(ARM, [1])
+        second = commands.command_long(ARM, [0])                     # 同じコマンドは前の結果の後に送る
+        reposition = commands.command_int(REPOSITION, [-1], x=358790000, y=1403390000, z=30)
+        unknown = commands.command_long(mavlink.MAV_CMD_DO_SET_SERVO, [9, 1500])
+        assert first.result(timeout=2).ok and second.result(timeout=2).ok
+        assert [p1 for command, p1, p2 in vehicle.commands if command == ARM] == [1.0, 0.0]
+        assert reposition.result(timeout=2).ok
+        assert vehicle.confirmations.count((REPOSITION, None)) == 1
+        with pytest.raises(command_sender.CommandError):
+            unknown.result(timeout=3)                                # 2回送って応答なし
+        assert [c for c, p1, p2 in vehicle.commands].count(mavlink.MAV_CMD_DO_SET_SERVO) == 2
+
+        pending = commands.command_long(mavlink.MAV_CMD_DO_SET_SERVO, [9, 1100])
+        started = time.monotonic()
+        commands.close()
+        with pytest.raises(command_sender.CommandError):
+            pending.result(timeout=1)
+        assert time.monotonic() - started < 1
+        with pytest.raises(command_sender.CommandError):
+            commands.command_long(ARM, [1])
+    finally:
+        stop.set()
+        receiver.join()
+        master.close()
+        vehicle.close()
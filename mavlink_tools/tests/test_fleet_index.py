@@ -0,0 +1,88 @@
+import math
+import random
+
+import fleet_index
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def brute_force(fleet, lat, lon, k):
+    found = []
+    for name in fleet._entries:
+        entry = fleet._entries[name]
+        if entry.available and not entry.reserved:
+            x, y = fleet._project(lat, lon)
+            found.append((math.hypot(entry.x - x, entry.y - y), name))
+    return [(name, d) for d, name in sorted(found)[:k]]
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(1)
+    fleet = fleet_index.FleetIndex(cell_size=200)
+    for index in range(2000):
+        fleet.update("v%d" % index, 35.8 + rng.uniform(0, 0.1), 139.0 + rng.uniform(0, 0.1))
+    # 動いた機体はセルを移る
+    for index in range(0, 2000, 3):
+        fleet.update("v%d" % index, 35.8 + rng.uniform(0, 0.1), 139.0 + rng.uniform(0, 0.1))
+    for index in range(0, 2000, 7):
+        fleet.set_available("v%d" % index, False)
+    fleet.remove("v1")
+    assert "v1" not in fleet and len(fleet) == 1999
+
+    for _ in range(50):
+        lat, lon = 35.75 + rng.uniform(0, 0.2), 138.95 + rng.uniform(0, 0.2)   # 範囲外も含む
+        assert fleet.nearest(lat, lon, k=5) == brute_force(fleet, lat, lon, 5)
+
+    near = fleet.nearest(35.85, 139.05, k=100, max_distance=300)
+    assert near and all(d <= 300 for _, d in near)
+    assert near == [item for item in brute_force(fleet, 35.85, 139.05, 100) if item[1] <= 300]
+
+
+def test_dispatch_reserves_and_skips_stale():
+    clock = Clock()
+    fleet = fleet_index.FleetIndex(max_age=5.0, clock=clock)
+    fleet.update("a", 35.800, 139.000)
+    fleet.update("b", 35.801, 139.000)
+    fleet.update("c", 35.900, 139.000)
+
+    assert fleet.dispatch(35.8005, 139.0) == "a"
+    assert fleet.dispatch(35.8005, 139.0) == "b"          # a は確保済み
+    assert fleet.dispatch(35.8005, 139.0, max_distance=1000) is None
+    fleet.release("a")
+    assert [name for name, _ in fleet.nearest(35.8005, 139.0, k=3)] == ["a", "c"]
+    assert [name for name, _ in fleet.nearest(35.8005, 139.0, k=3, available_only=False)] == ["a", "b", "c"]
+    assert [name for name, _ in fleet.nearest(35.8005, 139.0, accept=lambda name: name != "a")] == ["c"]
+
+    clock.now = 6.0
+    fleet.update("c", 35.900, 139.000)
+    assert [name for name, _ in fleet.nearest(35.8005, 139.0, k=3)] == ["c"]     # a の位置は古い
+    assert fleet.position("a")[3] == 6.0
+
+
+def test_attach_updates_from_global_position_int():
+    class Pool:
+        def on(self, msg_type, handler):
+            self.msg_type, self.handler = msg_type, handler
+
+    class Vehicle:
+        name = "copter"
+
+    class Position:
+        def __init__(self, lat, lon):
+            self.lat, self.lon, self.relative_alt = lat, lon, 12000
+
+    pool = Pool()
+    fleet = fleet_index.FleetIndex()
+    fleet.attach(pool)
+    assert pool.msg_type == "GLOBAL_POSITION_INT"
+    pool.handler(Vehicle(), Position(0, 0))             # 測位前
+    assert len(fleet) == 0
+    pool.handler(Vehicle(), Position(358066270, 1390852520))
+    lat, lon, alt, _ = fleet.position("copter")
+    assert (round(lat, 6), round(lon, 6), alt) == (35.806627, 139.085252, 12.0)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import geodesy
+
+
+def dms(degrees, minutes, seconds):
+    sign = -1 if degrees < 0 else 1
+    return sign * (abs(degrees) + minutes / 60 + seconds / 3600)
+
+
+# Vincenty (1975) の検証例と GeographicLib の例（WGS84）
+FLINDERS_PEAK = (dms(-37, 57, 3.72030), dms(144, 25, 29.52440))
+BUNINYONG = (dms(-37, 39, 10.15610), dms(143, 55, 35.38390))
+
+
+def test_geodesic_distance_matches_wgs84_references():
+    assert geodesy.geodesic_distance(*FLINDERS_PEAK, *BUNINYONG) == pytest.approx(54972.271, abs=1e-3)
+    assert geodesy.geodesic_distance(40.6, -73.8, 51.6, -0.5) == pytest.approx(5551759.400319, abs=1e-3)
+    assert geodesy.geodesic_distance(-41.32, 174.81, 40.96, -5.50) == pytest.approx(19959679.267353, abs=1e-3)
+    # 球面の近似は 0.5% 以内
+    assert geodesy.distance(*FLINDERS_PEAK, *BUNINYONG) == pytest.approx(54972.271, rel=5e-3)
+
+
+def test_ecef_and_enu_roundtrip():
+    assert geodesy.lla_to_ecef(0.0, 0.0, 0.0) == pytest.approx((6378137.0, 0.0, 0.0))
+    assert geodesy.lla_to_ecef(90.0, 0.0, 0.0) == pytest.approx((0.0, 0.0, 6356752.314245), abs=1e-6)
+
+    lat0, lon0, alt0 = 35.878275, 140.338069, 10.0
+    east, north, up = geodesy.lla_to_enu(lat0, lon0 + 0.01, alt0, lat0, lon0, alt0)
+    assert east == pytest.approx(902.6, abs=0.5)
+    assert abs(north) < 1.0 and up < 0           # 地球が丸いので東へ進むと下がる
+
+    rng = np.random.default_rng(1)
+    e, n, u = rng.uniform(-5000, 5000, (3, 1000))
+    lat, lon, alt = geodesy.enu_to_lla(e, n, u, lat0, lon0, alt0)
+    back = geodesy.lla_to_enu(lat, lon, alt, lat0, lon0, alt0)
+    assert np.max(np.abs(np.array(back) - [e, n, u])) < 1e-6
+
+
+def test_vectorized_matches_scalar():
+    rng = np.random.default_rng(2)
+    lat1, lat2 = rng.uniform(-80, 80, (2, 200))
+    lon1, lon2 = rng.uniform(-180, 180, (2, 200))
+    for func in (geodesy.distance, geodesy.approx_distance, geodesy.bearing, geodesy.geodesic_distance):
+        vector = func(lat1, lon1, lat2, lon2)
+        scalar = [func(*map(float, args)) for args in zip(lat1, lon1, lat2, lon2)]
+        assert isinstance(scalar[0], float)
+        assert np.allclose(vector, scalar, rtol=1e-12, atol=1e-5)     # Vincenty は反復回数の差で μm 程度ずれる
+
+    # 移動先 → 距離・方位で元に戻る
+    lat, lon = geodesy.destination(lat1, lon1, 45.0, 1234.5)
+    assert np.allclose(geodesy.distance(lat1, lon1, lat, lon), 1234.5)
+    assert np.allclose(geodesy.bearing(lat1, lon1, lat, lon), 45.0, atol=1e-6)
+    assert geodesy.bearing(35.0, 139.0, 35.1, 139.0) == pytest.approx(0.0)
+    assert geodesy.bearing(35.0, 139.0, 35.0, 139.1) == pytest.approx(90.0, abs=0.05)
+
+
+def test_path_length_and_fleet_proximity():
+    lats = [35.0, 35.001, 35.001, 35.0]
+    lons = [139.0, 139.0, 139.001, 139.001]
+    legs = [geodesy.distance(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(3)]
+    assert geodesy.path_length(lats, lons) == pytest.approx(sum(legs))
+
+    # 全機体の組み合わせをブロードキャストで一度に計算する
+    lat = np.array([35.0, 35.0001, 35.01])
+    lon = np.array([139.0, 139.0, 139.0])
+    pairwise = geodesy.distance(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    assert pairwise.shape == (3, 3)
+    assert (pairwise < 20).sum() == 5           # 自分自身 3 + 近い1組 x2
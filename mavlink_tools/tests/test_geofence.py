@@ -0,0 +1,112 @@
+import math
+import os
+
+import numpy as np
+from pymavlink import mavutil
+
+import geofence
+import mission_transfer
+from test_mission_transfer import make_mission
+
+POLY_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "workshop", "11th")
+
+
+def load_day4():
+    return geofence.Geofence.load(
+        [os.path.join(POLY_DIR, "day4-fence.poly")],
+        [os.path.join(POLY_DIR, "day4-exclude%d.poly" % i) for i in (1, 2, 3)])
+
+
+def star(lat, lon, radius, points=12):
+    """凹んだ多角形（星形）。"""
+    vertices = []
+    for i in range(points * 2):
+        r = radius if i % 2 == 0 else radius * 0.4
+        angle = math.pi * i / points
+        vertices.append((lat + r * math.cos(angle), lon + r * math.sin(angle)))
+    return vertices
+
+
+def test_poly_files_and_grid_match_ray_casting(tmp_path):
+    fence = load_day4()
+    assert [zone.name for zone in fence.zones] == ["day4-fence", "day4-exclude1", "day4-exclude2", "day4-exclude3"]
+    assert len(fence.inclusions[0].vertices) == 4          # 閉じた頂点は取り除く
+    assert fence.breach(35.805, 139.086) == "day4-exclude1"
+    assert fence.breach(35.80, 139.00) is None
+    assert fence.breach(35.90, 139.00) == "day4-fence"
+
+    path = tmp_path / "star.poly"
+    geofence.write_poly(str(path), star(35.8, 139.0, 0.01))
+    polygon = geofence.Polygon.load(str(path))
+    assert polygon.name == "star" and len(polygon.vertices) == 24
+    assert (polygon.grid == geofence.INSIDE).any() and (polygon.grid == geofence.OUTSIDE).any()
+
+    rng = np.random.default_rng(3)
+    lats = rng.uniform(35.785, 35.815, 20000)
+    lons = rng.uniform(138.985, 139.015, 20000)
+    expected = geofence._crossings(lats, lons, polygon.edges)
+    assert 0 < expected.sum() < len(lats)
+    assert np.array_equal(polygon.contains(lats, lons), expected)
+    assert [polygon.contains_point(a, b) for a, b in zip(lats[:2000], lons[:2000])] == expected[:2000].tolist()
+
+
+def test_check_batch_and_mission():
+    fence = load_day4()
+    fence.exclusions.append(geofence.Circle(35.82, 139.05, 100, "tower"))
+    result = fence.check([35.805, 35.80, 35.90, 35.82], [139.086, 139.00, 139.00, 139.0505])
+    assert result.tolist() == [1, -1, 0, 4]
+    assert fence.check(35.80, 139.00) == -1
+
+    # 2点目から3点目への経路が day4-exclude1 を横切る（どちらの点も外）
+    items = make_mission(4)
+    for item, (lat, lon) in zip(items, [(35.80, 139.08), (35.805, 139.084), (35.805, 139.089), (35.90, 139.0)]):
+        item.x, item.y = int(lat * 1e7), int(lon * 1e7)
+    violations = fence.check_mission(items)
+    assert (1, 2, "day4-exclude1") in violations
+    assert (3, None, "day4-fence") in violations
+    assert all(seq != 0 and seq != 1 for seq, next_seq, _ in violations if next_seq is None)
+
+
+def test_fence_items_roundtrip_and_upload(monkeypatch):
+    fence = load_day4()
+    fence.exclusions.append(geofence.Circle(35.82, 139.05, 100, "tower"))
+    fence.return_point = (35.80, 139.00)
+    items = fence.to_items()
+    mavlink = mavutil.mavlink
+    assert [item.seq for item in items] == list(range(18))
+    assert items[0].command == mavlink.MAV_CMD_NAV_FENCE_RETURN_POINT
+    assert {item.command for item in items[1:5]} == {mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_INCLUSION}
+    assert items[1].param1 == 4
+    assert items[-1].command == mavlink.MAV_CMD_NAV_FENCE_CIRCLE_EXCLUSION and items[-1].param1 == 100
+
+    loaded = geofence.Geofence.from_items(items)
+    assert loaded.return_point == (35.80, 139.00)
+    assert [len(zone.vertices) for zone in loaded.inclusions] == [4]
+    assert len(loaded.exclusions) == 4 and loaded.exclusions[3].radius == 100
+    assert loaded.breach(35.805, 139.086) == "polygon5"
+
+    calls = []
+    monkeypatch.setattr(mission_transfer, "upload_mission",
+                        lambda master, items, mission_type=0, **kwargs: calls.append((len(items), mission_type)))
+    fence.upload(object())
+    assert calls == [(18, mavlink.MAV_MISSION_TYPE_FENCE)]
+
+
+def test_attach_reports_breach_transitions():
+    class Pool:
+        def on(self, msg_type, handler):
+            self.handler = handler
+
+    class Vehicle:
+        name = "copter"
+
+    class Position:
+        def __init__(self, lat, lon):
+            self.lat, self.lon = int(lat * 1e7), int(lon * 1e7)
+
+    pool = Pool()
+    events = []
+    load_day4().attach(pool, lambda vehicle, zone: events.append(zone))
+    for lat, lon in [(35.80, 139.0), (35.80, 139.0), (35.805, 139.086), (35.805, 139.086), (35.80, 139.0)]:
+        pool.handler(Vehicle(), Position(lat, lon))
+    assert events == ["day4-exclude1", None]          # 最初は違反なしの状態から
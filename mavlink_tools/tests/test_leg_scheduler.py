@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+import leg_scheduler
+from leg_scheduler import Leg, LegScheduler
+
+
+def sleeper(seconds, emit_at=None, fail=False):
+    def run(ctx):
+        if emit_at is not None:
+            time.sleep(emit_at)
+            ctx.emit("arrived")
+            time.sleep(seconds - emit_at)
+        else:
+            time.sleep(seconds)
+        if fail:
+            raise RuntimeError("motor failure")
+        return seconds
+    return run
+
+
+def test_independent_legs_run_concurrently_and_dependencies_wait():
+    legs = [
+        Leg("rover", sleeper(0.3, emit_at=0.1), emits={"arrived": 0.1}, duration=0.3),
+        Leg("boat", sleeper(0.2), after=["rover"], duration=0.2),
+        Leg("copter", sleeper(0.1), after=["rover.arrived"], duration=0.1),
+        Leg("plane", sleeper(0.25), duration=0.25),
+    ]
+    report = LegScheduler(legs).run(timeout=5)
+    assert report.ok
+    assert 0.45 < report.elapsed < 0.7           # 直列なら 0.85 秒
+    assert report.events["rover.arrived"] < report.legs["copter"].started_at < report.events["rover"]
+    assert report.legs["boat"].started_at >= report.events["rover"]
+    assert report.legs["plane"].started_at < 0.05
+    assert report.critical_path == ["rover", "boat"]
+    assert "rover -> boat" in report.table()
+
+    total, path, times = LegScheduler(legs).plan()
+    assert total == pytest.approx(0.5)
+    assert path == ["rover", "boat"]
+    assert times["copter"] == pytest.approx((0.1, 0.2))
+
+
+def test_failed_leg_skips_only_its_dependents():
+    legs = [
+        Leg("rover", sleeper(0.1, emit_at=0.05, fail=True), emits={"arrived": None}),
+        Leg("boat", sleeper(0.05), after=["rover"]),
+        Leg("copter", sleeper(0.05), after=["boat"]),
+        Leg("transfer", sleeper(0.05), after=["rover.arrived"]),
+        Leg("plane", sleeper(0.05)),
+    ]
+    report = LegScheduler(legs).run(timeout=5)
+    status = {name: leg.status for name, leg in report.legs.items()}
+    assert status == {"rover": leg_scheduler.FAILED, "boat": leg_scheduler.SKIPPED,
+                      "copter": leg_scheduler.SKIPPED, "transfer": leg_scheduler.DONE,
+                      "plane": leg_scheduler.DONE}
+    assert "motor failure" in report.legs["rover"].error
+    assert not report.ok
+
+
+def test_graph_errors_are_reported_before_running():
+    with pytest.raises(ValueError, match="循環"):
+        LegScheduler([Leg("a", sleeper(0), after=["b"]), Leg("b", sleeper(0), after=["a"])])
+    with pytest.raises(ValueError, match="a.cargo"):
+        LegScheduler([Leg("a", sleeper(0)), Leg("b", sleeper(0), after=["a.cargo"])])
@@ -0,0 +1,64 @@
+import time
+
+from pymavlink import mavutil
+
+import fake_vehicle
+import link_stats
+import mav_dispatch
+
+mavlink = mavutil.mavlink
+
+
+def test_mavutil_connection_counts_and_rtt():
+    vehicle = fake_vehicle.FakeVehicle()
+    master = fake_vehicle.connect(vehicle)
+    try:
+        stats = link_stats.instrument(master, "copter")
+        link_stats.ping(master)
+        master.mav.command_long_send(1, 1, mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0,
+                                     mavlink.MAVLINK_MSG_ID_ATTITUDE, 100000, 0, 0, 0, 0, 0)
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline and not (stats.rtt["timesync"] and stats.rtt["command"]):
+            master.recv_match(blocking=True, timeout=0.1)
+        assert stats.rtt_stats("timesync")[0] < 1.0 and stats.rtt_stats("command")[0] < 1.0
+        assert stats.tx_messages == {mavlink.MAVLINK_MSG_ID_TIMESYNC: 1, mavlink.MAVLINK_MSG_ID_COMMAND_LONG: 1}
+        assert stats.rx_messages[mavlink.MAVLINK_MSG_ID_COMMAND_ACK] == 1
+        assert stats.rx_bytes > 0 and stats.rx_lost == 0 and stats.decoded_messages == stats.rx_frames
+        assert stats.summary().startswith("copter: 受信 ")
+
+        text = link_stats.prometheus_text([stats])
+        assert "# TYPE mavlink_rtt_seconds summary" in text
+        assert 'mavlink_tx_messages_total{link="copter",type="TIMESYNC"} 1' in text
+        assert 'mavlink_rtt_seconds_count{link="copter",method="command"} 1' in text
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_dispatcher_frames_loss_and_crc_errors():
+    sender = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    frames = []
+    for index in range(12):
+        if index % 2:
+            msg = sender.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR, 3, 0, 4, 3)
+        else:
+            msg = sender.sys_status_encode(0, 0, 0, 500, 12000, -1, 80, 0, 0, 0, 0, 0, 0)
+        sender.seq = index
+        frames.append(bytearray(msg.pack(sender)))
+    for index in (7, 8):                              # HEARTBEAT と（読み飛ばす）SYS_STATUS の本体を壊す
+        payload = 10 if frames[index][0] == mav_dispatch.MAVLINK2_STX else 6
+        frames[index][payload] ^= 0xFF
+    del frames[3:5]                                   # 2フレーム落ちた
+
+    dispatcher = mav_dispatch.MessageDispatcher()
+    dispatcher.on("HEARTBEAT", lambda msg: None)     # SYS_STATUS はデコードせず読み飛ばす
+    stats = link_stats.LinkStats("radio")
+    link_stats._hook_mav(dispatcher.mav, stats)
+    dispatcher.frame_hook = stats.frame
+    dispatcher.crc_error_hook = stats.crc_error
+    dispatcher.feed(b"".join(frames))
+
+    assert stats.crc_errors == 2 and stats.rx_lost == 4
+    assert stats.rx_frames == 8 and stats.sources[(1, 1)] == [11, 8, 4]
+    assert stats.rx_messages == {mavlink.MAVLINK_MSG_ID_SYS_STATUS: 4, mavlink.MAVLINK_MSG_ID_HEARTBEAT: 4}
+    assert stats.decoded_messages == 4 and round(stats.loss, 2) == 0.33
@@ -0,0 +1,89 @@
+import pytest
+from pymavlink import mavutil
+
+import mav_dispatch
+
+
+def encoder():
+    return mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+
+
+def heartbeat(mav, base_mode=0):
+    return mav.heartbeat_encode(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, base_mode, 4, 0).pack(mav)
+
+
+def test_only_registered_ids_are_decoded():
+    mav = encoder()
+    dispatcher = mav_dispatch.MessageDispatcher()
+    seen = []
+    dispatcher.on("TIMESYNC", seen.append)
+    data = heartbeat(mav) + mav.timesync_encode(0, 7).pack(mav) + mav.attitude_encode(0, 0, 0, 0, 0, 0, 0).pack(mav)
+    # フレームの途中で分割しても続きから処理できる
+    assert dispatcher.feed(data[:10]) == []
+    dispatcher.feed(data[10:])
+    assert [m.ts1 for m in seen] == [7]
+    assert dispatcher.decoded == 1
+    assert dispatcher.skipped == 2
+    assert dispatcher.bad_data == 0
+
+
+def test_handler_results_and_decorator():
+    mav = encoder()
+    dispatcher = mav_dispatch.MessageDispatcher()
+
+    @dispatcher.on(["MISSION_ITEM_REACHED", mavutil.mavlink.MAVLINK_MSG_ID_STATUSTEXT])
+    def arrived(msg):
+        if msg.get_type() == "MISSION_ITEM_REACHED":
+            return "reached %d" % msg.seq
+        return None
+
+    data = mav.statustext_encode(6, b"hello").pack(mav) + mav.mission_item_reached_encode(3).pack(mav)
+    assert dispatcher.feed(data) == ["reached 3"]
+    assert set(dispatcher.message_types) == {"MISSION_ITEM_REACHED", "STATUSTEXT"}
+
+    dispatcher.off("MISSION_ITEM_REACHED", arrived)
+    assert dispatcher.feed(mav.mission_item_reached_encode(4).pack(mav)) == []
+
+
+def test_garbage_and_bad_crc_are_counted():
+    mav = encoder()
+    dispatcher = mav_dispatch.MessageDispatcher()
+    seen = []
+    dispatcher.on("HEARTBEAT", seen.append)
+    broken = bytearray(heartbeat(mav))
+    broken[-1] ^= 0xFF
+    dispatcher.feed(b"\x01\x02\x03" + bytes(broken) + heartbeat(mav))
+    assert len(seen) == 1
+    assert dispatcher.bad_data >= 2
+
+
+def test_unknown_message_name_raises():
+    with pytest.raises(ValueError):
+        mav_dispatch.message_id("NO_SUCH_MESSAGE")
+
+
+class ListLink(mavutil.mavfile):
+    def __init__(self, data):
+        self.data = data
+        super().__init__(None, "test")
+
+    def recv(self, n=None):
+        data, self.data = self.data, b""
+        return data
+
+    def select(self, timeout):
+        return bool(self.data)
+
+    def close(self):
+        pass
+
+
+def test_pump_updates_master_state():
+    mav = encoder()
+    master = ListLink(heartbeat(mav, mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED))
+    dispatcher = mav_dispatch.MessageDispatcher(master.mav)
+    dispatcher.on("HEARTBEAT", lambda msg: "heartbeat")
+    assert dispatcher.pump(master, timeout=0) == ["heartbeat"]
+    assert master.motors_armed()
+    assert dispatcher.pump(master, timeout=0) == []
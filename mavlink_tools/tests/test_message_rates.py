@@ -0,0 +1,53 @@
+from pymavlink import mavutil
+
+import fake_vehicle
+import message_rates
+
+mavlink = mavutil.mavlink
+POSITION = mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT
+ATTITUDE = mavlink.MAVLINK_MSG_ID_ATTITUDE
+CURRENT = mavlink.MAVLINK_MSG_ID_MISSION_CURRENT
+
+
+def sets(vehicle):
+    return [(int(p1), int(p2)) for command, p1, p2 in vehicle.commands
+            if command == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL]
+
+
+def test_max_rate_deltas_and_restore():
+    vehicle = fake_vehicle.FakeVehicle()
+    vehicle.intervals[ATTITUDE] = 100000            # 他のスクリプトが 10Hz にしていた
+    master = fake_vehicle.connect(vehicle)
+    try:
+        rates = message_rates.RateManager(master, timeout=0.5)
+        rates.require("map", {"GLOBAL_POSITION_INT": 10, "ATTITUDE": 3})
+        rates.require("arrival", {POSITION: 2, "MISSION_CURRENT": 1})
+        result = rates.apply()
+        assert result.ok and result.queried == 3, result.table()
+        assert vehicle.intervals == {POSITION: 100000, ATTITUDE: 333000, CURRENT: 1000000}
+        assert rates.original == {POSITION: 250000, ATTITUDE: 100000, CURRENT: 250000}
+        assert result.rows[ATTITUDE].reported == 333000          # ms に丸められても一致とみなす
+
+        # 変化が無ければ何も送らない
+        count = len(vehicle.commands)
+        assert rates.apply().sent == 0 and len(vehicle.commands) == count
+
+        # map が抜けたら残りの最大へ下げ、誰も使わないものは元へ戻す
+        del vehicle.commands[:]
+        rates.release("map")
+        result = rates.apply()
+        assert result.ok and result.queried == 0
+        assert sorted(sets(vehicle)) == [(ATTITUDE, 100000), (POSITION, 500000)]
+        assert vehicle.intervals == {POSITION: 500000, ATTITUDE: 100000, CURRENT: 1000000}
+
+        with rates.consumer("logger", {"MISSION_CURRENT": 4, "VFR_HUD": 5}) as entered:
+            assert entered.ok and vehicle.intervals[CURRENT] == 250000
+        rates.release("arrival")
+        assert rates.apply().ok and rates.applied == {} and rates.original == {}
+        # 元の間隔（読み出した値）へ戻す
+        assert vehicle.intervals == {ATTITUDE: 100000, POSITION: 250000, CURRENT: 250000,
+                                     mavlink.MAVLINK_MSG_ID_VFR_HUD: 250000}
+        assert "GLOBAL_POSITION_INT" in result.table()
+    finally:
+        master.close()
+        vehicle.close()
@@ -0,0 +1,135 @@
+from pymavlink import mavutil
+
+import fake_vehicle
+import mav_dispatch
+import mission_diff
+from test_mission_transfer import make_mission
+
+
+def test_diff_ranges_merges_small_gaps():
+    old = make_mission(20)
+    new = make_mission(20)
+    for seq in (3, 5, 12):
+        new[seq].x += 1
+    new[19].z = 20.0000001        # float32 で同じ値になるので変更ではない
+    assert mission_diff.diff_ranges(old, new, merge_gap=2) == [(3, 5), (12, 12)]
+    assert mission_diff.diff_ranges(old, new, merge_gap=0) == [(3, 3), (5, 5), (12, 12)]
+    assert mission_diff.diff_ranges(old, make_mission(21)) is None
+
+
+def test_apply_writes_only_changed_range():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(100))
+    master = fake_vehicle.connect(vehicle)
+    try:
+        mirror = mission_diff.MissionMirror(master)
+        mirror.sync()
+        items = mirror.copy()
+        items[40].x += 500
+        items[41].z = 50.0
+
+        report = mirror.apply(items)
+        assert report.mode == "partial"
+        assert report.ranges == [(40, 41)]
+        assert report.items_sent == 2
+        assert vehicle.uploads == [(40, 42)]
+        assert vehicle.mission[40].x == items[40].x
+        assert vehicle.mission[41].z == 50.0
+        assert len(vehicle.mission) == 100
+
+        assert mirror.apply(items).mode == "none"
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_apply_falls_back_to_full_upload():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(30), partial_supported=False)
+    master = fake_vehicle.connect(vehicle)
+    try:
+        mirror = mission_diff.MissionMirror(master)
+        mirror.sync()
+        items = mirror.copy()
+        items[7].y += 10
+        report = mirror.apply(items)
+        assert report.mode == "full"
+        assert "MAV_MISSION_UNSUPPORTED" in report.reason
+        assert vehicle.uploads == [(0, 30)]
+        assert vehicle.mission[7].y == items[7].y
+
+        # 件数が変わると部分書き込みは試さない
+        vehicle.partial_supported = True
+        report = mirror.apply(mirror.copy() + make_mission(31)[30:])
+        assert report.mode == "full"
+        assert vehicle.uploads[-1] == (0, 31)
+        assert len(vehicle.mission) == 31
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_mission_cache_invalidation():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(50))
+    master = fake_vehicle.connect(vehicle)
+    try:
+        mirror = mission_diff.MissionMirror(master)
+        assert len(mirror.mission()) == 50
+        assert mirror.mission(verify=False) is mirror.items      # 往復なし
+        lists = vehicle.requests.count("MISSION_REQUEST_LIST")
+        assert mirror.mission() is mirror.items                  # 件数の確認だけ（1往復）
+        assert vehicle.requests.count("MISSION_REQUEST_LIST") == lists + 1
+        assert mirror.downloads == 1
+
+        # 他の GCS の書き込み（自分宛てではない ACCEPTED）で写しを捨てる
+        vehicle.mission = make_mission(20)
+        own = vehicle.mav.mission_ack_encode(master.mav.srcSystem, 0, 0)
+        own.pack(vehicle.mav)
+        mirror.handle(own)
+        assert not mirror.stale                                  # 自分宛ての ACK は無視する
+        ack = vehicle.mav.mission_ack_encode(254, 190, 0)
+        ack.pack(vehicle.mav)
+        mirror.handle(ack)
+        assert mirror.stale
+        assert len(mirror.mission(verify=False)) == 20 and mirror.downloads == 2
+
+        # 件数が変われば確認で気付く
+        vehicle.mission = make_mission(21)
+        assert len(mirror.mission()) == 21 and mirror.downloads == 3
+
+        # MISSION_CURRENT の mission_id が写しの ID と同じなら往復しない
+        mirror.opaque_id = 1234
+        current = vehicle.mav.mission_current_encode(0)
+        current.pack(vehicle.mav)
+        current.mission_id = 1234
+        mirror.handle(current)
+        lists = vehicle.requests.count("MISSION_REQUEST_LIST")
+        assert mirror.mission() is mirror.items
+        assert vehicle.requests.count("MISSION_REQUEST_LIST") == lists
+        current.mission_id = 99
+        mirror.handle(current)
+        assert mirror.stale
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_mission_watch_registers_and_compares_components():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(5))
+    master = fake_vehicle.connect(vehicle)
+    try:
+        mirror = mission_diff.MissionMirror(master)
+        mirror.sync()
+        dispatcher = mav_dispatch.MessageDispatcher()
+        dispatcher.on(mission_diff.MISSION_WATCH, mirror.handle)     # dialect に無い名前は含まない
+        assert set(mission_diff.MISSION_WATCH) <= {"MISSION_CHANGED", "MISSION_ACK", "MISSION_CURRENT"}
+
+        mav = mavutil.mavlink.MAVLink(None, srcSystem=vehicle.sysid, srcComponent=1)
+        own = mav.mission_ack_encode(master.mav.srcSystem, master.mav.srcComponent, 0).pack(mav)
+        dispatcher.feed(own)
+        assert dispatcher.decoded == 1 and not mirror.stale
+        # 同じ sysid 255 の別の GCS（compid 190）の書き込み
+        other = mav.mission_ack_encode(master.mav.srcSystem, 190, 0).pack(mav)
+        dispatcher.feed(other)
+        assert dispatcher.decoded == 2 and mirror.stale
+    finally:
+        master.close()
+        vehicle.close()
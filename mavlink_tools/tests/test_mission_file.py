@@ -0,0 +1,102 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+import mission_file
+
+TENNIS_COURT = os.path.join(os.path.dirname(__file__), "..", "..", "workshop", "21st", "takahiko-uno",
+                            "homework2", "Mission-TennisCourt.waypoints")
+
+
+def same(a, b):
+    return a.tobytes() == b.tobytes()          # NaN も含めて同じか
+
+
+def test_waypoints_line_endings_and_roundtrip(tmp_path):
+    mission = mission_file.load(TENNIS_COURT)            # Mission Planner が書いた \r\n のファイル
+    assert len(mission) == 40 and mission["seq"].tolist() == list(range(40))
+    assert mission[0]["x"] == 35.87893512900851          # 桁を落とさない
+    mission[5]["param4"] = float("nan")
+
+    path = str(tmp_path / "out.waypoints")
+    mission_file.save(path, mission)
+    assert same(mission_file.load(path), mission)
+
+    text = open(path).read()
+    for newline in ("\r\n", "\r"):
+        other = tmp_path / "other.waypoints"
+        other.write_bytes(("\ufeff" + text.replace("\n", newline)).encode("utf-8"))
+        assert same(mission_file.load(str(other)), mission)
+
+
+def test_plan_and_mission_json_roundtrip(tmp_path):
+    mission = mission_file.load(TENNIS_COURT)
+    mission[3]["param4"] = float("nan")
+    for name in ("out.plan", "out.mission"):
+        path = str(tmp_path / name)
+        mission_file.save(path, mission)
+        loaded = mission_file.load(path)
+        assert same(loaded[1:], mission[1:])
+        assert loaded[0][["x", "y", "z"]].tolist() == mission[0][["x", "y", "z"]].tolist()
+    plan = json.load(open(str(tmp_path / "out.plan")))
+    assert plan["mission"]["items"][2]["params"][3] is None     # NaN は null
+
+    # survey の ComplexItem は展開済みのアイテムを読む
+    plan["mission"]["items"][5:5] = [{
+        "type": "ComplexItem", "complexItemType": "survey",
+        "TransectStyleComplexItem": {"Items": [
+            {"type": "SimpleItem", "autoContinue": True, "command": 16, "frame": 3,
+             "params": [0, 0, 0, None, 35.88 + i * 1e-5, 140.33, 30]} for i in range(3)]}}]
+    path = str(tmp_path / "survey.plan")
+    json.dump(plan, open(path, "w"))
+    loaded = mission_file.load(path)
+    assert len(loaded) == 43 and loaded[6]["x"] == 35.88 and loaded["seq"].tolist() == list(range(43))
+
+
+def test_validation_errors(tmp_path):
+    lines = open(TENNIS_COURT).read().splitlines()
+    cases = [
+        (["QGC WPL 120"] + lines[1:], ":1: "),
+        (lines[:3] + [lines[4]], "seq が連番ではありません"),
+        (lines[:3] + [lines[3].replace("\t", "\tx\t", 1)], "列の数"),
+        # 13列の行の次に11列の行: 合計の個数は合っていても、ずらして読まない
+        (lines[:2] + [lines[2] + "\t2", "\t".join(lines[3].split("\t")[1:])], ":3: 列の数"),
+        (lines[:3] + ["\t".join(lines[3].split("\t")[:4] + ["abc"] + lines[3].split("\t")[5:])], "数値ではありません"),
+        (lines[:3] + ["\t".join(lines[3].split("\t")[:3] + ["9999"] + lines[3].split("\t")[4:])], "不明な command"),
+    ]
+    for content, message in cases:
+        path = tmp_path / "bad.waypoints"
+        path.write_text("\n".join(content) + "\n")
+        with pytest.raises(mission_file.MissionFileError) as error:
+            mission_file.load(str(path))
+        assert message in str(error.value) and "bad.waypoints" in str(error.value)
+    assert len(mission_file.load(str(path), strict=False)) == 3
+
+
+def test_out_of_range_frame_and_command_are_errors_even_when_not_strict():
+    lines = open(TENNIS_COURT).read().splitlines()
+    for column, value, message in ((3, "70000", "command が範囲外です（70000）"),
+                                   (2, "300", "frame が範囲外です（300）")):
+        fields = lines[3].split("\t")
+        fields[column] = value
+        content = lines[:3] + ["\t".join(fields)] + lines[4:]
+        # ブロックの NumPy 読み込み（u2 / u1 へ丸め込まない）→ 1行ずつの読み直し
+        with pytest.raises(mission_file.MissionFileError) as error:
+            mission_file.read_waypoints(io.StringIO("\n".join(content) + "\n"), strict=False)
+        assert message in str(error.value) and ":4: " in str(error.value)
+        # 1行ずつの読み込み（OverflowError にしない）
+        with pytest.raises(mission_file.MissionFileError) as error:
+            list(mission_file.iter_waypoints(content, strict=False))
+        assert message in str(error.value) and ":4: " in str(error.value)
+
+
+def test_items_conversion():
+    mission = mission_file.load(TENNIS_COURT)
+    items = mission_file.to_items(mission, 1, 1)
+    assert items[0].x == 358789351 and items[0].y == 1403358709
+    assert [item.command for item in items] == mission["command"].tolist()
+    back = mission_file.from_items(items)
+    assert np.allclose(back["x"], mission["x"], atol=1e-7) and same(back["command"], mission["command"])
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from pymavlink import mavutil
+
+import aio_mavlink
+import fake_vehicle
+import mission_transfer
+
+
+def make_mission(count):
+    return [mavutil.mavlink.MAVLink_mission_item_int_message(
+        1, 1, seq, mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+        mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, 0, 1, 0, 0, 0, 0,
+        358792449 + seq * 100, 1403394654, 20.0) for seq in range(count)]
+
+
+def test_download_and_partial_range():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(50))
+    master = fake_vehicle.connect(vehicle)
+    try:
+        items = mission_transfer.download_mission(master)
+        assert [item.seq for item in items] == list(range(50))
+        assert items[49].x == 358792449 + 4900
+
+        part = mission_transfer.download_mission(master, start=10, end=15)
+        assert [item.seq for item in part] == [10, 11, 12, 13, 14]
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_upload_and_download_over_lossy_link():
+    vehicle = fake_vehicle.FakeVehicle(mission_loss=0.2, seed=3)
+    master = fake_vehicle.connect(vehicle)
+    rtt = mission_transfer.RttEstimator(initial=0.1)
+    try:
+        assert mission_transfer.upload_mission(master, make_mission(40), rtt=rtt, timeout=30) == 40
+        assert [item.x for item in vehicle.mission] == [item.x for item in make_mission(40)]
+
+        items = mission_transfer.download_mission(master, rtt=rtt, timeout=30)
+        assert [item.seq for item in items] == list(range(40))
+        assert rtt.samples > 0
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_upload_rejected_raises():
+    transfer = mission_transfer.MissionUpload(0, 0, make_mission(3))
+    transfer.start(0.0)
+    transfer.handle(mavutil.mavlink.MAVLink_mission_ack_message(
+        255, 0, mavutil.mavlink.MAV_MISSION_NO_SPACE), 0.1)
+    assert transfer.done
+    assert "MAV_MISSION_NO_SPACE" in transfer.error
+
+
+def test_upload_verifies_lost_final_ack_and_closes_download():
+    items = make_mission(2)
+    transfer = mission_transfer.MissionUpload(0, 0, items, rtt=mission_transfer.RttEstimator(initial=0.1))
+    transfer.start(0.0)
+    for seq in (0, 1):
+        transfer.handle(mavutil.mavlink.MAVLink_mission_request_int_message(255, 0, seq), 0.01)
+    assert [m.get_type() for m in transfer.poll(0.5)] == ["MISSION_ITEM_INT"]   # 最後の ACK が来ない
+    out = transfer.handle(mavutil.mavlink.MAVLink_mission_ack_message(
+        255, 0, mavutil.mavlink.MAV_MISSION_ERROR), 0.6)
+    assert [m.get_type() for m in out] == ["MISSION_REQUEST_LIST"]
+    out = transfer.handle(mavutil.mavlink.MAVLink_mission_count_message(255, 0, 2), 0.7)
+    assert transfer.done and transfer.error is None
+    assert [(m.get_type(), m.type) for m in out] == [("MISSION_ACK", mavutil.mavlink.MAV_MISSION_ACCEPTED)]
+    assert [(item.target_system, item.seq) for item in items] == [(1, 0), (1, 1)]   # 渡したものは変えない
+
+
+def test_download_gives_up_after_retries():
+    transfer = mission_transfer.MissionDownload(1, 1, rtt=mission_transfer.RttEstimator(initial=0.1),
+                                                max_retries=2)
+    now = 0.0
+    sent = len(transfer.start(now))
+    while not transfer.done:
+        now += 0.05
+        sent += len(transfer.poll(now))
+    assert sent == 3
+    assert "MISSION_COUNT" in transfer.error
+
+
+def test_rtt_estimator_tracks_samples():
+    rtt = mission_transfer.RttEstimator()
+    assert rtt.timeout == mission_transfer.INITIAL_TIMEOUT
+    for _ in range(20):
+        rtt.add(0.1)
+    assert 0.1 <= rtt.timeout < 0.2
+
+
+def test_async_roundtrip():
+    vehicle = fake_vehicle.FakeVehicle(mission=make_mission(20))
+
+    async def scenario():
+        conn = await aio_mavlink.open_connection(vehicle.device)
+        await conn.wait_heartbeat(timeout=5)
+        items = await mission_transfer.download_mission_async(conn)
+        assert len(items) == 20
+        assert await mission_transfer.upload_mission_async(conn, items[:5]) == 5
+        conn.close()
+
+    try:
+        asyncio.run(asyncio.wait_for(scenario(), 20))
+        assert len(vehicle.mission) == 5
+    finally:
+        vehicle.close()
+
+
+def test_fence_type_needs_mavlink2_dialect():
+    if "mission_type" in mavutil.mavlink.MAVLink_mission_count_message.fieldnames:
+        pytest.skip("MAVLink2 dialect loaded")
+    with pytest.raises(ValueError):
+        mission_transfer.MissionDownload(1, 1, mission_type=1).start(0.0)
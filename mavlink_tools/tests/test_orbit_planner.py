@@ -0,0 +1,72 @@
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+from pymavlink import mavutil
+
+import orbit_planner
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "workshop", "20th", "takao_hokii"))
+import poi  # noqa: E402
+
+
+def make_specs(count):
+    return [orbit_planner.StructureSpec(35.87 + i * 1e-3, 140.33 + i * 1e-3, 2.0 + i % 5, 3.0, 0.0, 8.0 + i % 7)
+            for i in range(count)]
+
+
+def test_matches_poi_rings_and_mission_layout():
+    spec = make_specs(3)[2]
+    cur_lat, cur_lon = spec.center_lat - 1e-4, spec.center_lon + 3e-5
+    radius = poi.estimate_orbit_radius(spec, 10.0, 20.0)
+    # poi.plan_structure_orbits は plan_vertical_levels の start_alt_m に半径を渡している
+    expected_radius, expected = poi.plan_structure_orbits(spec, cur_lat, cur_lon, 36, 10.0, 20.0)
+
+    plan = orbit_planner.OrbitPlanner().plan(spec, safety_margin_m=10.0, min_radius_m=20.0, start_alt_m=radius)
+    assert plan.radius == expected_radius
+    start = plan.closest_index(cur_lat, cur_lon)
+    assert np.allclose(plan.rings(start), np.array(expected), rtol=0, atol=1e-12)
+
+    items = plan.mission(cur_lat, cur_lon, target_system=1, target_component=1)
+    mavlink = mavutil.mavlink
+    assert len(items) == 2 + len(expected) * 36 + 1
+    assert [item.seq for item in items] == list(range(len(items)))
+    assert items[0].command == mavlink.MAV_CMD_NAV_TAKEOFF and items[0].z == expected[0][0][2]
+    assert items[1].command == mavlink.MAV_CMD_DO_SET_ROI and items[1].z == spec.height_m / 2
+    assert items[-1].command == mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH
+    waypoints = items[2:-1]
+    assert {item.command for item in waypoints} == {mavlink.MAV_CMD_NAV_WAYPOINT}
+    assert all(item.param2 == 2.0 and math.isnan(item.param4) for item in waypoints)
+    flat = [point for ring in expected for point in ring]
+    assert all(abs(item.x - int(lat * 1e7)) <= 1 and abs(item.y - int(lon * 1e7)) <= 1
+               for item, (lat, lon, _) in zip(waypoints, flat))
+
+
+def test_plan_many_caches_and_rerotates():
+    planner = orbit_planner.OrbitPlanner(cache_size=100)
+    specs = make_specs(60)
+    plans = planner.plan_many(specs, n_points_per_ring=12)
+    assert (planner.hits, planner.misses) == (0, 60)
+    for spec, plan in zip(specs, plans):
+        single = orbit_planner.OrbitPlanner._compute([spec], plan.params)[0]
+        assert np.array_equal(plan.lats, single.lats) and np.array_equal(plan.altitudes, single.altitudes)
+
+    again = planner.plan_many(specs[:10] + make_specs(61)[60:], n_points_per_ring=12)
+    assert again[:10] == plans[:10]                      # 同じオブジェクト
+    assert (planner.hits, planner.misses) == (10, 61)
+    assert planner.plan(specs[0], n_points_per_ring=24) is not plans[0]    # パラメータが違う
+
+    plan = plans[0]
+    # 円周を作り直さずに、出発地点に近い点から始める
+    for index in (0, 3, 11):
+        lat, lon = plan.lats[index], plan.lons[index]
+        first = plan.mission(lat + 1e-6, lon)[2]
+        assert (first.x, first.y) == (int(lat * 1e7), int(lon * 1e7))
+
+    small = orbit_planner.OrbitPlanner(cache_size=5)
+    small.plan_many(specs[:8])
+    assert len(small) == 5
+    with pytest.raises(TypeError):
+        planner.plan(specs[0], n_points=12)
@@ -0,0 +1,63 @@
+import fake_vehicle
+import param_sync
+
+
+def make_params(count):
+    return {"PARAM_%03d" % i: float(i) for i in range(count)}
+
+
+def test_gaps_are_refetched_by_index(tmp_path):
+    vehicle = fake_vehicle.FakeVehicle(make_params(60), drop_list_indices={3, 17, 18, 59})
+    master = fake_vehicle.connect(vehicle)
+    try:
+        sync = param_sync.ParamSync(master, cache_dir=str(tmp_path), quiet_timeout=0.3)
+        params = sync.fetch()
+        assert params.count == 60
+        assert params.names[17] == "PARAM_017"
+        assert params.values["PARAM_059"] == 59.0
+        assert params.refetched == 4
+        assert not params.from_cache
+        assert vehicle.requests.count("PARAM_REQUEST_LIST") == 1
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_cache_is_reused_after_reconnect(tmp_path):
+    values = make_params(40)
+    vehicle = fake_vehicle.FakeVehicle(values)
+    master = fake_vehicle.connect(vehicle)
+    sync = param_sync.ParamSync(master, cache_dir=str(tmp_path), quiet_timeout=0.3)
+    sync.fetch()
+    master.close()
+    vehicle.close()
+    assert len(list(tmp_path.iterdir())) == 1
+
+    vehicle = fake_vehicle.FakeVehicle(values)
+    master = fake_vehicle.connect(vehicle)
+    try:
+        params = param_sync.ParamSync(master, cache_dir=str(tmp_path), quiet_timeout=0.3).fetch()
+        assert params.from_cache
+        assert params.count == 40
+        assert "PARAM_REQUEST_LIST" not in vehicle.requests
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_cache_is_rejected_when_count_differs(tmp_path):
+    vehicle = fake_vehicle.FakeVehicle(make_params(40))
+    master = fake_vehicle.connect(vehicle)
+    param_sync.ParamSync(master, cache_dir=str(tmp_path), quiet_timeout=0.3).fetch()
+    master.close()
+    vehicle.close()
+
+    vehicle = fake_vehicle.FakeVehicle(make_params(41))
+    master = fake_vehicle.connect(vehicle)
+    try:
+        params = param_sync.ParamSync(master, cache_dir=str(tmp_path), quiet_timeout=0.3).fetch()
+        assert not params.from_cache
+        assert params.count == 41
+    finally:
+        master.close()
+        vehicle.close()
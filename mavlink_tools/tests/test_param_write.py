@@ -0,0 +1,54 @@
+import time
+
+import fake_vehicle
+import param_write
+
+
+def test_batch_write_retries_only_failures():
+    vehicle = fake_vehicle.FakeVehicle(
+        {"WPNAV_SPEED": 500.0, "RTL_ALT": 1500.0, "ANGLE_MAX": 3000.0, "FS_OPTIONS": 0.0},
+        drop_set_echo={"RTL_ALT"}, readonly={"ANGLE_MAX"})
+    master = fake_vehicle.connect(vehicle)
+    try:
+        result = param_write.set_params(
+            master, {"WPNAV_SPEED": 1000, "RTL_ALT": 3000, "ANGLE_MAX": 4500,
+                     "FS_OPTIONS": 16, "NO_SUCH_PARAM": 1},
+            timeout=0.3, retries=2)
+        rows = result.rows
+        assert rows["WPNAV_SPEED"].status == param_write.OK
+        assert rows["WPNAV_SPEED"].attempts == 1
+        assert rows["FS_OPTIONS"].echoed == 16.0
+        assert rows["RTL_ALT"].status == param_write.OK
+        assert rows["RTL_ALT"].attempts == 2
+        assert rows["ANGLE_MAX"].status == param_write.MISMATCH
+        assert rows["ANGLE_MAX"].echoed == 3000.0
+        assert rows["NO_SUCH_PARAM"].status == param_write.TIMEOUT
+        assert sorted(result.failed) == ["ANGLE_MAX", "NO_SUCH_PARAM"]
+        assert result.sent == 8
+        assert vehicle.params["RTL_ALT"] == 3000.0
+        assert "NO_SUCH_PARAM" in result.table()
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_pipelining_overlaps_round_trips():
+    params = {"P%02d" % i: 0.0 for i in range(12)}
+    vehicle = fake_vehicle.FakeVehicle(params, reply_delay=0.1)
+    master = fake_vehicle.connect(vehicle)
+    try:
+        started = time.time()
+        result = param_write.set_params(master, {name: 1.5 for name in params}, window=12)
+        elapsed = time.time() - started
+        assert result.ok
+        # 1個ずつ往復すると 12 x 0.1 秒以上かかる
+        assert elapsed < 0.6
+        assert result.retry_time < 0.05
+    finally:
+        master.close()
+        vehicle.close()
+
+
+def test_values_match_uses_float32():
+    assert param_write.values_match(0.1, param_write.as_float32(0.1))
+    assert not param_write.values_match(2.5, 2.0)
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from pymavlink import mavutil
+
+import fake_vehicle
+import vehicle_pool
+
+
+def test_pool_routes_messages_per_vehicle():
+    vehicles = [fake_vehicle.FakeVehicle(params={"SYSID_THISMAV": sysid}, sysid=sysid)
+                for sysid in (1, 2, 3, 4)]
+    devices = {"v%d" % v.sysid: v.device for v in vehicles}
+    devices["silent"] = "udpin:127.0.0.1:0"
+    pool = vehicle_pool.VehiclePool(devices)
+    values = []
+    pool.on("PARAM_VALUE", lambda vehicle, msg: values.append((vehicle.name, msg.param_value)))
+    before = set(threading.enumerate())
+    try:
+        started = time.monotonic()
+        report = pool.open(timeout=1.0)
+        assert report == {"v1": None, "v2": None, "v3": None, "v4": None,
+                          "silent": vehicle_pool.TIMEOUT}
+        assert time.monotonic() - started < 2.0
+        new_threads = set(threading.enumerate()) - before
+        assert [t.name for t in new_threads] == ["VehiclePool"]    # 受信スレッドは1本
+        assert [v.target_system for v in pool.ready] == [1, 2, 3, 4]
+
+        v3 = pool["v3"]
+        assert v3.heartbeat.get_srcSystem() == 3
+        v3.send(v3.mav.param_request_read_encode(3, 1, b"SYSID_THISMAV", -1))
+        msg = v3.wait_message("HEARTBEAT", timeout=2)
+        assert msg is not None and msg.get_srcSystem() == 3
+        deadline = time.monotonic() + 2
+        while not values and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert values == [("v3", 3.0)]
+
+        # 同じ sysid のジンバルの HEARTBEAT は機体のものにしない
+        assert v3.target_component == 1
+        gimbal = mavutil.mavlink.MAVLink(None, srcSystem=3, srcComponent=154)
+        vehicles[2].send(gimbal.heartbeat_encode(
+            mavutil.mavlink.MAV_TYPE_GIMBAL, mavutil.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0), gimbal)
+        msg = v3.wait_message("HEARTBEAT", lambda m: m.get_srcComponent() == 154, timeout=2)
+        assert msg is not None and v3.heartbeat.get_srcComponent() == 1 and v3.target_component == 1
+        assert pool["v1"].wait_message("HEARTBEAT", lambda m: False, timeout=0.1) is None
+    finally:
+        pool.close()
+        for vehicle in vehicles:
+            vehicle.close()
+
+
+def test_disconnected_vehicle_is_dropped():
+    vehicle = fake_vehicle.FakeVehicle()
+    pool = vehicle_pool.VehiclePool([vehicle.device], gcs_heartbeat=0)
+    try:
+        assert pool.open(timeout=2.0) == {vehicle.device: None}
+        vehicle.close()
+        deadline = time.monotonic() + 3
+        while pool[vehicle.device].error is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool[vehicle.device].error == "disconnected"
+    finally:
+        pool.close()
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+from pymavlink import mavutil
+
+import fake_vehicle
+import vehicle_pool
+import vehicle_state
+
+mavlink = mavutil.mavlink
+
+
+def test_messages_update_immutable_snapshots():
+    mirror = vehicle_state.StateMirror(clock=lambda: 100.0)
+    empty = mirror.state
+    assert empty.seq == 0 and empty.connected is False and empty.lat is None
+
+    mirror.handle(mavlink.MAVLink_heartbeat_message(
+        mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+        mavlink.MAV_MODE_FLAG_SAFETY_ARMED | mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 4, 4, 3))
+    mirror.handle(mavlink.MAVLink_global_position_int_message(
+        0, 358790000, 1403390000, 30500, 10250, 0, 0, 0, 9000))
+    mirror.handle(mavlink.MAVLink_heartbeat_message(mavlink.MAV_TYPE_GCS, 8, 0, 0, 0, 3))   # GCS は無視
+    mirror.handle(mavlink.MAVLink_heartbeat_message(                                        # ジンバルも無視
+        mavlink.MAV_TYPE_GIMBAL, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0, 3))
+    mirror.handle(mavlink.MAVLink_attitude_message(0, 0.1, 0, 0, 0, 0, 0))
+    state = mirror.state
+    assert (state.seq, state.timestamp) == (3, 100.0)
+    assert (state.mode, state.armed, state.connected) == ("GUIDED", True, True)
+    assert state.lat == pytest.approx(35.879) and state.relative_alt == pytest.approx(10.25)
+    assert state.heading == 90.0 and state.roll == pytest.approx(5.7296, abs=1e-4)
+    assert empty.lat is None                                     # 前のスナップショットは変わらない
+
+    assert mirror.update(heading=90.0) is state                  # 変化なし
+    with pytest.raises(AttributeError):
+        state.lat = 0.0
+    with pytest.raises(TypeError):
+        mirror.update(latitude=1.0)
+    assert state.as_dict()["mode"] == "GUIDED" and "seq" in state.as_dict()
+    assert state == vehicle_state.VehicleState(**{k: v for k, v in state.as_dict().items()})
+
+
+def test_readers_never_see_torn_state():
+    mirror = vehicle_state.StateMirror()
+    stop = threading.Event()
+    torn = []
+
+    def writer():
+        value = 0
+        while not stop.is_set() and value < 20000:
+            value += 1
+            mirror.update(lat=float(value), lon=float(-value), alt=float(value * 2))
+
+    def reader():
+        while not stop.is_set():
+            state = mirror.state
+            if state.lat is not None and not (state.lon == -state.lat and state.alt == 2 * state.lat):
+                torn.append(state)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    write = threading.Thread(target=writer)
+    write.start()
+    assert mirror.wait(10, timeout=5).seq > 10                     # 更新を待てる
+    write.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert torn == [] and mirror.state.seq == 20000
+    assert mirror.wait(20000, timeout=0.05).seq == 20000          # タイムアウトなら今の状態
+
+
+def test_attach_uses_only_the_autopilot_component():
+    vehicle = fake_vehicle.FakeVehicle()
+    pool = vehicle_pool.VehiclePool({"copter": vehicle.device}, gcs_heartbeat=0)
+    mirror = vehicle_state.StateMirror()
+    mirror.attach(pool, "copter")
+    try:
+        assert pool.open(timeout=2.0) == {"copter": None}
+        gimbal = mavlink.MAVLink(None, srcSystem=vehicle.sysid, srcComponent=154)
+        vehicle.send(vehicle.mav.attitude_encode(0, 0.1, 0, 0, 0, 0, 0))
+        vehicle.send(gimbal.attitude_encode(0, 1.0, 0, 0, 0, 0, 0), gimbal)
+        vehicle.send(gimbal.heartbeat_encode(
+            mavlink.MAV_TYPE_GIMBAL, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0, 3), gimbal)
+        vehicle.send(vehicle.mav.sys_status_encode(0, 0, 0, 500, 12000, -1, 80, 0, 0, 0, 0, 0, 0))
+        state = mirror.state
+        while state.battery_voltage is None:                       # 最後に送った SYS_STATUS まで待つ
+            state = mirror.wait(state.seq, timeout=2)
+        assert state.roll == pytest.approx(5.7296, abs=1e-4)       # ジンバルの ATTITUDE は使わない
+        assert state.connected and state.battery_voltage == 12.0
+    finally:
+        pool.close()
+        vehicle.close()
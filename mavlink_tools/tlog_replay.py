@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+MAVLink の記録（tlog）と高速リプレイ
+
+SITL が無い環境でも、記録しておいた MAVLink の流れを TCP / UDP で再生すれば
+リレー運行スクリプトや Web バックエンド、到着判定ループの動作確認・計測ができる。
+
+記録形式は Mission Planner / MAVProxy と同じ tlog:
+    [8バイト ビッグエンディアンのUNIX時刻(マイクロ秒)][MAVLink の生フレーム] の繰り返し
+追記のみ（append-only）で書くため、記録中に落ちても途中までは読める。
+pymavlink（mavutil.mavlink_connection("xxx.tlog")）や MAVExplorer でもそのまま開ける。
+
+リプレイはフレームをデコードせず、ヘッダの長さ情報だけで切り出して送る。
+  --speed 1    記録時と同じ間隔で送る
+  --speed 10   10倍速
+  --speed 0    待たずに送る（最大速度。まとめて送るので 100k msg/s 以上出る）
+
+使い方:
+    # 記録（Ctrl+C で終了）
+    python tlog_replay.py record tcp:127.0.0.1:5762 flight.tlog
+    # TCP で待ち受けて再生（SITL の代わりに tcp:127.0.0.1:5760 へ接続できる）
+    python tlog_replay.py serve flight.tlog --tcp 127.0.0.1:5760 --speed 1
+    # UDP で送りつける（udpin:0.0.0.0:14550 で待ち受けているバックエンド向け）
+    python tlog_replay.py serve flight.tlog --udp 127.0.0.1:14550 --speed 0
+    # 内容の確認
+    python tlog_replay.py info flight.tlog
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+
+from pymavlink import mavutil
+
+MAVLINK1_STX = 0xFE
+MAVLINK2_STX = 0xFD
+MAVLINK2_SIGNED = 0x01          # incompat_flags: 署名付き（末尾に13バイト追加）
+SIGNATURE_LEN = 13
+
+# 最大速度でのリプレイ時に1回の送信にまとめるバイト数
+TCP_BATCH_BYTES = 64 * 1024
+UDP_BATCH_BYTES = 1400          # 1データグラムに収める上限（MTU 以下）
+
+
+def frame_length(buf, pos):
+    """buf[pos] から始まる MAVLink フレームの長さを返す。ヘッダが壊れていれば None。"""
+    stx = buf[pos]
+    if stx == MAVLINK1_STX:
+        return 6 + buf[pos + 1] + 2
+    if stx == MAVLINK2_STX:
+        length = 10 + buf[pos + 1] + 2
+        if buf[pos + 2] & MAVLINK2_SIGNED:
+            length += SIGNATURE_LEN
+        return length
+    return None
+
+
+def frame_crc_ok(buf, pos, length):
+    """buf[pos] から length バイトのフレームの CRC が合っているか（デコードはしない）。"""
+    stx = buf[pos]
+    if stx == MAVLINK2_STX:
+        header = 10
+        msg_id = buf[pos + 7] | (buf[pos + 8] << 8) | (buf[pos + 9] << 16)
+    else:
+        header = 6
+        msg_id = buf[pos + 5]
+    msg_class = mavutil.mavlink.mavlink_map.get(msg_id)
+    if msg_class is None:
+        return False
+    crc_end = pos + header + buf[pos + 1]
+    if crc_end + 2 > pos + length:
+        return False
+    crc = mavutil.mavlink.x25crc(bytes(buf[pos + 1:crc_end]))
+    crc.accumulate(bytes((msg_class.crc_extra,)))
+    return crc.crc == buf[crc_end] | (buf[crc_end + 1] << 8)
+
+
+# ---------------------------------------------------------------------------
+# 記録
+# ---------------------------------------------------------------------------
+
+class TlogWriter:
+    """tlog へ追記する。write() に MAVLink メッセージか生フレーム(bytes)を渡す。"""
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.file = open(path, "ab")
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._last_flush = time.time()
+
+    def write(self, msg, timestamp=None):
+        """1フレームを記録する。timestamp は UNIX 時刻[秒]（省略時は現在時刻）。"""
+        frame = msg if isinstance(msg, (bytes, bytearray)) else msg.get_msgbuf()
+        now = time.time()
+        usec = int((now if timestamp is None else timestamp) * 1e6)
+        self.file.write(struct.pack(">Q", usec) + bytes(frame))
+        self.count += 1
+        if now - self._last_flush >= self.flush_interval:
+            self.file.flush()
+            self._last_flush = now
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record(device, path, duration=None, source_system=255, source_component=0):
+    """device から受信した全メッセージを path に記録する。記録したメッセージ数を返す。
+
+    duration[秒] を指定するとその時間で終了する。Ctrl+C でも終了できる。
+    """
+    master = mavutil.mavlink_connection(device, source_system=source_system,
+                                        source_component=source_component)
+    deadline = None if duration is None else time.time() + duration
+    with TlogWriter(path) as writer:
+        try:
+            while deadline is None or time.time() < deadline:
+                msg = master.recv_match(blocking=True, timeout=1)
+                if msg is None or msg.get_type() == "BAD_DATA":
+                    continue
+                writer.write(msg)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            master.close()
+        return writer.count
+
+
+# ---------------------------------------------------------------------------
+# 読み込み
+# ---------------------------------------------------------------------------
+
+class Tlog:
+    """tlog を読み込んだもの。timestamps[i] はマイクロ秒、frames[i] は生フレーム。"""
+
+    def __init__(self, timestamps, frames):
+        self.timestamps = timestamps
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        """記録時間[秒]。"""
+        if len(self.timestamps) < 2:
+            return 0.0
+        return (self.timestamps[-1] - self.timestamps[0]) / 1e6
+
+
+def load(path):
+    """tlog を読み込む。末尾の書きかけのフレームや壊れた部分は読み飛ばす。
+
+    同期が取れている間はヘッダの長さだけで切り出す。同期が外れた後は、ペイロード中の
+    0xFD / 0xFE を STX と取り違えないよう、CRC が合うフレームが見つかるまで読み飛ばす。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    timestamps = []
+    frames = []
+    pos = 0
+    end = len(data)
+    synced = True
+    while pos + 11 <= end:
+        length = frame_length(data, pos + 8)
+        if (length is None or pos + 8 + length > end
+                or (not synced and not frame_crc_ok(data, pos + 8, length))):
+            # 同期が外れた: 次の STX を探す（タイムスタンプは STX の8バイト前）
+            next_pos = _resync(data, pos + 1)
+            if next_pos is None:
+                break
+            pos = next_pos
+            synced = False
+            continue
+        synced = True
+        timestamps.append(int.from_bytes(view[pos:pos + 8], "big"))
+        frames.append(bytes(view[pos + 8:pos + 8 + length]))
+        pos += 8 + length
+    return Tlog(timestamps, frames)
+
+
+def _resync(data, start):
+    """start 以降で、タイムスタンプ付きフレームの先頭になり得る位置を返す。"""
+    found = [pos for pos in (data.find(bytes([stx]), start + 8)
+                             for stx in (MAVLINK2_STX, MAVLINK1_STX)) if pos != -1]
+    return min(found) - 8 if found else None
+
+
+# ---------------------------------------------------------------------------
+# リプレイ
+# ---------------------------------------------------------------------------
+
+def replay(tlog, send, speed=1.0, batch_bytes=TCP_BATCH_BYTES, stop_event=None):
+    """tlog のフレームを send(bytes) で送る。送ったフレーム数を返す。
+
+    speed=0 は最大速度。それ以外は記録時の間隔を speed で割った間隔で送る。
+    送信時刻になったフレームはまとめて1回の send() で送る（batch_bytes まで）。
+    """
+    frames = tlog.frames
+    count = len(frames)
+    if count == 0:
+        return 0
+
+    if not speed:
+        sent = 0
+        batch = []
+        size = 0
+        for frame in frames:
+            if size + len(frame) > batch_bytes and batch:
+                send(b"".join(batch))
+                sent += len(batch)
+                batch = []
+                size = 0
+                if stop_event is not None and stop_event.is_set():
+                    return sent
+            batch.append(frame)
+            size += len(frame)
+        if batch:
+            send(b"".join(batch))
+            sent += len(batch)
+        return sent
+
+    timestamps = tlog.timestamps
+    origin = timestamps[0]
+    started = time.perf_counter()
+    i = 0
+    while i < count:
+        if stop_event is not None and stop_event.is_set():
+            return i
+        due = started + (timestamps[i] - origin) / 1e6 / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # 送信時刻を過ぎたフレームをまとめて送る
+        now = time.perf_counter()
+        batch = [frames[i]]
+        size = len(frames[i])
+        i += 1
+        while (i < count and size + len(frames[i]) <= batch_bytes
+               and started + (timestamps[i] - origin) / 1e6 / speed <= now):
+            batch.append(frames[i])
+            size += len(frames[i])
+            i += 1
+        send(b"".join(batch))
+    return count
+
+
+class ReplayServer:
+    """tlog を TCP サーバー（SITL の代わり）または UDP 送信で再生する。"""
+
+    def __init__(self, tlog, speed=1.0, loop=False):
+        self.tlog = tlog
+        self.speed = speed
+        self.loop = loop
+        self.sent = 0                 # 送信したフレーム数（全クライアント合計）
+        self._sent_lock = threading.Lock()   # クライアントごとのスレッドから足し込む
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+    def serve_tcp(self, host="127.0.0.1", port=5760):
+        """TCP で待ち受ける。接続してきたクライアントごとに先頭から再生する。実際のポートを返す。"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(8)
+        self._server.settimeout(0.5)
+        thread = threading.Thread(target=self._accept_loop, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self._server.getsockname()[1]
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                client, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._serve_client, args=(client,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _serve_client(self, client):
+        try:
+            self._run(client.sendall, TCP_BATCH_BYTES)
+        except OSError:
+            pass          # クライアントが切断した
+        finally:
+            client.close()
+
+    def send_udp(self, host, port, background=True):
+        """host:port へ UDP で送る（udpin で待ち受けている相手向け）。"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        def run():
+            try:
+                self._run(lambda data: sock.sendto(data, (host, port)), UDP_BATCH_BYTES)
+            finally:
+                sock.close()
+
+        if not background:
+            run()
+            return
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _run(self, send, batch_bytes):
+        while not self._stop.is_set():
+            sent = replay(self.tlog, send, self.speed, batch_bytes, self._stop)
+            with self._sent_lock:
+                self.sent += sent
+            if not self.loop:
+                return
+
+    def wait(self, timeout=None):
+        """再生スレッドが終わるまで待つ（TCP の待ち受けは stop() まで続く）。"""
+        for thread in list(self._threads):
+            thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.close()
+
+
+# ---------------------------------------------------------------------------
+# コマンドライン
+# ---------------------------------------------------------------------------
+
+def parse_hostport(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MAVLink の記録(tlog)と再生")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_record = sub.add_parser("record", help="接続先から受信したメッセージを tlog に追記する")
+    p_record.add_argument("device", help="接続文字列（例: tcp:127.0.0.1:5762）")
+    p_record.add_argument("path", help="出力する tlog")
+    p_record.add_argument("--duration", type=float, default=None, help="記録時間[秒]（既定: Ctrl+C まで）")
+
+    p_serve = sub.add_parser("serve", help="tlog を TCP / UDP で再生する")
+    p_serve.add_argument("path", help="再生する tlog")
+    p_serve.add_argument("--tcp", metavar="HOST:PORT", default=None, help="TCP で待ち受ける")
+    p_serve.add_argument("--udp", metavar="HOST:PORT", default=None, help="UDP で送る")
+    p_serve.add_argument("--speed", type=float, default=1.0, help="再生速度（1=等速, 0=最大速度）")
+    p_serve.add_argument("--loop", action="store_true", help="末尾まで再生したら先頭から繰り返す")
+
+    p_info = sub.add_parser("info", help="tlog のフレーム数・記録時間を表示する")
+    p_info.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        print("記録中: %s → %s（Ctrl+C で終了）" % (args.device, args.path))
+        count = record(args.device, args.path, args.duration)
+        print("%d メッセージを記録しました。" % count)
+        return
+
+    tlog = load(args.path)
+    if args.command == "info":
+        print("%s: %d フレーム / %.1f 秒" % (args.path, len(tlog), tlog.duration))
+        return
+
+    if not args.tcp and not args.udp:
+        parser.error("--tcp か --udp のどちらかを指定してください。")
+    server = ReplayServer(tlog, speed=args.speed, loop=args.loop)
+    try:
+        if args.tcp:
+            host, port = parse_hostport(args.tcp)
+            port = server.serve_tcp(host, port)
+            print("再生待ち受け中: tcp:%s:%d（%d フレーム, 速度 %s）"
+                  % (host, port, len(tlog), "最大" if not args.speed else "%gx" % args.speed))
+        if args.udp:
+            host, port = parse_hostport(args.udp)
+            print("UDP 送信: %s:%d" % (host, port))
+            server.send_udp(host, port)
+        while True:
+            time.sleep(1.0)
+            if not args.tcp and all(not t.is_alive() for t in server._threads):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    print("%d フレームを送信しました。" % server.sent)
+
+
+if __name__ == "__main__":
+    main()
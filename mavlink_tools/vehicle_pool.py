@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+複数機体の接続プール（受信スレッド1本）
+
+複数機体を扱うスクリプトは、機体ごとに dronekit の connect() や mavutil の接続を
+1台ずつ順番に開き、それぞれが受信スレッドを持つことが多い。
+  - 起動時間が「全機体の接続時間の合計」になる（5台なら5倍）
+  - 機体ごとに受信スレッドがあり、50台の SITL では数百スレッドが GIL を奪い合う
+
+VehiclePool は N 台の接続を並列に開き、すべてのソケットを1つの selectors（Linux では epoll）
+で待つ。受信したバイト列は機体ごとの MessageDispatcher（mav_dispatch）で切り出し、
+登録のあるメッセージだけをデコードして機体ごとの状態（PooledVehicle）へ振り分ける。
+HEARTBEAT の待ちも受信スレッドの中で全機体同時に進むので、起動時間は一番遅い機体で決まる。
+
+使い方:
+    pool = VehiclePool({"plane": "tcp:127.0.0.1:5762", "copter": "tcp:127.0.0.1:5772"})
+    report = pool.open(timeout=30)          # {"plane": None, "copter": "timeout"} 等
+    copter = pool["copter"]
+    print(copter.heartbeat.type, copter.mode, copter.armed)
+    pos = copter.wait_message("GLOBAL_POSITION_INT", timeout=5)
+
+    @pool.on("MISSION_ITEM_REACHED")
+    def reached(vehicle, msg):              # 受信スレッドから呼ばれる（すぐ戻ること）
+        print(vehicle.name, msg.seq)
+
+    copter.send(copter.mav.command_long_encode(...))
+    pool.close()
+"""
+
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymavlink import mavutil
+
+import mav_dispatch
+
+# 状態として最新値を保持するメッセージ（これ以外は on() で登録しない限りデコードしない）
+STATE_TYPES = ("HEARTBEAT", "GLOBAL_POSITION_INT", "SYS_STATUS", "GPS_RAW_INT",
+               "EKF_STATUS_REPORT", "MISSION_CURRENT", "MISSION_ITEM_REACHED",
+               "COMMAND_ACK", "STATUSTEXT")
+
+# 接続を並列に開くスレッド数の上限（TCP の connect は mavutil の中でブロックする）
+CONNECT_WORKERS = 32
+
+# 受信スレッドが select で待つ最大時間[秒]（close() や GCS ハートビートの送信のため）
+SELECT_TIMEOUT = 0.2
+
+# GCS としてハートビートを送る間隔[秒]（0 なら送らない）
+GCS_HEARTBEAT_INTERVAL = 1.0
+
+# 機体を特定できないまま open() が終わったときの理由
+TIMEOUT = "timeout"
+
+
+class PooledVehicle:
+    """プール内の1機体。受信スレッドが状態を更新し、他のスレッドから読む。"""
+
+    def __init__(self, name, device, source_system):
+        self.name = name
+        self.device = device
+        self.source_system = source_system
+        self.master = None
+        self.error = None                    # 接続できなかった理由（接続できていれば None）
+        self.dispatcher = None
+        self.messages = {}                   # メッセージ名 → 最新のメッセージ
+        self.received = {}                   # メッセージ名 → 受信数
+        self.heartbeat = None                # 機体（target_system）の最新の HEARTBEAT
+        self.last_heartbeat = None           # その受信時刻（time.monotonic()）
+        self.identified = threading.Event()  # 最初の HEARTBEAT を受信したらセット
+        self._updated = threading.Condition()
+        self._send_lock = threading.Lock()
+
+    def __repr__(self):
+        return "<PooledVehicle %s %s>" % (self.name, self.device)
+
+    # ---- 状態 ------------------------------------------------------------
+
+    @property
+    def mav(self):
+        """メッセージの組み立て用（xxx_encode）。送信は send() を使う。"""
+        return self.master.mav
+
+    @property
+    def target_system(self):
+        return self.master.target_system
+
+    @property
+    def target_component(self):
+        return self.master.target_component
+
+    @property
+    def mode(self):
+        return self.master.flightmode if self.heartbeat is not None else None
+
+    @property
+    def armed(self):
+        return self.master.motors_armed() if self.heartbeat is not None else False
+
+    def wait_message(self, msg_type, condition=None, timeout=None):
+        """この呼び出しの後に届く msg_type を待って返す。condition を満たすものだけを待つ。
+
+        状態として保持している型（STATE_TYPES と on() で登録した型）だけ待てる。
+        タイムアウトしたら None を返す。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._updated:
+            seen = self.received.get(msg_type, 0)
+            while True:
+                count = self.received.get(msg_type, 0)
+                if count > seen:
+                    seen = count
+                    msg = self.messages[msg_type]
+                    if condition is None or condition(msg):
+                        return msg
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._updated.wait(remaining)
+
+    # ---- 送信 ------------------------------------------------------------
+
+    def send(self, msg):
+        """msg（xxx_encode で作ったもの）を送る。どのスレッドからでも呼べる。"""
+        with self._send_lock:
+            self.master.mav.send(msg)
+
+    # ---- 受信スレッドから呼ばれる ------------------------------------------
+
+    def _connect(self):
+        try:
+            self.master = mavutil.mavlink_connection(self.device, source_system=self.source_system)
+        except Exception as error:
+            self.error = "%s: %s" % (type(error).__name__, error)
+            return self
+        self.dispatcher = mav_dispatch.MessageDispatcher(self.master.mav)
+        return self
+
+    def _on_message(self, msg):
+        self.master.post_message(msg)
+        msg_type = msg.get_type()
+        with self._updated:
+            self.messages[msg_type] = msg
+            self.received[msg_type] = self.received.get(msg_type, 0) + 1
+            # オートパイロットの HEARTBEAT だけを機体のものとする（GCS・同じ sysid のジンバル等は除く）
+            if msg_type == "HEARTBEAT" and msg.get_srcSystem() == self.master.target_system \
+                    and msg.type != mavutil.mavlink.MAV_TYPE_GCS \
+                    and msg.autopilot != mavutil.mavlink.MAV_AUTOPILOT_INVALID:
+                if not self.master.target_component:
+                    self.master.target_component = msg.get_srcComponent()
+                self.heartbeat = msg
+                self.last_heartbeat = time.monotonic()
+                self.identified.set()
+            self._updated.notify_all()
+
+    def _feed(self, data):
+        if self.master.first_byte:
+            self.master.auto_mavlink_version(data)
+        self.dispatcher.feed(data, self._on_message)
+
+
+class VehiclePool:
+    """複数機体の接続を1本の受信スレッドでまとめて扱う。
+
+    devices は {名前: 接続文字列} か、接続文字列のリスト（名前は接続文字列になる）。
+    """
+
+    def __init__(self, devices, source_system=255, state_types=STATE_TYPES,
+                 gcs_heartbeat=GCS_HEARTBEAT_INTERVAL):
+        if not isinstance(devices, dict):
+            devices = {device: device for device in devices}
+        self.vehicles = {name: PooledVehicle(name, device, source_system)
+                         for name, device in devices.items()}
+        self.state_types = list(state_types)
+        self.gcs_heartbeat = gcs_heartbeat
+        self.selector = selectors.DefaultSelector()
+        self.bytes_received = 0
+        self._handlers = []                  # (メッセージ種別, ハンドラ)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getitem__(self, name):
+        return self.vehicles[name]
+
+    def __iter__(self):
+        return iter(self.vehicles.values())
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    @property
+    def ready(self):
+        """HEARTBEAT で機体を特定できた機体のリスト。"""
+        return [vehicle for vehicle in self if vehicle.identified.is_set()]
+
+    # ---- 登録 ------------------------------------------------------------
+
+    def on(self, msg_types, handler=None):
+        """全機体の msg_types に handler(vehicle, msg) を登録する。デコレータとしても使える。
+
+        ハンドラは受信スレッドから呼ばれるので、時間のかかる処理はしないこと。
+        """
+        def register(func):
+            self._handlers.append((msg_types, func))
+            for vehicle in self:
+                if vehicle.dispatcher is not None:
+                    self._register(vehicle, msg_types, func)
+            return func
+
+        if handler is None:
+            return register
+        return register(handler)
+
+    @staticmethod
+    def _register(vehicle, msg_types, func):
+        vehicle.dispatcher.on(msg_types, lambda msg: func(vehicle, msg))
+
+    # ---- 開始・終了 --------------------------------------------------------
+
+    def open(self, timeout=30.0):
+        """全機体へ並列に接続し、HEARTBEAT で機体を特定できるまで最大 timeout 秒待つ。
+
+        {名前: None（成功）または失敗の理由} を返す。失敗した機体もプールには残るが、
+        受信はしない（error に理由が入る）。
+        """
+        deadline = time.monotonic() + timeout
+        workers = max(1, min(CONNECT_WORKERS, len(self.vehicles)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for vehicle in executor.map(PooledVehicle._connect, self.vehicles.values()):
+                if vehicle.error is not None:
+                    continue
+                for msg_type in self.state_types:
+                    vehicle.dispatcher.on(msg_type, _ignore)
+                for msg_types, func in self._handlers:
+                    self._register(vehicle, msg_types, func)
+                self.selector.register(vehicle.master.fd, selectors.EVENT_READ, vehicle)
+        self.start()
+        for vehicle in self:
+            if vehicle.error is None:
+                vehicle.identified.wait(max(0.0, deadline - time.monotonic()))
+        return self.report()
+
+    def report(self):
+        """{名前: None（特定できた）または失敗の理由} を返す。"""
+        return {vehicle.name: None if vehicle.identified.is_set() else (vehicle.error or TIMEOUT)
+                for vehicle in self}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="VehiclePool", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2)
+        for vehicle in self:
+            if vehicle.master is not None:
+                vehicle.master.close()
+        self.selector.close()
+
+    # ---- 受信スレッド --------------------------------------------------------
+
+    def _run(self):
+        next_heartbeat = time.monotonic()
+        while not self._stop.is_set():
+            if self.gcs_heartbeat and time.monotonic() >= next_heartbeat:
+                self._send_heartbeats()
+                next_heartbeat = time.monotonic() + self.gcs_heartbeat
+            if not self.selector.get_map():
+                self._stop.wait(SELECT_TIMEOUT)
+                continue
+            for key, _ in self.selector.select(SELECT_TIMEOUT):
+                vehicle = key.data
+                try:
+                    data = vehicle.master.recv(mav_dispatch.RECV_BYTES)
+                except OSError as error:
+                    self._drop(vehicle, "%s: %s" % (type(error).__name__, error))
+                    continue
+                if not data:
+                    # TCP で読めるのに空 = 相手が切断した（UDP はエラー応答で空になることがある）
+                    if isinstance(vehicle.master, mavutil.mavtcp):
+                        self._drop(vehicle, "disconnected")
+                    continue
+                self.bytes_received += len(data)
+                vehicle._feed(data)
+
+    def _send_heartbeats(self):
+        for vehicle in self:
+            if vehicle.master is None or vehicle.error is not None:
+                continue
+            try:
+                vehicle.send(vehicle.mav.heartbeat_encode(
+                    mavutil.mavlink.MAV_TYPE_GCS, mavutil.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0))
+            except OSError:
+                pass
+
+    def _drop(self, vehicle, reason):
+        vehicle.error = reason
+        self.selector.unregister(vehicle.master.fd)
+
+
+def _ignore(msg):
+    """状態の更新だけして、ハンドラとしては何もしない。"""
+    return None
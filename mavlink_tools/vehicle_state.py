@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+機体状態のミラー（ロック無しで読めるスナップショット）
+
+Web バックエンドのテレメトリは、受信スレッドが dict を更新し、HTTP / WebSocket の
+スレッドが読むことが多い。
+  - Lite_mapper の TelemetryData.get() は、呼ばれるたびにロックを取って dict 全体をコピーする
+  - komiyama の backend の update_state() は、更新のたびにロックを取って更新し、
+    broadcast_state() → get_state_snapshot() でもう一度ロックを取ってコピーする
+読む側が多い（ブラウザのタブ・ポーリング）と、200Hz で書く受信スレッドとロックを奪い合う。
+
+StateMirror は状態を変更できない VehicleState（タプル）で持つ。書く側は毎回
+新しい VehicleState を作り、参照を1回の代入で差し替える（ダブルバッファ）。
+CPython では属性の代入は不可分なので、読む側は mirror.state を読むだけでよい。
+  - ロックを取らない・コピーしない。書き込み中の半端な状態は見えない
+    （読む側が見るのは、必ずどこかの時点で完成した VehicleState）
+  - 受け取ったスナップショットは後から変わらないので、そのまま JSON にしたり、
+    別のスレッドへ渡したりできる
+  - seq は更新のたびに1つ増える。wait(seq) で「seq より新しい状態」を待てる（ロングポーリング用）
+書く側が複数ある場合（受信スレッドとコマンドのスレッド等）は、書く側だけが1つのロックを取る。
+速くなるのは読む側だけで、書く側は速くならない。更新のたびに VehicleState を作るので、
+1回の更新はロック + dict より少し遅く、読む側が休まず読み続けると書く側は GIL を
+待たされて周期が大きく遅れる（bench_vehicle_state.py）。
+
+使い方:
+    mirror = StateMirror()
+    mirror.attach(pool, "copter")            # VehiclePool の受信スレッドで更新する
+    # または受信ループで mirror.handle(msg)
+
+    state = mirror.state                     # どのスレッドからでも（ロック無し）
+    print(state.lat, state.lon, state.heading, state.mode)
+    return jsonify(state.as_dict())
+
+    state = mirror.wait(state.seq, timeout=10)   # 次の更新まで待つ
+"""
+
+import math
+import operator
+import threading
+import time
+
+from pymavlink import mavutil
+
+# 状態の項目（値の無いものは None）
+FIELDS = (
+    "connected", "armed", "mode",
+    "lat", "lon", "alt", "relative_alt", "heading",
+    "groundspeed", "airspeed", "climb",
+    "roll", "pitch", "yaw",
+    "battery_voltage", "battery_remaining",
+    "gps_fix", "satellites",
+)
+# タプルでの並び（seq・timestamp の後に FIELDS）
+_SLOTS = ("seq", "timestamp") + FIELDS
+_get_slots = operator.itemgetter(*_SLOTS)
+
+# handle() が使うメッセージ
+STATE_MESSAGES = ("HEARTBEAT", "GLOBAL_POSITION_INT", "VFR_HUD", "ATTITUDE", "SYS_STATUS", "GPS_RAW_INT")
+
+
+class VehicleState(tuple):
+    """ある時点の機体状態。作った後は変更できない。
+
+    seq は StateMirror が更新した回数、timestamp はその時刻（time.time()）。
+    中身はタプルなので、replace() は項目ごとの代入をせずに1回で新しい状態を作れる。
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, seq=0, timestamp=None, **fields):
+        fields.setdefault("connected", False)
+        fields.setdefault("armed", False)
+        return _EMPTY.replace(seq, timestamp, fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("VehicleState は変更できません（StateMirror.update() を使う）")
+
+    def __delattr__(self, name):
+        raise AttributeError("VehicleState は変更できません")
+
+    def __repr__(self):
+        return "<VehicleState seq=%d %s armed=%s lat=%s lon=%s>" % (
+            self.seq, self.mode, self.armed, self.lat, self.lon)
+
+    def __eq__(self, other):
+        if not isinstance(other, VehicleState):
+            return NotImplemented
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        if not isinstance(other, VehicleState):
+            return NotImplemented
+        return tuple.__ne__(self, other)
+
+    __hash__ = None
+
+    def replace(self, seq, timestamp, fields):
+        """fields（dict）を変えた新しい VehicleState。"""
+        values = dict(zip(_SLOTS, self))
+        values.update(fields)
+        if len(values) != len(_SLOTS):
+            raise TypeError("不明な項目: %s" % ", ".join(sorted(set(fields) - set(_SLOTS))))
+        values["seq"] = seq
+        values["timestamp"] = timestamp
+        return tuple.__new__(VehicleState, _get_slots(values))
+
+    def same_fields(self, other):
+        """seq・timestamp 以外の項目が other と同じか。"""
+        return self[2:] == other[2:]
+
+    def as_dict(self):
+        """JSON にできる dict（seq・timestamp を含む）。"""
+        return dict(zip(_SLOTS, self))
+
+
+for _index, _name in enumerate(_SLOTS):
+    setattr(VehicleState, _name, property(operator.itemgetter(_index)))
+del _index, _name
+
+_EMPTY = tuple.__new__(VehicleState, (None,) * len(_SLOTS))
+
+
+class StateMirror:
+    """1機体の最新の VehicleState。state の読み出しはロックを取らない。"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._state = VehicleState()
+        self._write_lock = threading.Lock()
+        self._updated = threading.Condition()
+        self._waiters = 0
+
+    @property
+    def state(self):
+        """最新のスナップショット（変更できない）。"""
+        return self._state
+
+    # ---- 書く側 ------------------------------------------------------------
+
+    def update(self, **fields):
+        """項目を更新する。値が変わらなければ何もせず、今の状態を返す。"""
+        with self._write_lock:
+            current = self._state
+            state = current.replace(current.seq + 1, self._clock(), fields)
+            if state.same_fields(current):
+                return current
+            self._state = state                  # ここで読む側に見えるようになる
+        if self._waiters:
+            with self._updated:
+                self._updated.notify_all()
+        return state
+
+    def handle(self, msg):
+        """MAVLink メッセージで状態を更新する（STATE_MESSAGES 以外は無視する）。"""
+        fields = message_fields(msg)
+        if fields:
+            self.update(**fields)
+
+    # ---- 読む側 ------------------------------------------------------------
+
+    def wait(self, seq, timeout=None):
+        """seq より新しい状態になるまで待って返す。タイムアウトしたら今の状態を返す。"""
+        state = self._state
+        if state.seq > seq:
+            return state
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._updated:
+            self._waiters += 1
+            try:
+                while self._state.seq <= seq:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._updated.wait(remaining)
+            finally:
+                self._waiters -= 1
+        return self._state
+
+    # ---- VehiclePool との接続 --------------------------------------------------
+
+    def attach(self, pool, name):
+        """pool（VehiclePool）の機体 name のメッセージで更新する。
+
+        使うのは機体（オートパイロット）のメッセージだけ（GCS・同じ sysid のジンバル等は除く）。
+        """
+        def on_message(vehicle, msg):
+            if vehicle.name == name and (msg.get_srcSystem(), msg.get_srcComponent()) == (
+                    vehicle.target_system, vehicle.target_component):
+                self.handle(msg)
+
+        return pool.on(list(STATE_MESSAGES), on_message)
+
+
+def message_fields(msg):
+    """メッセージから状態の項目を取り出す（{項目名: 値}）。"""
+    msg_type = msg.get_type()
+    if msg_type == "GLOBAL_POSITION_INT":
+        fields = {"lat": msg.lat * 1e-7, "lon": msg.lon * 1e-7,
+                  "alt": msg.alt * 1e-3, "relative_alt": msg.relative_alt * 1e-3}
+        if msg.hdg != 65535:                    # UINT16_MAX は不明
+            fields["heading"] = msg.hdg * 1e-2
+        return fields
+    if msg_type == "ATTITUDE":
+        return {"roll": math.degrees(msg.roll), "pitch": math.degrees(msg.pitch),
+                "yaw": math.degrees(msg.yaw)}
+    if msg_type == "VFR_HUD":
+        return {"groundspeed": msg.groundspeed, "airspeed": msg.airspeed,
+                "climb": msg.climb, "heading": float(msg.heading)}
+    if msg_type == "HEARTBEAT":
+        # GCS・ジンバル・カメラ等（autopilot が INVALID）の HEARTBEAT は機体の状態ではない
+        if (msg.type == mavutil.mavlink.MAV_TYPE_GCS
+                or msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID):
+            return None
+        return {"connected": True,
+                "armed": bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED),
+                "mode": mavutil.mode_string_v10(msg)}
+    if msg_type == "SYS_STATUS":
+        return {"battery_voltage": msg.voltage_battery * 1e-3 if msg.voltage_battery != 65535 else None,
+                "battery_remaining": msg.battery_remaining if msg.battery_remaining >= 0 else None}
+    if msg_type == "GPS_RAW_INT":
+        return {"gps_fix": msg.fix_type,
+                "satellites": msg.satellites_visible if msg.satellites_visible != 255 else None}
+    return None
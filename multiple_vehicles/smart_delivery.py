@@ -1,53 +1,71 @@
 # encoding: utf-8
 import math
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from dronekit import connect, LocationGlobalRelative
 
 vehicles = None
 wait_ready = False
+# Upper bound between tower checks. Arrivals wake the tower immediately.
 tower_loop_interval = 5
+# Per-vehicle limits for the bring-up phase (seconds)
+connect_timeout = 60
+identify_timeout = 30
+armable_timeout = 120
+
+# Name and address of each vehicle. The order decides which rover is 100 and 101.
+fleet = [
+    ('Plane', '127.0.0.1:14551'),
+    ('Copter', '127.0.0.1:14561'),
+    ('Boat', '127.0.0.1:14571'),
+    ('Rover1', '127.0.0.1:14581'),
+    ('Rover2', '127.0.0.1:14591'),
+]
 
 def heartbeat_handler(self, name, val):
     self.my_type = val.type
     log('My type is {}'.format(self.my_type))
     self.remove_message_listener('HEARTBEAT', heartbeat_handler)
+    self.identified.set()
+
+# Connect, identify and wait armable for one vehicle. Returns (vehicle, error).
+def prepare_vehicle(name, address):
+    started = time.time()
+    vehicle = None
+    try:
+        vehicle = connect(address, wait_ready=wait_ready, timeout=connect_timeout)
+        log('{} connected ({:.1f}s)'.format(name, time.time() - started))
+        vehicle.identified = threading.Event()
+        vehicle.add_message_listener('HEARTBEAT', heartbeat_handler)
+        if not vehicle.identified.wait(identify_timeout):
+            raise RuntimeError('no heartbeat within {}s'.format(identify_timeout))
+        vehicle.wait_for_armable(timeout=armable_timeout)
+        log('{} is armable ({:.1f}s)'.format(name, time.time() - started))
+        return vehicle, None
+    except Exception as e:
+        return vehicle, '{}: {}'.format(type(e).__name__, e)
 
+# Bring up all vehicles in parallel. Start-up time is that of the slowest vehicle.
 def prepare_vehicles():
-    plane = connect('127.0.0.1:14551', wait_ready=wait_ready, timeout=60)
-    log('Plane connected')
-    copter = connect('127.0.0.1:14561', wait_ready=wait_ready, timeout=60)
-    log('Copter connected')
-    boat = connect('127.0.0.1:14571', wait_ready=wait_ready, timeout=60)
-    log('Boat connected')
-    rover1 = connect('127.0.0.1:14581', wait_ready=wait_ready, timeout=60)
-    log('Rover1 connected')
-    rover2 = connect('127.0.0.1:14591', wait_ready=wait_ready, timeout=60)
-    log('Rover2 connected')
-    log('All vehicles were connected.')
-    plane.add_message_listener('HEARTBEAT', heartbeat_handler)
-    copter.add_message_listener('HEARTBEAT', heartbeat_handler)
-    boat.add_message_listener('HEARTBEAT', heartbeat_handler)
-    rover1.add_message_listener('HEARTBEAT', heartbeat_handler)
-    rover2.add_message_listener('HEARTBEAT', heartbeat_handler)
-    log('Wait all vehicles are armable.')
-    plane.wait_for_armable()
-    copter.wait_for_armable()
-    boat.wait_for_armable()
-    rover1.wait_for_armable()
-    rover2.wait_for_armable()
-    all_vehicles = [plane, copter, boat, rover1, rover2]
-
-    while True:
-        is_ok = True
-        for v in all_vehicles:
-            if not hasattr(v, 'my_type'):
-                log('Wait heartbeat')
-                is_ok = False
-                time.sleep(1)
-                break
-        if is_ok:
-            break
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=len(fleet)) as executor:
+        results = list(executor.map(lambda v: prepare_vehicle(*v), fleet))
+
+    log('Readiness report ({:.1f}s)'.format(time.time() - started))
+    for (name, address), (vehicle, error) in zip(fleet, results):
+        log('  {:<8} {:<16} {}'.format(name, address, error or 'READY'))
+
+    if any(error for _, error in results):
+        for vehicle, _ in results:
+            if vehicle is not None:
+                vehicle.close()
+        raise RuntimeError('Some vehicles are not ready.')
+
+    log('All vehicles are ready.')
+    all_vehicles = [vehicle for vehicle, _ in results]
 
     # Vehicle type are duplicated because we have two rovers. So need override.
     all_vehicles[3].my_type = 100
@@ -94,9 +112,29 @@ class ControlTower:
 
     def __init__(self, vehicles):
         self.targets = vehicles
+        self.arrivals = queue.Queue()
+        self._arrived = {}
         for v in self.targets:
             my_route = self.routes[v.my_type]
             my_route['instance'] = v
+        # Watch every place the tower checks: each destination and each waited-for handover point.
+        for my_route in self.routes.values():
+            self._watch(my_route['instance'], my_route['to'])
+            if my_route['wait']:
+                self._watch(self.routes[my_route['wait']]['instance'], my_route['from'])
+
+    # Notify the tower as soon as the vehicle comes within range of dest.
+    def _watch(self, vehicle, dest):
+        key = (vehicle.my_type, tuple(dest))
+        self._arrived[key] = False
+
+        def listener(_vehicle, name, location):
+            arrived = self._distance(vehicle, dest) <= self._arrival_radius(vehicle)
+            if arrived and not self._arrived[key]:
+                self.arrivals.put(key)
+            self._arrived[key] = arrived
+
+        vehicle.add_attribute_listener('location.global_frame', listener)
     
     # Launch a vehicle
     def _launch_vehicle(self, vehicle):
@@ -118,18 +156,25 @@ class ControlTower:
         target = LocationGlobalRelative(dest[0], dest[1], dest[2])
         vehicle.simple_goto(target)
     
-    # Check the vehicle has arrived.
-    def _is_arrived(self, vehicle, dest):
+    # Horizontal distance to dest in meters.
+    def _distance(self, vehicle, dest):
         target = LocationGlobalRelative(dest[0], dest[1], dest[2])
         dlat = vehicle.location.global_frame.lat - target.lat
         dlong = vehicle.location.global_frame.lon - target.lon
-        dist = math.sqrt((dlat*dlat) + (dlong*dlong)) * 1.113195e5
-        log('Arrived check for {} dist {}'.format(vehicle.my_type, dist))
+        return math.sqrt((dlat*dlat) + (dlong*dlong)) * 1.113195e5
+
+    def _arrival_radius(self, vehicle):
         # Plane
         if vehicle.my_type == 1:
-            return dist <= 150
+            return 150
         else:
-            return dist <= 10
+            return 10
+
+    # Check the vehicle has arrived.
+    def _is_arrived(self, vehicle, dest):
+        dist = self._distance(vehicle, dest)
+        log('Arrived check for {} dist {}'.format(vehicle.my_type, dist))
+        return dist <= self._arrival_radius(vehicle)
     
     # Is all vehicles arrived??
     def _complete(self, vehicles):
@@ -167,7 +212,15 @@ class ControlTower:
                         log('Wait for {}'.format(self.routes[my_route['wait']]['instance'].my_type))
             if self._complete(vehicles=vehicles):
                 break
-            time.sleep(tower_loop_interval)
+            self._wait_arrival()
+
+    # Sleep until some vehicle arrives somewhere the tower cares about.
+    def _wait_arrival(self):
+        try:
+            vehicle_type, dest = self.arrivals.get(timeout=tower_loop_interval)
+            log('{} reached {}'.format(vehicle_type, list(dest)))
+        except queue.Empty:
+            pass
     
     def cleanup(self, vehicles):
         for v in vehicles:
@@ -0,0 +1,143 @@
+"""Benchmark: TelemetryHub throughput and per-client latency vs. number of clients.
+
+Replays a tlog through the hub's single reader thread while 1..50 simulated
+WebSocket clients drain their queues, then prints messages/s and the mean/p99
+publish-to-client latency for each client count. Both should stay flat as the
+number of clients grows.
+
+    python bench_telemetry_hub.py                  # synthetic tlog at 2000 msg/s
+    python bench_telemetry_hub.py --tlog mav.tlog  # replay a recorded flight
+    python bench_telemetry_hub.py --rate 0         # replay as fast as possible
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import struct
+import tempfile
+import time
+
+from pymavlink import mavutil
+
+from telemetry_hub import TelemetryHub
+
+
+def write_synthetic_tlog(path, count):
+    """Write a tlog with 10 Hz GLOBAL_POSITION_INT and 1 Hz HEARTBEAT from sysid 1."""
+    mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    usec = int(time.time() * 1e6)
+    with open(path, "wb") as f:
+        for i in range(count):
+            if i % 10 == 0:
+                msg = mav.heartbeat_encode(
+                    mavutil.mavlink.MAV_TYPE_QUADROTOR, mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                    mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 4, mavutil.mavlink.MAV_STATE_ACTIVE)
+            else:
+                msg = mav.global_position_int_encode(
+                    i * 100, 358792449 + i, 1403394654 - i, 10000, 5000 + i % 1000, 0, 0, 0, 9000)
+            f.write(struct.pack(">Q", usec) + msg.pack(mav))
+            usec += 100000
+
+
+def load_messages(path):
+    """Decode every HEARTBEAT / GLOBAL_POSITION_INT in the tlog up front."""
+    log = mavutil.mavlink_connection(path)
+    messages = []
+    while True:
+        msg = log.recv_match(type=["HEARTBEAT", "GLOBAL_POSITION_INT"])
+        if msg is None:
+            break
+        messages.append(msg)
+    log.close()
+    return messages
+
+
+class ReplayVehicle:
+    """Stands in for a mavfile: recv_match() hands out tlog messages at a fixed rate."""
+
+    def __init__(self, messages, rate):
+        self.messages = messages
+        self.interval = 1.0 / rate if rate else 0.0
+        self.target_system = messages[0].get_srcSystem()
+        self.target_component = messages[0].get_srcComponent()
+        self._index = 0
+        self._started = None
+
+    def recv_match(self, type=None, blocking=False, timeout=None):
+        if self._index >= len(self.messages):
+            time.sleep(timeout or 0)
+            return None
+        if self._started is None:
+            self._started = time.perf_counter()
+        if self.interval:
+            delay = self._started + self._index * self.interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        msg = self.messages[self._index]
+        self._index += 1
+        return msg
+
+
+async def run_once(messages, rate, clients):
+    status = {"connected": True, "armed": False, "mode": "UNKNOWN",
+              "latitude": 0.0, "longitude": 0.0, "altitude": 0.0, "heading": 0}
+    hub = TelemetryHub(status)
+    hub.bind_loop(asyncio.get_running_loop())
+    latencies = []
+
+    async def client(sub):
+        while True:
+            await sub.get()
+            latencies.append(sub.latency)
+
+    subs = [hub.subscribe() for _ in range(clients)]
+    tasks = [asyncio.create_task(client(sub)) for sub in subs]
+
+    total = len(messages)
+    vehicle = ReplayVehicle(messages, rate)
+    started = time.perf_counter()
+    hub.start(vehicle)
+    while hub.messages < total:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.05)  # Let the last snapshots drain
+    hub.stop()
+    for task in tasks:
+        task.cancel()
+
+    dropped = sum(sub.dropped for sub in subs)
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0.0
+    mean = statistics.fmean(latencies) if latencies else 0.0
+    return total / elapsed, mean, p99, dropped / max(1, clients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tlog", default=None, help="tlog to replay (default: synthetic)")
+    parser.add_argument("--messages", type=int, default=20000, help="synthetic tlog size")
+    parser.add_argument("--rate", type=float, default=2000, help="replay rate in msg/s (0 = max speed)")
+    parser.add_argument("--clients", default="1,5,10,25,50", help="comma-separated client counts")
+    args = parser.parse_args()
+
+    tmpdir = None
+    path = args.tlog
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, "bench.tlog")
+        write_synthetic_tlog(path, args.messages)
+    messages = load_messages(path)
+
+    print(f"tlog: {path} ({len(messages)} tracked messages, "
+          f"{'max speed' if not args.rate else '%.0f msg/s' % args.rate})")
+    print(f"{'clients':>8} {'msgs/s':>10} {'mean ms':>9} {'p99 ms':>9} {'dropped/client':>15}")
+    for clients in (int(c) for c in args.clients.split(",")):
+        rate, mean, p99, dropped = asyncio.run(run_once(messages, args.rate, clients))
+        print(f"{clients:>8} {rate:>10.0f} {mean * 1000:>9.3f} {p99 * 1000:>9.3f} {dropped:>15.0f}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 import os
+import sys
 import asyncio
 import json
 import time
-import functools
 import threading
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pymavlink import mavutil
 
+from broadcaster import BroadcastScheduler
+from telemetry_hub import TelemetryHub
+
+# Link quality metrics come from link_stats in the repository's mavlink_tools. It is not
+# part of an image built from this directory alone, so /metrics is optional.
+_MAVLINK_TOOLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "mavlink_tools")
+if os.path.isdir(_MAVLINK_TOOLS):
+    sys.path.append(_MAVLINK_TOOLS)
+try:
+    import link_stats
+except ImportError:
+    link_stats = None
+
 app = FastAPI()
 
 # Mount static files for the frontend
@@ -17,6 +30,7 @@ app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 # Drone connection global variables
 connection_string = os.environ.get("MAV_ENDPOINT", "udpout:host.docker.internal:14550")
 vehicle = None
+vehicle_link = None  # link_stats.LinkStats of the vehicle connection (for /metrics)
 drone_connected = False
 MODE_MAP = {}
 REVERSE_MODE_MAP = {}
@@ -29,6 +43,11 @@ drone_status = {
     "altitude": 0.0,
     "heading": 0,
 }
+# One MAVLink reader per vehicle connection, shared by every WebSocket client
+hub = TelemetryHub(drone_status)
+# Per-client broadcast schedulers, keyed by client id (for /broadcast_stats)
+broadcasters = {}
+_next_client_id = 0
 
 # --- MAVLink Helper Functions (adapted from CLI app) ---
 async def request_data_streams():
@@ -48,7 +67,7 @@ def connect_to_vehicle():
     """Start a background thread that attempts to connect to the vehicle without blocking the main thread."""
     global vehicle, drone_connected, MODE_MAP, REVERSE_MODE_MAP
     def _connect():
-        global vehicle, MODE_MAP, REVERSE_MODE_MAP, drone_connected
+        global vehicle, vehicle_link, MODE_MAP, REVERSE_MODE_MAP, drone_connected
         while True:
             try:
                 print(f"Attempting to connect to vehicle on: {connection_string}")
@@ -76,6 +95,9 @@ def connect_to_vehicle():
                     continue
                 m.target_system = hb.get_srcSystem()
                 m.target_component = hb.get_srcComponent()
+                # Measure the link from here on (after the first HEARTBEAT fixed the MAVLink version)
+                if link_stats is not None:
+                    vehicle_link = link_stats.instrument(m, connection_string)
                 MODE_MAP = mavutil.mode_mapping_byname(hb.type) or {}
                 REVERSE_MODE_MAP = {v: k for k, v in MODE_MAP.items()}
                 m.mav.request_data_stream_send(m.target_system, m.target_component,
@@ -83,6 +105,7 @@ def connect_to_vehicle():
                 vehicle = m
                 drone_connected = True
                 drone_status["connected"] = True
+                hub.start(vehicle, REVERSE_MODE_MAP)
                 print("Connected to vehicle (system %u component %u)" % (vehicle.target_system, vehicle.target_component))
                 # Schedule request_data_streams in the asyncio loop if available
                 try:
@@ -195,71 +218,34 @@ async def goto_location(latitude, longitude, altitude):
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     print("WebSocket connected.")
+    global _next_client_id
+    _next_client_id += 1
+    client_id = _next_client_id
+    subscription = hub.subscribe()
+    scheduler = BroadcastScheduler(websocket.send_text)
+    broadcasters[client_id] = scheduler
+    tasks = []
     try:
-        # Send initial drone status
-        await websocket.send_json(drone_status)
+        # Send initial drone status (as the first, full delta)
+        scheduler.update(hub.snapshot())
+        await scheduler.flush()
 
-        # Task to continuously read MAVLink messages and send status
-        async def mavlink_reader():
-            global drone_status
-            loop = asyncio.get_event_loop()
+        # Task to merge snapshots from the shared telemetry hub into this client's pending delta
+        async def status_feeder():
             while True:
-                try:
-                    if vehicle and drone_connected:
-                        # Use run_in_executor to avoid blocking the event loop.
-                        # Add a timeout to recv_match to prevent it from blocking indefinitely,
-                        # which can cause websocket keepalive pings to fail.
-                        msg = await loop.run_in_executor(
-                            None, functools.partial(vehicle.recv_match, blocking=True, timeout=0.1)
-                        )
-                        if msg:
-                            # Only process messages from the connected vehicle to avoid GCS HEARTBEAT noise
-                            try:
-                                src_sys = msg.get_srcSystem()
-                                src_comp = msg.get_srcComponent()
-                            except Exception:
-                                src_sys = None
-                                src_comp = None
-                            if vehicle and src_sys == getattr(vehicle, "target_system", None) and src_comp == getattr(vehicle, "target_component", None):
-                                # Update drone_status based on MAVLink messages
-                                if msg.get_type() == 'GLOBAL_POSITION_INT':
-                                    drone_status["latitude"] = msg.lat / 1e7
-                                    drone_status["longitude"] = msg.lon / 1e7
-                                    drone_status["altitude"] = msg.relative_alt / 1000.0 # mm to meters (home-relative, matches GCS)
-                                    drone_status["heading"] = msg.hdg / 100.0 # centidegrees to degrees
-                                elif msg.get_type() == 'HEARTBEAT':
-                                    # ARM status via base_mode SAFETY_ARMED flag
-                                    try:
-                                        armed = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
-                                    except Exception:
-                                        armed = drone_status.get("armed", False)
-                                    drone_status["armed"] = armed
-
-                                    # Map mode id -> name using REVERSE_MODE_MAP populated at connect
-                                    mode_name = REVERSE_MODE_MAP.get(msg.custom_mode, "UNKNOWN")
-                                    drone_status["mode"] = mode_name
-
-                                # Send updated status to frontend ONLY when there's a new message
-                                await websocket.send_json(drone_status)
-                            else:
-                                # Message from another source (e.g., GCS), ignore briefly
-                                await asyncio.sleep(0.001)
-                        else:
-                            # No message received within the timeout, yield control briefly
-                            await asyncio.sleep(0.01)
-                    else:
-                        # If not connected, wait a bit before checking again
-                        await asyncio.sleep(1)
-                except WebSocketDisconnect:
-                    print("MAVLink reader: WebSocket disconnected, stopping task.")
-                    break  # Exit the loop if the socket is closed
-                except Exception as e:
-                    print(f"An error occurred in mavlink_reader: {e}")
-                    # If any other error occurs, log it and break the loop to be safe
-                    break
-
-
-        reader_task = asyncio.create_task(mavlink_reader())
+                scheduler.update(await subscription.get())
+
+        # Task to send the coalesced deltas at the broadcast rate
+        async def status_sender():
+            try:
+                await scheduler.run()
+            except WebSocketDisconnect:
+                print("Status sender: WebSocket disconnected, stopping task.")
+            except Exception as e:
+                print(f"An error occurred in status_sender: {e}")
+
+        tasks.append(asyncio.create_task(status_feeder()))
+        tasks.append(asyncio.create_task(status_sender()))
 
         while True:
             data = await websocket.receive_text()
@@ -297,8 +283,11 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        if 'reader_task' in locals() and not reader_task.done():
-            reader_task.cancel()
+        subscription.close()
+        broadcasters.pop(client_id, None)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
 
 # --- HTTP Endpoint for Frontend ---
 @app.get("/")
@@ -307,6 +296,24 @@ async def get_frontend():
     with open("../frontend/index.html", "r", encoding="utf-8") as f:
         return HTMLResponse(content=f.read())
 
+# Per-client telemetry bandwidth
+@app.get("/broadcast_stats")
+async def broadcast_stats():
+    clients = {str(client_id): scheduler.stats() for client_id, scheduler in broadcasters.items()}
+    return {
+        "clients": clients,
+        "total_bytes_per_sec": round(sum(c["bytes_per_sec"] for c in clients.values()), 3),
+        "total_messages_per_sec": round(sum(c["messages_per_sec"] for c in clients.values()), 3),
+    }
+
+# Link quality of the vehicle connection (Prometheus text format)
+@app.get("/metrics")
+async def metrics():
+    if link_stats is None:
+        return PlainTextResponse("link_stats (mavlink_tools) is not available\n", status_code=503)
+    links = [vehicle_link] if vehicle_link is not None else []
+    return Response(content=link_stats.prometheus_text(links), media_type=link_stats.PROMETHEUS_CONTENT_TYPE)
+
 # Register service for BlueOS
 @app.get("/register_service")
 async def register_service():
@@ -324,6 +331,8 @@ async def register_service():
 # --- Startup Event ---
 @app.on_event("startup")
 async def startup_event():
+    # Snapshots from the reader thread are handed to this loop for fan-out
+    hub.bind_loop(asyncio.get_running_loop())
     # Attempt to connect to the drone on startup
     # For a real application, this might be triggered by a user action
     # connect_to_vehicle() # Don't auto-connect, let frontend trigger it
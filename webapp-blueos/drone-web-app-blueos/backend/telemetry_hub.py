@@ -0,0 +1,177 @@
+"""Single-reader MAVLink telemetry hub shared by every WebSocket client.
+
+One background thread per vehicle connection reads and decodes each MAVLink
+message exactly once, updates a shared status dict, and fans the resulting
+snapshot out to any number of subscribers. Every subscriber owns a bounded
+asyncio.Queue; when a slow client falls behind, its oldest snapshot is dropped
+so the reader never blocks and the other clients are unaffected. If the event
+loop itself is busy, snapshots are coalesced at the thread hop so only the
+newest one is fanned out.
+"""
+import asyncio
+import threading
+import time
+
+from pymavlink import mavutil
+
+# Message types that change drone_status. Anything else is decoded and skipped.
+TRACKED_TYPES = ["GLOBAL_POSITION_INT", "HEARTBEAT"]
+
+# Snapshots kept per client before the oldest one is dropped.
+DEFAULT_QUEUE_SIZE = 8
+
+
+class Subscription:
+    """A client's view of the hub: a bounded queue of status snapshots."""
+
+    def __init__(self, hub, maxsize):
+        self.hub = hub
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.seq = 0          # Sequence number of the last snapshot received
+        self.latency = 0.0    # Seconds between publish and get() of that snapshot
+        self.dropped = 0      # Snapshots discarded because the client was slow
+
+    def put(self, item):
+        """Enqueue a snapshot, dropping the oldest one if the queue is full (loop thread only)."""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        """Wait for the next status snapshot."""
+        seq, published_at, snapshot = await self.queue.get()
+        self.seq = seq
+        self.latency = time.perf_counter() - published_at
+        return snapshot
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class TelemetryHub:
+    """Owns the single MAVLink reader and the list of WebSocket subscribers."""
+
+    def __init__(self, status, queue_size=DEFAULT_QUEUE_SIZE):
+        self.status = status              # Shared drone_status dict (updated in place)
+        self.queue_size = queue_size
+        self.mode_names = {}              # custom_mode -> mode name
+        self.messages = 0                 # Messages decoded from the vehicle
+        self.published = 0               # Snapshots produced by the reader
+        self.coalesced = 0               # Snapshots replaced before the loop fanned them out
+        self._subscribers = set()
+        self._loop = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = None              # Newest snapshot waiting for the loop
+
+    # --- Lifecycle ---
+    def bind_loop(self, loop):
+        """Remember the event loop that subscribers live on (call from the startup event)."""
+        self._loop = loop
+
+    def start(self, vehicle, mode_names=None):
+        """Start reading from vehicle. Any previous reader is stopped first."""
+        self.stop()
+        if mode_names is not None:
+            self.mode_names = mode_names
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._reader, args=(vehicle,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- Subscribers ---
+    def subscribe(self):
+        """Register a new client. Must be called from the event loop."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        sub = Subscription(self, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    # --- Reader thread ---
+    def _reader(self, vehicle):
+        while not self._stop.is_set():
+            try:
+                msg = vehicle.recv_match(type=TRACKED_TYPES, blocking=True, timeout=0.5)
+            except Exception as e:
+                print(f"Telemetry reader error: {e}")
+                time.sleep(0.5)
+                continue
+            if msg is None:
+                continue
+            # Only process messages from the connected vehicle to avoid GCS HEARTBEAT noise
+            if (msg.get_srcSystem() != getattr(vehicle, "target_system", None)
+                    or msg.get_srcComponent() != getattr(vehicle, "target_component", None)):
+                continue
+            self.messages += 1
+            self.handle_message(msg)
+
+    def handle_message(self, msg):
+        """Apply one decoded message to the shared status and publish a snapshot."""
+        msg_type = msg.get_type()
+        with self._lock:
+            if msg_type == "GLOBAL_POSITION_INT":
+                self.status["latitude"] = msg.lat / 1e7
+                self.status["longitude"] = msg.lon / 1e7
+                self.status["altitude"] = msg.relative_alt / 1000.0  # mm to meters (home-relative, matches GCS)
+                self.status["heading"] = msg.hdg / 100.0  # centidegrees to degrees
+            elif msg_type == "HEARTBEAT":
+                # ARM status via base_mode SAFETY_ARMED flag
+                self.status["armed"] = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+                self.status["mode"] = self.mode_names.get(msg.custom_mode, "UNKNOWN")
+            else:
+                return
+            snapshot = dict(self.status)
+        self.publish(snapshot)
+
+    def publish(self, snapshot):
+        """Hand a snapshot to the event loop for fan-out. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        with self._lock:
+            self.published += 1
+            item = (self.published, time.perf_counter(), snapshot)
+            scheduled = self._pending is not None
+            if scheduled:
+                self.coalesced += 1
+            self._pending = item
+        if scheduled:
+            return  # The pending fan-out will pick up this newer snapshot
+        try:
+            loop.call_soon_threadsafe(self._fan_out)
+        except RuntimeError:
+            pass  # Loop is shutting down
+
+    def _fan_out(self):
+        with self._lock:
+            item, self._pending = self._pending, None
+        if item is None:
+            return
+        for sub in list(self._subscribers):
+            sub.put(item)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.status)
@@ -0,0 +1,46 @@
+import socket
+import time
+
+from fastapi.testclient import TestClient
+from pymavlink import mavutil
+
+import main
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_metrics_reports_the_vehicle_link(monkeypatch):
+    client = TestClient(main.app)
+    response = client.get("/metrics")                     # Not connected yet: no samples
+    assert response.status_code == 200
+    assert response.headers["content-type"] == main.link_stats.PROMETHEUS_CONTENT_TYPE
+
+    device = "udpin:127.0.0.1:%d" % free_udp_port()
+    monkeypatch.setattr(main, "connection_string", device)
+    autopilot = mavutil.mavlink_connection(device.replace("udpin", "udpout"), source_system=1)
+    try:
+        main.connect_to_vehicle()
+        deadline = time.monotonic() + 5
+        while main.vehicle_link is None and time.monotonic() < deadline:
+            autopilot.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                         mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0)
+            time.sleep(0.05)
+        assert main.vehicle_link is not None
+        for _ in range(3):
+            autopilot.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                         mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0)
+        time.sleep(0.3)                                    # Let the hub's reader take them
+
+        text = client.get("/metrics").text
+        assert "# TYPE mavlink_rx_messages_total counter" in text
+        assert 'mavlink_rx_messages_total{link="%s",type="HEARTBEAT"}' % device in text
+        assert 'mavlink_tx_messages_total{link="%s",type="REQUEST_DATA_STREAM"}' % device in text
+    finally:
+        main.hub.stop()
+        if main.vehicle is not None:
+            main.vehicle.close()
+        autopilot.close()
@@ -0,0 +1,94 @@
+"""Rate-limited, coalesced drone_status broadcasting for one WebSocket client.
+
+Status updates are merged into a per-field delta (only fields whose value
+differs from what the client last received) and sent at a fixed rate. A
+change to an immediate field such as `armed` or `mode` flushes right away so
+the UI never lags on safety-relevant state. Each scheduler counts the
+messages and bytes it sends so per-client bandwidth can be reported.
+"""
+import asyncio
+import json
+import os
+import time
+
+# Default send rate for telemetry deltas [Hz]; override with BROADCAST_HZ
+DEFAULT_RATE_HZ = float(os.environ.get("BROADCAST_HZ", "5"))
+
+# Fields that are sent immediately when they change instead of waiting for the next tick
+IMMEDIATE_FIELDS = ("armed", "mode", "connected")
+
+_MISSING = object()
+
+
+class BroadcastScheduler:
+    """Coalesces status updates into deltas and sends them at rate_hz."""
+
+    def __init__(self, send_text, rate_hz=DEFAULT_RATE_HZ, immediate_fields=IMMEDIATE_FIELDS):
+        self.send_text = send_text        # async callable, e.g. websocket.send_text
+        self.interval = 1.0 / rate_hz
+        self.immediate_fields = set(immediate_fields)
+        self.updates = 0                  # update() calls (one per MAVLink-driven change)
+        self.messages = 0                 # Delta messages actually sent
+        self.bytes = 0                    # Payload bytes actually sent
+        self.started = time.monotonic()
+        self._sent = {}                   # Field values the client currently has
+        self._pending = {}                # Fields changed since the last send
+        self._wake = asyncio.Event()
+
+    def update(self, status):
+        """Merge a full status dict into the pending delta."""
+        self.updates += 1
+        urgent = False
+        for key, value in status.items():
+            if self._sent.get(key, _MISSING) == value:
+                self._pending.pop(key, None)  # Changed back to what the client already has
+                continue
+            self._pending[key] = value
+            if key in self.immediate_fields:
+                urgent = True
+        if urgent:
+            self._wake.set()
+
+    async def flush(self):
+        """Send the pending delta now, if there is one."""
+        if not self._pending:
+            return
+        delta, self._pending = self._pending, {}
+        text = json.dumps(delta, separators=(",", ":"))
+        await self.send_text(text)
+        self._sent.update(delta)
+        self.messages += 1
+        self.bytes += len(text.encode("utf-8"))
+
+    async def run(self):
+        """Send deltas every interval, or immediately when an immediate field changes."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.interval
+        while True:
+            timeout = next_tick - loop.time()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            now = loop.time()
+            if now >= next_tick:
+                # Keep a fixed cadence, but don't try to catch up after a stall
+                next_tick += self.interval
+                if next_tick <= now:
+                    next_tick = now + self.interval
+            await self.flush()
+
+    def stats(self):
+        """Per-client counters and average rates since the client connected."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "rate_hz": round(1.0 / self.interval, 3),
+            "updates": self.updates,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "elapsed_sec": round(elapsed, 3),
+            "messages_per_sec": round(self.messages / elapsed, 3),
+            "bytes_per_sec": round(self.bytes / elapsed, 3),
+        }
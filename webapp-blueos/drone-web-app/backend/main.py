@@ -1,12 +1,26 @@
+import os
+import sys
 import asyncio
 import json
 import time
 import functools
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pymavlink import mavutil
 
+from broadcaster import BroadcastScheduler
+
+# Link quality metrics come from link_stats in the repository's mavlink_tools. It is not
+# part of a copy of this directory alone, so /metrics is optional.
+_MAVLINK_TOOLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "mavlink_tools")
+if os.path.isdir(_MAVLINK_TOOLS):
+    sys.path.append(_MAVLINK_TOOLS)
+try:
+    import link_stats
+except ImportError:
+    link_stats = None
+
 app = FastAPI()
 
 # Mount static files for the frontend
@@ -15,6 +29,7 @@ app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 # Drone connection global variables
 connection_string = 'tcp:127.0.0.1:5762'
 vehicle = None
+vehicle_link = None  # link_stats.LinkStats of the vehicle connection (for /metrics)
 drone_connected = False
 drone_status = {
     "connected": False,
@@ -25,6 +40,9 @@ drone_status = {
     "altitude": 0.0,
     "heading": 0,
 }
+# Per-client broadcast schedulers, keyed by client id (for /broadcast_stats)
+broadcasters = {}
+_next_client_id = 0
 
 # --- MAVLink Helper Functions (adapted from CLI app) ---
 async def request_data_streams():
@@ -41,12 +59,15 @@ async def request_data_streams():
         1)   # Start sending
 
 def connect_to_vehicle():
-    global vehicle, drone_connected
+    global vehicle, vehicle_link, drone_connected
     print(f"Attempting to connect to vehicle on: {connection_string}")
     try:
         vehicle = mavutil.mavlink_connection(connection_string, wait_heartbeat=True)
         vehicle.wait_heartbeat()
         print("Heartbeat from system (system %u component %u)" % (vehicle.target_system, vehicle.target_component))
+        # Measure the link from here on (after the first HEARTBEAT fixed the MAVLink version)
+        if link_stats is not None:
+            vehicle_link = link_stats.instrument(vehicle, connection_string)
         drone_connected = True
         drone_status["connected"] = True
         # Request data streams after successful connection
@@ -156,9 +177,15 @@ async def goto_location(latitude, longitude, altitude):
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     print("WebSocket connected.")
+    global _next_client_id
+    _next_client_id += 1
+    client_id = _next_client_id
+    scheduler = BroadcastScheduler(websocket.send_text)
+    broadcasters[client_id] = scheduler
     try:
-        # Send initial drone status
-        await websocket.send_json(drone_status)
+        # Send initial drone status (as the first, full delta)
+        scheduler.update(drone_status)
+        await scheduler.flush()
 
         # Task to continuously read MAVLink messages and send status
         async def mavlink_reader():
@@ -193,8 +220,8 @@ async def websocket_endpoint(websocket: WebSocket):
                                         break
                                 drone_status["mode"] = mode_name
 
-                            # Send updated status to frontend ONLY when there's a new message
-                            await websocket.send_json(drone_status)
+                            # Queue the change; the scheduler sends coalesced deltas at its own rate
+                            scheduler.update(drone_status)
                         else:
                             # No message received within the timeout, yield control briefly
                             await asyncio.sleep(0.01)
@@ -210,7 +237,17 @@ async def websocket_endpoint(websocket: WebSocket):
                     break
 
 
+        # Task to send the coalesced deltas at the broadcast rate
+        async def status_sender():
+            try:
+                await scheduler.run()
+            except WebSocketDisconnect:
+                print("Status sender: WebSocket disconnected, stopping task.")
+            except Exception as e:
+                print(f"An error occurred in status_sender: {e}")
+
         reader_task = asyncio.create_task(mavlink_reader())
+        sender_task = asyncio.create_task(status_sender())
 
         while True:
             data = await websocket.receive_text()
@@ -248,8 +285,29 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
+        broadcasters.pop(client_id, None)
         if 'reader_task' in locals() and not reader_task.done():
             reader_task.cancel()
+        if 'sender_task' in locals() and not sender_task.done():
+            sender_task.cancel()
+
+# Per-client telemetry bandwidth
+@app.get("/broadcast_stats")
+async def broadcast_stats():
+    clients = {str(client_id): scheduler.stats() for client_id, scheduler in broadcasters.items()}
+    return {
+        "clients": clients,
+        "total_bytes_per_sec": round(sum(c["bytes_per_sec"] for c in clients.values()), 3),
+        "total_messages_per_sec": round(sum(c["messages_per_sec"] for c in clients.values()), 3),
+    }
+
+# Link quality of the vehicle connection (Prometheus text format)
+@app.get("/metrics")
+async def metrics():
+    if link_stats is None:
+        return PlainTextResponse("link_stats (mavlink_tools) is not available\n", status_code=503)
+    links = [vehicle_link] if vehicle_link is not None else []
+    return Response(content=link_stats.prometheus_text(links), media_type=link_stats.PROMETHEUS_CONTENT_TYPE)
 
 # --- HTTP Endpoint for Frontend ---
 @app.get("/")
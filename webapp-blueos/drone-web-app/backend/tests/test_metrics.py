@@ -0,0 +1,51 @@
+import asyncio
+import socket
+import threading
+
+from fastapi.testclient import TestClient
+from pymavlink import mavutil
+
+import main
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_metrics_reports_the_vehicle_link(monkeypatch):
+    client = TestClient(main.app)
+    response = client.get("/metrics")                     # Not connected yet: no samples
+    assert response.status_code == 200
+    assert response.headers["content-type"] == main.link_stats.PROMETHEUS_CONTENT_TYPE
+
+    device = "udpin:127.0.0.1:%d" % free_udp_port()
+    monkeypatch.setattr(main, "connection_string", device)
+    autopilot = mavutil.mavlink_connection(device.replace("udpin", "udpout"), source_system=1)
+    stop = threading.Event()
+
+    def send_heartbeats():
+        while not stop.wait(0.05):
+            autopilot.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                         mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, 0)
+
+    async def connect():
+        return main.connect_to_vehicle()                   # Blocks until the first HEARTBEAT
+
+    sender = threading.Thread(target=send_heartbeats)
+    sender.start()
+    try:
+        assert asyncio.run(connect())
+        assert main.vehicle_link is not None
+        assert main.vehicle.recv_match(type="HEARTBEAT", blocking=True, timeout=2) is not None
+
+        text = client.get("/metrics").text
+        assert "# TYPE mavlink_rx_messages_total counter" in text
+        assert 'mavlink_rx_messages_total{link="%s",type="HEARTBEAT"}' % device in text
+    finally:
+        stop.set()
+        sender.join()
+        if main.vehicle is not None:
+            main.vehicle.close()
+        autopilot.close()
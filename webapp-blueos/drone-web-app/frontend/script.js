@@ -23,6 +23,8 @@ let map;
 let droneMarker;
 let flightPath = [];
 let flightPathPolyline;
+// Latest drone state; the backend only sends the fields that changed
+let droneState = {};
 
 // Initialize Leaflet Map
 function initMap() {
@@ -42,24 +44,31 @@ function connectWebSocket() {
         connectionStatus.textContent = '接続済み';
         console.log('WebSocket connected');
         clearFlightPath(); // Clear previous flight path on new connection
+        droneState = {}; // The first message after connecting is the full state
         // Send a connect command to the backend to initiate drone connection
         ws.send(JSON.stringify({ type: 'connect' }));
     };
 
     ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
+        let data = JSON.parse(event.data);
         // console.log('Received:', data);
 
         if (data.type === 'status') {
             // This is a general status message from backend
             console.log('Backend Status:', data.message);
         } else {
-            // This is drone telemetry data
+            // This is a drone telemetry delta: merge it into the full state
+            Object.assign(droneState, data);
+            const changedPosition = ('latitude' in data) || ('longitude' in data) || ('altitude' in data);
+            data = droneState;
             armedStatus.textContent = data.armed ? 'アーム済み' : '未アーム';
             modeStatus.textContent = data.mode;
             latitudeStatus.textContent = data.latitude.toFixed(6);
             longitudeStatus.textContent = data.longitude.toFixed(6);
             altitudeStatus.textContent = data.altitude.toFixed(2);
+            if (!changedPosition) {
+                return;
+            }
 
             // Update drone marker on map
             const newLatLng = new L.LatLng(data.latitude, data.longitude);
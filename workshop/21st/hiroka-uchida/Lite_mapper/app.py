@@ -1,11 +1,15 @@
+import json
+import time
 import logging
 import atexit
 from datetime import datetime
 
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 
+from config import Config
 from drone_connection import DroneConnection
 from telemetry import TelemetryData, TelemetryWorker
+from telemetry_store import TelemetryStore, FIELDS
 
 
 logging.basicConfig(level=logging.INFO)
@@ -16,10 +20,17 @@ drone_connection = DroneConnection()
 
 telemetry_data = TelemetryData()
 
+# 位置を受信するたびの時系列（地図の軌跡・履歴用）
+telemetry_store = TelemetryStore(
+    capacity=Config.TELEMETRY_HISTORY_CAPACITY,
+    spill_dir=Config.TELEMETRY_SPILL_DIR,
+)
+
 telemetry_worker = TelemetryWorker(
     drone_connection,
     telemetry_data,
     interval=1.0,
+    telemetry_store=telemetry_store,
 )
 
 saved_points = []
@@ -81,14 +92,122 @@ def disconnect():
 
 @app.route("/telemetry")
 def telemetry():
+    """
+    最新のテレメトリを返す。
+    after=N を付けると version N より新しい更新まで待ってから返す（最大 timeout 秒）。
+    N が今の version より大きい（サーバーが再起動した）ときは待たずに全項目を返す
+    """
+
+    after = request.args.get("after")
+
+    if after is None:
+
+        return jsonify(
+            telemetry_data.get()
+        )
+
+    try:
+
+        version = int(after)
+
+        timeout = min(
+            float(request.args.get("timeout", 10)),
+            Config.TELEMETRY_LONG_POLL_MAX,
+        )
+
+    except ValueError as e:
 
-    data = telemetry_data.get()
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
 
-    print(data)
+    data = telemetry_data.wait_for_update(
+        version,
+        timeout,
+    )
 
     return jsonify(data)
 
 
+def resume_version(event_id):
+    """
+    SSE の Last-Event-ID（"epoch-version"）から再開する version を求める。
+    別のプロセスの ID や不正な ID なら -1（全項目を送る）
+    """
+
+    epoch, _, version = (event_id or "").partition("-")
+
+    if epoch != telemetry_data.epoch or not version.isdigit():
+        return -1
+
+    return int(version)
+
+
+@app.route("/stream")
+def stream():
+    """
+    テレメトリの差分を Server-Sent Events で送り続ける。
+
+    - 最初（または再開できないとき）は全項目、以降は変わった項目だけを送る
+    - イベント ID は "epoch-version"。再接続時にブラウザが Last-Event-ID として
+      送ってくるので、その続きの差分から再開する
+    - 更新が無い間は一定間隔でコメント行（keep-alive）を送る
+    """
+
+    version = resume_version(
+        request.headers.get("Last-Event-ID")
+        or request.args.get("last_event_id")
+    )
+
+    def generate(version):
+
+        yield f"retry: {Config.STREAM_RETRY_MS}\n\n"
+
+        while True:
+
+            started = time.monotonic()
+
+            latest, changes = telemetry_data.wait_for_changes(
+                version,
+                Config.STREAM_HEARTBEAT_INTERVAL,
+            )
+
+            if not changes:
+
+                yield ": keep-alive\n\n"
+
+                continue
+
+            event = "snapshot" if version < 0 else "delta"
+
+            version = latest
+
+            yield (
+                f"id: {telemetry_data.epoch}-{version}\n"
+                f"event: {event}\n"
+                f"data: {json.dumps(changes)}\n\n"
+            )
+
+            # 更新が続いても STREAM_MIN_INTERVAL ごとにまとめて送る
+            time.sleep(
+                max(
+                    0.0,
+                    Config.STREAM_MIN_INTERVAL
+                    - (time.monotonic() - started),
+                )
+            )
+
+    return Response(
+        generate(version),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @app.route("/arm", methods=["POST"])
 def arm():
 
@@ -402,6 +521,76 @@ def saved_points_api():
 
     return jsonify(saved_points)
 
+def query_float(name):
+
+    value = request.args.get(name)
+
+    return float(value) if value else None
+
+def history_fields(fields):
+
+    names = [
+        name for name in fields.split(",")
+        if name and name != "time"
+    ]
+
+    return ("time", *names)
+
+@app.route("/history")
+def history():
+    """
+    時刻範囲（start 以上 end 未満, UNIX 時刻）のテレメトリを返す。
+    fields で項目を絞れる（カンマ区切り）
+    """
+
+    fields = request.args.get("fields")
+
+    try:
+
+        records = telemetry_store.records(
+            query_float("start"),
+            query_float("end"),
+            history_fields(fields) if fields else FIELDS,
+        )
+
+    except (KeyError, ValueError) as e:
+
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify(records)
+
+@app.route("/trail")
+def trail():
+    """
+    地図の軌跡。最大 points 点に間引いた [[緯度, 経度], ...] を返す
+    """
+
+    try:
+
+        columns = telemetry_store.trail(
+            int(request.args.get("points", 500)),
+            query_float("start"),
+            query_float("end"),
+        )
+
+    except ValueError as e:
+
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify({
+        "time": columns["time"].tolist(),
+        "points": list(zip(
+            columns["latitude"].tolist(),
+            columns["longitude"].tolist(),
+        )),
+    })
+
 def emergency_rtl():
 
     if drone_connection.is_connected():
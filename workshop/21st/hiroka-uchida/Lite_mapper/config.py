@@ -53,6 +53,22 @@ class Config:
 
     TELEMETRY_UPDATE_INTERVAL = 1.0
 
+    # /telemetry?after=N で更新を待つ最大時間[秒]
+    TELEMETRY_LONG_POLL_MAX = 30
+
+    # /stream（Server-Sent Events）
+    STREAM_HEARTBEAT_INTERVAL = 15     # 更新が無いときの keep-alive 間隔[秒]
+    STREAM_MIN_INTERVAL = 0.05         # 差分を送る最短間隔[秒]
+    STREAM_RETRY_MS = 1000             # 切断後にブラウザが再接続するまで[ms]
+
+    # 時系列の保持数（10Hz で 4 時間分）
+    TELEMETRY_HISTORY_CAPACITY = 144000
+
+    # 保持数を超えた古いサンプルの書き出し先（未設定なら捨てる）
+    TELEMETRY_SPILL_DIR = os.environ.get(
+        "TELEMETRY_SPILL_DIR"
+    )
+
     # ==========================
     # フライト設定
     # ==========================
@@ -12,12 +12,29 @@ const API = {
     rtl: "/rtl",
 
     savePoint: "/save_point",
-    savedPoints: "/saved_points"
+    savedPoints: "/saved_points",
+    trail: "/trail",
+    stream: "/stream"
 };
 
+// 軌跡の点数と更新間隔[ms]
+const TRAIL_POINTS = 500;
+const TRAIL_INTERVAL = 5000;
+
+// テレメトリのロングポーリング（待ち時間[s]、最短間隔[ms]、エラー後の待ち[ms]）
+const LONG_POLL_TIMEOUT = 10;
+const STATUS_MIN_INTERVAL = 50;
+const STATUS_RETRY_INTERVAL = 1000;
+
 let map = null;
 let droneMarker = null;
-let statusPollTimer = null;
+let trailLine = null;
+let statusPolling = false;
+let statusStream = null;
+
+// /stream で受け取った最新の状態（差分を重ねていく）
+let telemetryState = {};
+let trailPollTimer = null;
 
 document.addEventListener("DOMContentLoaded", () => {
     initMap();
@@ -46,6 +63,14 @@ function initMap() {
     ).addTo(map);
 
     droneMarker.bindPopup("Drone");
+
+    trailLine = L.polyline(
+        [],
+        {
+            color: "#ff6600",
+            weight: 3,
+        }
+    ).addTo(map);
 }
 
 function bindEvents() {
@@ -334,39 +359,143 @@ async function onGoto() {
 
 function startStatusPolling() {
 
-    if (statusPollTimer) {
+    if (window.EventSource) {
+
+        startStatusStream();
+
+    } else if (!statusPolling) {
+
+        statusPolling = true;
+
+        pollStatus();
+    }
+
+    if (trailPollTimer) {
         clearInterval(
-            statusPollTimer
+            trailPollTimer
         );
     }
 
-    statusPollTimer =
+    trailPollTimer =
         setInterval(
-            pollStatus,
-            1000
+            () => {
+                loadTrail();
+                loadSavedPoints().catch(
+                    () => {}
+                );
+            },
+            TRAIL_INTERVAL
         );
 
-    pollStatus();
+    loadTrail();
+
+    loadSavedPoints().catch(
+        () => {}
+    );
 }
 
-async function pollStatus() {
+async function loadTrail() {
 
     try {
 
-        const data =
+        const trail =
             await getJSON(
-                API.status
+                `${API.trail}?points=${TRAIL_POINTS}`
             );
 
-        renderStatus(data);
-
-        await loadSavedPoints();
+        trailLine.setLatLngs(
+            trail.points
+        );
 
     } catch (e) {
 
     }
 }
 
+// Server-Sent Events: 最初に全項目（snapshot）、以降は変わった項目（delta）が届く。
+// 切断されるとブラウザが Last-Event-ID 付きで再接続し、続きから受け取れる
+function startStatusStream() {
+
+    if (statusStream) {
+        statusStream.close();
+    }
+
+    statusStream =
+        new EventSource(
+            API.stream
+        );
+
+    statusStream.addEventListener(
+        "snapshot",
+        (event) => {
+
+            telemetryState =
+                JSON.parse(event.data);
+
+            renderStatus(
+                telemetryState
+            );
+        }
+    );
+
+    statusStream.addEventListener(
+        "delta",
+        (event) => {
+
+            Object.assign(
+                telemetryState,
+                JSON.parse(event.data)
+            );
+
+            renderStatus(
+                telemetryState
+            );
+        }
+    );
+}
+
+function sleep(ms) {
+
+    return new Promise(
+        (resolve) => setTimeout(resolve, ms)
+    );
+}
+
+// ロングポーリング: 前回の version より新しい更新をサーバーで待ってから受け取る
+async function pollStatus() {
+
+    let version = -1;
+
+    while (statusPolling) {
+
+        const started =
+            Date.now();
+
+        try {
+
+            const data =
+                await getJSON(
+                    `${API.status}?after=${version}&timeout=${LONG_POLL_TIMEOUT}`
+                );
+
+            version = data.version;
+
+            renderStatus(data);
+
+        } catch (e) {
+
+            await sleep(
+                STATUS_RETRY_INTERVAL
+            );
+        }
+
+        // 更新が続いても描画と要求は STATUS_MIN_INTERVAL ごとまでにする
+        await sleep(
+            STATUS_MIN_INTERVAL - (Date.now() - started)
+        );
+    }
+}
+
 function renderStatus(data) {
 
     setConnectionBadge(
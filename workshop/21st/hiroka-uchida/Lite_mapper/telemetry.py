@@ -7,6 +7,7 @@ telemetry.py
 import threading
 import time
 import math
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,10 +16,23 @@ logger = logging.getLogger(__name__)
 class TelemetryData:
     """
     最新のテレメトリ状態を保持するスレッドセーフなデータコンテナ
+
+    値が変わるたびに version が1つ増える。wait_for_update() で
+    「version N より新しい更新」を待てる（/telemetry のロングポーリング用）。
+    項目ごとに最後に変わった version を持つので、wait_for_changes() で
+    「version N から変わった項目だけ」を取り出せる（/stream の差分配信用）
     """
 
     def __init__(self):
         self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._version = 0
+
+        # プロセスごとの識別子。再起動後に古い version で再開されたら全項目を送り直す
+        self.epoch = uuid.uuid4().hex[:8]
+
+        # 項目名 -> その項目が最後に変わった version
+        self._changed_at = {}
 
         self._data = {
             "connected": False,
@@ -44,20 +58,88 @@ class TelemetryData:
 
         with self._lock:
 
+            changed = [
+                key for key, value in kwargs.items()
+                if self._data.get(key) != value
+            ]
+
             self._data.update(kwargs)
 
             self._data["last_update"] = time.time()
 
+            if changed:
+
+                self._changed(
+                    changed + ["last_update"]
+                )
+
     def get(self):
 
         with self._lock:
 
-            return dict(self._data)
+            return self._snapshot()
+
+    def wait_for_update(
+        self,
+        version: int,
+        timeout: float = None,
+    ):
+        """
+        version より新しい更新があるまで待ち、最新の状態を返す。
+        timeout までに更新が無ければ、その時点の状態（同じ version）を返す。
+        version が現在より新しい（再起動前のプロセスの version）ときは待たずに返す
+        """
+
+        with self._lock:
+
+            if version <= self._version:
+
+                self._updated.wait_for(
+                    lambda: self._version > version,
+                    timeout,
+                )
+
+            return self._snapshot()
+
+    def wait_for_changes(
+        self,
+        version: int,
+        timeout: float = None,
+    ):
+        """
+        version より新しい更新があるまで待ち、(最新の version, 変わった項目の dict) を返す。
+        version が負、または現在より新しい（別のプロセスの version）ときは全項目を返す。
+        timeout までに更新が無ければ空の dict を返す
+        """
+
+        with self._lock:
+
+            if 0 <= version <= self._version:
+
+                self._updated.wait_for(
+                    lambda: self._version > version,
+                    timeout,
+                )
+
+                changes = {
+                    key: self._data[key]
+                    for key, changed_at in self._changed_at.items()
+                    if changed_at > version
+                }
+
+            else:
+
+                changes = dict(self._data)
+
+            return self._version, changes
 
     def set_connected(self, connected: bool):
 
         with self._lock:
 
+            if connected == self._data["connected"]:
+                return
+
             self._data["connected"] = connected
 
             if not connected:
@@ -65,10 +147,32 @@ class TelemetryData:
                 self._data["armed"] = False
                 self._data["flight_mode"] = None
 
+            self._changed(
+                ["connected", "armed", "flight_mode"]
+            )
+
+    def _changed(self, keys):
+
+        self._version += 1
+
+        for key in keys:
+            self._changed_at[key] = self._version
+
+        self._updated.notify_all()
+
+    def _snapshot(self):
+
+        data = dict(self._data)
+
+        data["version"] = self._version
+
+        return data
+
 
 class TelemetryWorker:
     """
     MAVLink接続からテレメトリを継続的に取得するバックグラウンドワーカー
+    メッセージを受信するたびに TelemetryData を更新する
     """
 
     def __init__(
@@ -76,10 +180,14 @@ class TelemetryWorker:
         drone_connection,
         telemetry_data: TelemetryData,
         interval: float = 1.0,
+        telemetry_store=None,
     ):
         self.drone_connection = drone_connection
         self.telemetry_data = telemetry_data
-        self.interval = interval
+        self.telemetry_store = telemetry_store
+        self._boot_offset = None
+        self._last_boot_time = 0.0
+        self.interval = interval        # 受信待ちの最大時間、エラー後の待ち時間[秒]
         self._stop_event = threading.Event()
         self._thread = None
 
@@ -121,9 +229,30 @@ class TelemetryWorker:
 
         while not self._stop_event.is_set():
 
+            master = self.drone_connection.master
+
+            if master is None:
+
+                self.telemetry_data.set_connected(
+                    False
+                )
+
+                self._stop_event.wait(
+                    self.interval
+                )
+
+                continue
+
             try:
 
-                self._poll_once()
+                # 1メッセージ受信するたびにすぐ反映する
+                msg = master.recv_match(
+                    blocking=True,
+                    timeout=self.interval,
+                )
+
+                if msg is not None:
+                    self._handle(master, msg)
 
             except Exception as e:
 
@@ -135,55 +264,78 @@ class TelemetryWorker:
                     False
                 )
 
-            time.sleep(
-                self.interval
-            )
+                self._stop_event.wait(
+                    self.interval
+                )
+
+    def _handle(self, master, msg):
 
-    def _poll_once(self):
+        update_kwargs = self._convert(
+            master,
+            msg,
+        )
+
+        if not update_kwargs:
+            return
 
-        master = self.drone_connection.master
+        update_kwargs["connected"] = True
+
+        self.telemetry_data.update(
+            **update_kwargs
+        )
 
-        if master is None:
+        # 位置を受信するたびに、その時点の状態を時系列へ記録する
+        if (
+            msg.get_type() == "GLOBAL_POSITION_INT"
+            and self.telemetry_store is not None
+        ):
 
-            self.telemetry_data.set_connected(
-                False
+            self.telemetry_store.append(
+                self.telemetry_data.get(),
+                self._sample_time(msg),
             )
 
-            return
+    def _sample_time(self, msg):
+        """
+        サンプルの時刻。受信時刻はリンクの遅延や揺らぎを含むので
+        time_boot_ms を使い、機体の起動時刻（壁時計）を最小遅延の受信から推定する
+        """
 
-        messages = {}
+        boot_time = msg.time_boot_ms / 1000.0
 
-        deadline = time.time() + 0.8
+        if boot_time < self._last_boot_time:
 
-        while time.time() < deadline:
+            # 機体が再起動した
+            self._boot_offset = None
 
-            msg = master.recv_match(
-                blocking=False
-            )
+        self._last_boot_time = boot_time
 
-            if msg is None:
+        offset = msg._timestamp - boot_time
 
-                time.sleep(0.02)
+        if (
+            self._boot_offset is None
+            or offset < self._boot_offset
+        ):
+            self._boot_offset = offset
 
-                continue
+        return boot_time + self._boot_offset
 
-            msg_type = msg.get_type()
+    def _convert(self, master, msg):
+        """
+        受信したメッセージを TelemetryData の項目へ変換する（関係ないメッセージは空の dict）
+        """
 
-            messages[msg_type] = msg
+        msg_type = msg.get_type()
 
-        update_kwargs = {
-            "connected": True
-        }
+        update_kwargs = {}
 
         # -------------------------
         # 位置情報
         # -------------------------
 
-        if "GLOBAL_POSITION_INT" in messages:
+        if msg_type == "GLOBAL_POSITION_INT":
 
-            gpi = messages[
-                "GLOBAL_POSITION_INT"
-            ]
+            gpi = msg
 
             update_kwargs["latitude"] = (
                 gpi.lat / 1e7
@@ -211,7 +363,7 @@ class TelemetryWorker:
         # フライトモード
         # -------------------------
 
-        if "HEARTBEAT" in messages:
+        if msg_type == "HEARTBEAT":
 
             try:
 
@@ -233,9 +385,9 @@ class TelemetryWorker:
         # 対地速度
         # -------------------------
 
-        if "VFR_HUD" in messages:
+        if msg_type == "VFR_HUD":
 
-            vfr = messages["VFR_HUD"]
+            vfr = msg
 
             update_kwargs[
                 "groundspeed"
@@ -245,11 +397,9 @@ class TelemetryWorker:
         # バッテリー
         # -------------------------
 
-        if "SYS_STATUS" in messages:
+        if msg_type == "SYS_STATUS":
 
-            sys_status = messages[
-                "SYS_STATUS"
-            ]
+            sys_status = msg
 
             update_kwargs[
                 "battery_voltage"
@@ -262,9 +412,9 @@ class TelemetryWorker:
         # 姿勢情報
         # -------------------------
 
-        if "ATTITUDE" in messages:
+        if msg_type == "ATTITUDE":
 
-            att = messages["ATTITUDE"]
+            att = msg
 
             update_kwargs["roll"] = round(
                 math.degrees(att.roll),
@@ -281,6 +431,4 @@ class TelemetryWorker:
                 2
             )
 
-        self.telemetry_data.update(
-            **update_kwargs
-        )
\ No newline at end of file
+        return update_kwargs
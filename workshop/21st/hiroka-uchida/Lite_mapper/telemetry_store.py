@@ -0,0 +1,537 @@
+"""
+telemetry_store.py
+テレメトリの時系列を保持するリングバッファ
+
+1サンプルごとに dict を作るとメモリも GC も重いので、
+項目ごとに確保済みの NumPy 配列（列）へ書き込む。
+  - 容量を超えたら古いものから上書きする（リングバッファ）
+  - 時刻は単調増加なので、時間範囲の取り出しは二分探索（O(log n)）
+  - 地図の軌跡用に、点数を間引いた取り出しができる
+  - spill_dir を指定すると、上書きされる前の古いサンプルをディスクへ書き出し、
+    np.memmap で開いて時間範囲の取り出しに含める（メモリに載せずに何時間分でも残せる）
+
+1サンプルは約 60 バイト。10Hz で 4 時間分（144,000 サンプル）でも約 9MB
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# 列の定義（項目名, 型）。実数の欠損は NaN、フライトモードは番号（-1 が欠損）で持つ
+COLUMNS = (
+    ("time", np.float64),
+    ("latitude", np.float64),
+    ("longitude", np.float64),
+    ("altitude", np.float32),
+    ("relative_altitude", np.float32),
+    ("heading", np.float32),
+    ("groundspeed", np.float32),
+    ("battery_voltage", np.float32),
+    ("roll", np.float32),
+    ("pitch", np.float32),
+    ("yaw", np.float32),
+    ("armed", np.bool_),
+    ("flight_mode", np.int16),
+)
+
+FIELDS = tuple(
+    name for name, _ in COLUMNS
+)
+
+# ディスクへ書き出すときのまとまり（容量に対する割合）
+SPILL_FRACTION = 8
+
+
+class TelemetryStore:
+    """
+    テレメトリの時系列を列ごとの NumPy 配列で持つスレッドセーフなリングバッファ
+    """
+
+    def __init__(
+        self,
+        capacity: int = 144000,
+        spill_dir: str = None,
+    ):
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+
+        self._lock = threading.Lock()
+
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in COLUMNS
+        }
+
+        self._start = 0        # 最も古いサンプルの位置
+        self._size = 0         # 保持しているサンプル数
+        self._last_time = -math.inf
+
+        # フライトモード名 <-> 番号
+        self._modes = []
+        self._mode_codes = {}
+
+        # ディスクへ書き出したサンプル数と、開いている memmap
+        self._spilled = 0
+        self._spill_maps = None
+
+        if spill_dir:
+
+            os.makedirs(
+                spill_dir,
+                exist_ok=True,
+            )
+
+            self._spilled = self._spill_file_rows()
+
+            self._load_modes()
+
+    def __len__(self):
+
+        with self._lock:
+
+            return self._spilled + self._size
+
+    # -------------------------
+    # 書き込み
+    # -------------------------
+
+    def append(self, sample: dict, timestamp: float = None):
+        """
+        1サンプルを追加する。sample は TelemetryData.get() と同じ形式の dict
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+
+            # 時刻が戻ると二分探索できないので、直前の時刻より前にはしない
+            timestamp = max(
+                timestamp,
+                self._last_time,
+            )
+
+            self._last_time = timestamp
+
+            if self._size == self.capacity:
+                self._evict()
+
+            index = (
+                self._start + self._size
+            ) % self.capacity
+
+            columns = self._columns
+
+            columns["time"][index] = timestamp
+
+            for name, _ in COLUMNS[1:-2]:
+
+                value = sample.get(name)
+
+                columns[name][index] = (
+                    math.nan if value is None else value
+                )
+
+            columns["armed"][index] = bool(
+                sample.get("armed")
+            )
+
+            columns["flight_mode"][index] = self._mode_code(
+                sample.get("flight_mode")
+            )
+
+            self._size += 1
+
+    def _mode_code(self, mode):
+
+        if mode is None:
+            return -1
+
+        code = self._mode_codes.get(mode)
+
+        if code is None:
+
+            code = len(self._modes)
+
+            self._modes.append(mode)
+
+            self._mode_codes[mode] = code
+
+            if self.spill_dir:
+                self._save_modes()
+
+        return code
+
+    def _evict(self):
+        """
+        満杯のとき、古いサンプルをまとめて捨てる（spill_dir があればディスクへ書き出す）
+        """
+
+        count = max(
+            1,
+            self.capacity // SPILL_FRACTION,
+        )
+
+        if self.spill_dir:
+
+            indices = self._physical(0, count)
+
+            for name, _ in COLUMNS:
+
+                with open(self._spill_path(name), "ab") as f:
+
+                    self._columns[name][indices].tofile(f)
+
+            self._spilled += count
+
+            self._spill_maps = None
+
+        self._start = (
+            self._start + count
+        ) % self.capacity
+
+        self._size -= count
+
+    # -------------------------
+    # 読み出し
+    # -------------------------
+
+    def latest(self):
+        """
+        最新のサンプルを dict で返す（無ければ None）
+        """
+
+        with self._lock:
+
+            if not self._size:
+                return None
+
+            index = self._physical(
+                self._size - 1,
+                self._size,
+            )
+
+            return self._records(
+                self._take(index, FIELDS)
+            )[0]
+
+    def range(
+        self,
+        start: float = None,
+        end: float = None,
+        fields=FIELDS,
+    ):
+        """
+        時刻 start 以上 end 未満のサンプルを {項目名: 配列} で返す（配列はコピー）
+        """
+
+        with self._lock:
+
+            spilled = self._spill_range(
+                start,
+                end,
+                fields,
+            )
+
+            first, last = self._search(
+                start,
+                end,
+            )
+
+            columns = self._take(
+                self._physical(first, last),
+                fields,
+            )
+
+        if spilled is not None:
+
+            columns = {
+                name: np.concatenate((spilled[name], columns[name]))
+                for name in fields
+            }
+
+        return columns
+
+    def trail(
+        self,
+        max_points: int = 500,
+        start: float = None,
+        end: float = None,
+    ):
+        """
+        地図の軌跡用に、位置を最大 max_points 点に間引いて返す
+        """
+
+        columns = self.range(
+            start,
+            end,
+            ("time", "latitude", "longitude"),
+        )
+
+        valid = ~np.isnan(
+            columns["latitude"]
+        )
+
+        columns = {
+            name: values[valid]
+            for name, values in columns.items()
+        }
+
+        count = len(columns["time"])
+
+        if count > max_points:
+
+            # 等間隔に選ぶ（最新の点は必ず含める）
+            picks = np.linspace(
+                0,
+                count - 1,
+                max_points,
+            ).astype(np.int64)
+
+            columns = {
+                name: values[picks]
+                for name, values in columns.items()
+            }
+
+        return columns
+
+    def records(
+        self,
+        start: float = None,
+        end: float = None,
+        fields=FIELDS,
+    ):
+        """
+        range() の結果を JSON にできる dict のリストにする（NaN は None）
+        """
+
+        return self._records(
+            self.range(start, end, fields)
+        )
+
+    def _records(self, columns):
+
+        names = list(columns)
+
+        lists = []
+
+        for name in names:
+
+            values = columns[name]
+
+            if name == "flight_mode":
+
+                lists.append([
+                    self._modes[code] if code >= 0 else None
+                    for code in values.tolist()
+                ])
+
+            elif values.dtype.kind == "f":
+
+                if values.dtype == np.float32:
+
+                    # float32 の端数（1.23 -> 1.2300000190734863）を落とす
+                    values = np.round(
+                        values.astype(np.float64),
+                        4,
+                    )
+
+                lists.append([
+                    None if value != value else value
+                    for value in values.tolist()
+                ])
+
+            else:
+
+                lists.append(
+                    values.tolist()
+                )
+
+        return [
+            dict(zip(names, row))
+            for row in zip(*lists)
+        ]
+
+    def _physical(self, first, last):
+        """
+        論理位置 first..last（古い順）を配列の添字にする
+        """
+
+        return (
+            self._start
+            + np.arange(first, last)
+        ) % self.capacity
+
+    def _take(self, indices, fields):
+
+        return {
+            name: self._columns[name][indices]
+            for name in fields
+        }
+
+    def _search(self, start, end):
+        """
+        リングバッファ内の時刻範囲を論理位置 (first, last) で返す
+        """
+
+        times = self._columns["time"]
+
+        # リングは「start から末尾」「先頭から」の2区間で、どちらも時刻順に並んでいる
+        tail = min(
+            self._size,
+            self.capacity - self._start,
+        )
+
+        segments = (
+            times[self._start:self._start + tail],
+            times[:self._size - tail],
+        )
+
+        def locate(value, default):
+
+            if value is None:
+                return default
+
+            position = 0
+
+            for segment in segments:
+
+                found = int(
+                    np.searchsorted(segment, value, side="left")
+                )
+
+                position += found
+
+                if found < len(segment):
+                    break
+
+            return position
+
+        return (
+            locate(start, 0),
+            locate(end, self._size),
+        )
+
+    # -------------------------
+    # ディスクへの書き出し
+    # -------------------------
+
+    def _spill_path(self, name):
+
+        # modes はフライトモード名の一覧（JSON）、それ以外は列ごとの生データ
+        extension = "json" if name == "modes" else "bin"
+
+        return os.path.join(
+            self.spill_dir,
+            f"{name}.{extension}",
+        )
+
+    def _spill_file_rows(self):
+        """
+        前回の書き出しが残っていれば、その行数を返す。
+        書き出しの途中で止まっていた場合は、全列でそろっている行数に切り詰める
+        """
+
+        rows = []
+
+        for name, dtype in COLUMNS:
+
+            path = self._spill_path(name)
+
+            size = (
+                os.path.getsize(path)
+                if os.path.exists(path)
+                else 0
+            )
+
+            rows.append(
+                size // np.dtype(dtype).itemsize
+            )
+
+        count = min(rows)
+
+        for name, dtype in COLUMNS:
+
+            path = self._spill_path(name)
+
+            if os.path.exists(path):
+
+                os.truncate(
+                    path,
+                    count * np.dtype(dtype).itemsize,
+                )
+
+        if count:
+
+            last = np.memmap(
+                self._spill_path("time"),
+                dtype=np.float64,
+                mode="r",
+            )[count - 1]
+
+            self._last_time = float(last)
+
+        return count
+
+    def _load_modes(self):
+
+        path = self._spill_path("modes")
+
+        if os.path.exists(path):
+
+            with open(path, encoding="utf-8") as f:
+
+                self._modes = json.load(f)
+
+            self._mode_codes = {
+                mode: code
+                for code, mode in enumerate(self._modes)
+            }
+
+    def _save_modes(self):
+
+        with open(self._spill_path("modes"), "w", encoding="utf-8") as f:
+
+            json.dump(self._modes, f)
+
+    def _spill_range(self, start, end, fields):
+
+        if not self._spilled:
+            return None
+
+        if self._spill_maps is None:
+
+            self._spill_maps = {
+                name: np.memmap(
+                    self._spill_path(name),
+                    dtype=dtype,
+                    mode="r",
+                    shape=(self._spilled,),
+                )
+                for name, dtype in COLUMNS
+            }
+
+        times = self._spill_maps["time"]
+
+        first = (
+            0 if start is None
+            else int(np.searchsorted(times, start, side="left"))
+        )
+
+        last = (
+            self._spilled if end is None
+            else int(np.searchsorted(times, end, side="left"))
+        )
+
+        return {
+            name: np.array(self._spill_maps[name][first:last])
+            for name in fields
+        }
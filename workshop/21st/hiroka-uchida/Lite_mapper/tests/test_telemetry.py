@@ -0,0 +1,37 @@
+import threading
+import time
+
+from telemetry import TelemetryData
+
+
+def test_wait_for_update_returns_on_change_and_after_restart():
+    data = TelemetryData()
+    data.update(latitude=35.0)
+    assert data.get()["version"] == 1
+
+    timer = threading.Timer(0.05, data.update, kwargs={"latitude": 35.1})
+    timer.start()
+    started = time.monotonic()
+    snapshot = data.wait_for_update(1, timeout=2)
+    timer.join()
+    assert snapshot["version"] == 2 and snapshot["latitude"] == 35.1
+    assert time.monotonic() - started < 1
+
+    data.update(latitude=35.1)                                     # 変化なしは version を進めない
+    assert data.wait_for_update(2, timeout=0.05)["version"] == 2
+
+    # 再起動前のプロセスの version（今より大きい）なら待たずに全項目を返す
+    started = time.monotonic()
+    snapshot = data.wait_for_update(500, timeout=2)
+    assert time.monotonic() - started < 0.5
+    assert snapshot["version"] == 2 and snapshot["latitude"] == 35.1
+
+
+def test_wait_for_changes_returns_only_changed_fields():
+    data = TelemetryData()
+    data.update(latitude=35.0, longitude=139.0)
+    data.update(latitude=35.1)
+    version, changes = data.wait_for_changes(1, timeout=0)
+    assert version == 2 and set(changes) == {"latitude", "last_update"}
+    version, changes = data.wait_for_changes(99, timeout=0)        # 別のプロセスの version
+    assert version == 2 and changes["longitude"] == 139.0
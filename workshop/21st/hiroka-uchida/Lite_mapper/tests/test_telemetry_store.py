@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+from telemetry_store import TelemetryStore
+
+
+def sample(index, mode="GUIDED"):
+    return {
+        "latitude": 35.0 + index * 1e-4,
+        "longitude": 139.0,
+        "relative_altitude": 1.25 * index,
+        "armed": index % 2 == 0,
+        "flight_mode": mode,
+    }
+
+
+def fill(store, count, start=0):
+    for index in range(start, start + count):
+        store.append(sample(index, "AUTO" if index >= 10 else "GUIDED"), timestamp=float(index))
+
+
+def test_ring_wraps_and_time_ranges():
+    store = TelemetryStore(capacity=8)
+    fill(store, 20)
+    assert len(store) == 8
+    assert store.range(fields=("time",))["time"].tolist() == list(range(12, 20))
+    assert store.range(14, 17, ("time",))["time"].tolist() == [14.0, 15.0, 16.0]
+    assert store.range(0, 12, ("time",))["time"].tolist() == []
+
+    latest = store.latest()
+    assert latest["time"] == 19.0 and latest["flight_mode"] == "AUTO" and latest["armed"] is False
+    assert latest["heading"] is None                               # 欠損は None
+
+    # 時刻は戻らない
+    store.append(sample(20), timestamp=3.0)
+    assert store.latest()["time"] == 19.0
+
+
+def test_trail_skips_missing_positions_and_keeps_latest():
+    store = TelemetryStore(capacity=100)
+    fill(store, 50)
+    store.append({"latitude": None, "longitude": None}, timestamp=50.0)
+    trail = store.trail(max_points=5)
+    assert trail["time"].tolist() == [0.0, 12.0, 24.0, 36.0, 49.0]
+    assert not np.isnan(trail["latitude"]).any()
+    assert len(store.trail(max_points=100)["time"]) == 50
+    assert store.trail(start=45)["time"].tolist() == [45.0, 46.0, 47.0, 48.0, 49.0]
+
+
+def test_spill_covers_evicted_samples_and_reloads(tmp_path):
+    store = TelemetryStore(capacity=8, spill_dir=str(tmp_path))
+    fill(store, 20)
+    assert len(store) == 20
+    assert store.range(fields=("time",))["time"].tolist() == [float(i) for i in range(20)]
+    records = store.records(5, 15, ("time", "relative_altitude", "flight_mode"))
+    assert [r["time"] for r in records] == [float(i) for i in range(5, 15)]
+    assert records[0]["relative_altitude"] == 6.25
+    assert [r["flight_mode"] for r in records[4:6]] == ["GUIDED", "AUTO"]
+
+    # 書き出した分は次の起動で読み戻す（リングに残っていた分は失われる）
+    reloaded = TelemetryStore(capacity=8, spill_dir=str(tmp_path))
+    assert len(reloaded) == 12
+    assert reloaded.records(10, 12, ("time", "flight_mode")) == [
+        {"time": 10.0, "flight_mode": "AUTO"}, {"time": 11.0, "flight_mode": "AUTO"}]
+    reloaded.append(sample(0, "RTL"), timestamp=1.0)                # 書き出し済みより前にはしない
+    assert reloaded.latest()["time"] == 11.0 and reloaded.latest()["flight_mode"] == "RTL"
+
+    # 書き出しの途中で止まった列は、そろっている行数に切り詰める
+    with open(tmp_path / "time.bin", "ab") as f:
+        f.write(np.float64(99.0).tobytes())
+    assert len(TelemetryStore(capacity=8, spill_dir=str(tmp_path))) == 12
+    assert math.isclose(TelemetryStore(capacity=8, spill_dir=str(tmp_path)).range(
+        fields=("latitude",))["latitude"][-1], 35.0011)